@@ -0,0 +1,204 @@
+"""
+このファイルは、運用担当者向けの管理者用ページ（アプリの稼働状況の表示）が記述されたファイルです。
+application.logを確認しなくても、回答の所要時間・エラー・LLMの順番待ち・キャッシュのヒット率を1画面で確認できます。
+また、次のN件の回答生成のプロファイル（profiling.py）を、再デプロイせずに取得できます（URLに「&profile=N」を指定しても可）。
+
+画面のメニューには表示せず、URLに「?admin=<トークン>」を指定した場合のみ、main.pyから表示します。
+（トークンは環境変数「RAG_ADMIN_TOKEN」で指定。未設定の場合は、管理者用ページを表示しない）
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import hmac
+import os
+import time
+from collections import deque
+from datetime import datetime
+import pandas as pd
+import streamlit as st
+import constants as ct
+from metrics import get_registry, percentile, render_prometheus, subtract_counts
+from profiling import get_request_profiler, list_profiles
+
+
+############################################################
+# 関数定義
+############################################################
+
+def is_admin_request():
+    """
+    管理者用ページを表示するリクエストか（URLのクエリパラメータのトークンが一致するか）を判定
+
+    トークンが設定されていない場合は常にFalse。比較にかかる時間からトークンを推測されないよう、hmac.compare_digestで比較する。
+    """
+    token = os.environ.get(ct.ADMIN_TOKEN_ENV)
+    value = st.query_params.get(ct.ADMIN_QUERY_PARAM)
+    if not token or value is None:
+        return False
+    return hmac.compare_digest(value.encode("utf-8"), token.encode("utf-8"))
+
+
+def metric_values(metric):
+    """
+    メトリクスのラベルの組み合わせごとの値を、{ラベルの辞書のタプル: 値} で取得
+    """
+    return dict(metric.items()) if metric is not None else {}
+
+
+def total(metric, **labels):
+    """
+    指定のラベルを含む、すべての組み合わせの値の合計
+    """
+    return sum(value for key, value in metric_values(metric).items() if set(labels.items()) <= set(key))
+
+
+def record_latency_history():
+    """
+    回答の所要時間のヒストグラムを記録し、直近の期間のパーセンタイルをグラフ用の履歴に追加
+
+    Returns:
+        時刻ごとのp50/p95/p99（ミリ秒）のDataFrame
+    """
+    snapshots = st.session_state.setdefault("admin_snapshots", deque())
+    history = st.session_state.setdefault("admin_history", deque(maxlen=ct.ADMIN_HISTORY_POINTS))
+
+    now = time.time()
+    counts = get_registry().histogram("rag_stage_duration_seconds").snapshot(stage="request")
+    snapshots.append((now, counts))
+    # 直近の期間より前の記録は、期間の始点となる1件のみ残す
+    while len(snapshots) > 1 and snapshots[1][0] <= now - ct.ADMIN_WINDOW_SECONDS:
+        snapshots.popleft()
+
+    window = subtract_counts(counts, snapshots[0][1]) if len(snapshots) > 1 else counts
+    history.append({
+        "time": datetime.fromtimestamp(now),
+        **{f"p{q}": (percentile(window, q) or 0.0) * 1000 for q in (50, 95, 99)},
+    })
+    return pd.DataFrame(list(history)).set_index("time")
+
+
+def stage_table(histogram):
+    """
+    処理段階ごとの所要時間（起動からの累計）の表
+    """
+    rows = []
+    for key, value in histogram.items() if histogram is not None else []:
+        rows.append({
+            "処理段階": dict(key).get("stage"),
+            "件数": value.count,
+            "平均(ms)": value.sum / value.count * 1000 if value.count else 0.0,
+            **{f"p{q}(ms)": (percentile(value.counts, q) or 0.0) * 1000 for q in (50, 95, 99)},
+            "最大(ms)": value.max * 1000,
+        })
+    return pd.DataFrame(rows).sort_values("処理段階") if rows else pd.DataFrame()
+
+
+def cache_table(metrics):
+    """
+    キャッシュごとのヒット率の表
+    """
+    rows = {}
+    values = list(metric_values(metrics.get("rag_cache_requests_total")).items())
+    # 質問の埋め込みベクトルのキャッシュは、query_rewrite.pyの累計値を使う
+    values += [((("cache", "embedding"), *key), value)
+               for key, value in metric_values(metrics.get("rag_embedding_cache_requests_total")).items()]
+    for key, value in values:
+        labels = dict(key)
+        row = rows.setdefault(labels["cache"], {"キャッシュ": labels["cache"], "hit": 0, "miss": 0})
+        row[labels["result"]] += value
+    for row in rows.values():
+        row["ヒット率"] = f"{row['hit'] / (row['hit'] + row['miss']):.1%}" if row["hit"] + row["miss"] else "-"
+    return pd.DataFrame(list(rows.values()))
+
+
+def display_health(metrics):
+    """
+    稼働状況の要約（回答件数・エラー率・LLMの順番待ち・インデックスの件数）を表示
+    """
+    answers = metrics.get("rag_answers_total")
+    answered = total(answers)
+    errors = total(answers, path="error") + total(answers, path="fallback")
+    columns = st.columns(5)
+    columns[0].metric("回答件数", f"{answered:,}")
+    columns[1].metric("エラー率", f"{errors / answered:.1%}" if answered else "-")
+    columns[2].metric("LLMの順番待ち", total(metrics.get("rag_llm_queue_depth")))
+    columns[3].metric("LLMの実行中", total(metrics.get("rag_llm_in_flight")))
+    index_documents = metric_values(metrics.get("rag_index_documents"))
+    columns[4].metric("インデックス件数", f"{sum(index_documents.values()):,}" if index_documents else "未作成")
+
+
+@st.fragment(run_every=ct.ADMIN_REFRESH_SECONDS)
+def display_live_metrics():
+    """
+    メトリクスを一定間隔で更新して表示
+    """
+    metrics = {metric.name: metric for metric in get_registry().collect()}
+    display_health(metrics)
+
+    st.markdown(f"#### 回答の所要時間（直近{ct.ADMIN_WINDOW_SECONDS}秒のパーセンタイル、ミリ秒）")
+    st.line_chart(record_latency_history())
+
+    st.markdown("#### 処理段階ごとの所要時間（起動からの累計）")
+    st.dataframe(stage_table(metrics.get("rag_stage_duration_seconds")), hide_index=True)
+
+    st.markdown("#### キャッシュのヒット率")
+    st.dataframe(cache_table(metrics), hide_index=True)
+
+    tokens = metrics.get("rag_llm_tokens_total")
+    st.markdown(f"#### LLMのトークン数\nプロンプト: {total(tokens, kind='prompt'):,} / 回答: {total(tokens, kind='completion'):,}")
+
+
+def apply_profile_query_params():
+    """
+    URLのクエリパラメータ（「&profile=N&profile_mode=sampler」）で指定されたプロファイルを設定
+
+    画面の再実行のたびに設定し直さないよう、設定後はクエリパラメータから取り除く。
+    """
+    count = st.query_params.get(ct.PROFILE_QUERY_PARAM)
+    if count is None:
+        return
+    mode = st.query_params.get(ct.PROFILE_MODE_QUERY_PARAM, ct.PROFILE_MODES[0])
+    try:
+        get_request_profiler().arm(int(count), mode)
+        st.toast(f"次の{count}件の回答生成をプロファイルします（{mode}）。")
+    except ValueError as e:
+        st.error(f"プロファイルの指定が正しくありません: {e}", icon=ct.ERROR_ICON)
+    del st.query_params[ct.PROFILE_QUERY_PARAM]
+    if ct.PROFILE_MODE_QUERY_PARAM in st.query_params:
+        del st.query_params[ct.PROFILE_MODE_QUERY_PARAM]
+
+
+def display_profiling():
+    """
+    回答生成のプロファイルの指定と、保存したプロファイルの一覧を表示
+    """
+    st.markdown("#### プロファイル")
+    profiler = get_request_profiler()
+    status = profiler.status()
+    st.caption(f"残り{status['remaining']}件（{status['mode']}）。結果は {ct.PROFILE_DIR_PATH} に保存します。")
+    with st.form("profile_form"):
+        columns = st.columns(2)
+        count = columns[0].number_input("プロファイルする件数", min_value=0, max_value=ct.PROFILE_MAX_REQUESTS, value=1)
+        mode = columns[1].selectbox("方法", ct.PROFILE_MODES)
+        if st.form_submit_button("次の回答生成からプロファイル"):
+            profiler.arm(count, mode)
+            st.rerun()
+    profiles = list_profiles()
+    if profiles:
+        st.dataframe(pd.DataFrame({"ファイル": profiles}), hide_index=True)
+
+
+def render_admin_page():
+    """
+    管理者用ページを表示
+    """
+    apply_profile_query_params()
+    st.title("管理者用ページ（稼働状況）")
+    st.caption(f"{ct.ADMIN_REFRESH_SECONDS}秒ごとに更新。Prometheusからは /metrics（ポート{ct.METRICS_PORT}）で取得できます。")
+    display_live_metrics()
+    display_profiling()
+    with st.expander("Prometheus形式のメトリクス"):
+        st.code(render_prometheus(), language="text")
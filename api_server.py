@@ -0,0 +1,343 @@
+"""
+このファイルは、画面（main.py）を介さずに社内情報の検索・回答生成・社員検索を行うためのHTTP APIです。
+画面と同じRetriever・社員名簿のインデックス・LLMの接続プールとスケジューラを共有し、
+リクエストは全セッション共有の非同期エンジンのイベントループ上で処理します。
+
+使い方:
+    python api_server.py --port 8080
+
+エンドポイント:
+    GET/POST /search     関連ドキュメントの検索（q: 質問文、k: 取得件数）
+    POST     /answer     回答生成（{"question": "...", "stream": true}。ストリーミングはNDJSON形式）
+    GET      /employees  社員検索（name: 氏名・メールアドレス、部署・役職・従業員区分: 一致条件、limit: 件数）
+    GET      /healthz    稼働確認
+    GET      /metrics    メトリクス（Prometheusのテキスト形式）
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import json
+import threading
+import pandas as pd
+from aiohttp import web
+import constants as ct
+import utils
+from async_engine import get_async_engine
+from context_packer import count_tokens
+from employee_engine import get_employee_engine
+from hedging import HedgedLLM
+from initialize_ultra_lite import get_current_retriever, get_shared_retriever
+from llm_clients import get_llm, close_clients
+from llm_scheduler import ScheduledLLM, get_llm_scheduler, query_priority
+from metrics import PROMETHEUS_CONTENT_TYPE, render_prometheus
+from request_deadline import Deadline, StageTimeout
+from tracing import current_span, start_span
+
+
+############################################################
+# 定数定義
+############################################################
+RETRIEVER_KEY = web.AppKey("retriever", object)
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_app(retriever):
+    """
+    HTTP APIのアプリケーションを作成
+
+    Args:
+        retriever: 検索に使うRetriever（Noneの場合、検索・回答生成は503を返す）
+    """
+    app = web.Application()
+    app[RETRIEVER_KEY] = retriever
+    app.router.add_get("/search", search)
+    app.router.add_post("/search", search)
+    app.router.add_post("/answer", answer)
+    app.router.add_get("/employees", employees)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+async def search(request):
+    """
+    関連ドキュメントを検索（回答生成は行わない）
+    """
+    params = await read_params(request)
+    query = require_text(params, "q")
+    k = parse_int(params.get("k"), ct.RAG_SEARCH_K, ct.API_MAX_SEARCH_K)
+    retriever = require_retriever(request)
+
+    deadline = Deadline()
+    docs, lexical_fallback = await utils.aretrieve_documents(retriever, query, deadline, k)
+    return json_response({
+        "query": query,
+        "results": [document_to_dict(doc) for doc in docs],
+        "lexical_fallback": lexical_fallback,
+        "timings": deadline.timings,
+    })
+
+
+async def answer(request):
+    """
+    質問に回答（画面と同じく、社員名簿で答えられる質問はLLMを使わずに回答）
+
+    "stream" がtrue（既定）の場合は、次のイベントを1行1件のJSON（NDJSON）で順に返す。
+        {"event": "sources", "sources": [...]}  検索結果
+        {"event": "token", "text": "..."}       回答の断片
+        {"event": "done", "answer": "...", ...} 回答全体と処理時間
+    """
+    params = await read_params(request)
+    question = require_text(params, "question")
+    stream = params.get("stream", True) not in (False, "false", "0")
+    session_id = request.headers.get(ct.API_SESSION_HEADER) or request.remote or "api"
+    with start_span("request", session_id=session_id, query_chars=len(question), streaming=stream):
+        return await answer_question(request, question, stream, session_id)
+
+
+async def answer_question(request, question, stream, session_id):
+    """
+    質問に回答（answerの本体。処理全体のスパンの中で実行する）
+    """
+    deadline = Deadline()
+
+    with start_span("cache_lookup", source="employee_engine") as span:
+        structured_response = await get_async_engine().to_thread(utils.answer_structured_query, question)
+        span.set_attribute("cache_hit", structured_response is not None)
+    # 処理全体のスパンに、回答の方法を記録（メトリクスの回答件数の内訳になる）
+    current_span().set_attribute("path", "structured" if structured_response is not None else "rag")
+    if structured_response is not None:
+        result = {"answer": structured_response["answer"], "sources": [], "lexical_fallback": False}
+        if not stream:
+            return json_response({**result, "timings": deadline.timings})
+        response = await start_stream(request)
+        await send_event(response, {"event": "sources", "sources": []})
+        await send_event(response, {"event": "token", "text": result["answer"]})
+        await send_event(response, {"event": "done", **result, "timings": deadline.timings})
+        await response.write_eof()
+        return response
+
+    retriever = require_retriever(request)
+    if not stream:
+        llm = ScheduledLLM(HedgedLLM(get_llm(), scheduler=get_llm_scheduler()), session_id, priority=query_priority(question))
+        text, docs = await utils.aanswer_with_rag(llm, retriever, question, deadline)
+        return json_response({
+            "answer": text,
+            "sources": [document_to_dict(doc) for doc in docs],
+            "timings": deadline.timings,
+        })
+
+    docs, lexical_fallback, formatted_results, messages = await utils.aprepare_rag(retriever, question, deadline)
+    response = await start_stream(request)
+    await send_event(response, {"event": "sources", "sources": [document_to_dict(doc) for doc in docs]})
+
+    # ストリーミングの間はスケジューラの実行枠を確保し続ける（ヘッジは最初のトークンで勝敗が決まる一括応答のみで使う）
+    llm = ScheduledLLM(get_llm(), session_id, priority=query_priority(question))
+    parts = []
+
+    async def stream_tokens():
+        # 最初のトークンまでの時間は、実行枠の順番待ちを含めて計測
+        first_token_span = start_span("llm_first_token")
+        try:
+            async for chunk in llm.astream(messages):
+                if chunk.content:
+                    if first_token_span.end_ns is None:
+                        first_token_span.end()
+                    parts.append(chunk.content)
+                    await send_event(response, {"event": "token", "text": chunk.content})
+        finally:
+            # 最初のトークンが届く前に終わった場合（時間切れ・エラー・空の応答）も、スパンを閉じる
+            if first_token_span.end_ns is None:
+                first_token_span.set_attribute("received", False)
+                first_token_span.end()
+
+    truncated = False
+    with start_span("llm_complete", streaming=True) as span:
+        try:
+            await deadline.run_async("completion", stream_tokens())
+        except StageTimeout:
+            span.set_attribute("timed_out", True)
+            if parts:
+                # 途中まで返した回答はそのまま残し、打ち切ったことだけを伝える
+                truncated = True
+            else:
+                parts.append(utils.build_sources_only_answer(formatted_results))
+                await send_event(response, {"event": "token", "text": parts[-1]})
+        span.set_attribute("completion_tokens", count_tokens("".join(parts)))
+    if lexical_fallback:
+        parts.append(f"\n\n{ct.REQUEST_LEXICAL_FALLBACK_NOTE}")
+        await send_event(response, {"event": "token", "text": parts[-1]})
+
+    await send_event(response, {
+        "event": "done",
+        "answer": "".join(parts),
+        "lexical_fallback": lexical_fallback,
+        "truncated": truncated,
+        "timings": deadline.timings,
+    })
+    await response.write_eof()
+    return response
+
+
+async def employees(request):
+    """
+    社員名簿のインデックスから社員を検索
+    """
+    name = request.query.get("name", "").strip()
+    filters = {
+        dim: request.query[dim] for dim in ct.EMPLOYEE_AGGREGATE_DIMENSIONS if request.query.get(dim)
+    }
+    limit = parse_int(request.query.get("limit"), ct.API_MAX_EMPLOYEES, ct.API_MAX_EMPLOYEES)
+
+    def find():
+        employee_engine = get_employee_engine()
+        if name:
+            df = employee_engine.find_employees_by_name(name)
+            for dim, value in filters.items():
+                df = df[df[dim] == value]
+            return df.head(limit)
+        return employee_engine.search(filters=filters, limit=limit)
+
+    df = await get_async_engine().to_thread(find)
+    columns = [column for column in ct.EMPLOYEE_RECORD_COLUMNS if column in df.columns]
+    records = df[columns].astype(object).where(pd.notna(df[columns]), None).to_dict("records")
+    return json_response({"count": len(records), "employees": records})
+
+
+async def healthz(request):
+    """
+    稼働確認（インデックスのバージョンと社員数を返す）
+    """
+    retriever = get_current_retriever(request.app[RETRIEVER_KEY])
+    return json_response({
+        "status": "ok" if retriever is not None else "degraded",
+        "index_version": utils.get_index_version(retriever) if retriever is not None else None,
+        "employees": len(get_employee_engine().df),
+    })
+
+
+async def metrics(request):
+    """
+    メトリクス（回答・検索の所要時間、キャッシュのヒット、トークン数、順番待ちの長さなど）をPrometheusのテキスト形式で返す
+    """
+    return web.Response(body=render_prometheus().encode("utf-8"), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+
+async def read_params(request):
+    """
+    クエリ文字列とJSONのリクエストボディ（POSTの場合）を合わせたパラメータを取得
+    """
+    params = dict(request.query)
+    if request.method == "POST" and request.can_read_body:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise bad_request("リクエストボディがJSONではありません。")
+        if not isinstance(body, dict):
+            raise bad_request("リクエストボディはJSONオブジェクトで指定してください。")
+        params.update(body)
+    return params
+
+
+def require_text(params, name):
+    value = params.get(name)
+    if not isinstance(value, str) or not value.strip():
+        raise bad_request(f"パラメータ「{name}」を指定してください。")
+    return value.strip()
+
+
+def require_retriever(request):
+    # 社員名簿の更新を反映して共有のRetrieverを作り直した場合は、新しいものを使う
+    retriever = get_current_retriever(request.app[RETRIEVER_KEY])
+    if retriever is None:
+        raise web.HTTPServiceUnavailable(
+            text=json_dumps({"error": "文書検索機能が利用できません。"}), content_type="application/json"
+        )
+    return retriever
+
+
+def parse_int(value, default, maximum):
+    """
+    件数のパラメータを整数に変換（1〜上限の範囲に収める）
+    """
+    if value in (None, ""):
+        return default
+    try:
+        return max(1, min(int(value), maximum))
+    except (TypeError, ValueError):
+        raise bad_request(f"件数は整数で指定してください: {value}")
+
+
+def bad_request(message):
+    return web.HTTPBadRequest(text=json_dumps({"error": message}), content_type="application/json")
+
+
+def document_to_dict(doc):
+    return {"content": doc.page_content, "metadata": doc.metadata}
+
+
+def json_dumps(payload):
+    # メタデータに含まれる日付などは文字列に変換する
+    return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def json_response(payload):
+    return web.json_response(payload, dumps=json_dumps)
+
+
+async def start_stream(request):
+    response = web.StreamResponse(headers={"Content-Type": NDJSON_CONTENT_TYPE, "Cache-Control": "no-cache"})
+    await response.prepare(request)
+    return response
+
+
+async def send_event(response, payload):
+    await response.write((json_dumps(payload) + "\n").encode("utf-8"))
+
+
+async def start_server(app, host, port):
+    """
+    HTTPサーバーを起動（keep-aliveの接続は一定時間維持し、同じ呼び出し元からのリクエストで使い回す）
+
+    Returns:
+        停止時にcleanupを呼び出すAppRunner
+    """
+    runner = web.AppRunner(app, keepalive_timeout=ct.API_KEEPALIVE_TIMEOUT)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="社内情報の検索・回答生成・社員検索のHTTP API")
+    parser.add_argument("--host", default=ct.API_HOST)
+    parser.add_argument("--port", type=int, default=ct.API_PORT)
+    args = parser.parse_args()
+
+    # 画面と同じく、インデックスはプロセス全体で1回だけ作成して共有する
+    retriever = get_shared_retriever()
+    get_employee_engine()
+
+    # LLMの非同期クライアントが同じイベントループで使われるよう、サーバーも非同期エンジンのイベントループで動かす
+    engine = get_async_engine()
+    runner = engine.run(start_server(create_app(retriever), args.host, args.port))
+    print(f"HTTP APIを起動しました: http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.run(runner.cleanup())
+        close_clients()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+このファイルは、全セッションで共有する専用のイベントループ上で、RAGの処理（埋め込み・検索・回答生成）を非同期に実行するエンジンが記述されたファイルです。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class AsyncEngine:
+    """
+    専用スレッドで動き続けるイベントループと、ブロッキング処理を逃がすスレッドプール
+
+    Streamlitのスクリプトスレッドなどの同期のコードは、submit / run でコルーチンを投入して結果を待つ。
+    LLM・埋め込みモデルのAPI呼び出しはイベントループ上で非同期に行うため、
+    同時に処理できるリクエスト数がスレッド数に縛られない。
+    ベクトル検索などのCPU処理・ブロッキング処理は、to_thread でスレッドプールに逃がす。
+    """
+
+    def __init__(self, workers=ct.ASYNC_ENGINE_WORKERS):
+        self.loop = asyncio.new_event_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="async-engine-worker")
+        self.loop.set_default_executor(self.executor)
+        self._started = threading.Event()
+        self.thread = threading.Thread(target=self._run_loop, name="async-engine-loop", daemon=True)
+        self.thread.start()
+        self._started.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """
+        コルーチンをイベントループに投入（呼び出し元のコンテキスト変数（セッション状態・トレースのスパン）を引き継ぐ）
+
+        Returns:
+            結果を受け取るためのconcurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(_run_in_context(contextvars.copy_context(), coro), self.loop)
+
+    def run(self, coro, on_poll=None):
+        """
+        コルーチンをイベントループに投入し、完了するまで呼び出し元のスレッドで待つ
+
+        Args:
+            coro: 実行するコルーチン
+            on_poll: 待っている間、一定間隔で呼び出し元のスレッドから呼び出すコールバック（画面表示の更新用）
+
+        Returns:
+            コルーチンの戻り値
+        """
+        future = self.submit(coro)
+        try:
+            while True:
+                try:
+                    return future.result(timeout=ct.ASYNC_ENGINE_POLL_INTERVAL)
+                except concurrent.futures.TimeoutError:
+                    if on_poll is not None:
+                        on_poll()
+        except BaseException:
+            # 呼び出し元が中断された場合は、イベントループ側の処理もキャンセル
+            future.cancel()
+            raise
+
+    async def to_thread(self, fn, *args, **kwargs):
+        """
+        ブロッキングする関数を、エンジンのスレッドプールで実行して待つ（コンテキスト変数を引き継ぐ）
+        """
+        context = contextvars.copy_context()
+        return await self.loop.run_in_executor(self.executor, lambda: context.run(fn, *args, **kwargs))
+
+    def shutdown(self):
+        """
+        イベントループとスレッドプールを停止（プロセス終了時やテスト用）
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait=False)
+
+
+############################################################
+# 関数定義
+############################################################
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_async_engine():
+    """
+    プロセス全体で共有する非同期エンジンを取得
+
+    Returns:
+        AsyncEngineのインスタンス
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = AsyncEngine()
+    return _engine
+
+
+async def _run_in_context(context, coro):
+    """
+    呼び出し元のスレッドのコンテキスト変数を設定してから、コルーチンを実行
+    """
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+async def aembed_query(embeddings, text):
+    """
+    質問文の埋め込みベクトルを非同期に取得（非同期APIがない埋め込みモデルはスレッドプールで実行）
+    """
+    if hasattr(embeddings, "aembed_query"):
+        return await embeddings.aembed_query(text)
+    return await get_async_engine().to_thread(embeddings.embed_query, text)
@@ -0,0 +1,304 @@
+"""
+このファイルは、JSONLファイルに書かれた複数の質問に一括で回答するための処理が記述されたファイルです。
+質問の埋め込みはまとめて1回のリクエストで取得し、ベクトル検索は全質問分を1回の行列演算で行い、
+回答生成は同時実行数を制限して並行に行います。結果は回答ができた順にJSONLで出力します。
+
+使い方:
+    python batch_answer.py questions.jsonl -o answers.jsonl --concurrency 8
+    python batch_answer.py questions.jsonl --retrieve-only   # 検索結果のみ（LLMを使わない）
+
+入力ファイルの形式（1行に1件）:
+    {"id": "q1", "question": "経理部のスタッフを教えて"}
+    {"query": "営業部のマネージャーは誰ですか"}   # final_test.pyと同じ「query」キーも使える
+    "有給休暇の申請方法は？"                    # 文字列だけの行も使える
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+import weakref
+import numpy as np
+import constants as ct
+import utils
+from async_engine import get_async_engine
+from initialize_ultra_lite import get_shared_retriever
+from lexical_search import get_vectorstore_documents
+from llm_clients import get_llm, close_clients
+from llm_scheduler import LLMScheduler, ScheduledLLM, PRIORITY_LOW
+
+
+############################################################
+# クラス定義
+############################################################
+
+class VectorMatrix:
+    """
+    ベクターストアの全ドキュメントの埋め込みベクトルを、1つの行列にまとめたもの
+
+    複数の質問の検索を、質問ベクトルの行列との1回の行列積（コサイン類似度）で行う。
+    """
+
+    def __init__(self, documents, vectors):
+        self.documents = documents
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def search(self, query_vectors, k=ct.RAG_SEARCH_K):
+        """
+        複数の質問ベクトルそれぞれについて、類似度の高い順にドキュメントを取得
+
+        Args:
+            query_vectors: 質問ベクトルのリスト
+            k: 質問ごとに取得する件数
+
+        Returns:
+            質問ごとの [(ドキュメント, 類似度), ...] のリスト
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ self.vectors.T
+        k = min(k, len(self.documents))
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+
+        # 上位k件だけを部分ソートで取り出してから、k件の中を並べ替える
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [
+            [(self.documents[position], float(score)) for position, score in zip(row, row_scores)]
+            for row, row_scores in zip(top, top_scores)
+        ]
+
+
+############################################################
+# 関数定義
+############################################################
+_matrices = weakref.WeakKeyDictionary()
+_matrices_lock = threading.Lock()
+
+
+def get_vector_matrix(vectorstore):
+    """
+    ベクターストアのドキュメントと埋め込みベクトルの行列を取得（ベクターストアごとに1回だけ作成）
+
+    Returns:
+        VectorMatrixのインスタンス（ベクトルを取り出せないベクターストアの場合はNone）
+    """
+    with _matrices_lock:
+        matrix = _matrices.get(vectorstore)
+        if matrix is None:
+            matrix = _build_vector_matrix(vectorstore)
+            if matrix is None:
+                return None
+            _matrices[vectorstore] = matrix
+        return matrix
+
+
+def _build_vector_matrix(vectorstore):
+    # FAISS（インデックスの登録順にベクトルを取り出す）
+    index = getattr(vectorstore, "index", None)
+    index_to_docstore_id = getattr(vectorstore, "index_to_docstore_id", None)
+    if index is not None and index_to_docstore_id is not None:
+        try:
+            vectors = index.reconstruct_n(0, index.ntotal)
+            documents = [vectorstore.docstore.search(index_to_docstore_id[i]) for i in range(index.ntotal)]
+            return VectorMatrix(documents, vectors)
+        except Exception as e:
+            print(f"ベクトルの取り出しエラー: {e}")
+            return None
+
+    # InMemoryVectorStore
+    store = getattr(vectorstore, "store", None)
+    if isinstance(store, dict) and store:
+        items = list(store.values())
+        documents = get_vectorstore_documents(vectorstore)
+        return VectorMatrix(documents, [item["vector"] for item in items])
+    return None
+
+
+def search_batch(vectorstore, query_vectors, k=ct.RAG_SEARCH_K):
+    """
+    複数の質問ベクトルの検索をまとめて実行（行列にできないベクターストアの場合は1件ずつ検索）
+
+    Returns:
+        質問ごとの [(ドキュメント, 類似度), ...] のリスト（類似度を取得できない場合はNone）
+    """
+    matrix = get_vector_matrix(vectorstore)
+    if matrix is not None:
+        return matrix.search(query_vectors, k)
+    return [
+        [(doc, None) for doc in vectorstore.similarity_search_by_vector(vector, k=k)]
+        for vector in query_vectors
+    ]
+
+
+def read_questions(lines):
+    """
+    JSONLの各行から質問を読み込む（空行は読み飛ばす）
+
+    Returns:
+        「question」キーに質問文を持つ辞書のリスト（入力のその他のキーはそのまま残す）
+    """
+    items = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if isinstance(record, str):
+            record = {"question": record}
+        question = record.get("question") or record.get("query")
+        if not isinstance(question, str) or not question.strip():
+            raise ValueError(f"{line_number}行目に質問（question / query）がありません。")
+        items.append({**record, "question": question.strip()})
+    return items
+
+
+def source_to_dict(doc, score):
+    return {
+        "source": doc.metadata.get("source"),
+        "page": doc.metadata.get("page"),
+        "score": score,
+    }
+
+
+async def aanswer_batch(items, retriever, k=ct.RAG_SEARCH_K, concurrency=ct.BATCH_CONCURRENCY,
+                        retrieve_only=False, scheduler=None):
+    """
+    複数の質問に一括で回答（非同期エンジン上で実行）
+
+    質問は ct.BATCH_EMBED_SIZE 件ごとに、埋め込みの取得とベクトル検索をまとめて行う。
+    画面と同じく、社員名簿で答えられる質問はLLMを使わずに回答する（retrieve_only の場合を除く）。
+
+    Args:
+        items: read_questions で読み込んだ質問のリスト
+        retriever: 検索に使うRetriever
+        k: 質問ごとに取得する関連ドキュメント数
+        concurrency: 同時に実行する回答生成の数
+        retrieve_only: 検索結果のみを返し、回答生成を行わない
+        scheduler: LLM呼び出しに使うスケジューラ（省略時はプロセス全体で共有するもの）
+
+    Yields:
+        質問ごとの結果の辞書（入力の順番は「index」に入る。回答ができた順に返す）
+    """
+    engine = get_async_engine()
+    vectorstore = retriever.vectorstore
+    # 画面からの質問を待たせないよう、一括回答は低い優先度で実行
+    llm = ScheduledLLM(get_llm(), ct.BATCH_SESSION_ID, priority=PRIORITY_LOW, scheduler=scheduler)
+    pending = set()
+
+    async def answer_one(index, item, hits):
+        started_at = time.monotonic()
+        question = item["question"]
+        docs = [doc for doc, _ in hits]
+        result = {**item, "index": index, "sources": [source_to_dict(doc, score) for doc, score in hits]}
+        try:
+            context_text = await engine.to_thread(utils.build_context_text, docs, question)
+            result["answer"] = (await llm.ainvoke(utils.build_rag_messages(question, context_text))).content
+        except Exception as e:
+            result["error"] = str(e)
+        result["elapsed"] = time.monotonic() - started_at
+        return result
+
+    for start in range(0, len(items), ct.BATCH_EMBED_SIZE):
+        chunk = list(enumerate(items[start:start + ct.BATCH_EMBED_SIZE], start))
+
+        rag_items = chunk
+        if not retrieve_only:
+            structured = await engine.to_thread(
+                lambda: [utils.answer_structured_query(item["question"]) for _, item in chunk]
+            )
+            rag_items = []
+            for (index, item), response in zip(chunk, structured):
+                if response is None:
+                    rag_items.append((index, item))
+                else:
+                    yield {**item, "index": index, "answer": response["answer"], "sources": [], "structured": True}
+        if not rag_items:
+            continue
+
+        # 埋め込みはまとめて1回のリクエストで取得し、検索は全質問分を1回の行列演算で行う
+        questions = [item["question"] for _, item in rag_items]
+        vectors = await vectorstore.embeddings.aembed_documents(questions)
+        all_hits = await engine.to_thread(search_batch, vectorstore, vectors, k)
+
+        for (index, item), hits in zip(rag_items, all_hits):
+            if retrieve_only:
+                yield {**item, "index": index, "sources": [source_to_dict(doc, score) for doc, score in hits]}
+                continue
+            # 実行中の回答生成が上限に達している間は、次の質問を始めずに完了したものから返す
+            while len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            pending.add(asyncio.create_task(answer_one(index, item, hits)))
+
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield task.result()
+
+
+async def run_batch(items, retriever, output, **kwargs):
+    """
+    一括回答を実行し、結果を1件ずつJSONLで書き出す
+
+    Returns:
+        書き出した件数
+    """
+    count = 0
+    async for result in aanswer_batch(items, retriever, **kwargs):
+        output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+        output.flush()
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSONLファイルの質問に一括で回答")
+    parser.add_argument("input", help="質問のJSONLファイル（「-」で標準入力）")
+    parser.add_argument("-o", "--output", default="-", help="結果のJSONLファイル（既定は標準出力）")
+    parser.add_argument("-k", type=int, default=ct.RAG_SEARCH_K, help="質問ごとに取得する関連ドキュメント数")
+    parser.add_argument("--concurrency", type=int, default=ct.BATCH_CONCURRENCY, help="同時に実行する回答生成の数")
+    parser.add_argument("--retrieve-only", action="store_true", help="検索結果のみを出力し、回答生成を行わない")
+    args = parser.parse_args()
+
+    if args.input == "-":
+        items = read_questions(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            items = read_questions(f)
+
+    retriever = get_shared_retriever()
+    if retriever is None:
+        sys.exit("文書検索機能が利用できないため、一括回答を実行できません。")
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    started_at = time.monotonic()
+    try:
+        count = get_async_engine().run(run_batch(
+            items, retriever, output, k=args.k, concurrency=args.concurrency,
+            retrieve_only=args.retrieve_only,
+            # このプロセスの回答生成はすべて一括回答のため、同時実行数の上限は指定値に合わせる
+            scheduler=LLMScheduler(max_concurrency=args.concurrency),
+        ))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        close_clients()
+    print(f"{count}件の質問に回答しました（{time.monotonic() - started_at:.1f}秒）", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+このファイルは、OpenAI APIを使わずに、RAGの各処理段階の性能を計測するベンチマークです。
+埋め込みモデル・LLMは、同じ入力には常に同じ結果を返すスタブ（stub_models.py）に差し替えて計測します。
+
+計測する指標:
+    ingestion    ./dataのファイル読み込み（件数・文字数あたりの処理速度）
+    scale_N      ./dataのコーパスをN倍に複製したコーパスでの、
+                 チャンク分割・インデックス作成・検索（p50/p99）・文脈の作成（p50/p99）・
+                 get_llm_responseの全体（p50/p99）の所要時間
+
+使い方:
+    python benchmark.py run                          # 結果は ./logs/benchmarks にJSONで保存
+    python benchmark.py run --scales 1 10 -o result.json
+    python benchmark.py compare baseline.json result.json   # 劣化した指標があれば終了コード1
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import constants as ct
+
+
+############################################################
+# 定数定義
+############################################################
+# 計測に使う質問（final_test.py・investigate_keiri_issue.pyの質問と、社内文書に関する質問）
+BENCHMARK_QUERIES = [
+    "人事部に所属している従業員情報を一覧化して",
+    "営業部のマネージャーは誰ですか",
+    "IT部の社員は何人いますか？",
+    "経理部のスタッフを教えて",
+    "経理部のアシスタントは誰ですか",
+    "総務部の従業員一覧を表示して",
+    "MTGの議事録について教えて",
+    "新入社員研修について",
+    "株主優待の内容を教えて",
+    "EcoTee Creatorの使い方は？",
+    "代行出荷サービスの料金体系について",
+    "環境・エシカルへの取り組みについて教えて",
+]
+
+
+############################################################
+# クラス定義
+############################################################
+
+class TimedEmbeddings:
+    """
+    埋め込みモデルの呼び出しにかかった時間を記録するラッパー（インデックス作成時間の内訳用）
+    """
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.seconds = 0.0
+
+    def __getattr__(self, name):
+        # モデル名などは元の埋め込みモデルのものを参照
+        return getattr(self.embeddings, name)
+
+    def embed_documents(self, texts):
+        started_at = time.perf_counter()
+        try:
+            return self.embeddings.embed_documents(texts)
+        finally:
+            self.seconds += time.perf_counter() - started_at
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        return await self.embeddings.aembed_query(text)
+
+
+############################################################
+# 関数定義
+############################################################
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else None
+
+
+def timed(fn, *args, **kwargs):
+    started_at = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started_at
+
+
+def get_vectorstore_class():
+    """
+    本番と同じFAISSを使う（インストールされていない場合はInMemoryVectorStoreで代替）
+    """
+    try:
+        import faiss  # noqa: F401
+        from langchain_community.vectorstores import FAISS
+        return FAISS
+    except ImportError:
+        from langchain_core.vectorstores import InMemoryVectorStore
+        return InMemoryVectorStore
+
+
+def scale_documents(documents, scale):
+    """
+    ドキュメントをscale倍に複製した合成コーパスを作成
+
+    複製したドキュメントは埋め込みベクトルが重複しないよう、本文の先頭に複製番号を付け、出典も別のものにする。
+    """
+    from langchain.schema import Document
+
+    scaled = list(documents)
+    for copy in range(1, scale):
+        for doc in documents:
+            metadata = {**doc.metadata, "source": f"{doc.metadata.get('source', '')}#copy{copy}"}
+            scaled.append(Document(page_content=f"[{copy}] {doc.page_content}", metadata=metadata))
+    return scaled
+
+
+def measure_ingestion():
+    """
+    ./dataのファイル読み込みの処理速度を計測
+
+    Returns:
+        指標の辞書と、読み込んだ社内文書・社員名簿のドキュメントのリスト
+    """
+    from initialize_ultra_lite import load_source_documents
+    from utils import create_csv_documents
+
+    source_docs, load_seconds = timed(load_source_documents)
+    csv_docs, csv_seconds = timed(create_csv_documents)
+    documents = len(source_docs) + len(csv_docs)
+    characters = sum(len(doc.page_content) for doc in source_docs + csv_docs)
+    seconds = load_seconds + csv_seconds
+    return {
+        "documents": documents,
+        "characters": characters,
+        "ingest_seconds": seconds,
+        "ingest_docs_per_second": documents / seconds if seconds else None,
+        "ingest_chars_per_second": characters / seconds if seconds else None,
+    }, source_docs, csv_docs
+
+
+def measure_scale(source_docs, csv_docs, scale, repeat, dimensions):
+    """
+    N倍に複製したコーパスで、チャンク分割から回答生成までの各処理段階の所要時間を計測
+
+    Returns:
+        指標の辞書
+    """
+    import streamlit as st
+    import utils
+    from initialize_ultra_lite import split_documents, build_retriever
+    from stub_models import StubEmbeddings
+
+    scaled_source = scale_documents(source_docs, scale)
+    scaled_csv = scale_documents(csv_docs, scale)
+
+    chunks, split_seconds = timed(split_documents, scaled_source)
+    documents = scaled_csv + chunks
+
+    embeddings = TimedEmbeddings(StubEmbeddings(dimensions))
+    retriever, build_seconds = timed(build_retriever, documents, embeddings, get_vectorstore_class())
+
+    retrieval, packing = [], []
+    for _ in range(repeat):
+        for query in BENCHMARK_QUERIES:
+            docs, seconds = timed(retriever.invoke, query)
+            retrieval.append(seconds)
+            _, seconds = timed(utils.build_context_text, docs, query)
+            packing.append(seconds)
+
+    # 画面からの呼び出しと同じく、セッションのRetrieverを使って回答を生成
+    st.session_state.retriever = retriever
+    end_to_end = []
+    for _ in range(repeat):
+        for query in BENCHMARK_QUERIES:
+            _, seconds = timed(utils.get_llm_response, query)
+            end_to_end.append(seconds)
+
+    return {
+        "chunks": len(chunks),
+        "indexed_documents": len(documents),
+        "split_seconds": split_seconds,
+        "index_build_seconds": build_seconds,
+        "index_embed_seconds": embeddings.seconds,
+        "retrieval_p50_ms": percentile_ms(retrieval, 50),
+        "retrieval_p99_ms": percentile_ms(retrieval, 99),
+        "pack_p50_ms": percentile_ms(packing, 50),
+        "pack_p99_ms": percentile_ms(packing, 99),
+        "e2e_p50_ms": percentile_ms(end_to_end, 50),
+        "e2e_p99_ms": percentile_ms(end_to_end, 99),
+    }
+
+
+def run_benchmark(scales=ct.BENCHMARK_SCALES, repeat=ct.BENCHMARK_REPEAT, dimensions=ct.BENCHMARK_EMBEDDING_DIMENSIONS):
+    """
+    ベンチマークを実行
+
+    Returns:
+        計測結果の辞書（"stages" に、計測対象ごとの指標の辞書を持つ）
+    """
+    ingestion, source_docs, csv_docs = measure_ingestion()
+    stages = {"ingestion": ingestion}
+    for scale in scales:
+        print(f"計測中: コーパス{scale}倍", file=sys.stderr)
+        stages[f"scale_{scale}"] = measure_scale(source_docs, csv_docs, scale, repeat, dimensions)
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "vectorstore": get_vectorstore_class().__name__,
+            "embedding_dimensions": dimensions,
+            "repeat": repeat,
+            "queries": len(BENCHMARK_QUERIES),
+        },
+        "stages": stages,
+    }
+
+
+def lower_is_better(metric):
+    """
+    指標が小さいほど良いもの（所要時間）か、大きいほど良いもの（処理速度）かを判定
+    """
+    return not metric.endswith("_per_second")
+
+
+def compare_results(baseline, current, tolerance=ct.BENCHMARK_REGRESSION_TOLERANCE, min_delta_ms=ct.BENCHMARK_MIN_DELTA_MS):
+    """
+    基準の計測結果と比べて、性能が劣化した指標を検出
+
+    件数（chunksなど）の指標は比較しない。
+
+    Returns:
+        (計測対象, 指標, 基準値, 今回の値, 変化率, 劣化かどうか) のリスト
+    """
+    rows = []
+    for stage, metrics in current["stages"].items():
+        base_metrics = baseline["stages"].get(stage, {})
+        for metric, value in metrics.items():
+            base = base_metrics.get(metric)
+            timing = metric.endswith(("_seconds", "_ms", "_per_second"))
+            if not timing or base in (None, 0) or value is None:
+                continue
+            change = (value - base) / base
+            worse = change if lower_is_better(metric) else -change
+            delta_ms = abs(value - base) * (1000 if metric.endswith("_seconds") else 1)
+            # 処理速度の指標は差を時間に換算できないため、変化率のみで判定する
+            noise = metric.endswith(("_seconds", "_ms")) and delta_ms < min_delta_ms
+            rows.append((stage, metric, base, value, change, worse > tolerance and not noise))
+    return rows
+
+
+def print_comparison(rows):
+    for stage, metric, base, value, change, regressed in rows:
+        mark = "❌ 劣化" if regressed else "  "
+        print(f"{mark:6} {stage:12} {metric:26} {base:14.3f} → {value:14.3f} ({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAGの処理段階ごとの性能ベンチマーク（スタブのLLM・埋め込みモデルを使用）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="ベンチマークを実行し、結果をJSONで保存")
+    run_parser.add_argument("--scales", type=int, nargs="+", default=list(ct.BENCHMARK_SCALES))
+    run_parser.add_argument("--repeat", type=int, default=ct.BENCHMARK_REPEAT)
+    run_parser.add_argument("--dimensions", type=int, default=ct.BENCHMARK_EMBEDDING_DIMENSIONS)
+    run_parser.add_argument("-o", "--output", help="結果のJSONファイル（既定は ./logs/benchmarks/benchmark_日時.json）")
+
+    compare_parser = subparsers.add_parser("compare", help="基準の結果と比べて、劣化した指標を検出")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=ct.BENCHMARK_REGRESSION_TOLERANCE)
+    compare_parser.add_argument("--min-delta-ms", type=float, default=ct.BENCHMARK_MIN_DELTA_MS)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        # 埋め込みモデル・LLMは、APIを呼び出さないスタブに差し替える（get_llm / get_embeddingsを呼び出す前に設定）
+        os.environ[ct.LLM_BACKEND_ENV] = "stub"
+        # Streamlitの画面外で実行する際の警告（セッション状態が使えない旨）を抑止
+        from streamlit.logger import set_log_level
+        set_log_level("error")
+        result = run_benchmark(args.scales, args.repeat, args.dimensions)
+        output = args.output
+        if output is None:
+            os.makedirs(ct.BENCHMARK_DIR_PATH, exist_ok=True)
+            output = os.path.join(ct.BENCHMARK_DIR_PATH, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(json.dumps(result["stages"], ensure_ascii=False, indent=2))
+        print(f"結果を保存しました: {output}", file=sys.stderr)
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    rows = compare_results(baseline, current, args.tolerance, args.min_delta_ms)
+    print_comparison(rows)
+    regressions = [row for row in rows if row[-1]]
+    if regressions:
+        print(f"\n{len(regressions)}件の指標で性能が劣化しています。")
+        sys.exit(1)
+    print("\n性能の劣化は見つかりませんでした。")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,7 @@ LINK_SOURCE_ICON = ":material/link: "
 WARNING_ICON = ":material/warning:"
 ERROR_ICON = ":material/error:"
 SPINNER_TEXT = "回答生成中..."
+SPINNER_QUEUE_TEXT = "回答生成中...（混み合っています。順番待ち: {position}番目）"
 
 
 # ==========================================
@@ -37,6 +38,52 @@ LOGGER_NAME = "ApplicationLog"
 LOG_FILE = "application.log"
 APP_BOOT_MESSAGE = "アプリが起動されました。"
 
+# 処理段階ごとのトレース（tracing.py）の設定
+TRACE_ENABLED_ENV = "RAG_TRACE"                 # 「0」を指定するとトレースを出力しない
+TRACE_FILE_PATH = "./logs/traces/spans.jsonl"
+TRACE_OTLP_ENDPOINT_ENV = "RAG_OTLP_ENDPOINT"   # 指定するとOTLP/HTTP（JSON）でも送信する（例: http://127.0.0.1:4318/v1/traces）
+TRACE_SERVICE_NAME = "rag-chatbot"
+TRACE_EXPORT_BATCH_SIZE = 64                    # まとめて出力するスパンの最大数
+TRACE_EXPORT_INTERVAL_SECONDS = 1.0             # スパンがまとまらなくても出力する間隔（秒）
+TRACE_OTLP_TIMEOUT_SECONDS = 3.0
+TRACE_OTLP_STUB_PORT = 4318                     # スタブのコレクター（stub_otlp_collector.py）のポート番号
+
+# メトリクス（metrics.py）の設定
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464                   # Streamlitのプロセス内のメトリクスを返すHTTPサーバーのポート番号（/metrics）
+METRICS_PORT_ENV = "RAG_METRICS_PORT"  # 「0」を指定するとHTTPサーバーを起動しない
+METRICS_SIGNIFICANT_DIGITS = 3        # 所要時間のヒストグラムの有効桁数（パーセンタイルの相対誤差1%以内）
+METRICS_QUANTILES = (0.5, 0.95, 0.99)
+
+# 管理者用ページ（admin.py）の設定。URLに「?admin=<トークン>」を指定した場合のみ表示する
+ADMIN_QUERY_PARAM = "admin"
+ADMIN_TOKEN_ENV = "RAG_ADMIN_TOKEN"   # 未設定の場合は管理者用ページを表示しない
+ADMIN_REFRESH_SECONDS = 5             # グラフの更新間隔（秒）
+ADMIN_WINDOW_SECONDS = 60             # パーセンタイルを計算する直近の期間（秒）
+ADMIN_HISTORY_POINTS = 120            # グラフに表示する点の数
+
+# 遅い質問のログ（slow_query_log.py）の設定
+SLOW_QUERY_LOGGER_NAME = "SlowQueryLog"
+SLOW_QUERY_LOG_FILE = "slow_queries.log"
+SLOW_QUERY_THRESHOLD_SECONDS = 8.0                # 回答生成の所要時間がこの秒数以上の質問を記録する
+SLOW_QUERY_THRESHOLD_ENV = "RAG_SLOW_QUERY_SECONDS"
+SLOW_QUERY_SAMPLE_RATE = 0.25                     # 閾値を超えた質問のうち記録する割合（プロファイルを取得した質問は必ず記録）
+SLOW_QUERY_PROFILE_SECONDS = 20.0                 # 処理中にこの秒数を超えた質問は、終了までのスタックを記録してプロファイルを保存
+SLOW_QUERY_WATCH_INTERVAL_SECONDS = 1.0           # 処理中の質問の所要時間を確認する間隔（秒）
+SLOW_QUERY_PROFILE_DIR_PATH = "./logs/slow_queries"
+
+# プロファイラー（profiling.py）の設定
+PROFILE_SAMPLE_INTERVAL_SECONDS = 0.005           # スタックを記録する間隔（秒）
+PROFILE_DIR_PATH = "./logs/profiles"
+PROFILE_REQUESTS_ENV = "RAG_PROFILE_REQUESTS"     # 指定すると、起動後の最初のN件の回答生成をプロファイルする
+PROFILE_MODE_ENV = "RAG_PROFILE_MODE"             # プロファイルの方法（PROFILE_MODESのいずれか。既定は先頭）
+PROFILE_MODES = ("sampler", "cprofile", "tracemalloc")
+PROFILE_QUERY_PARAM = "profile"                   # 管理者用ページで「&profile=N」を指定すると、次のN件をプロファイルする
+PROFILE_MODE_QUERY_PARAM = "profile_mode"
+PROFILE_MAX_REQUESTS = 100                        # 一度にプロファイルを指定できる件数の上限
+PROFILE_TRACEMALLOC_FRAMES = 25                   # メモリ割り当て時に記録するスタックの段数
+PROFILE_TRACEMALLOC_TOP = 30                      # メモリ割り当ての増加量の上位を出力する件数
+
 
 # ==========================================
 # LLM設定系
@@ -44,6 +91,37 @@ APP_BOOT_MESSAGE = "アプリが起動されました。"
 MODEL = "gpt-4o-mini"
 TEMPERATURE = 0.5
 
+# LLM・埋め込みモデルのAPI呼び出しで共有するHTTP接続プールの設定
+LLM_POOL_MAX_CONNECTIONS = 20     # 同時に張る接続数の上限
+LLM_POOL_MAX_KEEPALIVE = 10       # 使い回すために維持しておく接続数の上限
+LLM_POOL_KEEPALIVE_EXPIRY = 60.0  # 使われていない接続を維持する秒数
+LLM_HTTP2 = True                  # h2パッケージがインストールされている場合はHTTP/2を使う
+LLM_CONNECT_TIMEOUT = 5.0         # 接続確立のタイムアウト（秒）
+LLM_REQUEST_TIMEOUT = 60.0        # 1リクエストのタイムアウト（秒）
+LLM_MAX_RETRIES = 2
+
+# LLM・埋め込みモデルの切り替え（ベンチマーク・負荷試験用）
+LLM_BACKEND_ENV = "RAG_LLM_BACKEND"        # 「stub」を指定すると、APIを呼び出さないスタブを使う
+LLM_STUB_LATENCY_ENV = "RAG_STUB_LATENCY"  # スタブのLLMが最初のトークンを返すまでの秒数
+
+# LLMの同時呼び出し数の制限（プロセス全体のスケジューラ）の設定
+LLM_MAX_CONCURRENCY = 8                  # 同時に実行するLLM呼び出し数の上限
+LLM_SCHEDULER_SHORT_QUERY_LENGTH = 30    # この文字数以下の質問は優先して実行する
+LLM_SCHEDULER_AGING_SECONDS = 10.0       # 待ち時間がこの秒数を超えるごとに優先度を1段階引き上げる
+LLM_SCHEDULER_POLL_INTERVAL = 0.5        # 順番待ちの間、待ち順位を画面に反映する間隔（秒）
+LLM_SCHEDULER_LOG_WAIT_SECONDS = 1.0     # 待ち時間がこの秒数以上の場合にログ出力する
+LLM_SCHEDULER_METRICS_WINDOW = 1000      # 待ち時間の統計に使う直近のリクエスト数
+LLM_SCHEDULER_MAX_TRACKED_SESSIONS = 1000
+
+# 応答の遅いLLM呼び出しに対するヘッジリクエスト（同じリクエストをもう1本送る）の設定
+HEDGE_ENABLED = True
+HEDGE_PERCENTILE = 95            # 最初のトークンがこのパーセンタイルのTTFTを過ぎても届かない場合にヘッジする
+HEDGE_MIN_SAMPLES = 20           # TTFTの記録がこの件数に満たない間はヘッジしない
+HEDGE_MIN_DELAY_SECONDS = 0.3    # ヘッジするまでの待ち時間の下限（秒）
+HEDGE_LATENCY_WINDOW = 500       # パーセンタイルの計算に使う直近の記録数
+HEDGE_BUDGET_RATIO = 0.05        # ヘッジによる追加リクエストを、全リクエストのこの割合までに抑える
+HEDGE_BUDGET_BURST = 3           # 一時的に許容する連続ヘッジ数
+
 
 # ==========================================
 # RAG参照用のデータソース系
@@ -69,10 +147,211 @@ RAG_SEARCH_K = 5
 CHUNK_SIZE = 800           # チャンクの最大文字数（500→800に増加：より多くの文脈を保持）
 CHUNK_OVERLAP = 100        # チャンク間の重複文字数（50→100に増加：文脈の連続性向上）
 CHUNK_SEPARATOR = "\n"     # チャンク分割の区切り文字
+CHUNK_SPLITTER = "recursive"          # チャンク分割の方法（recursive: 区切り文字を順に試す / character: 1つの区切り文字で分割 / token: recursiveをトークン数で分割）
+CHUNK_SEPARATORS = [CHUNK_SEPARATOR]  # チャンク分割で使う区切り文字（recursive・tokenは先頭から順に試す）
+
+# LLMに渡す文脈（検索結果）のトークン数の上限
+CONTEXT_TOKEN_BUDGET = 3000
+# 上限に収まらないチャンクを切り詰めて含める場合の最小トークン数（これ未満の残りは使わない）
+CONTEXT_MIN_TRUNCATE_TOKENS = 200
+# トークン数の計算に使うエンコーディング（モデル名から判定できない場合）
+TOKENIZER_FALLBACK_ENCODING = "o200k_base"
+
+# 会話履歴をもとにした質問の書き換え（LLM呼び出し）を行うかの判定設定
+# 指示語・省略を示す表現（含まれていれば書き換える）
+REWRITE_REFERENCE_MARKERS = [
+    "それ", "その", "これ", "この", "あれ", "あの", "そこ", "そちら", "こちら",
+    "彼", "彼女", "前者", "後者", "上記", "同じ", "先ほど", "さっき", "他には", "ほかには",
+    "もっと", "詳しく", "具体的に", "ちなみに",
+]
+# 指示語の前後に続いても1語とみなす助詞（「それは」は指示語、「それぞれ」は指示語でない）
+REWRITE_MARKER_PARTICLES = "はがをにのでともへやか"
+# 質問の書き出しが続きの発話であることを示す表現
+REWRITE_LEADING_MARKERS = ["では", "じゃあ", "じゃ", "で、", "また", "あと", "それと", "ちなみに", "他の", "ほかの"]
+REWRITE_STANDALONE_MIN_LENGTH = 12   # 指示語がなくこの文字数以上の質問は、単独で意味が通るものとみなす
+REWRITE_SIMILARITY_THRESHOLD = 0.8  # 短い質問で、直前の質問との類似度がこれ以上なら話題の続きとみなす
+REWRITE_EMBEDDING_CACHE_SIZE = 64
+REWRITE_SPECULATIVE_WORKERS = 4      # 元の質問での検索を先行実行するスレッド数
+
+# 回答生成全体の制限時間（秒）と、処理段階ごとの時間配分（秒）
+REQUEST_DEADLINE_SECONDS = 30.0
+REQUEST_STAGE_BUDGETS = {
+    "embed": 3.0,        # 質問の埋め込み
+    "search": 2.0,       # ベクトル検索
+    "pack": 1.0,         # 文脈の作成（トークン数の上限内に詰める）
+    "completion": 25.0,  # LLMによる回答生成（順番待ちを含む）
+    "coalesce": 15.0,    # 同時に来た同じ質問の処理の結果を待つ時間（超えた場合は自分で実行）
+}
+# 同期の処理段階（Deadline.run）を実行中のスレッド数の上限（時間切れ後も処理が終わるまでは数える）
+REQUEST_STAGE_MAX_THREADS = 32
+# 文脈の作成が時間切れの場合に、検索結果をそのまま連結して渡す文字数の上限
+REQUEST_FALLBACK_CONTEXT_CHARS = 4000
+# 時間切れで処理を省略した場合に、回答の末尾に付ける注記
+REQUEST_LEXICAL_FALLBACK_NOTE = "※ 検索が時間内に完了しなかったため、キーワード一致による検索結果をもとに回答しています。"
+REQUEST_SOURCES_ONLY_MESSAGE = "回答の生成が時間内に完了しなかったため、関連する情報のみを表示します。時間をおいて再度お試しください。"
+
+# 同時に来た同じ質問の処理の結果を待つ間、画面表示を更新する間隔（秒）
+SINGLE_FLIGHT_POLL_INTERVAL = 0.2
+
+# 全セッション共有の非同期エンジン（専用のイベントループ）の設定
+ASYNC_ENGINE_WORKERS = 16           # ベクトル検索などのブロッキング処理を実行するスレッド数
+ASYNC_ENGINE_POLL_INTERVAL = 0.2    # 結果を待つ間、画面表示を更新する間隔（秒）
+
+# ベクトル検索の代替に使う語彙検索（文字n-gramのBM25）の設定
+LEXICAL_NGRAM = 2
+LEXICAL_BM25_K1 = 1.2
+LEXICAL_BM25_B = 0.75
+
+# HTTP API（api_server.py）の設定
+API_HOST = "127.0.0.1"
+API_PORT = 8080
+API_KEEPALIVE_TIMEOUT = 75.0     # 使われていない接続（keep-alive）を維持する秒数
+API_MAX_SEARCH_K = 50            # /search で一度に取得できる件数の上限
+API_MAX_EMPLOYEES = 200          # /employees で一度に返す社員数の上限
+API_SESSION_HEADER = "X-Session-Id"  # LLM呼び出しの順番待ちで、呼び出し元を区別するためのヘッダー
+
+# 一括回答（batch_answer.py）の設定
+BATCH_EMBED_SIZE = 500       # 1回の埋め込みリクエストにまとめる質問数
+BATCH_CONCURRENCY = 8        # 同時に実行する回答生成の数
+BATCH_SESSION_ID = "batch"   # LLM呼び出しの順番待ちで使うセッションID
+
+# ベンチマーク（benchmark.py）の設定
+BENCHMARK_DIR_PATH = "./logs/benchmarks"
+BENCHMARK_SCALES = (1, 10, 100)          # ./dataのコーパスを何倍に複製して計測するか
+BENCHMARK_REPEAT = 5                     # 検索・文脈の作成・回答生成を計測する、質問ごとの繰り返し回数
+BENCHMARK_EMBEDDING_DIMENSIONS = 1536    # スタブの埋め込みベクトルの次元数（text-embedding-3-smallと同じ）
+BENCHMARK_REGRESSION_TOLERANCE = 0.2     # 基準値よりこの割合以上悪化した指標を、性能の劣化として検出する
+BENCHMARK_MIN_DELTA_MS = 1.0             # 差がこのミリ秒未満の指標は、誤差として劣化とみなさない
+
+# 検索品質の評価（evaluate_retrieval.py）の設定
+EVAL_QUERIES_PATH = "./eval_queries.jsonl"   # 質問と、検索されるべきドキュメント（正解）の一覧
+EVAL_DIR_PATH = "./logs/eval"
+EVAL_K_VALUES = (3, 5, 8)                   # 評価する取得件数（RAG_SEARCH_Kの候補）
+EVAL_INDEXES = ("vector", "lexical")        # 評価するインデックス（ベクトル検索・語彙検索）
+
+# チャンク分割の設定の探索（tune_chunking.py）の設定
+CHUNK_TUNING_DIR_PATH = "./logs/chunk_tuning"
+EMBEDDING_CACHE_PATH = "./logs/embedding_cache"   # 埋め込みベクトルのキャッシュ（同じチャンクは設定を変えても埋め込み直さない）
+CHUNK_TUNING_SPLITTERS = ("recursive", "character", "token")
+CHUNK_TUNING_SIZES = (400, 600, 800, 1200)
+CHUNK_TUNING_OVERLAPS = (0, 50, 100, 200)
+CHUNK_TUNING_SEPARATORS = {
+    "newline": ["\n"],
+    "paragraph": ["\n\n", "\n", ""],
+    "sentence": ["\n\n", "\n", "。", "、", ""],
+}
+# パレート最適（他のすべての指標で劣らず、いずれかで勝る設定がない）かを判定する指標
+CHUNK_TUNING_OBJECTIVES = ("recall_at_k", "embedding_tokens", "index_bytes", "search_p50_ms")
+
+# 負荷試験（load_test.py）の設定
+LOAD_TEST_DIR_PATH = "./logs/load_tests"
+LOAD_TEST_SESSIONS = (1, 5, 10, 20, 50)   # 段階的に増やす同時セッション数
+LOAD_TEST_DURATION_SECONDS = 30.0         # 同時セッション数ごとの計測時間（秒）
+LOAD_TEST_STUB_LATENCY = 0.5              # スタブのLLMが最初のトークンを返すまでの秒数
+LOAD_TEST_STUB_PORT = 8765                # スタブのAPIサーバーのポート番号（backend=httpの場合）
+LOAD_TEST_SATURATION_GAIN = 0.1           # セッション数を増やしてもスループットの伸びがこの割合未満なら飽和とみなす
+LOAD_TEST_LATENCY_SLO_SECONDS = 10.0      # 応答時間のp95がこの秒数を超えたら飽和とみなす
+
+# ログからの実際の質問の再生（replay_log.py）の設定
+REPLAY_DIR_PATH = "./logs/replays"
+REPLAY_SPEED = 1.0                  # 再生速度（1.0で記録どおりの間隔、0で間隔を空けずに再生）
+REPLAY_MAX_IDLE_SECONDS = 60.0      # 記録上の質問の間隔がこの秒数を超える場合は、この秒数に詰めて再生
+REPLAY_MAX_WORKERS = 16             # 同時に処理する質問の最大数
+REPLAY_CACHE_SIZES = (64, 256, 1024)  # ヒット率を試算する回答キャッシュの件数
 
 # 軽量初期化時の最大ファイル読み込み数
 MAX_FILES_LITE = 5
 
+
+# ==========================================
+# 会話履歴（メモリ）設定系
+# ==========================================
+# LLMに渡す会話履歴（要約＋直近の会話）のトークン数の上限
+MEMORY_TOKEN_BUDGET = 1500
+# 要約せずにそのまま残す直近の往復数（ユーザー入力とAIの回答で1往復）
+MEMORY_RECENT_TURNS = 3
+# 要約が間に合わない場合でも保持し続ける会話履歴のトークン数の上限（超えた分は古い順に破棄）
+MEMORY_HARD_LIMIT_TOKENS = 6000
+
+
+# ==========================================
+# 従業員データ系
+# ==========================================
+EMPLOYEE_CSV_PATH = "./data/社員について/社員名簿.csv"
+EMPLOYEE_CSV_SOURCE_NAME = "社員名簿.csv"
+
+# 事前集計（マテリアライズドビュー）の集計軸
+EMPLOYEE_AGGREGATE_DIMENSIONS = ("部署", "役職", "従業員区分")
+# 集計軸を指すキーワード（クエリ内にあればその軸で集計する）
+EMPLOYEE_DIMENSION_KEYWORDS = {
+    "部署": ["部署", "部門"],
+    "役職": ["役職", "職位", "ポジション"],
+    "従業員区分": ["従業員区分", "雇用形態", "雇用区分"],
+}
+# 社員名簿に関する質問と判定するキーワード
+EMPLOYEE_QUERY_KEYWORDS = ["社員", "従業員", "スタッフ", "メンバー"]
+# 集計クエリと判定するキーワード（人数を尋ねる語は単独で、構成・割合などの語は社員を指す語と併せて使われた場合のみ）
+EMPLOYEE_HEADCOUNT_KEYWORDS = ["人数", "何人", "何名"]
+EMPLOYEE_DISTRIBUTION_KEYWORDS = ["構成", "内訳", "分布", "割合", "比率"]
+# 年齢分布・勤続年数分布を指すキーワード
+EMPLOYEE_AGE_KEYWORDS = ["年齢", "年代"]
+EMPLOYEE_TENURE_KEYWORDS = ["勤続", "在籍年数", "社歴"]
+# 年代の区切り幅（10 → 20代、30代...）
+EMPLOYEE_AGE_BUCKET_WIDTH = 10
+# 勤続年数の区分（下限年数, ラベル）。下限の昇順で定義する
+EMPLOYEE_TENURE_BUCKETS = [
+    (0, "1年未満"),
+    (1, "1〜3年"),
+    (3, "3〜5年"),
+    (5, "5〜10年"),
+    (10, "10年以上"),
+]
+
+# 範囲検索用のソート済みインデックスを作成する列
+EMPLOYEE_DATE_COLUMNS = ("生年月日", "入社日", "卒業年月日")
+EMPLOYEE_NUMERIC_COLUMNS = ("年齢",)
+# 「2020年以降」のような年指定が、どの日付列を指すかを判定するキーワード（該当なしの場合は範囲条件としない）
+EMPLOYEE_DATE_COLUMN_KEYWORDS = {
+    "生年月日": ["生まれ", "生年"],
+    "卒業年月日": ["卒業"],
+    "入社日": ["入社", "採用"],
+}
+# 上位N件検索のキーワード（キーワード, 並び替え列, 降順かどうか）
+EMPLOYEE_TOP_N_PATTERNS = [
+    (["新しく入社", "最近入社", "直近に入社", "入社が新しい", "新入社員"], "入社日", True),
+    (["勤続年数が長い", "勤続年数の長い", "長く勤", "入社が古い", "社歴が長い", "古参"], "入社日", False),
+    (["最年長", "年齢が高い", "年上"], "年齢", True),
+    (["最年少", "年齢が低い", "若い"], "年齢", False),
+]
+# 上位N件検索のキーワードの照合前に取り除く語（「勤続年数が最も長い」→「勤続年数が長い」）
+EMPLOYEE_TOP_N_SUPERLATIVES = ["最も", "もっとも", "一番", "いちばん"]
+# 上位N件検索で件数の指定がない場合の件数（グループごと・「最も」などの指定がある場合は1件）
+EMPLOYEE_TOP_N_DEFAULT = 5
+# 検索結果の表に常に表示する列
+EMPLOYEE_DISPLAY_COLUMNS = ["社員ID", "氏名（フルネーム）", "部署", "役職", "従業員区分"]
+
+# 社員1名分のRAG用ドキュメントに含める列（先頭4列の並びは検索結果の整形処理が前提としている）
+EMPLOYEE_RECORD_COLUMNS = [
+    "社員ID", "氏名（フルネーム）", "部署", "役職", "従業員区分", "性別", "年齢",
+    "入社日", "スキルセット", "保有資格", "大学名", "学部・学科",
+]
+
+# 氏名のあいまい検索（n-gramインデックス）の設定
+EMPLOYEE_NAME_COLUMN = "氏名（フルネーム）"
+EMPLOYEE_EMAIL_COLUMN = "メールアドレス"
+EMPLOYEE_NAME_NGRAM = 2                 # インデックスに使う文字n-gramの長さ
+EMPLOYEE_NAME_MAX_EDIT_DISTANCE = 1     # 許容する編集距離の上限（4文字以上の名前のみ）
+EMPLOYEE_NAME_HONORIFICS = ["さん", "氏", "様", "くん", "君"]
+EMPLOYEE_NAME_MAX_RESULTS = 10
+# 氏名を含む質問のうち、その社員本人について尋ねていると判定するキーワード（該当なしの場合は氏名のみの質問に限る）
+EMPLOYEE_NAME_CONTEXT_KEYWORDS = ["さん", "氏名", "連絡先", "メール", "部署", "所属", "役職", "社員", "従業員"]
+# 氏名を含んでいても、文書や社外の人物について尋ねていると判定するキーワード（通常のRAG処理に任せる）
+EMPLOYEE_NAME_EXCLUDE_KEYWORDS = ["議事録", "資料", "文書", "報告書", "書いた", "作成した", "顧客", "取引先", "お客様"]
+# 氏名のみの質問かを判定する際に、末尾から取り除く語（「山下涼平について教えて」→「山下涼平」）
+EMPLOYEE_NAME_QUERY_SUFFIXES = ["について教えて", "について", "の情報", "を教えて", "とは", "は", "?", "!", "。", "、", "."]
+# 氏名検索の結果の表に追加で表示する列
+EMPLOYEE_NAME_DISPLAY_COLUMNS = ["メールアドレス", "入社日", "スキルセット", "保有資格"]
+
 # ==========================================
 # UI表示設定系（マジックナンバー対策）
 # ==========================================
@@ -90,6 +369,12 @@ SUB_DOCUMENTS_START_INDEX = 1 # サブドキュメントの開始インデック
 # ==========================================
 SYSTEM_PROMPT_CREATE_INDEPENDENT_TEXT = "会話履歴と最新の入力をもとに、会話履歴なしでも理解できる独立した入力テキストを生成してください。"
 
+SYSTEM_PROMPT_SUMMARIZE_HISTORY = """
+    あなたは会話の要約担当です。
+    これまでの要約と、新たに要約対象となった会話をもとに、以降の質問に答えるために必要な情報
+    （話題、対象の部署・社員・文書名、ユーザーの意図など）を残した要約を300字以内で作成してください。
+"""
+
 SYSTEM_PROMPT_DOC_SEARCH = """
     あなたは社内の文書検索アシスタントです。
     以下の条件に基づき、ユーザー入力に対して回答してください。
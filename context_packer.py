@@ -0,0 +1,259 @@
+"""
+このファイルは、検索結果のチャンクをトークン数の上限内でLLMに渡す文脈にまとめる処理が記述されたファイルです。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import re
+from functools import lru_cache
+import constants as ct
+
+
+############################################################
+# トークン数の計算
+############################################################
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """
+    トークン数の計算に使うエンコーディングを取得（プロセス内で1度だけ読み込む）
+
+    Returns:
+        tiktokenのエンコーディング。tiktokenが利用できない場合はNone
+    """
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(ct.MODEL)
+        except KeyError:
+            return tiktoken.get_encoding(ct.TOKENIZER_FALLBACK_ENCODING)
+    except Exception as e:
+        print(f"tokenizer読み込みエラー（概算値で計算します）: {e}")
+        return None
+
+
+def count_tokens(text):
+    """
+    テキストのトークン数を計算
+
+    Args:
+        text: 対象のテキスト
+
+    Returns:
+        トークン数（tiktokenが利用できない場合は概算値）
+    """
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # 概算: 日本語などの非ASCII文字は1文字1トークン、ASCII文字は4文字1トークン
+    ascii_count = sum(1 for char in text if ord(char) < 128)
+    return (len(text) - ascii_count) + (ascii_count + 3) // 4
+
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    テキストを先頭から指定のトークン数に収まるよう切り詰める
+    """
+    encoding = get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return encoding.decode(tokens[:max_tokens])
+    # 概算値で計算している場合は、収まるまで文字数を減らす
+    end = min(len(text), max_tokens * 4)
+    while end > 0 and count_tokens(text[:end]) > max_tokens:
+        end = int(end * 0.9)
+    return text[:end]
+
+
+def get_token_count(doc):
+    """
+    ドキュメントのトークン数を取得（計算結果はメタデータにキャッシュし、次回以降は再計算しない）
+
+    Args:
+        doc: ドキュメント
+
+    Returns:
+        トークン数
+    """
+    token_count = doc.metadata.get("token_count")
+    if token_count is None:
+        token_count = count_tokens(doc.page_content)
+        doc.metadata["token_count"] = token_count
+    return token_count
+
+
+def annotate_token_counts(docs):
+    """
+    インデックス作成時に、全チャンクのトークン数をメタデータに記録しておく
+
+    Args:
+        docs: チャンク分割後のドキュメントのリスト
+    """
+    for doc in docs:
+        get_token_count(doc)
+
+
+############################################################
+# 文脈の組み立て
+############################################################
+
+def pack_context(docs, token_budget=ct.CONTEXT_TOKEN_BUDGET):
+    """
+    検索結果のチャンクを、トークン数の上限内で関連度の高い順に文脈テキストへまとめる
+
+    - 同じファイル（ページ）の隣接チャンクは、CHUNK_OVERLAP分の重複を除いて1つに結合
+    - 内容が重複するチャンクは除去
+    - 関連度の高い順に、上限に収まるまで追加
+
+    Args:
+        docs: 関連度の高い順に並んだ検索結果のドキュメント
+        token_budget: 文脈全体のトークン数の上限
+
+    Returns:
+        (文脈テキスト, 文脈に含めたドキュメントのリスト, 文脈のトークン数)
+    """
+    blocks = merge_neighbor_chunks(remove_duplicates(docs))
+
+    parts = []
+    used_docs = []
+    used_tokens = 0
+    separator_tokens = count_tokens("\n\n")
+    for block in blocks:
+        remaining = token_budget - used_tokens - (separator_tokens if parts else 0)
+        if remaining <= 0:
+            break
+        text = block["text"]
+        tokens = block["tokens"]
+        if tokens > remaining:
+            # 最初のブロックすら入らない場合や、残りが十分ある場合は切り詰めて含める
+            if remaining < ct.CONTEXT_MIN_TRUNCATE_TOKENS and parts:
+                continue
+            text = truncate_to_tokens(text, remaining)
+            tokens = count_tokens(text)
+        parts.append(text)
+        used_docs.extend(block["docs"])
+        used_tokens += tokens + (separator_tokens if len(parts) > 1 else 0)
+
+    return "\n\n".join(parts), used_docs, used_tokens
+
+
+def remove_duplicates(docs):
+    """
+    内容が同じ（空白の違いのみを含む）チャンク、および他のチャンクに完全に含まれるチャンクを除去
+
+    Args:
+        docs: 関連度の高い順に並んだドキュメント
+
+    Returns:
+        重複を除いたドキュメントのリスト（順序は維持）
+    """
+    unique_docs = []
+    normalized_texts = []
+    for doc in docs:
+        normalized = re.sub(r"\s+", " ", doc.page_content).strip()
+        if not normalized:
+            continue
+        if any(normalized in other for other in normalized_texts):
+            continue
+        # 後から来たチャンクが先のチャンクを含む場合は、先のチャンクを置き換える
+        contained = [i for i, other in enumerate(normalized_texts) if other in normalized]
+        if contained:
+            index = contained[0]
+            unique_docs[index] = doc
+            normalized_texts[index] = normalized
+            for i in reversed(contained[1:]):
+                del unique_docs[i]
+                del normalized_texts[i]
+            continue
+        unique_docs.append(doc)
+        normalized_texts.append(normalized)
+    return unique_docs
+
+
+def merge_neighbor_chunks(docs):
+    """
+    同じファイル（ページ）の、重複部分を持つ隣接チャンクを1つのブロックに結合
+
+    Args:
+        docs: 関連度の高い順に並んだドキュメント
+
+    Returns:
+        ブロック（"text", "tokens", "docs"を持つ辞書）のリスト。
+        ブロックの順序は、含まれるチャンクのうち最も関連度の高いものの順位
+    """
+    blocks = []
+    for doc in docs:
+        for block in blocks:
+            merged = merge_texts(block, doc)
+            if merged is not None:
+                block["text"] = merged["text"]
+                block["start"] = merged["start"]
+                block["docs"].append(doc)
+                block["tokens"] = None
+                break
+        else:
+            blocks.append({
+                "key": (doc.metadata.get("source"), doc.metadata.get("page")),
+                "text": doc.page_content,
+                "start": doc.metadata.get("start_index"),
+                "docs": [doc],
+                "tokens": get_token_count(doc),
+            })
+
+    for block in blocks:
+        if block["tokens"] is None:
+            block["tokens"] = count_tokens(block["text"])
+    return blocks
+
+
+def merge_texts(block, doc):
+    """
+    ブロックとチャンクが同じファイル（ページ）で隣接していれば、重複部分を除いて結合したテキストを返す
+
+    Args:
+        block: 結合先のブロック
+        doc: 結合するチャンク
+
+    Returns:
+        結合後の"text"と"start"を持つ辞書。隣接していない場合はNone
+    """
+    if block["key"] != (doc.metadata.get("source"), doc.metadata.get("page")):
+        return None
+
+    text = doc.page_content
+    start = doc.metadata.get("start_index")
+    block_text = block["text"]
+    block_start = block["start"]
+
+    # チャンク分割時に記録した開始位置がある場合は、位置から重複を判定
+    if start is not None and block_start is not None:
+        block_end = block_start + len(block_text)
+        end = start + len(text)
+        if start <= block_start <= end:
+            return {"text": text + block_text[end - block_start:], "start": start}
+        if block_start <= start <= block_end:
+            return {"text": block_text + text[block_end - start:], "start": block_start}
+        return None
+
+    # 開始位置がない場合は、末尾と先頭の文字列の重なりから判定
+    overlap = find_overlap(block_text, text)
+    if overlap:
+        return {"text": block_text + text[overlap:], "start": block_start}
+    overlap = find_overlap(text, block_text)
+    if overlap:
+        return {"text": text + block_text[overlap:], "start": start}
+    return None
+
+
+def find_overlap(first, second, max_overlap=ct.CHUNK_OVERLAP):
+    """
+    firstの末尾とsecondの先頭が重なっている文字数を取得（重なりがなければ0）
+    """
+    for size in range(min(max_overlap, len(first), len(second)), 0, -1):
+        if first.endswith(second[:size]):
+            # 1〜2文字の偶然の一致は重なりとみなさない
+            return size if size >= 10 else 0
+    return 0
@@ -0,0 +1,189 @@
+"""
+このファイルは、LLMとのやりとり用の会話履歴を、トークン数の上限内で保持する処理が記述されたファイルです。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import threading
+from collections import deque
+import constants as ct
+from context_packer import count_tokens
+
+
+############################################################
+# クラス定義
+############################################################
+
+class ConversationMemory:
+    """
+    トークン数の上限付きの会話履歴
+
+    直近の会話はそのまま保持し、上限を超えた古い会話は要約に畳み込む。
+    要約のLLM呼び出しは回答表示後にバックグラウンドで行い、回答生成を待たせない。
+    会話は LangChain のメッセージではなく (role, text, トークン数) のタプルで保持する。
+    """
+
+    def __init__(self, token_budget=ct.MEMORY_TOKEN_BUDGET, recent_turns=ct.MEMORY_RECENT_TURNS,
+                 hard_limit_tokens=ct.MEMORY_HARD_LIMIT_TOKENS):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.hard_limit_tokens = hard_limit_tokens
+        # (role, text, トークン数) のタプル。roleは"human"または"ai"
+        self.messages = deque()
+        self.summary = ""
+        self.summary_tokens = 0
+        # 先頭のメッセージの通し番号（要約中に古いメッセージが破棄された場合の位置合わせ用）
+        self._first_index = 0
+        self._lock = threading.Lock()
+        self._summarizing = False
+
+    def __len__(self):
+        return len(self.messages)
+
+    def add_turn(self, user_text, ai_text):
+        """
+        1往復分の会話を追加
+
+        Args:
+            user_text: ユーザー入力値
+            ai_text: AIの回答
+        """
+        with self._lock:
+            for role, text in (("human", user_text), ("ai", str(ai_text))):
+                self.messages.append((role, text, count_tokens(text)))
+
+            # 要約が追いつかない場合でもメモリが増え続けないよう、上限を超えた古い会話は破棄
+            total = self.summary_tokens + sum(tokens for _, _, tokens in self.messages)
+            while total > self.hard_limit_tokens and len(self.messages) > self.recent_turns * 2:
+                total -= self.messages.popleft()[2]
+                self._first_index += 1
+
+    def last_user_text(self):
+        """
+        直前のユーザー入力値を取得（会話がない場合は空文字）
+        """
+        with self._lock:
+            for role, text, _ in reversed(self.messages):
+                if role == "human":
+                    return text
+        return ""
+
+    def to_messages(self):
+        """
+        LLMに渡す会話履歴を、LangChainのメッセージのリストとして取得
+
+        Returns:
+            要約（SystemMessage）と直近の会話（HumanMessage/AIMessage）のリスト
+        """
+        from langchain.schema import HumanMessage, SystemMessage, AIMessage
+
+        with self._lock:
+            summary = self.summary
+            # 要約が追いついていない場合でも上限を超えないよう、新しい順に収まる分だけを渡す
+            messages = []
+            available = self.token_budget - self.summary_tokens
+            for message in reversed(self.messages):
+                if len(messages) >= 2 and message[2] > available:
+                    break
+                available -= message[2]
+                messages.append(message)
+            messages.reverse()
+            # 往復の途中（AIの回答）から始まらないようにする
+            if len(messages) > 1 and messages[0][0] == "ai":
+                messages.pop(0)
+
+        result = []
+        if summary:
+            result.append(SystemMessage(content=f"これまでの会話の要約:\n{summary}"))
+        for role, text, _ in messages:
+            result.append(HumanMessage(content=text) if role == "human" else AIMessage(content=text))
+        return result
+
+    def _messages_to_fold(self):
+        """
+        トークン数の上限を超えている場合に、要約に畳み込む古いメッセージの件数を取得
+        """
+        keep_tokens = 0
+        keep_count = 0
+        available = self.token_budget - self.summary_tokens
+        # 新しい順に、上限内に収まる（かつ最低限の直近往復数を満たす）メッセージを残す
+        for _, _, tokens in reversed(self.messages):
+            if keep_count >= self.recent_turns * 2 and keep_tokens + tokens > available:
+                break
+            keep_tokens += tokens
+            keep_count += 1
+        fold_count = len(self.messages) - keep_count
+        # 往復の途中で区切らないよう、偶数件に揃える
+        return fold_count - fold_count % 2
+
+    def needs_summary(self):
+        """
+        古い会話を要約に畳み込む必要があるかどうか
+        """
+        with self._lock:
+            return not self._summarizing and self._messages_to_fold() > 0
+
+    def summarize_in_background(self, llm):
+        """
+        上限を超えた古い会話の要約を、バックグラウンドのスレッドで作成
+
+        回答の画面表示が終わった後に呼び出す。要約が完了するまでの間も、
+        会話履歴は要約前の内容のまま利用できる。
+
+        Args:
+            llm: 要約に使うLLM
+
+        Returns:
+            要約を開始した場合はThreadオブジェクト、不要な場合はNone
+        """
+        with self._lock:
+            if self._summarizing:
+                return None
+            fold_count = self._messages_to_fold()
+            if fold_count <= 0:
+                return None
+            self._summarizing = True
+            start_index = self._first_index
+            folded = [self.messages[i] for i in range(fold_count)]
+            previous_summary = self.summary
+
+        thread = threading.Thread(
+            target=self._summarize,
+            args=(llm, previous_summary, folded, start_index + fold_count),
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _summarize(self, llm, previous_summary, folded, end_index):
+        """
+        要約を作成し、要約済みのメッセージを履歴から取り除く（バックグラウンドのスレッドで実行）
+        """
+        from langchain.schema import HumanMessage, SystemMessage
+
+        try:
+            conversation = "\n".join(
+                f"{'ユーザー' if role == 'human' else 'AI'}: {text}" for role, text, _ in folded
+            )
+            response = llm.invoke([
+                SystemMessage(content=ct.SYSTEM_PROMPT_SUMMARIZE_HISTORY),
+                HumanMessage(content=f"これまでの要約:\n{previous_summary or 'なし'}\n\n要約対象の会話:\n{conversation}")
+            ])
+            summary = response.content.strip()
+        except Exception as e:
+            print(f"会話履歴の要約エラー: {e}")
+            with self._lock:
+                self._summarizing = False
+            return
+
+        with self._lock:
+            # 要約中に上限超過で破棄された分を考慮し、要約済みのメッセージだけを取り除く
+            while self.messages and self._first_index < end_index:
+                self.messages.popleft()
+                self._first_index += 1
+            self.summary = summary
+            self.summary_tokens = count_tokens(summary)
+            self._summarizing = False
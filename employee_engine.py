@@ -0,0 +1,1102 @@
+"""
+このファイルは、社員名簿（CSV）を読み込み、集計・検索用のデータ構造を保持する従業員エンジンのファイルです。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import re
+import calendar
+import logging
+import threading
+import unicodedata
+from datetime import date, timedelta
+from itertools import combinations
+from collections import Counter
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+import constants as ct
+
+
+############################################################
+# 集計用のデータ構造
+############################################################
+
+class GroupStats:
+    """
+    1つの集計グループ（例: 営業部×主任）の集計値
+    """
+
+    __slots__ = ("count", "age_sum", "age_buckets", "tenure_buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.age_sum = 0
+        self.age_buckets = Counter()
+        self.tenure_buckets = Counter()
+
+    def apply(self, features, sign):
+        """
+        社員1名分の特徴量を加算（sign=1）または減算（sign=-1）する
+        """
+        self.count += sign
+        self.age_sum += sign * features["age"]
+        self.age_buckets[features["age_bucket"]] += sign
+        self.tenure_buckets[features["tenure_bucket"]] += sign
+
+    def copy(self):
+        stats = GroupStats()
+        stats.merge(self)
+        return stats
+
+    def merge(self, other):
+        """
+        別グループの集計値を合算する（ロールアップ用）
+        """
+        self.count += other.count
+        self.age_sum += other.age_sum
+        self.age_buckets.update(other.age_buckets)
+        self.tenure_buckets.update(other.tenure_buckets)
+
+    @property
+    def average_age(self):
+        return self.age_sum / self.count if self.count else 0.0
+
+
+class RangeIndex:
+    """
+    1列分のソート済みインデックス
+
+    値を昇順に並べた配列と、その並び順に対応する行番号を保持し、
+    範囲検索は二分探索（searchsorted）でO(log n + k)で行う。
+    """
+
+    def __init__(self, values):
+        """
+        Args:
+            values: 列の値（datetime64[D]またはfloatのNumPy配列。欠損値はNaT/NaN）
+        """
+        if np.issubdtype(values.dtype, np.datetime64):
+            valid = ~np.isnat(values)
+        else:
+            valid = ~np.isnan(values)
+        # 行番号順の値と欠損でないかどうか（候補行を並び替える際に使用）
+        self.values = values
+        self.valid = valid
+        positions = np.flatnonzero(valid)
+        order = np.argsort(values[positions], kind="stable")
+        # 昇順に並んだ行番号と値（欠損値の行はインデックスに含めない）
+        self.positions = positions[order]
+        self.sorted_values = values[self.positions]
+
+    def range(self, low=None, high=None):
+        """
+        low以上high以下の値を持つ行番号を、値の昇順で取得
+        """
+        start = 0 if low is None else np.searchsorted(self.sorted_values, low, side="left")
+        end = len(self.sorted_values) if high is None else np.searchsorted(self.sorted_values, high, side="right")
+        return self.positions[start:end]
+
+    def ordered(self, descending=False):
+        """
+        全行の行番号を値の昇順（descending=Trueの場合は降順）で取得
+        """
+        return self.positions[::-1] if descending else self.positions
+
+
+class NameIndex:
+    """
+    氏名・メールアドレスのあいまい検索用の文字n-gramインデックス
+
+    氏名（フルネーム）、姓、名、メールアドレスのローカル部をそれぞれ検索キーとして登録し、
+    n-gramの一致数で候補を絞り込んだ後、編集距離の上限付きで照合する。
+    姓・名だけのキーは誤一致（「あすか」と「ですか」など）を避けるため完全一致のみとする。
+    """
+
+    def __init__(self, names, emails):
+        """
+        Args:
+            names: 行番号順の氏名の配列
+            emails: 行番号順のメールアドレスの配列
+        """
+        # 検索キー（正規化済み文字列, 行番号, フルネームかどうか, 許容する編集距離）のリスト
+        self.keys = []
+        # n-gram → 検索キー番号のリスト
+        self.postings = {}
+
+        for position, (name, email) in enumerate(zip(names, emails)):
+            if isinstance(name, str):
+                key = normalize_name(name)
+                self._add(key, position, True, allowed_edit_distance(key))
+                parts = name.split()
+                if len(parts) > 1:
+                    for part in parts:
+                        self._add(normalize_name(part), position, False, 0)
+            if isinstance(email, str):
+                key = normalize_name(email.split("@")[0])
+                self._add(key, position, False, allowed_edit_distance(key))
+
+    def _add(self, key, position, is_full_name, max_distance):
+        if not key:
+            return
+        key_id = len(self.keys)
+        self.keys.append((key, position, is_full_name, max_distance))
+        for gram in set(char_ngrams(key)):
+            self.postings.setdefault(gram, []).append(key_id)
+
+    def find(self, text):
+        """
+        文字列に含まれる（あいまい一致する）氏名・メールアドレスを検索
+
+        Args:
+            text: ユーザー入力値
+
+        Returns:
+            (行番号, 編集距離, フルネームで一致したかどうか) のリスト（一致度の高い順）
+        """
+        normalized = normalize_name(text)
+        text_grams = set(char_ngrams(normalized)) | set(normalized)
+
+        # 検索キーごとに、入力値と共通するn-gramの数を数える
+        shared = Counter()
+        for gram in text_grams:
+            for key_id in self.postings.get(gram, ()):
+                shared[key_id] += 1
+
+        best = {}
+        for key_id, count in shared.items():
+            key, position, is_full_name, max_distance = self.keys[key_id]
+            key_gram_count = len(set(char_ngrams(key)))
+            # 編集1回で失われるn-gramは最大n個のため、一致数が足りないキーは照合せずに除外
+            if count < max(1, key_gram_count - ct.EMPLOYEE_NAME_NGRAM * max_distance):
+                continue
+            if len(key) == 1 and not any(f"{key}{honorific}" in normalized for honorific in ct.EMPLOYEE_NAME_HONORIFICS) and normalized != key:
+                # 「林」「森」のような1文字の姓は、敬称付きで書かれた場合のみ一致とみなす
+                continue
+            distance = substring_edit_distance(key, normalized, max_distance)
+            if distance is None:
+                continue
+            rank = (not is_full_name, distance, -len(key))
+            if position not in best or rank < best[position]:
+                best[position] = rank
+
+        ranked = sorted(best.items(), key=lambda item: item[1])
+        return [(position, rank[1], not rank[0]) for position, rank in ranked]
+
+    def is_name_only(self, text):
+        """
+        文字列が（敬称・「について教えて」などを除いて）氏名・メールアドレスだけか
+
+        Args:
+            text: ユーザー入力値
+
+        Returns:
+            いずれかの検索キーと、文字列全体があいまい一致する場合はTrue
+        """
+        normalized = strip_name_query(text)
+        for key, _, _, max_distance in self.keys:
+            if abs(len(key) - len(normalized)) <= max_distance \
+                    and substring_edit_distance(key, normalized, max_distance) is not None:
+                return True
+        return False
+
+
+############################################################
+# 従業員エンジン本体
+############################################################
+
+class EmployeeEngine:
+    """
+    社員名簿の読み込みと、集計値（マテリアライズドビュー）の保持を行うクラス
+
+    集計軸（部署・役職・従業員区分）のすべての組み合わせについて
+    グループごとの人数・年代分布・勤続年数分布を事前に計算しておき、
+    CSVの再読み込み時は変更された行の差分だけを反映する。
+    """
+
+    def __init__(self, csv_path=ct.EMPLOYEE_CSV_PATH):
+        self.csv_path = csv_path
+        # 再読み込み中に他スレッドが参照しないようにするためのロック
+        self._lock = threading.RLock()
+        self.df = pd.DataFrame()
+        # 社員ID → 行データ（差分検出用）
+        self._rows = {}
+        # 社員ID → 集計用の特徴量（差分反映時の減算に使用）
+        self._features = {}
+        # 集計軸の組み合わせ → {グループキー → GroupStats}
+        self._aggregates = {}
+        # 列名 → RangeIndex（日付・年齢の範囲検索、上位N件検索用）
+        self._range_indexes = {}
+        # 集計軸 → {値 → 該当行を示すboolのNumPy配列}（他の検索条件との組み合わせ用）
+        self._dimension_masks = {}
+        # 氏名・メールアドレスのあいまい検索用インデックス
+        self._name_index = None
+        self._mtime = None
+        self._reference_date = None
+        # 読み込みのたびに増えるバージョン番号（キャッシュのキーなどに使用）
+        self.version = 0
+
+    def refresh(self):
+        """
+        CSVファイルが更新されていれば再読み込みし、集計値を最新化する
+
+        Returns:
+            再読み込みを行った場合はTrue
+        """
+        if not os.path.exists(self.csv_path):
+            return False
+
+        mtime = os.path.getmtime(self.csv_path)
+        today = date.today()
+        if mtime == self._mtime and today == self._reference_date:
+            return False
+
+        with self._lock:
+            # ロック待ちの間に別スレッドが再読み込み済みの場合は何もしない
+            if mtime == self._mtime and today == self._reference_date:
+                return False
+
+            df = pd.read_csv(self.csv_path, encoding="utf-8")
+            # 集計に使えない行（社員IDの欠損・重複、年齢・入社日の不正な値）は読み飛ばす
+            df, rows, features = validate_roster(df, today)
+
+            # 新しい集計値・インデックスはすべて作成し終えてから差し替える
+            # （途中で失敗した場合は前回の状態のまま残り、次の呼び出しで改めて読み込む）
+            # 勤続年数は基準日に依存するため、日付が変わった場合は全件を再集計
+            if today != self._reference_date:
+                aggregates = self._rebuild(features)
+            else:
+                aggregates = self._apply_diff(rows, features)
+            indexes = self._build_indexes(df)
+
+            self.df = df
+            self._rows = rows
+            self._features = features
+            self._aggregates = aggregates
+            self._range_indexes, self._dimension_masks, self._name_index = indexes
+            self._mtime = mtime
+            self._reference_date = today
+            self.version += 1
+            return True
+
+    def _rebuild(self, features):
+        """
+        集計値を全件から作り直す
+
+        Returns:
+            集計軸の組み合わせ → {グループキー → GroupStats} の辞書
+        """
+        aggregates = {
+            dims: {}
+            for size in range(len(ct.EMPLOYEE_AGGREGATE_DIMENSIONS) + 1)
+            for dims in combinations(ct.EMPLOYEE_AGGREGATE_DIMENSIONS, size)
+        }
+        for employee_features in features.values():
+            self._apply(aggregates, employee_features, 1)
+        return aggregates
+
+    def _apply_diff(self, rows, features):
+        """
+        前回読み込み時との差分（追加・削除・変更された社員）だけを、現在の集計値のコピーに反映する
+
+        Returns:
+            集計軸の組み合わせ → {グループキー → GroupStats} の辞書
+        """
+        aggregates = {
+            dims: {key: stats.copy() for key, stats in groups.items()}
+            for dims, groups in self._aggregates.items()
+        }
+        for employee_id, old_row in self._rows.items():
+            if rows.get(employee_id) != old_row:
+                self._apply(aggregates, self._features[employee_id], -1)
+        for employee_id, row in rows.items():
+            if self._rows.get(employee_id) != row:
+                self._apply(aggregates, features[employee_id], 1)
+        return aggregates
+
+    @staticmethod
+    def _apply(aggregates, features, sign):
+        """
+        社員1名分の特徴量を、全ての集計軸の組み合わせに反映する
+        """
+        for dims, groups in aggregates.items():
+            key = tuple(features[dim] for dim in dims)
+            stats = groups.get(key)
+            if stats is None:
+                stats = groups[key] = GroupStats()
+            stats.apply(features, sign)
+            # 所属者がいなくなったグループは削除
+            if stats.count == 0:
+                del groups[key]
+
+    @staticmethod
+    def _build_indexes(df):
+        """
+        範囲検索用のソート済みインデックスと、集計軸の値ごとの行マスクを作成
+
+        Returns:
+            列名 → RangeIndex の辞書、集計軸 → {値 → 行マスク} の辞書、氏名・メールアドレスのインデックス
+        """
+        range_indexes = {}
+        for column in ct.EMPLOYEE_DATE_COLUMNS:
+            if column in df.columns:
+                values = pd.to_datetime(df[column], errors="coerce").to_numpy().astype("datetime64[D]")
+                range_indexes[column] = RangeIndex(values)
+        for column in ct.EMPLOYEE_NUMERIC_COLUMNS:
+            if column in df.columns:
+                values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=float)
+                range_indexes[column] = RangeIndex(values)
+
+        dimension_masks = {
+            dim: {value: (df[dim] == value).to_numpy() for value in df[dim].dropna().unique()}
+            for dim in ct.EMPLOYEE_AGGREGATE_DIMENSIONS
+        }
+
+        name_index = NameIndex(
+            df[ct.EMPLOYEE_NAME_COLUMN].to_numpy(),
+            df[ct.EMPLOYEE_EMAIL_COLUMN].to_numpy() if ct.EMPLOYEE_EMAIL_COLUMN in df.columns else [None] * len(df)
+        )
+        return range_indexes, dimension_masks, name_index
+
+    def find_employees_by_name(self, text):
+        """
+        氏名・メールアドレスのあいまい検索で社員を取得
+
+        Args:
+            text: ユーザー入力値（「山下涼平」「林さん」「taro70」など）
+
+        Returns:
+            該当する社員のDataFrame（一致度の高い順）
+        """
+        with self._lock:
+            if self._name_index is None:
+                return self.df.iloc[0:0]
+            matches = self._name_index.find(text)
+            # フルネームで一致した社員がいる場合は姓・名だけの一致を、
+            # 完全一致した社員がいる場合はあいまい一致を、候補に含めない
+            if matches:
+                _, best_distance, best_is_full_name = matches[0]
+                matches = [
+                    match for match in matches
+                    if match[1] == best_distance and match[2] == best_is_full_name
+                ]
+            positions = [position for position, _, _ in matches[:ct.EMPLOYEE_NAME_MAX_RESULTS]]
+            return self.df.iloc[positions]
+
+    def answer_name_query(self, query):
+        """
+        特定の社員について尋ねる質問であれば、該当する社員の行を表形式で回答
+
+        氏名に加えて「さん」「連絡先」「部署」などの社員本人を指す語があるか、氏名のみの質問の場合に回答する。
+        （「顧客の田中様について」「山下さんが書いた議事録」のような質問は、通常のRAG処理に任せる）
+
+        Args:
+            query: ユーザー入力値
+
+        Returns:
+            回答の辞書。社員本人についての質問でない場合はNone
+        """
+        if any(keyword in query for keyword in ct.EMPLOYEE_NAME_EXCLUDE_KEYWORDS):
+            return None
+        if not any(keyword in query for keyword in ct.EMPLOYEE_NAME_CONTEXT_KEYWORDS):
+            with self._lock:
+                if self._name_index is None or not self._name_index.is_name_only(query):
+                    return None
+
+        result_df = self.find_employees_by_name(query)
+        if result_df.empty:
+            return None
+
+        columns = list(ct.EMPLOYEE_DISPLAY_COLUMNS) + [
+            column for column in ct.EMPLOYEE_NAME_DISPLAY_COLUMNS if column in result_df.columns
+        ]
+        answer = f"**該当する社員: {len(result_df)}名**\n\n"
+        answer += tabulate(result_df[columns], headers="keys", tablefmt="pipe", showindex=False)
+        return {"answer": answer, "context": []}
+
+    def search(self, filters=None, ranges=None, order_by=None, descending=False, limit=None, per_group=None):
+        """
+        集計軸の一致条件・範囲条件・並び順を組み合わせて社員を検索
+
+        Args:
+            filters: 一致条件の辞書（例: {"部署": "営業部"}）
+            ranges: 範囲条件の辞書（例: {"入社日": (date(2020, 1, 1), None)}）。下限・上限は両端を含む
+            order_by: 並び替え列（範囲インデックスを持つ列）
+            descending: 降順で並べるかどうか
+            limit: 取得件数（per_groupを指定した場合はグループごとの件数）
+            per_group: グループごとに上位limit件を取得する場合の集計軸
+
+        Returns:
+            該当する社員のDataFrame
+        """
+        filters = filters or {}
+        ranges = ranges or {}
+
+        with self._lock:
+            df = self.df
+            masks = [self._dimension_masks.get(dim, {}).get(value) for dim, value in filters.items()]
+            if any(mask is None for mask in masks):
+                return df.iloc[0:0]
+
+            if ranges:
+                # 範囲条件は二分探索で候補行を絞り込み、残りの条件は候補行に対してのみ判定する
+                candidates = None
+                for column, (low, high) in ranges.items():
+                    index = self._range_indexes[column]
+                    low, high = to_index_value(index, low), to_index_value(index, high)
+                    positions = index.range(low, high)
+                    candidates = positions if candidates is None else candidates[np.isin(candidates, positions)]
+                for mask in masks:
+                    candidates = candidates[mask[candidates]]
+                if order_by is not None:
+                    index = self._range_indexes[order_by]
+                    # 候補行（k件）だけを並び替え列の値で並べ替える
+                    candidates = candidates[index.valid[candidates]]
+                    candidates = candidates[np.argsort(index.values[candidates], kind="stable")]
+                    if descending:
+                        candidates = candidates[::-1]
+                ordered = candidates
+            elif order_by is not None:
+                ordered = self._range_indexes[order_by].ordered(descending)
+                if per_group:
+                    groups = df[per_group].to_numpy()
+                    ordered = scan_ordered(ordered, masks, limit, groups, len(self._dimension_masks[per_group]))
+                else:
+                    ordered = scan_ordered(ordered, masks, limit)
+            else:
+                ordered = np.arange(len(df))
+                for mask in masks:
+                    ordered = ordered[mask[ordered]]
+
+            if limit is not None:
+                if per_group:
+                    groups = df[per_group].to_numpy()[ordered]
+                    taken = Counter()
+                    selected = []
+                    for position, group in zip(ordered, groups):
+                        if taken[group] < limit:
+                            taken[group] += 1
+                            selected.append(position)
+                    ordered = np.array(selected, dtype=np.int64)
+                else:
+                    ordered = ordered[:limit]
+
+            return df.iloc[ordered]
+
+    def answer_range_query(self, query):
+        """
+        日付・年齢の範囲条件や上位N件を指定した質問であれば、インデックスを使って表形式の回答を作成
+
+        Args:
+            query: ユーザー入力値
+
+        Returns:
+            回答の辞書。範囲・上位N件の質問でない場合はNone
+        """
+        spec = parse_range_query(query)
+        if spec is None:
+            return None
+
+        filters = self.extract_filters(query)
+        result_df = self.search(filters=filters, **spec)
+        if result_df.empty:
+            return {
+                "answer": "条件に該当する社員は見つかりませんでした。",
+                "context": []
+            }
+
+        columns = list(ct.EMPLOYEE_DISPLAY_COLUMNS)
+        for column in list(spec.get("ranges", {})) + [spec.get("order_by")]:
+            if column and column not in columns:
+                columns.append(column)
+
+        answer = f"**検索結果: {len(result_df)}名**\n\n"
+        conditions = [f"{dim}={value}" for dim, value in filters.items()]
+        conditions += [format_range_condition(column, low, high) for column, (low, high) in spec.get("ranges", {}).items()]
+        if conditions:
+            answer += "検索条件: " + "、".join(conditions) + "\n\n"
+        answer += tabulate(result_df[columns], headers="keys", tablefmt="pipe", showindex=False)
+
+        return {"answer": answer, "context": []}
+
+    def aggregate(self, group_by=(), filters=None):
+        """
+        事前集計済みの値から、指定の軸でグループ化した集計結果を取得
+
+        Args:
+            group_by: 集計軸のタプル（例: ("部署", "役職")）
+            filters: 絞り込み条件の辞書（例: {"部署": "営業部"}）
+
+        Returns:
+            (グループキー, GroupStats) のリスト（グループキーの昇順）
+        """
+        filters = filters or {}
+        # 絞り込み軸も含めた組み合わせの集計値を参照し、条件に合うグループだけを合算する
+        lookup_dims = tuple(
+            dim for dim in ct.EMPLOYEE_AGGREGATE_DIMENSIONS
+            if dim in group_by or dim in filters
+        )
+        with self._lock:
+            groups = self._aggregates.get(lookup_dims, {})
+            result = {}
+            for key, stats in groups.items():
+                values = dict(zip(lookup_dims, key))
+                if any(values[dim] != value for dim, value in filters.items()):
+                    continue
+                out_key = tuple(values[dim] for dim in group_by)
+                if out_key not in result:
+                    result[out_key] = GroupStats()
+                result[out_key].merge(stats)
+
+        return sorted(result.items(), key=lambda item: item[0])
+
+    def extract_filters(self, query):
+        """
+        クエリに含まれる部署・役職・従業員区分の値を、一致条件の辞書として取得
+
+        Args:
+            query: ユーザー入力値
+
+        Returns:
+            一致条件の辞書（例: {"部署": "営業部", "役職": "主任"}）
+        """
+        filters = {}
+        for dim in ct.EMPLOYEE_AGGREGATE_DIMENSIONS:
+            value = find_dimension_value(query, self.dimension_values(dim))
+            # 「インターン」のように複数の軸に同じ値がある場合は、先に一致した軸のみで絞り込む
+            if value is not None and value not in filters.values():
+                filters[dim] = value
+        return filters
+
+    def rows_by_ids(self, employee_ids):
+        """
+        社員IDの一覧に対応する行を、指定の順序で取得
+        """
+        with self._lock:
+            df = self.df
+            if df.empty:
+                return df
+            ids = [employee_id for employee_id in dict.fromkeys(employee_ids) if employee_id in self._rows]
+            return df.set_index("社員ID", drop=False).loc[ids] if ids else df.iloc[0:0]
+
+    def employee_records(self):
+        """
+        社員1名につき1件の、RAG用のコンパクトなテキストとメタデータを取得
+
+        Returns:
+            (テキスト, メタデータ) のリスト
+        """
+        with self._lock:
+            df = self.df
+        records = []
+        for row in df.to_dict("records"):
+            records.append((
+                format_employee_record(row),
+                {
+                    "source": ct.EMPLOYEE_CSV_SOURCE_NAME,
+                    "type": "employee_data",
+                    "employee_id": row["社員ID"],
+                    "name": row[ct.EMPLOYEE_NAME_COLUMN],
+                    **{dim: row[dim] for dim in ct.EMPLOYEE_AGGREGATE_DIMENSIONS},
+                }
+            ))
+        return records
+
+    def department_summaries(self):
+        """
+        部署ごとの概要（人数・役職構成・従業員区分）のテキストとメタデータを取得
+
+        Returns:
+            (テキスト, メタデータ) のリスト
+        """
+        summaries = []
+        for (dept,), stats in self.aggregate(("部署",)):
+            roles = self.aggregate(("役職",), {"部署": dept})
+            types = self.aggregate(("従業員区分",), {"部署": dept})
+            content = (
+                f"部署: {dept}\n"
+                f"人数: {stats.count}名\n"
+                f"役職構成: {'、'.join(f'{role} {role_stats.count}名' for (role,), role_stats in roles)}\n"
+                f"従業員区分: {'、'.join(f'{kind} {kind_stats.count}名' for (kind,), kind_stats in types)}"
+            )
+            summaries.append((
+                content,
+                {
+                    "source": ct.EMPLOYEE_CSV_SOURCE_NAME,
+                    "type": "department_summary",
+                    "department": dept,
+                    "employee_count": stats.count,
+                }
+            ))
+        return summaries
+
+    def dimension_values(self, dim):
+        """
+        集計軸の値の一覧を取得（例: 部署 → ["IT部", "営業部", ...]）
+        """
+        with self._lock:
+            return sorted(key[0] for key in self._aggregates.get((dim,), {}))
+
+    def answer_aggregate_query(self, query):
+        """
+        人数・構成・分布に関する質問であれば、事前集計値から表形式の回答を作成
+
+        Args:
+            query: ユーザー入力値
+
+        Returns:
+            回答の辞書。集計クエリでない場合はNone
+        """
+        mentions_employee = any(keyword in query for keyword in ct.EMPLOYEE_QUERY_KEYWORDS)
+        # 「営業部の売上の割合」のような社員と無関係な構成・割合の質問は、通常のRAG処理に任せる
+        if not (any(keyword in query for keyword in ct.EMPLOYEE_HEADCOUNT_KEYWORDS)
+                or mentions_employee and any(keyword in query for keyword in ct.EMPLOYEE_DISTRIBUTION_KEYWORDS)):
+            return None
+
+        group_by = [
+            dim for dim in ct.EMPLOYEE_AGGREGATE_DIMENSIONS
+            if any(keyword in query for keyword in ct.EMPLOYEE_DIMENSION_KEYWORDS[dim])
+        ]
+        filters = self.extract_filters(query)
+
+        show_age = any(keyword in query for keyword in ct.EMPLOYEE_AGE_KEYWORDS)
+        show_tenure = any(keyword in query for keyword in ct.EMPLOYEE_TENURE_KEYWORDS)
+
+        # 社員名簿に関する質問と判断できない場合は、通常のRAG処理に任せる
+        if not (group_by or filters or show_age or show_tenure or mentions_employee):
+            return None
+
+        results = self.aggregate(tuple(group_by), filters)
+        if not results:
+            return None
+
+        answer = "**社員名簿の集計結果**\n\n"
+        if filters:
+            answer += "絞り込み条件: " + "、".join(f"{dim}={value}" for dim, value in filters.items()) + "\n\n"
+        answer += format_aggregate_table(results, group_by, show_age, show_tenure)
+        answer += f"\n\n※ {ct.EMPLOYEE_CSV_SOURCE_NAME}（{self._reference_date}時点）から集計した正確な値です。"
+
+        return {"answer": answer, "context": []}
+
+
+############################################################
+# 関数定義
+############################################################
+
+def build_features(row, reference_date):
+    """
+    社員1名分の行データから、集計に使う特徴量を作成
+
+    Args:
+        row: 社員名簿の1行分の辞書
+        reference_date: 勤続年数を計算する基準日
+
+    Returns:
+        集計軸の値、年齢、年代、勤続年数区分を含む辞書
+    """
+    features = {dim: row[dim] for dim in ct.EMPLOYEE_AGGREGATE_DIMENSIONS}
+
+    age = int(row["年齢"])
+    features["age"] = age
+    bucket_start = age // ct.EMPLOYEE_AGE_BUCKET_WIDTH * ct.EMPLOYEE_AGE_BUCKET_WIDTH
+    features["age_bucket"] = f"{bucket_start}代"
+
+    joined = date.fromisoformat(str(row["入社日"]))
+    years = (reference_date - joined).days / 365.25
+    features["tenure_bucket"] = ct.EMPLOYEE_TENURE_BUCKETS[0][1]
+    for lower, label in ct.EMPLOYEE_TENURE_BUCKETS:
+        if years >= lower:
+            features["tenure_bucket"] = label
+
+    return features
+
+
+def validate_roster(df, reference_date):
+    """
+    社員名簿の各行から集計用の特徴量を作成し、集計に使えない行を除く
+
+    社員IDがない行、社員IDが重複する行（先に出現した行を使用）、年齢・入社日が欠損または不正な行は、
+    ログに記録して読み飛ばす。
+
+    Args:
+        df: 社員名簿のDataFrame
+        reference_date: 勤続年数を計算する基準日
+
+    Returns:
+        除いた後のDataFrame、社員ID → 行データの辞書、社員ID → 集計用の特徴量の辞書
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    rows = {}
+    features = {}
+    positions = []
+    for position, row in enumerate(df.to_dict("records")):
+        # CSVの行番号（ヘッダー行を含む）
+        line = position + 2
+        employee_id = row.get("社員ID")
+        if pd.isna(employee_id):
+            logger.warning(f"社員名簿の{line}行目: 社員IDがないため読み飛ばします。")
+            continue
+        if employee_id in rows:
+            logger.warning(f"社員名簿の{line}行目: 社員ID「{employee_id}」が重複しているため読み飛ばします。")
+            continue
+        try:
+            features[employee_id] = build_features(row, reference_date)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"社員名簿の{line}行目: 社員ID「{employee_id}」の値が不正なため読み飛ばします: {e}")
+            continue
+        rows[employee_id] = row
+        positions.append(position)
+
+    if len(positions) < len(df):
+        df = df.iloc[positions].reset_index(drop=True)
+    return df, rows, features
+
+
+def find_dimension_value(query, values):
+    """
+    クエリ内に含まれる集計軸の値を取得（「営業」のように「部」を省略した表記にも対応）
+
+    Args:
+        query: ユーザー入力値
+        values: 集計軸の値の一覧
+
+    Returns:
+        一致した値。見つからなければNone
+    """
+    # 「インターン」と「インターン生」のような包含関係がある場合に備えて、長い値から順に判定
+    for value in sorted(values, key=len, reverse=True):
+        if value in query:
+            return value
+    for value in sorted(values, key=len, reverse=True):
+        if value.endswith("部") and len(value) > 2 and value[:-1] in query:
+            return value
+    return None
+
+
+def format_aggregate_table(results, group_by, show_age=False, show_tenure=False):
+    """
+    集計結果をMarkdownのテーブル形式に整形
+
+    Args:
+        results: EmployeeEngine.aggregateの戻り値
+        group_by: 集計軸のリスト
+        show_age: 年代分布・平均年齢の列を含めるかどうか
+        show_tenure: 勤続年数分布の列を含めるかどうか
+
+    Returns:
+        Markdown形式のテーブル文字列
+    """
+    age_labels = sorted({label for _, stats in results for label in stats.age_buckets})
+    tenure_labels = [label for _, label in ct.EMPLOYEE_TENURE_BUCKETS]
+
+    headers = list(group_by) + ["人数"]
+    if show_age:
+        headers += ["平均年齢"] + age_labels
+    if show_tenure:
+        headers += tenure_labels
+
+    rows = []
+    total = 0
+    for key, stats in results:
+        row = list(key) + [stats.count]
+        if show_age:
+            row += [f"{stats.average_age:.1f}"] + [stats.age_buckets.get(label, 0) for label in age_labels]
+        if show_tenure:
+            row += [stats.tenure_buckets.get(label, 0) for label in tenure_labels]
+        rows.append(row)
+        total += stats.count
+
+    table = tabulate(rows, headers=headers, tablefmt="pipe")
+    if group_by and len(results) > 1:
+        table += f"\n\n合計: {total}名"
+    return table
+
+
+def format_employee_record(row):
+    """
+    社員1名分の行データを「項目名: 値」形式の1行ずつのテキストに整形
+    """
+    lines = []
+    for column in ct.EMPLOYEE_RECORD_COLUMNS:
+        value = row.get(column)
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            continue
+        label = "氏名" if column == ct.EMPLOYEE_NAME_COLUMN else column
+        lines.append(f"{label}: {value}")
+    return "\n".join(lines)
+
+
+def format_employee_table(df):
+    """
+    社員の行データを、RAG用ドキュメントと同じ列のMarkdownテーブルに整形
+    （LLMに渡す文脈用のため、トークン数を抑えるよう列幅の空白埋めは行わない）
+    """
+    columns = [column for column in ct.EMPLOYEE_RECORD_COLUMNS if column in df.columns]
+    lines = [
+        "| " + " | ".join(columns) + " |",
+        "|" + "---|" * len(columns),
+    ]
+    for row in df[columns].itertuples(index=False):
+        lines.append("| " + " | ".join("" if pd.isna(value) else str(value) for value in row) + " |")
+    return "\n".join(lines)
+
+
+def normalize_name(text):
+    """
+    氏名照合用に文字列を正規化（全角・半角の統一、空白の除去、英字の小文字化）
+    """
+    text = unicodedata.normalize("NFKC", text)
+    return "".join(text.split()).lower()
+
+
+def strip_name_query(text):
+    """
+    氏名のみの質問かを判定するために、正規化した文字列の末尾から「について教えて」などの語と敬称を取り除く
+    """
+    text = normalize_name(text)
+    stripped = True
+    while stripped:
+        stripped = False
+        for suffix in ct.EMPLOYEE_NAME_QUERY_SUFFIXES + ct.EMPLOYEE_NAME_HONORIFICS:
+            if text.endswith(suffix) and len(text) > len(suffix):
+                text = text[:-len(suffix)]
+                stripped = True
+    return text
+
+
+def char_ngrams(text, n=ct.EMPLOYEE_NAME_NGRAM):
+    """
+    文字n-gramの一覧を取得（n文字未満の場合は文字列全体を1つのn-gramとする）
+    """
+    if len(text) < n:
+        return [text] if text else []
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+def allowed_edit_distance(key):
+    """
+    検索キーの長さに応じて許容する編集距離（短い名前ほど誤一致しやすいため厳しくする）
+    """
+    if len(key) < 4:
+        return 0
+    return min(ct.EMPLOYEE_NAME_MAX_EDIT_DISTANCE, len(key) // 4)
+
+
+def substring_edit_distance(pattern, text, max_distance):
+    """
+    textのいずれかの部分文字列とpatternとの最小編集距離を計算（上限付き）
+
+    Args:
+        pattern: 検索キー
+        text: 照合対象の文字列
+        max_distance: 許容する編集距離の上限
+
+    Returns:
+        編集距離。上限を超える場合はNone
+    """
+    if max_distance == 0:
+        return 0 if pattern in text else None
+
+    # 先頭の行を0で初期化することで、textの任意の位置から一致を開始できるようにする
+    previous = list(range(len(pattern) + 1))
+    best = previous[-1]
+    for char in text:
+        current = [0]
+        for i, pattern_char in enumerate(pattern, 1):
+            cost = 0 if pattern_char == char else 1
+            current.append(min(previous[i] + 1, current[i - 1] + 1, previous[i - 1] + cost))
+        best = min(best, current[-1])
+        previous = current
+
+    return best if best <= max_distance else None
+
+
+def parse_range_query(query):
+    """
+    クエリから日付・年齢の範囲条件と、上位N件の指定を抽出
+
+    Args:
+        query: ユーザー入力値
+
+    Returns:
+        EmployeeEngine.searchに渡す引数の辞書。該当する指定がなければNone
+    """
+    spec = {}
+    ranges = {}
+    # 年齢・上位N件の指定は、社員（または入社）について尋ねている場合のみ対象とする
+    # （「20代向けのサービス」「若い顧客」のような社員と無関係な質問は通常のRAG処理に任せる）
+    mentions_employee = any(
+        keyword in query
+        for keyword in ct.EMPLOYEE_QUERY_KEYWORDS + ct.EMPLOYEE_DATE_COLUMN_KEYWORDS["入社日"]
+    )
+
+    # 「2020年以降」「2018年〜2020年」「2021年4月まで」などの日付範囲
+    # （「2023年の社員研修」のように、入社・生まれ・卒業のいずれも指定しない年指定は対象外とする）
+    date_column = None
+    for column, keywords in ct.EMPLOYEE_DATE_COLUMN_KEYWORDS.items():
+        if any(keyword in query for keyword in keywords):
+            date_column = column
+            break
+    date_matches = []
+    if date_column is not None:
+        date_matches = list(re.finditer(r"(\d{4})年(?:(\d{1,2})月)?(以降|以後|から|より後|以前|まで|より前)?", query))
+    for i, match in enumerate(date_matches):
+        year, month, suffix = int(match.group(1)), match.group(2), match.group(3)
+        start = date(year, int(month) if month else 1, 1)
+        end_month = int(month) if month else 12
+        end = date(year, end_month, calendar.monthrange(year, end_month)[1])
+        low, high = ranges.get(date_column, (None, None))
+        if suffix in ("以降", "以後", "から"):
+            low = start
+        elif suffix == "より後":
+            low = end + timedelta(days=1)
+        elif suffix in ("以前", "まで"):
+            high = end
+        elif suffix == "より前":
+            high = start - timedelta(days=1)
+        elif len(date_matches) == 2:
+            # 「2018年〜2020年」のように2つの年が並ぶ場合は、1つ目を下限、2つ目を上限とする
+            low, high = (start, high) if i == 0 else (low, end)
+        else:
+            low, high = start, end
+        ranges[date_column] = (low, high)
+
+    # 「30歳以上」「25歳未満」「40代」などの年齢範囲
+    age_query = query if mentions_employee else ""
+    for match in re.finditer(r"(\d{1,3})歳(以上|以下|未満|より上|超)?", age_query):
+        age, suffix = int(match.group(1)), match.group(2)
+        low, high = ranges.get("年齢", (None, None))
+        if suffix == "以上":
+            low = age
+        elif suffix in ("より上", "超"):
+            low = age + 1
+        elif suffix == "以下":
+            high = age
+        elif suffix == "未満":
+            high = age - 1
+        else:
+            low, high = age, age
+        ranges["年齢"] = (low, high)
+    for match in re.finditer(r"(\d{2})代", age_query):
+        decade = int(match.group(1))
+        ranges["年齢"] = (decade, decade + ct.EMPLOYEE_AGE_BUCKET_WIDTH - 1)
+
+    if ranges:
+        spec["ranges"] = ranges
+
+    # 「最近入社した5名」「各部署で最も勤続年数が長い社員」などの上位N件
+    top_n_query = query if mentions_employee else ""
+    superlative = any(word in top_n_query for word in ct.EMPLOYEE_TOP_N_SUPERLATIVES)
+    for word in ct.EMPLOYEE_TOP_N_SUPERLATIVES:
+        top_n_query = top_n_query.replace(word, "")
+    for keywords, column, descending in ct.EMPLOYEE_TOP_N_PATTERNS:
+        if any(keyword in top_n_query for keyword in keywords):
+            spec["order_by"] = column
+            spec["descending"] = descending
+            per_group = None
+            for dim, dim_keywords in ct.EMPLOYEE_DIMENSION_KEYWORDS.items():
+                if any(f"{prefix}{keyword}" in query or f"{keyword}{suffix}" in query
+                       for keyword in dim_keywords for prefix in ["各"] for suffix in ["ごと", "別"]):
+                    per_group = dim
+                    break
+            count_match = re.search(r"(\d+)\s*(?:人|名|件)", query)
+            if count_match:
+                spec["limit"] = int(count_match.group(1))
+            else:
+                spec["limit"] = 1 if per_group or superlative else ct.EMPLOYEE_TOP_N_DEFAULT
+            spec["per_group"] = per_group
+            break
+
+    return spec or None
+
+
+def to_index_value(index, value):
+    """
+    範囲条件の値を、インデックスの値の型（datetime64[D]またはfloat）に揃える
+    """
+    if value is None:
+        return None
+    if np.issubdtype(index.sorted_values.dtype, np.datetime64):
+        return np.datetime64(value, "D")
+    return float(value)
+
+
+def scan_ordered(ordered, masks, limit, groups=None, group_total=None):
+    """
+    並び順の先頭から条件に一致する行を探し、必要な件数が揃った時点で打ち切る
+
+    Args:
+        ordered: 並び替え済みの行番号
+        masks: 一致条件ごとの行マスクのリスト
+        limit: 取得件数（groupsを指定した場合はグループごとの件数）
+        groups: グループごとに取得する場合の、行ごとのグループ値の配列
+        group_total: グループの総数（全グループでlimit件揃った時点で打ち切る）
+
+    Returns:
+        条件に一致した行番号（並び順を維持）
+    """
+    if limit is None or (not masks and groups is None):
+        for mask in masks:
+            ordered = ordered[mask[ordered]]
+        return ordered
+
+    # 一度に判定する件数を少しずつ増やしながら走査し、全件を判定せずに済ませる
+    found = []
+    found_count = 0
+    taken = Counter()
+    chunk_size = max(limit * 4, 64)
+    start = 0
+    while start < len(ordered):
+        chunk = ordered[start:start + chunk_size]
+        for mask in masks:
+            chunk = chunk[mask[chunk]]
+        found.append(chunk)
+        if groups is None:
+            found_count += len(chunk)
+            if found_count >= limit:
+                break
+        else:
+            taken.update(groups[chunk])
+            full = sum(1 for count in taken.values() if count >= limit)
+            if full >= group_total:
+                break
+        start += chunk_size
+        chunk_size *= 2
+
+    return np.concatenate(found) if found else ordered[:0]
+
+
+def format_range_condition(column, low, high):
+    """
+    範囲条件を表示用の文字列に整形
+    """
+    if low is not None and high is not None:
+        return f"{column}: {low}〜{high}"
+    if low is not None:
+        return f"{column}: {low}以上"
+    return f"{column}: {high}以下"
+
+
+# プロセス内で共有する従業員エンジン（全セッションで同じ集計値を参照する）
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_employee_engine():
+    """
+    共有の従業員エンジンを取得（CSVが更新されていれば差分を反映してから返す）
+
+    Returns:
+        EmployeeEngineのインスタンス
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = EmployeeEngine()
+    _engine.refresh()
+    return _engine
@@ -0,0 +1,238 @@
+"""
+このファイルは、検索の品質（正解のドキュメントを取得できているか）と、そのコスト（プロンプトのトークン数・検索の所要時間）を
+インデックスとチャンク分割の設定ごとに評価するためのファイルです。
+RAG_SEARCH_K・CHUNK_SIZE・CHUNK_OVERLAPを変更する際や、性能改善の前後で、検索品質が保たれていることの確認に使います。
+
+評価用の質問と正解は eval_queries.jsonl（1行に1件）に記述します。正解はドキュメントのメタデータとの一致条件で指定します。
+    {"question": "株主優待の内容を教えて", "relevant": [{"source": "株主優待について.pdf"}]}
+    {"question": "経理部の主任を教えて", "relevant": [{"employee_id": "EMP0007"}, {"employee_id": "EMP0026"}]}
+    （sourceはファイル名で比較し、pageなどその他のキーは値が一致するかで比較する）
+
+使い方:
+    python evaluate_retrieval.py                                   # 現在の設定で評価
+    python evaluate_retrieval.py --chunk-sizes 500 800 1200 --chunk-overlaps 50 100 -k 3 5 8
+    python evaluate_retrieval.py --stub                            # APIを使わずに動作確認（品質の値は意味を持たない）
+
+評価指標:
+    recall@k       正解のうち、上位k件に含まれた割合の平均
+    mrr            最初に正解が現れた順位の逆数の平均
+    hit_rate       上位k件に正解が1件以上含まれた質問の割合
+    prompt_tokens  上位k件から作成したLLMへのメッセージのトークン数の平均
+    embed / search 質問の埋め込み・検索の所要時間（ミリ秒）
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import constants as ct
+from benchmark import get_vectorstore_class
+
+
+############################################################
+# 関数定義
+############################################################
+
+def load_labelled_queries(path=ct.EVAL_QUERIES_PATH):
+    """
+    評価用の質問と正解の一覧を読み込む
+
+    Returns:
+        「question」「relevant」キーを持つ辞書のリスト
+    """
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if not record.get("question") or not record.get("relevant"):
+                raise ValueError(f"{path}の{line_number}行目に質問（question）または正解（relevant）がありません。")
+            queries.append(record)
+    return queries
+
+
+def is_relevant(doc, label):
+    """
+    ドキュメントが正解の一致条件を満たすかを判定
+    """
+    for key, expected in label.items():
+        value = doc.metadata.get(key)
+        if key == "source":
+            value = os.path.basename(str(value or "").replace("\\", "/"))
+        if value != expected:
+            return False
+    return True
+
+
+def score_ranking(docs, labels):
+    """
+    検索結果の順位から、正解の再現率と、最初の正解の順位の逆数を計算
+
+    Returns:
+        (再現率, 順位の逆数)
+    """
+    found = set()
+    reciprocal_rank = 0.0
+    for rank, doc in enumerate(docs, 1):
+        matched = [i for i, label in enumerate(labels) if is_relevant(doc, label)]
+        if matched and not reciprocal_rank:
+            reciprocal_rank = 1.0 / rank
+        found.update(matched)
+    return len(found) / len(labels), reciprocal_rank
+
+
+def prompt_tokens(docs, question):
+    """
+    検索結果から作成した、回答生成用のLLMへのメッセージのトークン数
+    """
+    import utils
+    from context_packer import count_tokens
+
+    messages = utils.build_rag_messages(question, utils.build_context_text(docs, question))
+    return sum(count_tokens(message.content) for message in messages)
+
+
+def search(index, retriever, question, query_vector, k):
+    """
+    指定のインデックスで検索
+
+    Returns:
+        ドキュメントのリストと、検索の所要時間（秒）
+    """
+    from lexical_search import lexical_search
+
+    started_at = time.perf_counter()
+    if index == "lexical":
+        docs = lexical_search(retriever, question, k)
+    else:
+        docs = retriever.vectorstore.similarity_search_by_vector(query_vector, k=k)
+    return docs, time.perf_counter() - started_at
+
+
+def evaluate(queries, chunk_sizes=(ct.CHUNK_SIZE,), chunk_overlaps=(ct.CHUNK_OVERLAP,),
+             k_values=ct.EVAL_K_VALUES, indexes=ct.EVAL_INDEXES, embeddings=None):
+    """
+    インデックス・チャンク分割の設定・取得件数の組み合わせごとに、検索品質とコストを評価
+
+    質問の埋め込みはチャンク分割の設定によらず同じため、最初に1回だけ取得する。
+
+    Returns:
+        組み合わせごとの評価結果の辞書のリスト
+    """
+    from initialize_ultra_lite import load_source_documents, split_documents, build_retriever
+    from llm_clients import get_embeddings
+    from utils import create_csv_documents
+
+    embeddings = embeddings or get_embeddings()
+    source_docs = load_source_documents()
+    csv_docs = create_csv_documents()
+
+    query_vectors, embed_seconds = [], []
+    for query in queries:
+        started_at = time.perf_counter()
+        query_vectors.append(embeddings.embed_query(query["question"]))
+        embed_seconds.append(time.perf_counter() - started_at)
+
+    results = []
+    for chunk_size in chunk_sizes:
+        for chunk_overlap in chunk_overlaps:
+            if chunk_overlap >= chunk_size:
+                continue
+            print(f"評価中: CHUNK_SIZE={chunk_size}, CHUNK_OVERLAP={chunk_overlap}", file=sys.stderr)
+            chunks = split_documents(source_docs, chunk_size, chunk_overlap)
+            started_at = time.perf_counter()
+            retriever = build_retriever(csv_docs + chunks, embeddings, get_vectorstore_class())
+            build_seconds = time.perf_counter() - started_at
+
+            for index in indexes:
+                for k in k_values:
+                    details, search_seconds = [], []
+                    for query, query_vector in zip(queries, query_vectors):
+                        docs, seconds = search(index, retriever, query["question"], query_vector, k)
+                        search_seconds.append(seconds)
+                        recall, reciprocal_rank = score_ranking(docs, query["relevant"])
+                        details.append({
+                            "question": query["question"],
+                            "recall": recall,
+                            "reciprocal_rank": reciprocal_rank,
+                            "prompt_tokens": prompt_tokens(docs, query["question"]),
+                            "sources": [doc.metadata.get("source") for doc in docs],
+                        })
+                    results.append({
+                        "index": index,
+                        "chunk_size": chunk_size,
+                        "chunk_overlap": chunk_overlap,
+                        "k": k,
+                        "chunks": len(chunks),
+                        "index_build_seconds": build_seconds,
+                        "recall_at_k": float(np.mean([d["recall"] for d in details])),
+                        "mrr": float(np.mean([d["reciprocal_rank"] for d in details])),
+                        "hit_rate": float(np.mean([d["reciprocal_rank"] > 0 for d in details])),
+                        "prompt_tokens": float(np.mean([d["prompt_tokens"] for d in details])),
+                        "embed_p50_ms": float(np.percentile(embed_seconds, 50) * 1000) if index == "vector" else 0.0,
+                        "search_p50_ms": float(np.percentile(search_seconds, 50) * 1000),
+                        "search_p95_ms": float(np.percentile(search_seconds, 95) * 1000),
+                        "details": details,
+                    })
+    return results
+
+
+def print_results(results):
+    print(f"{'index':8} {'size':>5} {'overlap':>7} {'k':>3} {'chunks':>6} {'recall@k':>8} {'mrr':>6} {'hit':>6} "
+          f"{'tokens':>7} {'embed_ms':>8} {'search_ms':>9}")
+    for r in results:
+        print(f"{r['index']:8} {r['chunk_size']:>5} {r['chunk_overlap']:>7} {r['k']:>3} {r['chunks']:>6} "
+              f"{r['recall_at_k']:>8.3f} {r['mrr']:>6.3f} {r['hit_rate']:>6.3f} {r['prompt_tokens']:>7.0f} "
+              f"{r['embed_p50_ms']:>8.1f} {r['search_p50_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="インデックス・チャンク分割の設定ごとの検索品質とコストの評価")
+    parser.add_argument("--queries", default=ct.EVAL_QUERIES_PATH, help="評価用の質問と正解のJSONLファイル")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[ct.CHUNK_SIZE])
+    parser.add_argument("--chunk-overlaps", type=int, nargs="+", default=[ct.CHUNK_OVERLAP])
+    parser.add_argument("-k", type=int, nargs="+", default=list(ct.EVAL_K_VALUES), help="評価する取得件数")
+    parser.add_argument("--indexes", nargs="+", choices=ct.EVAL_INDEXES, default=list(ct.EVAL_INDEXES))
+    parser.add_argument("--stub", action="store_true", help="APIを使わないスタブの埋め込みモデルで動作確認する")
+    parser.add_argument("-o", "--output", help="結果のJSONファイル（既定は ./logs/eval/eval_日時.json）")
+    args = parser.parse_args()
+
+    if args.stub:
+        os.environ[ct.LLM_BACKEND_ENV] = "stub"
+    # Streamlitの画面外で実行する際の警告を抑止
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+
+    queries = load_labelled_queries(args.queries)
+    results = evaluate(queries, args.chunk_sizes, args.chunk_overlaps, args.k, args.indexes)
+    print_results(results)
+
+    output = args.output
+    if output is None:
+        os.makedirs(ct.EVAL_DIR_PATH, exist_ok=True)
+        output = os.path.join(ct.EVAL_DIR_PATH, f"eval_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "queries": args.queries,
+                "vectorstore": get_vectorstore_class().__name__,
+                "stub": args.stub,
+            },
+            "results": results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+このファイルは、LLMの応答が遅い場合に同じリクエストをもう1本送り、先に応答した方を採用する（ヘッジリクエスト）処理が記述されたファイルです。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import asyncio
+import threading
+import time
+from collections import deque
+import numpy as np
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class LatencyTracker:
+    """
+    直近のLLM呼び出しの、最初のトークンが届くまでの時間（TTFT）の記録
+    """
+
+    def __init__(self, window=ct.HEDGE_LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def hedge_delay(self, percentile=ct.HEDGE_PERCENTILE):
+        """
+        2本目のリクエストを送るまでの待ち時間（直近の記録の指定パーセンタイル）
+
+        Returns:
+            待ち時間（秒）。記録が少なく判断できない場合はNone（ヘッジしない）
+        """
+        with self._lock:
+            if len(self._latencies) < ct.HEDGE_MIN_SAMPLES:
+                return None
+            latencies = np.asarray(self._latencies, dtype=float)
+        return max(float(np.percentile(latencies, percentile)), ct.HEDGE_MIN_DELAY_SECONDS)
+
+
+class HedgeBudget:
+    """
+    ヘッジによる追加のリクエスト数の上限（トークンバケット方式）
+
+    リクエスト1件ごとに ratio 分の枠が貯まり、ヘッジ1回で1枠を使う。枠の上限は burst。
+    """
+
+    def __init__(self, ratio=ct.HEDGE_BUDGET_RATIO, burst=ct.HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self.requests = 0
+        self.hedges = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_acquire(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedges += 1
+            return True
+
+
+class _Cancelled(Exception):
+    """
+    先に応答した側を採用したため、打ち切られたリクエスト
+    """
+
+
+class HedgedLLM:
+    """
+    invokeの呼び出しにヘッジリクエストを使うLLMのラッパー
+
+    ストリーミングで呼び出し、最初のトークンが直近のTTFTの指定パーセンタイルを過ぎても届かない場合に、
+    同じリクエストをもう1本送る。先に最初のトークンが届いた方を採用し、もう一方はその時点でキャンセルしてストリームを閉じる。
+    同期の呼び出し（invoke）も、共有の非同期エンジン上で ainvoke を実行する。
+
+    ScheduledLLMで包んで使う場合、スケジューラの実行枠は1本目のリクエストの分のみ確保される。
+    scheduler を渡すと、ヘッジ側のリクエストにも実行枠を確保し、空きがなければヘッジしない
+    （同時に実行するLLM呼び出し数が、スケジューラの上限を超えないようにする）。
+    """
+
+    def __init__(self, llm, tracker=None, budget=None, enabled=None, scheduler=None):
+        self.llm = llm
+        self.tracker = tracker or _tracker
+        self.budget = budget or _budget
+        self.enabled = ct.HEDGE_ENABLED if enabled is None else enabled
+        self.scheduler = scheduler
+
+    def invoke(self, messages, on_first_token=None, **kwargs):
+        """
+        ヘッジ付きで回答を生成
+
+        Args:
+            messages: LLMへのメッセージ
+            on_first_token: 採用したリクエストの最初のトークンが届いた時点で呼び出すコールバック（TTFTの計測用）
+        """
+        if not self.enabled and on_first_token is None:
+            return self.llm.invoke(messages, **kwargs)
+
+        # 負けた側のリクエストを最初のトークンの時点で確実に打ち切れるよう、非同期版で実行する
+        # （同期のストリームは、別スレッドで次のトークンを待っている間は閉じられない）
+        from async_engine import get_async_engine
+        return get_async_engine().run(self.ainvoke(messages, on_first_token=on_first_token, **kwargs))
+
+    async def ainvoke(self, messages, on_first_token=None, **kwargs):
+        """
+        invokeの非同期版（負けた側のリクエストは、最初のトークンが届いた時点で即座にキャンセルする）
+        """
+        if not self.enabled and on_first_token is None:
+            return await self.llm.ainvoke(messages, **kwargs)
+
+        if self.enabled:
+            self.budget.record_request()
+        first_token = asyncio.Event()
+        tasks = []
+        state = {"winner": None}
+
+        async def stream(name):
+            started_at = time.monotonic()
+            message = None
+            try:
+                async for chunk in self.llm.astream(messages, **kwargs):
+                    if message is None:
+                        # 採用されたかどうかに関わらず、最初のトークンが届いたリクエストのTTFTを記録
+                        self.tracker.record(time.monotonic() - started_at)
+                        if state["winner"] is None:
+                            state["winner"] = name
+                            first_token.set()
+                            if on_first_token is not None:
+                                on_first_token()
+                            # 負けた側のリクエストをキャンセル（ストリームが閉じられる）
+                            for task in tasks:
+                                if task is not asyncio.current_task():
+                                    task.cancel()
+                    if state["winner"] != name:
+                        raise _Cancelled()
+                    message = chunk if message is None else message + chunk
+            except asyncio.CancelledError:
+                if message is None and name == "primary" and state["winner"] == "hedge":
+                    # ヘッジ側が先に応答した場合、1本目のTTFTは少なくともここまでの待ち時間だったとして記録する
+                    # （採用された側だけを記録すると、遅い応答が記録から抜けてパーセンタイルが小さく偏るため）
+                    self.tracker.record(time.monotonic() - started_at)
+                raise
+            if message is None:
+                raise RuntimeError("LLMから応答がありませんでした。")
+            return message
+
+        tasks.append(asyncio.create_task(stream("primary")))
+        waiter = asyncio.create_task(first_token.wait())
+        try:
+            delay = self.tracker.hedge_delay() if self.enabled else None
+            if delay is not None:
+                await asyncio.wait([tasks[0], waiter], timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not first_token.is_set() and not tasks[0].done() and self._try_acquire_hedge():
+                    hedge = asyncio.create_task(stream("hedge"))
+                    if self.scheduler is not None:
+                        # 開始前にキャンセルされた場合も含め、終了時に確保した実行枠を解放する
+                        hedge.add_done_callback(lambda _: self.scheduler.release())
+                    tasks.append(hedge)
+
+            errors = []
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None:
+                        return task.result()
+                    if not isinstance(task.exception(), _Cancelled):
+                        errors.append(task.exception())
+            raise errors[0] if errors else RuntimeError("LLMから応答がありませんでした。")
+        finally:
+            waiter.cancel()
+            for task in tasks:
+                task.cancel()
+
+    def _try_acquire_hedge(self):
+        """
+        ヘッジ側のリクエストを送れるかを判定（スケジューラの実行枠とヘッジの上限の両方に空きがある場合のみ）
+        """
+        if self.scheduler is not None and not self.scheduler.try_acquire():
+            return False
+        if not self.budget.try_acquire():
+            if self.scheduler is not None:
+                self.scheduler.release()
+            return False
+        return True
+
+
+############################################################
+# 関数定義
+############################################################
+# プロセス全体で共有する、TTFTの記録とヘッジの上限
+_tracker = LatencyTracker()
+_budget = HedgeBudget()
+
+
+def hedge_stats():
+    """
+    ヘッジの実行状況（リクエスト数・ヘッジ数・現在の待ち時間）を取得
+    """
+    return {
+        "requests": _budget.requests,
+        "hedges": _budget.hedges,
+        "hedge_delay": _tracker.hedge_delay(),
+    }
@@ -9,7 +9,6 @@ from __future__ import annotations
 ############################################################
 import os
 import logging
-from logging.handlers import TimedRotatingFileHandler
 from uuid import uuid4
 import sys
 import unicodedata
@@ -18,9 +17,11 @@ import streamlit as st
 from docx import Document
 from langchain_community.document_loaders import WebBaseLoader
 from langchain.text_splitter import CharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 import constants as ct
+from conversation_memory import ConversationMemory
+from llm_clients import get_embeddings
+from structured_logging import setup_logging
 
 
 ############################################################
@@ -52,43 +53,10 @@ def initialize_logger():
     """
     ログ出力の設定
     """
-    # 指定のログフォルダが存在すれば読み込み、存在しなければ新規作成
-    os.makedirs(ct.LOG_DIR_PATH, exist_ok=True)
-    
-    # 引数に指定した名前のロガー（ログを記録するオブジェクト）を取得
-    # 再度別の箇所で呼び出した場合、すでに同じ名前のロガーが存在していれば読み込む
-    logger = logging.getLogger(ct.LOGGER_NAME)
-
-    # すでにロガーにハンドラー（ログの出力先を制御するもの）が設定されている場合、同じログ出力が複数回行われないよう処理を中断する
-    if logger.hasHandlers():
-        return
-
-    # 1日単位でログファイルの中身をリセットし、切り替える設定
-    log_handler = TimedRotatingFileHandler(
-        os.path.join(ct.LOG_DIR_PATH, ct.LOG_FILE),
-        when="D",
-        encoding="utf8"
-    )
-    # 出力するログメッセージのフォーマット定義
-    # - 「levelname」: ログの重要度（INFO, WARNING, ERRORなど）
-    # - 「asctime」: ログのタイムスタンプ（いつ記録されたか）
-    # - 「lineno」: ログが出力されたファイルの行番号
-    # - 「funcName」: ログが出力された関数名
-    # - 「session_id」: セッションID（誰のアプリ操作か分かるように）
-    # - 「message」: ログメッセージ
-    formatter = logging.Formatter(
-        f"[%(levelname)s] %(asctime)s line %(lineno)s, in %(funcName)s, session_id={st.session_state.session_id}: %(message)s"
-    )
-
-    # 定義したフォーマッターの適用
-    log_handler.setFormatter(formatter)
-
-    # ログレベルを「INFO」に設定
-    logger.setLevel(logging.INFO)
-
-    # 作成したハンドラー（ログ出力先を制御するオブジェクト）を、
-    # ロガー（ログメッセージを実際に生成するオブジェクト）に追加してログ出力の最終設定
-    logger.addHandler(log_handler)
+    # ログは1行1件のJSONで出力し、各記録にはログ出力時に処理中のセッションのIDを付ける
+    # （ファイルへの書き込みはバックグラウンドのスレッドで行い、画面の処理を待たせない）
+    # すでに設定済みの場合、同じログ出力が複数回行われないよう何もしない
+    setup_logging()
 
 
 def initialize_session_id():
@@ -127,8 +95,8 @@ def initialize_retriever():
         
         logger.info("文字コード調整完了")
         
-        # 埋め込みモデルの用意
-        embeddings = OpenAIEmbeddings()
+        # 埋め込みモデルの用意（回答時のLLMと接続プールを共有）
+        embeddings = get_embeddings()
         logger.info("埋め込みモデル準備完了")
         
         # チャンク分割用のオブジェクトを作成（マジックナンバー対策: 定数化）
@@ -165,8 +133,8 @@ def initialize_session_state():
     if "messages" not in st.session_state:
         # 「表示用」の会話ログを順次格納するリストを用意
         st.session_state.messages = []
-        # 「LLMとのやりとり用」の会話ログを順次格納するリストを用意
-        st.session_state.chat_history = []
+        # 「LLMとのやりとり用」の会話ログを順次格納するオブジェクトを用意（トークン数の上限付き）
+        st.session_state.chat_history = ConversationMemory()
 
 
 def load_data_sources():
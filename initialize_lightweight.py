@@ -6,6 +6,7 @@ Streamlit Cloud用の初期化ファイル（軽量版）
 import os
 import streamlit as st
 from typing import Optional
+from conversation_memory import ConversationMemory
 
 def initialize_retriever_lightweight():
     """
@@ -26,7 +27,7 @@ def initialize_app_lightweight():
     try:
         # セッション状態の初期化
         if "chat_history" not in st.session_state:
-            st.session_state.chat_history = []
+            st.session_state.chat_history = ConversationMemory()
         
         if "mode" not in st.session_state:
             st.session_state.mode = "社内問い合わせ"
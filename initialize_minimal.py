@@ -10,6 +10,7 @@ from uuid import uuid4
 import streamlit as st
 from dotenv import load_dotenv
 import constants as ct
+from conversation_memory import ConversationMemory
 
 # 「.env」ファイルで定義した環境変数の読み込み
 load_dotenv()
@@ -23,7 +24,7 @@ def initialize_minimal():
     # セッション状態の初期化
     if "messages" not in st.session_state:
         st.session_state.messages = []
-        st.session_state.chat_history = []
+        st.session_state.chat_history = ConversationMemory()
     
     # セッションID生成
     if "session_id" not in st.session_state:
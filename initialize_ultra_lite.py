@@ -6,16 +6,27 @@ Streamlit Cloud 超安定版初期化
 from __future__ import annotations
 
 import os
-import logging
-from logging.handlers import TimedRotatingFileHandler
+import threading
 from uuid import uuid4
 import streamlit as st
 import constants as ct
+from conversation_memory import ConversationMemory
+from metrics import start_metrics_server
+from structured_logging import setup_logging
 from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
 
 # 「.env」ファイルで定義した環境変数の読み込み
 load_dotenv()
 
+# 全セッションとHTTP API（api_server.py）で共有するRetriever
+_shared_retriever = None
+_shared_retriever_lock = threading.Lock()
+# 共有のRetrieverに登録した社内文書のチャンク（社員名簿の更新時に、読み込み・分割をやり直さずに使う）
+_source_chunks = []
+# 社員名簿の更新を反映するための、Retrieverの作り直しの実行中のスレッド
+_roster_rebuild = None
+
 def initialize():
     """
     画面読み込み時に実行する初期化処理（RAG対応版）
@@ -23,36 +34,19 @@ def initialize():
     initialize_session_state()
     initialize_session_id()
     initialize_logger()
-    # RAGリトリーバーを初期化
+    # Prometheusからメトリクスを取得するためのHTTPサーバーを起動（プロセスで1回のみ）
+    start_metrics_server()
+    # RAGリトリーバーを初期化（インデックスはプロセス全体で1回だけ作成し、全セッションで共有）
     if "retriever" not in st.session_state:
-        st.session_state.retriever = initialize_retriever()
+        st.session_state.retriever = get_shared_retriever()
 
 
 def initialize_logger():
     """
-    ログ出力の設定（簡素版）
+    ログ出力の設定（JSON形式・バックグラウンドのスレッドで書き込み。プロセスで1回のみ）
     """
     try:
-        os.makedirs(ct.LOG_DIR_PATH, exist_ok=True)
-        logger = logging.getLogger(ct.LOGGER_NAME)
-        
-        if logger.hasHandlers():
-            return
-
-        log_handler = TimedRotatingFileHandler(
-            os.path.join(ct.LOG_DIR_PATH, ct.LOG_FILE),
-            when="D",
-            encoding="utf8"
-        )
-        
-        formatter = logging.Formatter(
-            f"[%(levelname)s] %(asctime)s session_id={st.session_state.session_id}: %(message)s"
-        )
-        
-        log_handler.setFormatter(formatter)
-        logger.setLevel(logging.INFO)
-        logger.addHandler(log_handler)
-        
+        setup_logging()
     except Exception:
         # ログ初期化に失敗してもアプリは動作させる
         pass
@@ -72,7 +66,101 @@ def initialize_session_state():
     """
     if "messages" not in st.session_state:
         st.session_state.messages = []
-        st.session_state.chat_history = []
+        st.session_state.chat_history = ConversationMemory()
+
+
+def get_shared_retriever():
+    """
+    プロセス全体で共有するRetrieverを取得（初回の呼び出し時に作成）
+
+    インデックスの内容はセッションによらず同じため、セッションごとに文書の読み込み・埋め込みをやり直さない。
+    作成に失敗した場合は保持せず、次の呼び出しで作成をやり直す。
+
+    Returns:
+        Retriever（作成に失敗した場合はNone）
+    """
+    global _shared_retriever
+    if _shared_retriever is None:
+        with _shared_retriever_lock:
+            if _shared_retriever is None:
+                _shared_retriever = initialize_retriever()
+    else:
+        refresh_roster_documents(_shared_retriever)
+    return _shared_retriever
+
+
+def get_current_retriever(retriever):
+    """
+    セッションが保持しているRetrieverが共有のRetrieverの場合、社員名簿の更新を反映した最新のものを取得
+
+    Args:
+        retriever: セッションが保持しているRetriever
+
+    Returns:
+        共有のRetrieverであれば最新の共有のRetriever、それ以外（負荷試験用など）はそのまま
+    """
+    if retriever is None or "roster_version" not in (getattr(retriever, "metadata", None) or {}):
+        return retriever
+    return get_shared_retriever()
+
+
+def refresh_roster_documents(retriever):
+    """
+    社員名簿のCSVが更新されていれば、社員ごとのドキュメントを入れ替えたRetrieverをバックグラウンドで作り直す
+
+    作り直しが終わるまでは、現在のRetrieverで検索を続ける。作り直したRetrieverは、共有のRetrieverと差し替える。
+
+    Args:
+        retriever: 現在の共有のRetriever
+    """
+    global _roster_rebuild
+    from employee_engine import get_employee_engine
+
+    indexed_version = (retriever.metadata or {}).get("roster_version")
+    if indexed_version is None or indexed_version == get_employee_engine().version:
+        return
+    with _shared_retriever_lock:
+        if _roster_rebuild is not None and _roster_rebuild.is_alive():
+            return
+        _roster_rebuild = threading.Thread(
+            target=_rebuild_roster_documents, args=(retriever,), name="roster-reindex", daemon=True
+        )
+        _roster_rebuild.start()
+
+
+def _rebuild_roster_documents(retriever):
+    """
+    社員ごとのドキュメントを最新の社員名簿から作り直し、共有のRetrieverを差し替える（別スレッドで実行）
+    """
+    global _shared_retriever
+    from employee_engine import get_employee_engine
+    from utils import create_csv_documents
+
+    try:
+        # 作成中に社員名簿がさらに更新された場合は、次の呼び出しで改めて作り直す
+        roster_version = get_employee_engine().version
+        documents = create_csv_documents() + _source_chunks
+        # 変更のない社員・社内文書のチャンクは、作成済みの埋め込みベクトルを使う
+        embeddings = retriever.vectorstore.embeddings
+        if isinstance(embeddings, ReusedEmbeddings):
+            embeddings = embeddings.for_documents(documents)
+        new_retriever = build_retriever(documents, embeddings=embeddings, vectorstore_cls=type(retriever.vectorstore))
+        new_retriever.metadata["roster_version"] = roster_version
+        with _shared_retriever_lock:
+            if _shared_retriever is retriever:
+                _shared_retriever = new_retriever
+        print(f"社員名簿の更新を検索インデックスに反映しました: {len(documents)}件")
+    except Exception as e:
+        print(f"社員名簿の検索インデックスへの反映に失敗: {e}")
+
+
+def set_shared_retriever(retriever):
+    """
+    作成済みのRetrieverを、プロセス全体で共有するRetrieverとして設定（負荷試験などで、あらかじめ作成したものを使う場合）
+    """
+    global _shared_retriever
+    with _shared_retriever_lock:
+        _shared_retriever = retriever
 
 
 def initialize_retriever():
@@ -80,11 +168,6 @@ def initialize_retriever():
     RAG統合版リトリーバー初期化（CSV+ファイル統合）
     """
     try:
-        from langchain_openai import OpenAIEmbeddings
-        from langchain_community.vectorstores import FAISS
-        from langchain.text_splitter import RecursiveCharacterTextSplitter
-        import os
-        
         all_documents = []
         
         # 1. CSVデータをドキュメント化
@@ -94,45 +177,22 @@ def initialize_retriever():
             all_documents.extend(csv_docs)
             print(f"CSV文書を統合: {len(csv_docs)}件")
         
-        # 2. 社内文書ファイルを読み込み
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=ct.CHUNK_SIZE,
-            chunk_overlap=ct.CHUNK_OVERLAP,
-            separators=[ct.CHUNK_SEPARATOR]
-        )
-        
-        # サポートされているファイル形式を読み込み
-        for root, dirs, files in os.walk(ct.RAG_TOP_FOLDER_PATH):
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_extension = os.path.splitext(file)[1].lower()
-                
-                if file_extension in ct.SUPPORTED_EXTENSIONS:
-                    try:
-                        # ファイル読み込み
-                        loader = ct.SUPPORTED_EXTENSIONS[file_extension](file_path)
-                        documents = loader.load()
-                        
-                        # テキスト分割
-                        chunks = text_splitter.split_documents(documents)
-                        
-                        # メタデータにファイルパスを設定
-                        for chunk in chunks:
-                            chunk.metadata["source"] = file_path.replace("\\", "/")
-                        
-                        all_documents.extend(chunks)
-                        
-                    except Exception as e:
-                        print(f"ファイル読み込みエラー {file_path}: {e}")
+        # 2. 社内文書ファイルを読み込み、チャンクに分割
+        source_chunks = split_documents(load_source_documents())
+        all_documents.extend(source_chunks)
         
         print(f"総文書数: {len(all_documents)}件")
         
         # 3. ベクトルストア作成
         if all_documents:
-            from langchain_community.vectorstores import FAISS
-            embeddings = OpenAIEmbeddings()
-            vectorstore = FAISS.from_documents(all_documents, embeddings)
-            return vectorstore.as_retriever(search_kwargs={"k": ct.RAG_SEARCH_K})
+            from employee_engine import get_employee_engine
+            from llm_clients import get_embeddings
+            global _source_chunks
+            _source_chunks = source_chunks
+            retriever = build_retriever(all_documents, embeddings=ReusedEmbeddings(get_embeddings()))
+            # 社員名簿が更新された場合に、社員ごとのドキュメントを作り直すためのバージョン
+            retriever.metadata["roster_version"] = get_employee_engine().version
+            return retriever
         else:
             print("読み込める文書が見つかりませんでした")
             return None
@@ -142,4 +202,173 @@ def initialize_retriever():
         print(f"RAG初期化失敗: {e}")
         import traceback
         print(traceback.format_exc())
-        return None
\ No newline at end of file
+        return None
+
+
+def load_source_documents(folder_path=ct.RAG_TOP_FOLDER_PATH):
+    """
+    フォルダ配下の社内文書ファイルを読み込む（社員名簿は「create_csv_documents」で社員ごとのドキュメントにしているため除外）
+
+    Args:
+        folder_path: 読み込むフォルダのパス
+
+    Returns:
+        ファイルパスをメタデータ「source」に設定したドキュメントのリスト
+    """
+    documents = []
+    for root, dirs, files in os.walk(folder_path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            file_extension = os.path.splitext(file)[1].lower()
+            
+            if os.path.normpath(file_path) == os.path.normpath(ct.EMPLOYEE_CSV_PATH):
+                continue
+
+            if file_extension in ct.SUPPORTED_EXTENSIONS:
+                try:
+                    loader = ct.SUPPORTED_EXTENSIONS[file_extension](file_path)
+                    loaded = loader.load()
+                    for doc in loaded:
+                        doc.metadata["source"] = file_path.replace("\\", "/")
+                    documents.extend(loaded)
+                except Exception as e:
+                    print(f"ファイル読み込みエラー {file_path}: {e}")
+    return documents
+
+
+def split_documents(documents, chunk_size=ct.CHUNK_SIZE, chunk_overlap=ct.CHUNK_OVERLAP, separators=None, splitter=None):
+    """
+    ドキュメントをチャンクに分割
+
+    開始位置（start_index）は、回答時に隣接チャンクの重複部分を除いて結合するために記録する。
+    分割の設定（chunking）は、インデックスのバージョン（compute_index_version）に含めるために記録する。
+
+    Args:
+        documents: 分割するドキュメントのリスト
+        chunk_size: チャンクの最大文字数（splitterが「token」の場合は最大トークン数）
+        chunk_overlap: チャンク間の重複文字数（splitterが「token」の場合は重複トークン数）
+        separators: 区切り文字のリスト（省略時は ct.CHUNK_SEPARATORS。splitterが「character」の場合は先頭のみ使う）
+        splitter: 分割の方法（省略時は ct.CHUNK_SPLITTER）
+
+    Returns:
+        チャンクのリスト
+    """
+    from langchain.text_splitter import CharacterTextSplitter, RecursiveCharacterTextSplitter
+    from context_packer import count_tokens
+
+    splitter = splitter or ct.CHUNK_SPLITTER
+    separators = separators or ct.CHUNK_SEPARATORS
+    if splitter == "character":
+        text_splitter = CharacterTextSplitter(
+            separator=separators[0],
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            add_start_index=True
+        )
+    elif splitter in ("recursive", "token"):
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=separators,
+            length_function=count_tokens if splitter == "token" else len,
+            add_start_index=True
+        )
+    else:
+        raise ValueError(f"未対応のチャンク分割の方法です: {splitter}")
+    chunks = text_splitter.split_documents(documents)
+    chunking = f"{splitter}:{chunk_size}:{chunk_overlap}:{separators!r}"
+    for chunk in chunks:
+        chunk.metadata["chunking"] = chunking
+    return chunks
+
+
+def build_retriever(documents, embeddings=None, vectorstore_cls=None):
+    """
+    ドキュメントのベクトルストアを作成し、Retrieverを取得
+
+    Args:
+        documents: インデックスに登録するドキュメントのリスト
+        embeddings: 埋め込みモデル（省略時は回答時のLLMと接続プールを共有するもの）
+        vectorstore_cls: ベクトルストアのクラス（省略時はFAISS）
+
+    Returns:
+        Retriever
+    """
+    from llm_clients import get_embeddings
+    from context_packer import annotate_token_counts
+    from lexical_search import get_lexical_index
+
+    if vectorstore_cls is None:
+        from langchain_community.vectorstores import FAISS
+        vectorstore_cls = FAISS
+
+    # 回答時に再計算しないよう、各チャンクのトークン数をメタデータに記録
+    annotate_token_counts(documents)
+    vectorstore = vectorstore_cls.from_documents(documents, embeddings or get_embeddings())
+    # 同じ内容のインデックスを使うセッション同士で、同時に来た同じ質問の処理をまとめられるよう、内容のバージョンを記録
+    retriever = vectorstore.as_retriever(
+        search_kwargs={"k": ct.RAG_SEARCH_K},
+        metadata={"index_version": compute_index_version(documents)}
+    )
+    # ベクトル検索が時間切れの場合に代替する語彙検索のインデックスも、あらかじめ作成しておく
+    get_lexical_index(retriever)
+    return retriever
+
+
+def compute_index_version(documents):
+    """
+    インデックスに登録するドキュメントの内容から、インデックスのバージョン（ハッシュ値）を計算
+
+    チャンク分割の設定は、定数の値ではなく各チャンクの分割に実際に使った設定（split_documentsが記録したもの）を含める。
+
+    Args:
+        documents: インデックスに登録するドキュメントのリスト
+
+    Returns:
+        ドキュメントの内容が同じであれば同じになる文字列
+    """
+    import hashlib
+
+    digest = hashlib.sha1()
+    digest.update(f"{ct.RAG_SEARCH_K}".encode("utf-8"))
+    for doc in documents:
+        digest.update(str(doc.metadata.get("source", "")).encode("utf-8"))
+        digest.update(str(doc.metadata.get("chunking", "")).encode("utf-8"))
+        digest.update(doc.page_content.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ReusedEmbeddings(Embeddings):
+    """
+    インデックスに登録したテキストの埋め込みベクトルを保持し、同じテキストは埋め込み直さない埋め込みモデルのラッパー
+    （社員名簿の更新時に、変更のない社員・社内文書のチャンクを埋め込み直さずにインデックスを作り直すため）
+    """
+
+    def __init__(self, embeddings, vectors=None):
+        self.embeddings = embeddings
+        self._vectors = dict(vectors or {})
+
+    def __getattr__(self, name):
+        # モデル名などは元の埋め込みモデルのものを参照
+        return getattr(self.embeddings, name)
+
+    def for_documents(self, documents):
+        """
+        documentsのうち、埋め込み済みのテキストのベクトルのみを引き継いだラッパーを作成（削除された社員の分は保持しない）
+        """
+        texts = {doc.page_content for doc in documents}
+        return ReusedEmbeddings(
+            self.embeddings, {text: vector for text, vector in self._vectors.items() if text in texts}
+        )
+
+    def embed_documents(self, texts):
+        missing = [text for text in dict.fromkeys(texts) if text not in self._vectors]
+        if missing:
+            self._vectors.update(zip(missing, self.embeddings.embed_documents(missing)))
+        return [self._vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text):
+        return await self.embeddings.aembed_query(text)
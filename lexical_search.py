@@ -0,0 +1,140 @@
+"""
+このファイルは、埋め込みモデルを使わない文字n-gramの語彙検索（BM25）の処理が記述されたファイルです。
+ベクトル検索が時間内に終わらない場合の代替の検索手段として使います。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import math
+import threading
+import weakref
+from collections import Counter, defaultdict
+import constants as ct
+from employee_engine import char_ngrams, normalize_name
+
+
+############################################################
+# クラス定義
+############################################################
+
+class LexicalIndex:
+    """
+    ドキュメントの文字n-gramの転置インデックス
+
+    日本語は単語の区切りがないため、文字n-gramを語として扱い、BM25でスコアを計算する。
+    """
+
+    def __init__(self, documents, n=ct.LEXICAL_NGRAM):
+        self.documents = list(documents)
+        self.n = n
+        # n-gram → [(ドキュメントの位置, 出現回数), ...]
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for position, doc in enumerate(self.documents):
+            grams = Counter(char_ngrams(normalize_name(doc.page_content), n))
+            self.lengths.append(sum(grams.values()))
+            for gram, count in grams.items():
+                self.postings[gram].append((position, count))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def search(self, query, k=ct.RAG_SEARCH_K):
+        """
+        質問文に含まれるn-gramをもとに、関連度の高い順にドキュメントを取得
+
+        Args:
+            query: 質問文
+            k: 取得する件数
+
+        Returns:
+            ドキュメントのリスト
+        """
+        if not self.documents:
+            return []
+
+        k1, b = ct.LEXICAL_BM25_K1, ct.LEXICAL_BM25_B
+        total = len(self.documents)
+        scores = defaultdict(float)
+        for gram in set(char_ngrams(normalize_name(query), self.n)):
+            postings = self.postings.get(gram)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, count in postings:
+                norm = k1 * (1 - b + b * self.lengths[position] / (self.average_length or 1))
+                scores[position] += idf * count * (k1 + 1) / (count + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        return [self.documents[position] for position, _ in ranked]
+
+
+############################################################
+# 関数定義
+############################################################
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def get_vectorstore_documents(vectorstore):
+    """
+    ベクターストアに登録されているドキュメントの一覧を取得（取得できない場合は空のリスト）
+    """
+    from langchain.schema import Document
+
+    # FAISS
+    docstore = getattr(vectorstore, "docstore", None)
+    store = getattr(docstore, "_dict", None)
+    if isinstance(store, dict):
+        return list(store.values())
+
+    # InMemoryVectorStore
+    store = getattr(vectorstore, "store", None)
+    if isinstance(store, dict):
+        return [Document(page_content=item["text"], metadata=item.get("metadata") or {}) for item in store.values()]
+
+    # Chroma
+    if hasattr(vectorstore, "get"):
+        try:
+            result = vectorstore.get(include=["documents", "metadatas"])
+            return [
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(result["documents"], result["metadatas"])
+            ]
+        except Exception as e:
+            print(f"語彙検索用のドキュメント取得エラー: {e}")
+    return []
+
+
+def get_lexical_index(retriever):
+    """
+    Retrieverのベクターストアと同じドキュメントを対象にした語彙検索のインデックスを取得（ベクターストアごとに1回だけ作成）
+
+    Returns:
+        LexicalIndexのインスタンス（ドキュメントを取得できない場合はNone）
+    """
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if vectorstore is None:
+        return None
+    with _indexes_lock:
+        index = _indexes.get(vectorstore)
+        if index is None:
+            documents = get_vectorstore_documents(vectorstore)
+            if not documents:
+                return None
+            index = _indexes[vectorstore] = LexicalIndex(documents)
+        return index
+
+
+def lexical_search(retriever, query, k=ct.RAG_SEARCH_K):
+    """
+    ベクトル検索の代わりに語彙検索で関連ドキュメントを取得
+
+    Returns:
+        ドキュメントのリスト（語彙検索ができない場合は空のリスト）
+    """
+    index = get_lexical_index(retriever)
+    if index is None:
+        return []
+    return index.search(query, k)
@@ -0,0 +1,194 @@
+"""
+このファイルは、LLM・埋め込みモデルのクライアントと、プロンプト・Chainのオブジェクトをプロセス全体で共有する処理が記述されたファイルです。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import threading
+from functools import lru_cache
+import httpx
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+import constants as ct
+from async_engine import get_async_engine
+
+
+############################################################
+# 設定関連
+############################################################
+_lock = threading.Lock()
+_http_client = None
+_async_http_client = None
+
+
+############################################################
+# 関数定義
+############################################################
+
+def http2_available():
+    """
+    HTTP/2を利用できるか（h2パッケージがインストールされているか）を判定
+    """
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _client_options():
+    """
+    同期・非同期のHTTPクライアントで共通の接続プール・タイムアウト設定を取得
+    """
+    return {
+        "http2": ct.LLM_HTTP2 and http2_available(),
+        "limits": httpx.Limits(
+            max_connections=ct.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=ct.LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=ct.LLM_POOL_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(ct.LLM_REQUEST_TIMEOUT, connect=ct.LLM_CONNECT_TIMEOUT),
+    }
+
+
+def use_stub_backend():
+    """
+    APIを呼び出さないスタブのLLM・埋め込みモデルを使うか（環境変数で指定）を判定
+    """
+    return os.environ.get(ct.LLM_BACKEND_ENV, "").lower() == "stub"
+
+
+def get_http_client():
+    """
+    LLM・埋め込みモデルのAPI呼び出しで共有する同期HTTPクライアントを取得
+
+    接続を使い回す（keep-alive）ことで、2回目以降のリクエストではTCP接続・TLSハンドシェイクを省略する。
+    """
+    global _http_client
+    with _lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(**_client_options())
+        return _http_client
+
+
+def get_async_http_client():
+    """
+    LLM・埋め込みモデルのAPI呼び出しで共有する非同期HTTPクライアントを取得
+    """
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None or _async_http_client.is_closed:
+            _async_http_client = httpx.AsyncClient(**_client_options())
+        return _async_http_client
+
+
+@lru_cache(maxsize=None)
+def get_llm(model=ct.MODEL, temperature=ct.TEMPERATURE):
+    """
+    共有のHTTPクライアントを使うLLMのオブジェクトを取得（モデル・温度ごとに1つを使い回す）
+    """
+    if use_stub_backend():
+        from stub_models import StubChatModel
+        return StubChatModel(latency=float(os.environ.get(ct.LLM_STUB_LATENCY_ENV, 0)))
+    return ChatOpenAI(
+        model_name=model,
+        temperature=temperature,
+        request_timeout=ct.LLM_REQUEST_TIMEOUT,
+        max_retries=ct.LLM_MAX_RETRIES,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_embeddings():
+    """
+    共有のHTTPクライアントを使う埋め込みモデルのオブジェクトを取得
+    """
+    if use_stub_backend():
+        from stub_models import StubEmbeddings
+        return StubEmbeddings()
+    return OpenAIEmbeddings(
+        request_timeout=ct.LLM_REQUEST_TIMEOUT,
+        max_retries=ct.LLM_MAX_RETRIES,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
+
+
+def get_cached_embeddings(embeddings=None, cache_path=ct.EMBEDDING_CACHE_PATH):
+    """
+    埋め込みベクトルをファイルに保存し、同じテキストは埋め込み直さない埋め込みモデルを取得
+    （チャンク分割の設定を変えてインデックスを何度も作り直す評価用。キャッシュはモデルごとに分ける）
+
+    Args:
+        embeddings: 埋め込みモデル（省略時は get_embeddings）
+        cache_path: キャッシュを保存するフォルダのパス
+    """
+    from langchain.embeddings import CacheBackedEmbeddings
+    from langchain.storage import LocalFileStore
+
+    embeddings = embeddings or get_embeddings()
+    return CacheBackedEmbeddings.from_bytes_store(
+        embeddings,
+        LocalFileStore(cache_path),
+        namespace=getattr(embeddings, "model", type(embeddings).__name__),
+        query_embedding_cache=True,
+        key_encoder="sha256",
+    )
+
+
+@lru_cache(maxsize=None)
+def get_question_generator_prompt():
+    """
+    会話履歴なしでも理解できる、独立した入力テキストを生成するためのプロンプトテンプレートを取得
+    """
+    return ChatPromptTemplate.from_messages([
+        ("system", ct.SYSTEM_PROMPT_CREATE_INDEPENDENT_TEXT),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}")
+    ])
+
+
+@lru_cache(maxsize=None)
+def get_question_answer_chain(mode):
+    """
+    モードに応じた、検索結果をもとにLLMから回答を取得する用のChainを取得（モードごとに1つを使い回す）
+
+    Args:
+        mode: 回答モード（ct.ANSWER_MODE_1 または ct.ANSWER_MODE_2）
+    """
+    if mode == ct.ANSWER_MODE_1:
+        question_answer_template = ct.SYSTEM_PROMPT_DOC_SEARCH
+    else:
+        question_answer_template = ct.SYSTEM_PROMPT_INQUIRY
+
+    question_answer_prompt = ChatPromptTemplate.from_messages([
+        ("system", question_answer_template),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}")
+    ])
+    return create_stuff_documents_chain(get_llm(), question_answer_prompt)
+
+
+def close_clients():
+    """
+    共有のHTTPクライアントを閉じる（プロセス終了時やテスト用）
+    """
+    global _http_client, _async_http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        if _async_http_client is not None and not _async_http_client.is_closed:
+            # 非同期クライアントの接続は、非同期エンジンのイベントループ上で閉じる
+            get_async_engine().run(_async_http_client.aclose())
+        _http_client = None
+        _async_http_client = None
+    get_llm.cache_clear()
+    get_embeddings.cache_clear()
+    get_question_answer_chain.cache_clear()
@@ -0,0 +1,392 @@
+"""
+このファイルは、LLMの同時呼び出し数をプロセス全体で制限し、セッション間で公平に順番を割り当てる処理が記述されたファイルです。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import asyncio
+import contextlib
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
+import constants as ct
+
+
+############################################################
+# 定数定義
+############################################################
+# 優先度（値が小さいほど先に実行する）
+PRIORITY_HIGH = 0     # 短い質問など、すぐに終わるリクエスト
+PRIORITY_NORMAL = 1   # 通常のRAGの回答生成
+PRIORITY_LOW = 2      # 会話履歴の要約など、ユーザーを待たせないバックグラウンド処理
+
+
+############################################################
+# クラス定義
+############################################################
+
+class _Ticket:
+    """
+    LLM呼び出しの順番待ちの整理券
+    """
+
+    __slots__ = ("session_id", "priority", "seq", "enqueued_at", "granted", "on_grant")
+
+    def __init__(self, session_id, priority, seq, on_grant=None):
+        self.session_id = session_id
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted = threading.Event()
+        # 実行枠が割り当てられたときに呼び出すコールバック（非同期の呼び出し元への通知用）
+        self.on_grant = on_grant
+
+
+class LLMScheduler:
+    """
+    LLM呼び出しの同時実行数の上限と、セッション単位の公平な順番待ちを管理するスケジューラ
+
+    LLMの呼び出しは呼び出し元のスレッド（Streamlitのスクリプトスレッド）でそのまま実行し、
+    スケジューラは実行してよいタイミングの割り当てのみを行う。
+    空きが出た場合は、優先度 → 最後に実行枠を割り当ててからの経過（セッション間のラウンドロビン） → 到着順
+    で次のリクエストを選ぶ。待ち時間が長くなった低優先度のリクエストは、徐々に優先度を引き上げる。
+    """
+
+    def __init__(self, max_concurrency=ct.LLM_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        # セッションIDごとの順番待ちの列（セッション内は到着順）
+        self._queues = {}
+        # セッションIDごとの、最後に実行枠を割り当てた通し番号
+        self._last_served = {}
+        self._grant_seq = itertools.count()
+        self._in_flight = 0
+        # 整理券ごとの待ち順位（順番待ちの列が変わるまで、または一定時間が経つまで使い回す）
+        self._positions = None
+        self._positions_at = 0.0
+        # メトリクス
+        self._total = 0
+        self._queued_total = 0
+        self._max_queue_depth = 0
+        self._wait_times = deque(maxlen=ct.LLM_SCHEDULER_METRICS_WINDOW)
+
+    def run(self, session_id, fn, *args, priority=PRIORITY_NORMAL, on_wait=None, **kwargs):
+        """
+        実行枠が空くまで待ってから、関数を呼び出し元のスレッドで実行
+
+        Args:
+            session_id: リクエスト元のセッションID
+            fn: 実行する関数（llm.invokeなど）
+            priority: 優先度（PRIORITY_HIGH / PRIORITY_NORMAL / PRIORITY_LOW）
+            on_wait: 順番待ちの間、待ち順位（1始まり）が変わるたびに呼び出すコールバック
+
+        Returns:
+            関数の戻り値
+        """
+        ticket = self._enqueue(session_id, priority)
+        try:
+            last_position = None
+            while not ticket.granted.wait(ct.LLM_SCHEDULER_POLL_INTERVAL):
+                with self._lock:
+                    # 待ち時間による優先度の引き上げを反映するため、待機中も割り当てを試みる
+                    self._dispatch()
+                if on_wait is not None and not ticket.granted.is_set():
+                    position = self.position(ticket)
+                    if position and position != last_position:
+                        on_wait(position)
+                        last_position = position
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+        self._record_wait(ticket)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.release()
+
+    async def run_async(self, session_id, fn, *args, priority=PRIORITY_NORMAL, on_wait=None, **kwargs):
+        """
+        実行枠が空くまで待ってから、コルーチン関数を実行（イベントループのスレッドをブロックしない）
+
+        同期の呼び出し（run）と同じ実行枠・順番待ちの列を共有する。
+
+        Args:
+            session_id: リクエスト元のセッションID
+            fn: 実行するコルーチン関数（llm.ainvokeなど）
+            priority: 優先度（PRIORITY_HIGH / PRIORITY_NORMAL / PRIORITY_LOW）
+            on_wait: 順番待ちの間、待ち順位（1始まり）が変わるたびに呼び出すコールバック（イベントループのスレッドで呼び出す）
+
+        Returns:
+            コルーチン関数の戻り値
+        """
+        async with self.reserve_async(session_id, priority=priority, on_wait=on_wait):
+            return await fn(*args, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def reserve_async(self, session_id, priority=PRIORITY_NORMAL, on_wait=None):
+        """
+        実行枠が空くまで待ってから、withブロックを抜けるまで実行枠を確保（ストリーミングでの回答生成用）
+
+        Args:
+            session_id: リクエスト元のセッションID
+            priority: 優先度（PRIORITY_HIGH / PRIORITY_NORMAL / PRIORITY_LOW）
+            on_wait: 順番待ちの間、待ち順位（1始まり）が変わるたびに呼び出すコールバック（イベントループのスレッドで呼び出す）
+        """
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        ticket = self._enqueue(session_id, priority, on_grant=notify)
+        try:
+            last_position = None
+            while not ticket.granted.is_set():
+                try:
+                    await asyncio.wait_for(asyncio.shield(granted), ct.LLM_SCHEDULER_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    with self._lock:
+                        self._dispatch()
+                    if on_wait is not None and not ticket.granted.is_set():
+                        position = self.position(ticket)
+                        if position and position != last_position:
+                            on_wait(position)
+                            last_position = position
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+        self._record_wait(ticket)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _record_wait(self, ticket):
+        """
+        実行枠が割り当てられるまでの待ち時間を記録
+        """
+        wait_time = time.monotonic() - ticket.enqueued_at
+        with self._lock:
+            self._wait_times.append(wait_time)
+        if wait_time >= ct.LLM_SCHEDULER_LOG_WAIT_SECONDS:
+            logging.getLogger(ct.LOGGER_NAME).info(
+                f"LLM呼び出しの順番待ち: {wait_time:.2f}秒（優先度={ticket.priority}, 待ち={self.queue_depth()}件）"
+            )
+
+    def position(self, ticket):
+        """
+        順番待ち中の整理券の待ち順位（1始まり）を取得（実行中・取り消し済みの場合は0）
+
+        待ち順位は順番待ちの列が変わったとき（または待ち時間による優先度の引き上げを反映する間隔ごと）に
+        まとめて計算し、待っている各リクエストからの問い合わせでは計算済みの値を返す。
+        """
+        with self._lock:
+            if ticket.granted.is_set():
+                return 0
+            now = time.monotonic()
+            if self._positions is None or now - self._positions_at >= ct.LLM_SCHEDULER_POLL_INTERVAL:
+                self._positions = self._compute_positions(now)
+                self._positions_at = now
+            return self._positions.get(ticket, 0)
+
+    def try_acquire(self):
+        """
+        順番待ちをせずに実行枠を1つ確保（ヘッジリクエストなど、枠が空いていなければ実行しない処理用）
+
+        順番待ちのリクエストがある場合は、空きがあっても確保しない（待っているリクエストを追い越さない）。
+        確保できた場合は、処理の終了後に release を呼び出す。
+
+        Returns:
+            実行枠を確保できた場合はTrue
+        """
+        with self._lock:
+            if self._in_flight >= self.max_concurrency or self._queues:
+                return False
+            self._in_flight += 1
+            self._total += 1
+            return True
+
+    def release(self):
+        """
+        実行枠を解放し、順番待ちのリクエストに割り当てる
+        """
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def queue_depth(self):
+        """
+        順番待ち中のリクエスト数を取得
+        """
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        """
+        待ち行列の長さ・待ち時間などのメトリクスを取得
+        """
+        with self._lock:
+            waits = np.asarray(self._wait_times, dtype=float)
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "queue_depth": sum(len(queue) for queue in self._queues.values()),
+                "max_queue_depth": self._max_queue_depth,
+                "waiting_sessions": len(self._queues),
+                "total_requests": self._total,
+                "queued_requests": self._queued_total,
+                "wait_avg": float(waits.mean()) if waits.size else 0.0,
+                "wait_p95": float(np.percentile(waits, 95)) if waits.size else 0.0,
+                "wait_max": float(waits.max()) if waits.size else 0.0,
+            }
+
+    def _sort_key(self, ticket, now):
+        """
+        次に実行枠を割り当てるリクエストを選ぶための並び順のキー（ロック取得中に呼び出す）
+        """
+        aged_priority = ticket.priority - int((now - ticket.enqueued_at) / ct.LLM_SCHEDULER_AGING_SECONDS)
+        queue = self._queues.get(ticket.session_id)
+        # 同じセッションの後続のリクエストは、先行のリクエストより後に並べる
+        depth = queue.index(ticket) if queue else 0
+        return (aged_priority, depth, self._last_served.get(ticket.session_id, -1), ticket.seq)
+
+    def _compute_positions(self, now):
+        """
+        順番待ち中の全ての整理券の待ち順位を計算（ロック取得中に呼び出す）
+        """
+        keys = {}
+        for queue in self._queues.values():
+            for depth, ticket in enumerate(queue):
+                aged_priority = ticket.priority - int((now - ticket.enqueued_at) / ct.LLM_SCHEDULER_AGING_SECONDS)
+                keys[ticket] = (aged_priority, depth, self._last_served.get(ticket.session_id, -1), ticket.seq)
+        # セッション内の順番と、セッション間の選択順を組み合わせた順位
+        return {ticket: i + 1 for i, ticket in enumerate(sorted(keys, key=keys.get))}
+
+    def _enqueue(self, session_id, priority, on_grant=None):
+        with self._lock:
+            ticket = _Ticket(session_id, priority, next(self._seq), on_grant)
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._positions = None
+            self._total += 1
+            self._dispatch()
+            if not ticket.granted.is_set():
+                self._queued_total += 1
+                depth = sum(len(queue) for queue in self._queues.values())
+                self._max_queue_depth = max(self._max_queue_depth, depth)
+            return ticket
+
+    def _dispatch(self):
+        """
+        空いている実行枠を、順番待ちのリクエストに割り当てる（ロック取得中に呼び出す）
+        """
+        now = time.monotonic()
+        while self._in_flight < self.max_concurrency and self._queues:
+            # 各セッションの先頭のリクエストの中から選ぶ
+            ticket = min((queue[0] for queue in self._queues.values()), key=lambda t: self._sort_key(t, now))
+            queue = self._queues[ticket.session_id]
+            queue.popleft()
+            if not queue:
+                del self._queues[ticket.session_id]
+            self._last_served[ticket.session_id] = next(self._grant_seq)
+            self._positions = None
+            self._in_flight += 1
+            ticket.granted.set()
+            if ticket.on_grant is not None:
+                ticket.on_grant()
+
+        # 終了したセッションの記録が増え続けないようにする
+        if len(self._last_served) > ct.LLM_SCHEDULER_MAX_TRACKED_SESSIONS:
+            for session_id in sorted(self._last_served, key=self._last_served.get)[:len(self._last_served) // 2]:
+                if session_id not in self._queues:
+                    del self._last_served[session_id]
+
+    def _cancel(self, ticket):
+        """
+        順番待ち中に中断された（画面の再実行など）リクエストを取り消す
+        """
+        with self._lock:
+            if ticket.granted.is_set():
+                self._in_flight -= 1
+            else:
+                queue = self._queues.get(ticket.session_id)
+                if queue and ticket in queue:
+                    queue.remove(ticket)
+                    self._positions = None
+                    if not queue:
+                        del self._queues[ticket.session_id]
+            self._dispatch()
+
+
+class ScheduledLLM:
+    """
+    invokeの呼び出しをスケジューラ経由で行うLLMのラッパー
+
+    LLMのオブジェクトを受け取る既存の処理（会話履歴の要約など）に、そのまま渡せるようにする。
+    """
+
+    def __init__(self, llm, session_id, priority=PRIORITY_NORMAL, on_wait=None, scheduler=None):
+        self.llm = llm
+        self.session_id = session_id
+        self.priority = priority
+        self.on_wait = on_wait
+        self.scheduler = scheduler or get_llm_scheduler()
+
+    def invoke(self, messages, **kwargs):
+        return self.scheduler.run(
+            self.session_id, self.llm.invoke, messages,
+            priority=self.priority, on_wait=self.on_wait, **kwargs
+        )
+
+    async def ainvoke(self, messages, **kwargs):
+        return await self.scheduler.run_async(
+            self.session_id, self.llm.ainvoke, messages,
+            priority=self.priority, on_wait=self.on_wait, **kwargs
+        )
+
+    async def astream(self, messages, **kwargs):
+        """
+        実行枠を確保したまま、回答をストリーミングで受け取る（最後のチャンクを受け取るまで実行枠を使い続ける）
+        """
+        async with self.scheduler.reserve_async(self.session_id, priority=self.priority, on_wait=self.on_wait):
+            async for chunk in self.llm.astream(messages, **kwargs):
+                yield chunk
+
+
+############################################################
+# 関数定義
+############################################################
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler():
+    """
+    プロセス全体で共有するスケジューラを取得
+
+    Returns:
+        LLMSchedulerのインスタンス
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
+
+
+def query_priority(query):
+    """
+    質問の長さから、LLM呼び出しの優先度を判定（短い質問ほど早く終わるため優先する）
+    """
+    if len(query) <= ct.LLM_SCHEDULER_SHORT_QUERY_LENGTH:
+        return PRIORITY_HIGH
+    return PRIORITY_NORMAL
@@ -0,0 +1,308 @@
+"""
+このファイルは、複数のユーザーが同時に質問した場合の性能を計測する負荷試験ツールです。
+同時にN個のセッションを動かし、それぞれが自分のセッション状態・会話履歴を持ったまま、
+画面からの質問と同じ手順（utils.get_llm_response → 会話履歴の要約）で質問を続けます。
+LLM・埋め込みモデルは、遅延を指定できるスタブに差し替えます。
+
+同時セッション数を段階的に増やし、スループット・応答時間のパーセンタイル・セッションあたりのメモリ使用量（RSS）を計測して、
+スループットが伸びなくなる（または応答時間が目標を超える）同時セッション数を飽和点として報告します。
+
+※ StreamlitのAppTestは実行のたびにプロセス全体の状態を初期化するため、同時に複数実行できない。
+  そのため画面の描画は計測に含めず、セッションごとのスレッドで session_context.session_scope を使って
+  セッション状態を切り替える。
+
+使い方:
+    python load_test.py --sessions 1 5 10 20 --duration 30 --latency 0.5
+    python load_test.py --backend http --latency 1.0   # スタブのAPIサーバー経由（HTTPの接続プールも含めて計測）
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import itertools
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from uuid import uuid4
+import numpy as np
+import constants as ct
+from session_context import SessionState, session_scope
+
+
+############################################################
+# 定数定義
+############################################################
+# 会話の続きの質問（会話履歴を使った質問の書き換え・要約も負荷に含める）
+FOLLOW_UP_QUERIES = ["それについてもっと詳しく教えて", "他には何がありますか？"]
+
+
+############################################################
+# クラス定義
+############################################################
+
+class VirtualSession:
+    """
+    1人のユーザーのセッション（initialize_ultra_lite.initializeで作成するものと同じ内容のセッション状態）
+    """
+
+    def __init__(self, index, queries):
+        from conversation_memory import ConversationMemory
+        from initialize_ultra_lite import get_shared_retriever
+
+        self.index = index
+        self.queries = queries
+        # 回答モードはセッションごとに交互に割り当てる
+        self.state = SessionState(
+            session_id=uuid4().hex,
+            mode=ct.ANSWER_MODE_1 if index % 2 == 0 else ct.ANSWER_MODE_2,
+            messages=[],
+            chat_history=ConversationMemory(),
+            retriever=get_shared_retriever(),
+        )
+        self.latencies = []
+        self.errors = 0
+
+    def ask(self, query):
+        """
+        画面からの質問と同じ手順で、1件の質問に回答
+        """
+        import utils
+
+        with session_scope(self.state):
+            response = utils.get_llm_response(query)
+            self.state.messages.append({"role": "user", "content": query})
+            self.state.messages.append({"role": "assistant", "content": response})
+            utils.summarize_chat_history()
+        return response
+
+    def run_until(self, stop_at):
+        """
+        計測の終了時刻まで、質問を続ける（セッションごとに質問の順番をずらす）
+        """
+        queries = itertools.islice(itertools.cycle(self.queries), self.index, None)
+        while time.monotonic() < stop_at:
+            query = next(queries)
+            started_at = time.monotonic()
+            try:
+                response = self.ask(query)
+                failed = ct.ERROR_ICON in response.get("answer", "")
+            except Exception as e:
+                print(f"負荷試験のセッション{self.index}でエラー: {e}", file=sys.stderr)
+                failed = True
+            self.latencies.append(time.monotonic() - started_at)
+            self.errors += failed
+
+
+############################################################
+# 関数定義
+############################################################
+
+def current_rss_bytes():
+    """
+    プロセスの現在のメモリ使用量（RSS）を取得（/procがない環境では最大値で代替）
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOSはバイト単位、Linuxはキロバイト単位
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def build_queries():
+    """
+    負荷試験で使う質問の一覧（ベンチマークの質問と、会話の続きの質問）
+    """
+    from benchmark import BENCHMARK_QUERIES
+
+    queries = []
+    for query in BENCHMARK_QUERIES:
+        queries.append(query)
+        queries.append(FOLLOW_UP_QUERIES[len(queries) % len(FOLLOW_UP_QUERIES)])
+    return queries
+
+
+def start_stub_server(port, latency):
+    """
+    スタブのAPIサーバーを別プロセスで起動し、接続を受け付けるまで待つ
+    """
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_openai_server.py"),
+         "--port", str(port), "--latency", str(latency)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("スタブのAPIサーバーを起動できませんでした。")
+
+
+def prepare_retriever():
+    """
+    全セッションで共有するRetrieverを、計測の前に作成しておく
+
+    本番と同じFAISSを使えない環境では、InMemoryVectorStoreで作成したものを共有する。
+    """
+    from benchmark import get_vectorstore_class
+    from initialize_ultra_lite import (
+        get_shared_retriever, set_shared_retriever, load_source_documents, split_documents, build_retriever
+    )
+    from utils import create_csv_documents
+
+    vectorstore_cls = get_vectorstore_class()
+    if vectorstore_cls.__name__ == "FAISS":
+        get_shared_retriever()
+    else:
+        documents = create_csv_documents() + split_documents(load_source_documents())
+        set_shared_retriever(build_retriever(documents, vectorstore_cls=vectorstore_cls))
+
+
+def run_level(sessions, duration, queries):
+    """
+    指定の同時セッション数で、計測時間の間だけ質問を続ける
+
+    Returns:
+        指標の辞書
+    """
+    from llm_scheduler import get_llm_scheduler
+
+    rss_before = current_rss_bytes()
+    virtual_sessions = [VirtualSession(i, queries) for i in range(sessions)]
+
+    started_at = time.monotonic()
+    stop_at = started_at + duration
+    threads = [
+        threading.Thread(target=session.run_until, args=(stop_at,), name=f"load-session-{session.index}")
+        for session in virtual_sessions
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started_at
+    # セッション状態（会話履歴など）を保持したまま、メモリ使用量を計測
+    rss_after = current_rss_bytes()
+
+    latencies = [latency for session in virtual_sessions for latency in session.latencies]
+    errors = sum(session.errors for session in virtual_sessions)
+    scheduler_stats = get_llm_scheduler().stats()
+    return {
+        "sessions": sessions,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_p50_seconds": float(np.percentile(latencies, 50)) if latencies else None,
+        "latency_p95_seconds": float(np.percentile(latencies, 95)) if latencies else None,
+        "latency_p99_seconds": float(np.percentile(latencies, 99)) if latencies else None,
+        "rss_bytes": rss_after,
+        "rss_per_session_bytes": max(0, rss_after - rss_before) / sessions,
+        "llm_queue_wait_p95_seconds": scheduler_stats.get("wait_p95"),
+        "llm_max_queue_depth": scheduler_stats.get("max_queue_depth"),
+    }
+
+
+def find_saturation(levels, gain=ct.LOAD_TEST_SATURATION_GAIN, slo=ct.LOAD_TEST_LATENCY_SLO_SECONDS):
+    """
+    スループットが伸びなくなった、または応答時間のp95が目標を超えた最初の同時セッション数を判定
+
+    Returns:
+        飽和した同時セッション数（計測した範囲で飽和しなかった場合はNone）
+    """
+    previous = None
+    for level in levels:
+        if level["latency_p95_seconds"] is not None and level["latency_p95_seconds"] > slo:
+            return level["sessions"]
+        if previous is not None and level["throughput_per_second"] < previous["throughput_per_second"] * (1 + gain):
+            return level["sessions"]
+        previous = level
+    return None
+
+
+def print_levels(levels):
+    print(f"{'sessions':>8} {'requests':>8} {'errors':>6} {'req/s':>7} {'p50_s':>7} {'p95_s':>7} {'p99_s':>7} "
+          f"{'rss_MB':>7} {'MB/session':>10}")
+    for level in levels:
+        print(f"{level['sessions']:>8} {level['requests']:>8} {level['errors']:>6} {level['throughput_per_second']:>7.2f} "
+              f"{level['latency_p50_seconds'] or 0:>7.2f} {level['latency_p95_seconds'] or 0:>7.2f} "
+              f"{level['latency_p99_seconds'] or 0:>7.2f} {level['rss_bytes'] / 2**20:>7.1f} "
+              f"{level['rss_per_session_bytes'] / 2**20:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同時セッション数を段階的に増やして計測する負荷試験")
+    parser.add_argument("--sessions", type=int, nargs="+", default=list(ct.LOAD_TEST_SESSIONS))
+    parser.add_argument("--duration", type=float, default=ct.LOAD_TEST_DURATION_SECONDS, help="同時セッション数ごとの計測時間（秒）")
+    parser.add_argument("--latency", type=float, default=ct.LOAD_TEST_STUB_LATENCY, help="スタブのLLMの応答遅延（秒）")
+    parser.add_argument("--backend", choices=("inprocess", "http"), default="inprocess",
+                        help="inprocess: プロセス内のスタブ / http: スタブのAPIサーバー（別プロセス）")
+    parser.add_argument("--port", type=int, default=ct.LOAD_TEST_STUB_PORT)
+    parser.add_argument("-o", "--output", help="結果のJSONファイル（既定は ./logs/load_tests/load_test_日時.json）")
+    args = parser.parse_args()
+
+    # LLM・埋め込みモデルの差し替えは、get_llm / get_embeddingsを呼び出す前に設定
+    stub_process = None
+    if args.backend == "http":
+        stub_process = start_stub_server(args.port, args.latency)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+        os.environ["OPENAI_API_KEY"] = "dummy"
+    else:
+        os.environ[ct.LLM_BACKEND_ENV] = "stub"
+        os.environ[ct.LLM_STUB_LATENCY_ENV] = str(args.latency)
+    # Streamlitの画面外で実行する際の警告を抑止
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+
+    try:
+        prepare_retriever()
+        queries = build_queries()
+        levels = []
+        for sessions in args.sessions:
+            print(f"計測中: 同時セッション数 {sessions}", file=sys.stderr)
+            levels.append(run_level(sessions, args.duration, queries))
+    finally:
+        if stub_process is not None:
+            stub_process.terminate()
+
+    print_levels(levels)
+    saturation = find_saturation(levels)
+    if saturation is None:
+        print("\n計測した範囲では飽和しませんでした。")
+    else:
+        print(f"\n飽和点: 同時セッション数 {saturation}")
+
+    output = args.output
+    if output is None:
+        os.makedirs(ct.LOAD_TEST_DIR_PATH, exist_ok=True)
+        output = os.path.join(ct.LOAD_TEST_DIR_PATH, f"load_test_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "backend": args.backend,
+                "latency": args.latency,
+                "duration": args.duration,
+                "llm_max_concurrency": ct.LLM_MAX_CONCURRENCY,
+            },
+            "levels": levels,
+            "saturation_sessions": saturation,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,10 @@ from initialize_ultra_lite import initialize  # 超軽量版を使用
 import components as cn
 # （自作）変数（定数）がまとめて定義・管理されているモジュール
 import constants as ct
+# （自作）処理段階ごとの所要時間をトレースとして記録する関数
+from tracing import end_script_span, start_script_span, start_span
+# （自作）運用担当者向けの管理者用ページ
+import admin
 
 
 ############################################################
@@ -59,6 +63,11 @@ if not "initialized" in st.session_state:
     st.session_state.initialized = True
     logger.info(ct.APP_BOOT_MESSAGE)
 
+# 管理者用ページ（URLに「?admin=<トークン>」を指定した場合のみ表示し、チャット画面は表示しない）
+if admin.is_admin_request():
+    admin.render_admin_page()
+    st.stop()
+
 
 ############################################################
 # 4. 初期表示
@@ -105,27 +114,37 @@ if chat_message:
     with st.chat_message("user"):
         st.markdown(chat_message)
 
+    # 回答の取得から画面表示までの処理段階ごとの所要時間を、1つのトレースとして記録
+    chat_turn_span = start_script_span("chat_turn", mode=st.session_state.mode)
     # ==========================================
     # 7-2. LLMからの回答取得
     # ==========================================
     # 「st.spinner」でグルグル回っている間、表示の不具合が発生しないよう空のエリアを表示
     res_box = st.empty()
+    # LLM呼び出しが混み合っている場合に、順番待ちの順位を表示するエリア
+    queue_box = st.empty()
     # LLMによる回答生成（回答生成が完了するまでグルグル回す）
     with st.spinner(ct.SPINNER_TEXT):
         try:
             # 画面読み込み時に作成したRetrieverを使い、Chainを実行
-            llm_response = utils.get_llm_response(chat_message)
+            llm_response = utils.get_llm_response(
+                chat_message,
+                on_queue_wait=lambda position: queue_box.caption(ct.SPINNER_QUEUE_TEXT.format(position=position))
+            )
         except Exception as e:
             # エラーログの出力
             logger.error(f"{ct.GET_LLM_RESPONSE_ERROR_MESSAGE}\n{e}")
             # エラーメッセージの画面表示
             st.error(utils.build_error_message(ct.GET_LLM_RESPONSE_ERROR_MESSAGE), icon=ct.ERROR_ICON)
             # 後続の処理を中断
+            end_script_span(chat_turn_span)
             st.stop()
+    queue_box.empty()
     
     # ==========================================
     # 7-3. LLMからの回答表示
     # ==========================================
+    render_span = start_span("render")
     with st.chat_message("assistant"):
         try:
             # 軽量版レスポンス処理（RAGファイル表示対応）
@@ -158,6 +177,8 @@ if chat_message:
             error_msg = f"⚠️ 回答表示に失敗しました。\n\nこのエラーが繰り返し発生する場合は、管理者にお問い合わせください。\n\n詳細: {str(e)}"
             st.error(error_msg, icon=ct.ERROR_ICON)
             content = error_msg
+    render_span.end()
+    end_script_span(chat_turn_span)
 
     # ==========================================
     # 7-4. 会話ログへの追加
@@ -165,4 +186,10 @@ if chat_message:
     # 表示用の会話ログにユーザーメッセージを追加
     st.session_state.messages.append({"role": "user", "content": chat_message})
     # 表示用の会話ログにAIメッセージを追加
-    st.session_state.messages.append({"role": "assistant", "content": content})
\ No newline at end of file
+    st.session_state.messages.append({"role": "assistant", "content": content})
+
+    # ==========================================
+    # 7-5. 会話履歴の要約
+    # ==========================================
+    # 回答の表示後に、上限を超えた古い会話履歴の要約をバックグラウンドで開始
+    utils.summarize_chat_history()
\ No newline at end of file
@@ -0,0 +1,421 @@
+"""
+このファイルは、アプリの稼働状況（回答・検索の所要時間、キャッシュのヒット、LLMのトークン数、順番待ちの長さ、インデックスの件数）を
+プロセス内で集計するメトリクスの処理が記述されたファイルです。
+
+集計したメトリクスは、Prometheusのテキスト形式（/metrics）と、管理者用ページ（admin.py）で確認できます。
+処理段階ごとの所要時間は、トレースのスパン（tracing.py）の終了時に自動で記録します。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import math
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import constants as ct
+
+
+############################################################
+# 定数定義
+############################################################
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+############################################################
+# クラス定義
+############################################################
+
+class HdrHistogram:
+    """
+    値の桁ごとに、有効桁数で決まる一定の相対精度のバケットに数えるヒストグラム（HDR Histogramと同じ考え方）
+
+    値の範囲を事前に決めなくても、どの桁の値もパーセンタイルの相対誤差が 10^(1-有効桁数) 以内に収まる。
+    バケットは値が入ったものだけを持つため、メモリ使用量は値のばらつきの桁数に比例する。
+    """
+
+    def __init__(self, significant_digits=ct.METRICS_SIGNIFICANT_DIGITS):
+        self.significant_digits = significant_digits
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def bucket(self, value):
+        """
+        値が入るバケットのキー（桁, 仮数の上位の有効桁）
+        """
+        if value <= 0:
+            return (-math.inf, 0)
+        exponent = math.floor(math.log10(value)) - (self.significant_digits - 1)
+        return (exponent, int(value / 10.0 ** exponent))
+
+    @staticmethod
+    def bucket_value(key):
+        """
+        バケットの代表値（バケットの中央の値）
+        """
+        exponent, mantissa = key
+        if exponent == -math.inf:
+            return 0.0
+        return (mantissa + 0.5) * 10.0 ** exponent
+
+    def record(self, value):
+        key = self.bucket(value)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def snapshot(self):
+        """
+        現時点のバケットごとの件数のコピー（2時点の差から、直近の期間のパーセンタイルを計算するのに使う）
+        """
+        return dict(self.counts)
+
+    def copy(self):
+        histogram = HdrHistogram(self.significant_digits)
+        histogram.counts = dict(self.counts)
+        histogram.count, histogram.sum, histogram.min, histogram.max = self.count, self.sum, self.min, self.max
+        return histogram
+
+
+class Metric:
+    """
+    ラベルの組み合わせごとに値を持つメトリクスの基底クラス
+    """
+
+    kind = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class Counter(Metric):
+    """
+    増加し続ける値（件数・トークン数など）
+    """
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """
+        他の処理が数えている累計値をそのまま設定（出力の直前に値を取得するcollector用）
+        """
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """
+    増減する現在の値（順番待ちの長さ・インデックスの件数など）
+    """
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+
+class Histogram(Metric):
+    """
+    値の分布（所要時間など）。Prometheusにはパーセンタイルを持つsummaryとして出力する
+    """
+
+    kind = "summary"
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = HdrHistogram()
+            histogram.record(value)
+
+    def snapshot(self, **labels):
+        with self._lock:
+            histogram = self._values.get(self._key(labels))
+            return histogram.snapshot() if histogram is not None else {}
+
+    def items(self):
+        # 出力中に他のスレッドが記録しても影響しないよう、コピーを返す
+        with self._lock:
+            return [(key, histogram.copy()) for key, histogram in self._values.items()]
+
+
+class MetricsRegistry:
+    """
+    プロセス全体のメトリクスの一覧
+
+    メトリクスは名前ごとに1つだけ作成し、2回目以降は同じものを返す。
+    出力の直前に値を取得するメトリクス（順番待ちの長さなど）は、collectorとして登録する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _get_or_create(self, cls, name, help_text):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"メトリクス「{name}」は別の種類で登録されています。")
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name, help_text=""):
+        return self._get_or_create(Histogram, name, help_text)
+
+    def register_collector(self, collector):
+        """
+        出力の直前に呼び出して、ゲージの値を更新する関数を登録
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self):
+        """
+        collectorを呼び出して値を更新し、メトリクスの一覧を取得
+        """
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                collector(self)
+            except Exception as e:
+                print(f"メトリクスの取得エラー（{getattr(collector, '__name__', collector)}）: {e}", file=sys.stderr)
+        with self._lock:
+            return list(self._metrics.values())
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    /metrics へのリクエストに、Prometheusのテキスト形式でメトリクスを返すハンドラー
+    """
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # アクセスログは出力しない（定期的に取得されるため）
+        pass
+
+
+############################################################
+# 関数定義
+############################################################
+_registry = None
+_registry_lock = threading.Lock()
+_server = None
+_server_failed = False
+_server_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    プロセス全体で共有するメトリクスの一覧を取得（初回の呼び出し時に、標準のcollectorを登録）
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = MetricsRegistry()
+                registry.register_collector(collect_llm_scheduler)
+                registry.register_collector(collect_caches)
+                registry.register_collector(collect_index)
+                _registry = registry
+    return _registry
+
+
+def percentile(counts, q):
+    """
+    バケットごとの件数から、パーセンタイルの値を計算
+
+    Args:
+        counts: {バケットのキー: 件数} の辞書（HdrHistogram.snapshotの値、または2時点の差）
+        q: 0〜100のパーセンタイル
+
+    Returns:
+        パーセンタイルの値（件数が0の場合はNone）
+    """
+    total = sum(counts.values())
+    if total <= 0:
+        return None
+    rank = max(1, math.ceil(total * q / 100))
+    seen = 0
+    for key in sorted(counts):
+        seen += counts[key]
+        if seen >= rank:
+            return HdrHistogram.bucket_value(key)
+    return HdrHistogram.bucket_value(max(counts))
+
+
+def subtract_counts(current, previous):
+    """
+    2時点のバケットごとの件数の差（直近の期間に記録した分）
+    """
+    return {key: count - previous.get(key, 0) for key, count in current.items() if count - previous.get(key, 0) > 0}
+
+
+def observe_span(span):
+    """
+    終了したトレースのスパンから、処理段階の所要時間・キャッシュのヒット・トークン数を記録
+    """
+    registry = get_registry()
+    registry.histogram("rag_stage_duration_seconds", "処理段階ごとの所要時間（秒）").observe(
+        span.duration_ms / 1000, stage=span.name
+    )
+    attributes = span.attributes
+    if span.status == "error":
+        registry.counter("rag_stage_errors_total", "エラーになった処理段階の件数").inc(stage=span.name)
+    if "cache_hit" in attributes:
+        registry.counter("rag_cache_requests_total", "キャッシュの参照件数（結果ごと）").inc(
+            cache=attributes.get("source", span.name), result="hit" if attributes["cache_hit"] else "miss"
+        )
+    if span.name == "request":
+        registry.counter("rag_answers_total", "回答した件数（回答の方法ごと）").inc(path=attributes.get("path", "unknown"))
+        if "single_flight_shared" in attributes:
+            registry.counter("rag_cache_requests_total", "キャッシュの参照件数（結果ごと）").inc(
+                cache="single_flight", result="hit" if attributes["single_flight_shared"] else "miss"
+            )
+    if span.name == "lexical_search":
+        registry.counter("rag_lexical_fallbacks_total", "ベクトル検索が時間切れで語彙検索に切り替えた件数").inc()
+    if span.name == "context_pack" and "prompt_tokens" in attributes:
+        registry.counter("rag_llm_tokens_total", "LLMのトークン数").inc(attributes["prompt_tokens"], kind="prompt")
+    if span.name == "llm_complete" and "completion_tokens" in attributes:
+        registry.counter("rag_llm_tokens_total", "LLMのトークン数").inc(attributes["completion_tokens"], kind="completion")
+
+
+def collect_llm_scheduler(registry):
+    from llm_scheduler import get_llm_scheduler
+
+    stats = get_llm_scheduler().stats()
+    registry.gauge("rag_llm_queue_depth", "LLM呼び出しの順番待ちの件数").set(stats["queue_depth"])
+    registry.gauge("rag_llm_in_flight", "実行中のLLM呼び出しの件数").set(stats["in_flight"])
+    registry.gauge("rag_llm_max_concurrency", "LLMの同時呼び出し数の上限").set(stats["max_concurrency"])
+    registry.gauge("rag_llm_queue_wait_p95_seconds", "LLM呼び出しの順番待ち時間のp95（秒）").set(stats["wait_p95"])
+
+
+def collect_caches(registry):
+    from query_rewrite import embedding_cache_stats
+    from utils import get_rag_single_flight_stats
+
+    embedding_cache = embedding_cache_stats()
+    registry.gauge("rag_embedding_cache_entries", "質問の埋め込みベクトルのキャッシュの件数").set(embedding_cache["size"])
+    requests = registry.counter("rag_embedding_cache_requests_total", "質問の埋め込みベクトルのキャッシュの参照件数（結果ごと）")
+    requests.set_total(embedding_cache["hits"], result="hit")
+    requests.set_total(embedding_cache["misses"], result="miss")
+    registry.gauge("rag_single_flight_in_flight", "同じ質問をまとめて処理中の件数").set(get_rag_single_flight_stats()["in_flight"])
+
+
+def collect_index(registry):
+    import initialize_ultra_lite
+
+    # インデックスの作成はここでは行わない（作成済みの場合のみ件数を出力）
+    retriever = initialize_ultra_lite._shared_retriever
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if vectorstore is None:
+        return
+    index = getattr(vectorstore, "index", None)
+    documents = index.ntotal if index is not None else len(getattr(vectorstore, "store", {}))
+    registry.gauge("rag_index_documents", "インデックスに登録されたドキュメント数").set(documents)
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def render_prometheus(registry=None):
+    """
+    メトリクスをPrometheusのテキスト形式で出力
+    """
+    lines = []
+    for metric in (registry or get_registry()).collect():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in metric.items():
+            if isinstance(metric, Histogram):
+                for quantile in ct.METRICS_QUANTILES:
+                    quantile_value = percentile(value.counts, quantile * 100)
+                    lines.append(f"{metric.name}{format_labels(labels, [('quantile', quantile)])} "
+                                 f"{'NaN' if quantile_value is None else quantile_value}")
+                lines.append(f"{metric.name}_sum{format_labels(labels)} {value.sum}")
+                lines.append(f"{metric.name}_count{format_labels(labels)} {value.count}")
+            else:
+                lines.append(f"{metric.name}{format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(port=None):
+    """
+    /metrics でメトリクスを返すHTTPサーバーを、バックグラウンドのスレッドで起動（プロセスで1回のみ）
+
+    Streamlitのプロセス内のメトリクスを、Prometheusから取得できるようにするために使う。
+    ポート番号が0の場合や、ポートが使用中の場合は起動しない。
+    """
+    global _server, _server_failed
+    port = int(os.environ.get(ct.METRICS_PORT_ENV, ct.METRICS_PORT) if port is None else port)
+    if port <= 0:
+        return None
+    with _server_lock:
+        if _server is None and not _server_failed:
+            try:
+                _server = ThreadingHTTPServer((ct.METRICS_HOST, port), _MetricsRequestHandler)
+            except OSError as e:
+                # 画面の再実行のたびに起動し直さない
+                _server_failed = True
+                print(f"メトリクスのHTTPサーバーを起動できませんでした（ポート{port}）: {e}", file=sys.stderr)
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
@@ -0,0 +1,296 @@
+"""
+このファイルは、回答生成の処理のどこで時間がかかっているかを調べるためのプロファイラーが記述されたファイルです。
+
+StackSamplerは、一定間隔で全スレッドの呼び出し中の関数（スタック）を記録するサンプリング方式のプロファイラーで、
+処理を計測用に書き換えずに、実行中の処理に後から適用できます（遅い質問のログ（slow_query_log.py）で使用）。
+結果は flamegraph.pl・speedscope で表示できる折りたたみ形式（1行に「関数;関数;... 回数」）で保存します。
+
+本番環境の回答生成を、再デプロイせずにプロファイルすることもできます。
+環境変数「RAG_PROFILE_REQUESTS」（起動時）または管理者用ページ（実行中）で件数を指定すると、
+次のN件の回答生成（utils.get_llm_response）を、指定の方法でプロファイルして ./logs/profiles に保存します。
+
+    sampler      全スレッドのスタックのサンプリング（.folded。回答生成は非同期エンジンのスレッドで実行されるため、既定はこの方法）
+    cprofile     cProfileによる関数ごとの計測（.prof。snakeviz・flameprofで表示できる。回答生成を呼び出したスレッドのみ計測）
+    tracemalloc  メモリ割り当ての増加量（.folded（バイト数）・上位の一覧の.txt・スナップショットの.tracemalloc）
+
+sys._current_frames がない実行環境では、samplerの代わりにcProfileを使います。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import contextlib
+import cProfile
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class StackSampler:
+    """
+    一定間隔で全スレッドのスタックを記録するプロファイラー（バックグラウンドのスレッドで実行）
+
+        sampler = StackSampler()
+        sampler.start()
+        ...
+        sampler.stop()
+        sampler.write_folded("./logs/profiles/request.folded")
+    """
+
+    def __init__(self, interval=ct.PROFILE_SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def folded(self):
+        """
+        記録したスタックを、折りたたみ形式（flamegraph.pl・speedscopeの入力形式）の文字列で取得
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def write_folded(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        return path
+
+
+class RequestProfiler:
+    """
+    次のN件の回答生成をプロファイルする設定（プロセス全体で共有）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining = 0
+        self.mode = ct.PROFILE_MODES[0]
+        try:
+            count = int(os.environ.get(ct.PROFILE_REQUESTS_ENV) or 0)
+            if count > 0:
+                self.arm(count, os.environ.get(ct.PROFILE_MODE_ENV) or ct.PROFILE_MODES[0])
+        except ValueError as e:
+            print(f"プロファイルの設定エラー: {e}", file=sys.stderr)
+
+    def arm(self, count, mode=ct.PROFILE_MODES[0]):
+        """
+        次のcount件の回答生成をプロファイルするよう設定（0件で解除）
+        """
+        if mode not in ct.PROFILE_MODES:
+            raise ValueError(f"プロファイルの方法は {', '.join(ct.PROFILE_MODES)} のいずれかを指定してください: {mode}")
+        with self._lock:
+            self.remaining = max(0, min(int(count), ct.PROFILE_MAX_REQUESTS))
+            self.mode = mode
+
+    def take(self):
+        """
+        プロファイルする件数が残っていれば1件分を使い、プロファイルの方法を返す（残っていない場合はNone）
+        """
+        with self._lock:
+            if self.remaining <= 0:
+                return None
+            self.remaining -= 1
+            return self.mode
+
+    def status(self):
+        with self._lock:
+            return {"remaining": self.remaining, "mode": self.mode}
+
+
+############################################################
+# 関数定義
+############################################################
+_request_profiler = None
+_request_profiler_lock = threading.Lock()
+# tracemallocを利用中のプロファイルの数（同時に処理中の質問の間で、計測の開始・終了を共有する）
+_tracemalloc_users = 0
+_tracemalloc_started = False
+_tracemalloc_lock = threading.Lock()
+
+
+def get_request_profiler():
+    global _request_profiler
+    if _request_profiler is None:
+        with _request_profiler_lock:
+            if _request_profiler is None:
+                _request_profiler = RequestProfiler()
+    return _request_profiler
+
+
+@contextlib.contextmanager
+def profile_next_request(name="request"):
+    """
+    プロファイルの件数が残っていれば、withブロックの中の処理をプロファイルして ./logs/profiles に保存
+
+    Returns:
+        プロファイルの方法と保存したファイルのパスの辞書（プロファイルしない場合はNone。パスはブロックの終了後に追加される）
+    """
+    mode = get_request_profiler().take()
+    if mode is None:
+        yield None
+        return
+    if mode == "sampler" and not hasattr(sys, "_current_frames"):
+        mode = "cprofile"
+
+    prefix = os.path.join(ct.PROFILE_DIR_PATH, f"{datetime.now():%Y%m%d_%H%M%S_%f}_{name}_{mode}")
+    result = {"mode": mode, "paths": []}
+    profiler = {"sampler": _profile_stacks, "cprofile": _profile_calls, "tracemalloc": _profile_allocations}[mode]
+    # プロファイラーの開始・終了時のエラーで、回答生成を失敗させない
+    stack = contextlib.ExitStack()
+    try:
+        stack.enter_context(profiler(prefix, result["paths"]))
+    except Exception as e:
+        print(f"プロファイルの開始エラー: {e}", file=sys.stderr)
+    try:
+        yield result
+    finally:
+        try:
+            stack.close()
+        except Exception as e:
+            print(f"プロファイルの終了エラー: {e}", file=sys.stderr)
+        logging.getLogger(ct.LOGGER_NAME).info(
+            "プロファイルを保存しました", extra={"event": "profile", "mode": mode, "paths": result["paths"]}
+        )
+
+
+@contextlib.contextmanager
+def _profile_stacks(prefix, paths):
+    sampler = StackSampler().start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        _save(paths, prefix + ".folded", sampler.write_folded)
+
+
+@contextlib.contextmanager
+def _profile_calls(prefix, paths):
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        _save(paths, prefix + ".prof", profile.dump_stats)
+
+
+@contextlib.contextmanager
+def _profile_allocations(prefix, paths):
+    # 他のスレッド（同時に処理中の別の質問）の割り当ても含まれる
+    _start_tracemalloc()
+    try:
+        before = tracemalloc.take_snapshot()
+    except Exception:
+        _stop_tracemalloc()
+        raise
+    try:
+        yield
+    finally:
+        try:
+            after = tracemalloc.take_snapshot()
+        finally:
+            _stop_tracemalloc()
+        _save(paths, prefix + ".tracemalloc", after.dump)
+        _save(paths, prefix + ".folded", lambda path: _write_text(path, "".join(
+            f"{';'.join(f'{os.path.basename(frame.filename)}:{frame.lineno}' for frame in stat.traceback)} {stat.size_diff}\n"
+            for stat in after.compare_to(before, "traceback") if stat.size_diff > 0
+        )))
+        _save(paths, prefix + ".txt", lambda path: _write_text(path, "".join(
+            f"{stat}\n" for stat in after.compare_to(before, "lineno")[:ct.PROFILE_TRACEMALLOC_TOP]
+        )))
+
+
+def _start_tracemalloc():
+    """
+    tracemallocの計測を開始（同時にプロファイル中の質問がある場合は、利用数を増やすのみ）
+    """
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(ct.PROFILE_TRACEMALLOC_FRAMES)
+            _tracemalloc_started = True
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    """
+    tracemallocの利用数を減らし、最後の利用者であれば計測を終了（他で開始された計測は終了しない）
+    """
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_started:
+            tracemalloc.stop()
+            _tracemalloc_started = False
+
+
+def _write_text(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _save(paths, path, write):
+    """
+    プロファイルの結果をファイルに保存（保存に失敗しても回答生成は続ける）
+    """
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        write(path)
+        paths.append(path)
+    except Exception as e:
+        print(f"プロファイルの保存エラー: {e}", file=sys.stderr)
+
+
+def list_profiles(limit=20):
+    """
+    保存したプロファイルのファイルを、新しい順に取得
+    """
+    if not os.path.isdir(ct.PROFILE_DIR_PATH):
+        return []
+    files = [os.path.join(ct.PROFILE_DIR_PATH, name) for name in os.listdir(ct.PROFILE_DIR_PATH)]
+    return sorted(files, key=os.path.getmtime, reverse=True)[:limit]
+
+
+def frame_label(frame):
+    """
+    スタックの1段の表示名（関数名・ファイル名・関数の定義行）
+    """
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
@@ -0,0 +1,205 @@
+"""
+このファイルは、会話履歴をもとにした質問の書き換え（独立した入力テキストの生成）を、必要な場合にのみ行う処理が記述されたファイルです。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from langchain_core.output_parsers import StrOutputParser
+import constants as ct
+
+
+############################################################
+# 設定関連
+############################################################
+# 書き換えと並行して、元の質問での検索を先行実行するためのスレッドプール
+_executor = ThreadPoolExecutor(max_workers=ct.REWRITE_SPECULATIVE_WORKERS, thread_name_prefix="speculative-retrieval")
+
+# 指示語・省略表現を1語として含むかを判定する正規表現
+# （前後がひらがなの場合は、助詞を除いて別の語の一部とみなす。例: 「それぞれ」の「それ」）
+_reference_marker_pattern = re.compile(
+    rf"(?:(?<![\u3041-\u309f])|(?<=[{ct.REWRITE_MARKER_PARTICLES}]))"
+    rf"(?:{'|'.join(re.escape(marker) for marker in ct.REWRITE_REFERENCE_MARKERS)})"
+    rf"(?:(?![\u3041-\u309f])|(?=[{ct.REWRITE_MARKER_PARTICLES}]))"
+)
+
+# 直前の質問の埋め込みベクトルのキャッシュ（同じ質問を何度も埋め込まないようにする）
+_embedding_cache = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+_embedding_cache_hits = 0
+_embedding_cache_misses = 0
+
+
+############################################################
+# 関数定義
+############################################################
+
+def normalize_query(text):
+    """
+    質問の比較用に、全角・半角や空白、末尾の記号の違いを吸収した文字列を取得
+
+    Args:
+        text: 質問文
+
+    Returns:
+        正規化した質問文
+    """
+    text = unicodedata.normalize("NFKC", str(text)).strip().lower()
+    text = re.sub(r"\s+", "", text)
+    return text.rstrip("?？。.!！")
+
+
+def has_reference_marker(query):
+    """
+    指示語（それ、その件など）や省略を示す表現が質問に含まれているかを判定
+
+    Args:
+        query: 質問文
+
+    Returns:
+        含まれていればTrue
+    """
+    text = normalize_query(query)
+    if any(text.startswith(marker) for marker in ct.REWRITE_LEADING_MARKERS):
+        return True
+    return _reference_marker_pattern.search(text) is not None
+
+
+def get_embeddings(retriever):
+    """
+    Retrieverのベクターストアが使っている埋め込みモデルを取得（取得できない場合はNone）
+    """
+    vectorstore = getattr(retriever, "vectorstore", None)
+    try:
+        return getattr(vectorstore, "embeddings", None)
+    except Exception:
+        return None
+
+
+def embed_query(embeddings, text):
+    """
+    質問文の埋め込みベクトルを取得（直近の質問はキャッシュから返す）
+    """
+    global _embedding_cache_hits, _embedding_cache_misses
+    with _embedding_cache_lock:
+        if text in _embedding_cache:
+            _embedding_cache.move_to_end(text)
+            _embedding_cache_hits += 1
+            return _embedding_cache[text]
+        _embedding_cache_misses += 1
+
+    vector = np.asarray(embeddings.embed_query(text), dtype=np.float32)
+
+    with _embedding_cache_lock:
+        _embedding_cache[text] = vector
+        while len(_embedding_cache) > ct.REWRITE_EMBEDDING_CACHE_SIZE:
+            _embedding_cache.popitem(last=False)
+    return vector
+
+
+def embedding_cache_stats():
+    """
+    埋め込みベクトルのキャッシュのヒット数・ミス数などのメトリクスを取得
+    """
+    with _embedding_cache_lock:
+        return {
+            "size": len(_embedding_cache),
+            "hits": _embedding_cache_hits,
+            "misses": _embedding_cache_misses,
+        }
+
+
+def cosine_similarity(a, b):
+    """
+    2つのベクトルのコサイン類似度を計算
+    """
+    norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+    if norm == 0.0:
+        return 0.0
+    return float(np.dot(a, b) / norm)
+
+
+def needs_rewrite(query, memory, embeddings=None):
+    """
+    会話履歴をもとにした質問の書き換えが必要かを、LLMを使わずに判定
+
+    1. 会話の最初の質問は書き換え不要
+    2. 指示語・省略表現を含む質問は書き換えが必要
+    3. それ以外で十分に長い質問は、単独で意味が通るものとして書き換え不要
+    4. 短い質問は、直前の質問との埋め込みの類似度が高い場合（同じ話題の続き）のみ書き換えが必要
+
+    Args:
+        query: 質問文
+        memory: 会話履歴（ConversationMemory）
+        embeddings: 類似度の計算に使う埋め込みモデル（Noneの場合、短い質問は書き換えが必要と判定）
+
+    Returns:
+        書き換えが必要ならTrue
+    """
+    previous_query = memory.last_user_text() if memory is not None else ""
+    if not previous_query and not getattr(memory, "summary", ""):
+        return False
+
+    if has_reference_marker(query):
+        return True
+
+    if len(normalize_query(query)) >= ct.REWRITE_STANDALONE_MIN_LENGTH:
+        return False
+
+    if embeddings is None or not previous_query:
+        return True
+
+    try:
+        similarity = cosine_similarity(embed_query(embeddings, query), embed_query(embeddings, previous_query))
+    except Exception as e:
+        print(f"質問の類似度計算エラー: {e}")
+        return True
+    return similarity >= ct.REWRITE_SIMILARITY_THRESHOLD
+
+
+def retrieve_with_rewrite(llm, retriever, question_generator_prompt, query, chat_history, memory):
+    """
+    必要な場合のみ質問を書き換えて、関連ドキュメントを検索
+
+    書き換えが必要な場合は、書き換えのLLM呼び出しと並行して元の質問での検索を先行実行し、
+    書き換え結果が元の質問と同じであれば、先行実行した検索結果をそのまま使う。
+    書き換え結果が異なる場合は、先行実行がまだ順番待ちであれば取り消し、書き換え後の質問での検索を
+    呼び出し元のスレッドで実行する（スレッドプールの空きを待たない。実行中の先行検索は中断できないため、終了を待たずに結果を破棄する）
+
+    Args:
+        llm: 書き換えに使うLLM
+        retriever: ベクターストアを検索するRetriever
+        question_generator_prompt: 独立した入力テキストを生成するプロンプトテンプレート
+        query: ユーザー入力値
+        chat_history: LLMに渡す会話履歴（メッセージのリスト）
+        memory: 会話履歴（ConversationMemory）
+
+    Returns:
+        検索結果のドキュメントのリストと、検索に使った質問文
+    """
+    if not chat_history or not needs_rewrite(query, memory, get_embeddings(retriever)):
+        return retriever.invoke(query), query
+
+    speculative = _executor.submit(retriever.invoke, query)
+    try:
+        rewrite_chain = question_generator_prompt | llm | StrOutputParser()
+        rewritten = rewrite_chain.invoke({"input": query, "chat_history": chat_history}).strip()
+    except Exception as e:
+        print(f"質問の書き換えエラー: {e}")
+        rewritten = ""
+
+    if not rewritten or normalize_query(rewritten) == normalize_query(query):
+        return speculative.result(), query
+
+    # 先行実行分は、まだ始まっていなければ取り消す（実行中の場合は、スレッドプールで最後まで実行されたうえで破棄される）
+    speculative.cancel()
+    # 書き換え後の質問で検索し直す
+    return retriever.invoke(rewritten), rewritten
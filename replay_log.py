@@ -0,0 +1,479 @@
+"""
+このファイルは、アプリのログ（./logs/application.log）に記録された実際のユーザーの質問を、
+記録どおりの間隔（または速度を上げて）で再生し、応答時間の分布とキャッシュのヒット率を計測するツールです。
+インデックス・キャッシュの設定を変更する際に、合成した質問ではなく実際の利用状況で比較するために使います。
+
+ログは1行1件のJSON（structured_logging.pyの形式）と、以前のテキスト形式のどちらも読み込めます。
+main.pyは質問と回答を、いずれも {"message": ..., "application_mode": ...} の形式でログに出力するため、
+セッションごとに「質問 → 回答」の順に交互に記録されているものとして、質問の記録のみを取り出します。
+（回答の取得に失敗した場合はエラーのログが出力され、回答は記録されない）
+日付ごとにローテーションされた過去のログ（application.log.YYYY-MM-DD）も、日付順に読み込みます。
+
+使い方:
+    python replay_log.py                                   # ./logs のログを記録どおりの間隔で再生
+    python replay_log.py logs/application.log.2026-10-18 --speed 10
+    python replay_log.py --speed 0 --chunk-size 800 -k 8 --embedding-cache-size 256
+    python replay_log.py --stub --speed 0                  # APIを使わずに動作確認
+
+計測する指標:
+    latency            質問1件あたりの応答時間（全体・回答モードごとのパーセンタイル）
+    lag                記録上の時刻からの再生の遅れ（処理が追いつかない場合に大きくなる）
+    embedding_cache    質問の埋め込みベクトルのキャッシュ（query_rewrite.py）のヒット率
+    single_flight      同時に来た同じ質問の処理をまとめた割合
+    answer_cache       同じ質問（表記ゆれを正規化）に回答キャッシュを使った場合のヒット率の試算（件数ごと）
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import ast
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+import constants as ct
+
+
+############################################################
+# 定数定義
+############################################################
+# 以前のテキスト形式のログの1件の先頭行。メッセージが複数行の場合は、次の先頭行までを1件とする
+LOG_RECORD_PATTERN = re.compile(
+    r"^\[(?P<level>[A-Z]+)\] (?P<asctime>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) "
+    r"session_id=(?P<session_id>\w*): (?P<message>.*)$"
+)
+LOG_TIME_FORMAT = "%Y-%m-%d %H:%M:%S,%f"
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+
+
+############################################################
+# 関数定義
+############################################################
+
+def find_log_files(paths):
+    """
+    再生するログファイルの一覧を、古い順に取得
+
+    Args:
+        paths: ログファイルまたはログのフォルダのパスのリスト（フォルダの場合はローテーション済みのログも含める）
+
+    Returns:
+        ログファイルのパスのリスト
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, ct.LOG_FILE + "*")))
+        else:
+            files.append(path)
+    # ローテーション済みのログは「application.log.YYYY-MM-DD」、出力中のログは最後
+    return sorted(set(files), key=lambda f: (os.path.basename(f) == ct.LOG_FILE, os.path.basename(f)))
+
+
+def parse_json_record(line):
+    """
+    JSON形式のログの1行を、ログの記録の辞書に変換
+
+    Returns:
+        「level」「time」「session_id」「message」キーを持つ辞書（JSON形式のログの行でない場合はNone）
+    """
+    if not line.startswith("{"):
+        return None
+    try:
+        entry = json.loads(line)
+        time_ = datetime.fromisoformat(entry["time"])
+    except (ValueError, KeyError, TypeError):
+        return None
+    if not isinstance(entry, dict) or "level" not in entry:
+        return None
+    return {
+        "level": entry["level"],
+        "time": time_,
+        "session_id": entry.get("session_id") or "",
+        "message": entry.get("message"),
+    }
+
+
+def iter_log_records(path):
+    """
+    ログファイルから、1件ずつログの記録を読み込む（JSON形式とテキスト形式の行が混在していてもよい）
+
+    Returns:
+        「level」「time」「session_id」「message」キーを持つ辞書のジェネレーター
+    """
+    record = None
+    with open(path, encoding="utf8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            json_record = parse_json_record(line)
+            if json_record is not None:
+                if record is not None:
+                    yield record
+                    record = None
+                yield json_record
+                continue
+            match = LOG_RECORD_PATTERN.match(line)
+            if match is None:
+                # 複数行のメッセージの続き
+                if record is not None:
+                    record["message"] += "\n" + line
+                continue
+            if record is not None:
+                yield record
+            record = {
+                "level": match["level"],
+                "time": datetime.strptime(match["asctime"], LOG_TIME_FORMAT),
+                "session_id": match["session_id"],
+                "message": match["message"],
+            }
+    if record is not None:
+        yield record
+
+
+def parse_chat_message(text):
+    """
+    ログのメッセージが、質問・回答の記録（{"message": ..., "application_mode": ...}）であれば取り出す
+
+    Args:
+        text: ログのメッセージ（JSON形式のログでは辞書、テキスト形式のログでは辞書を文字列にしたもの）
+
+    Returns:
+        辞書（質問・回答の記録でない場合はNone）
+    """
+    if isinstance(text, dict):
+        value = text
+    elif not isinstance(text, str) or not text.startswith("{"):
+        return None
+    else:
+        try:
+            value = ast.literal_eval(text)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return None
+    if isinstance(value, dict) and isinstance(value.get("message"), str) and "application_mode" in value:
+        return value
+    return None
+
+
+def load_queries(paths, modes=None, limit=None):
+    """
+    ログから、ユーザーの質問の記録を時刻順に取り出す
+
+    Args:
+        paths: ログファイルまたはログのフォルダのパスのリスト
+        modes: 再生する回答モード（Noneの場合はすべて）
+        limit: 再生する質問の最大数
+
+    Returns:
+        「time」「session_id」「message」「mode」キーを持つ辞書のリスト
+    """
+    queries = []
+    # セッションごとに、次の記録が質問（True）か回答（False）か
+    expecting_query = {}
+    for path in find_log_files(paths):
+        for record in iter_log_records(path):
+            session_id = record["session_id"]
+            if record["level"] == "ERROR":
+                # 回答の取得・表示に失敗した場合、回答は記録されない
+                expecting_query[session_id] = True
+                continue
+            chat_message = parse_chat_message(record["message"])
+            if chat_message is None:
+                continue
+            if expecting_query.get(session_id, True):
+                queries.append({
+                    "time": record["time"],
+                    "session_id": session_id,
+                    "message": chat_message["message"],
+                    "mode": chat_message["application_mode"],
+                })
+            expecting_query[session_id] = not expecting_query.get(session_id, True)
+
+    queries.sort(key=lambda query: query["time"])
+    if modes:
+        queries = [query for query in queries if query["mode"] in modes]
+    return queries[:limit] if limit else queries
+
+
+def schedule_offsets(queries, speed=ct.REPLAY_SPEED, max_idle=ct.REPLAY_MAX_IDLE_SECONDS):
+    """
+    記録上の時刻から、再生開始からの各質問の送信時刻（秒）を計算
+
+    夜間などの長い空白は max_idle 秒に詰め、speed 倍の速度で再生する（speedが0の場合は間隔を空けない）。
+    """
+    offsets = []
+    offset = 0.0
+    previous = None
+    for query in queries:
+        if previous is not None and speed > 0:
+            gap = (query["time"] - previous).total_seconds()
+            offset += min(max(gap, 0.0), max_idle) / speed
+        offsets.append(offset)
+        previous = query["time"]
+    return offsets
+
+
+def simulate_answer_cache(queries, sizes=ct.REPLAY_CACHE_SIZES):
+    """
+    同じ質問（表記ゆれを正規化し、回答モードごと）への回答をキャッシュした場合のヒット率を、キャッシュの件数ごとに試算
+
+    会話の続きの質問も区別せずに数えるため、実際に得られるヒット率の上限の目安となる。
+
+    Returns:
+        {件数: ヒット率} の辞書
+    """
+    from query_rewrite import normalize_query
+
+    keys = [(query["mode"], normalize_query(query["message"])) for query in queries]
+    rates = {}
+    for size in sizes:
+        cache = OrderedDict()
+        hits = 0
+        for key in keys:
+            if key in cache:
+                cache.move_to_end(key)
+                hits += 1
+                continue
+            cache[key] = True
+            if len(cache) > size:
+                cache.popitem(last=False)
+        rates[size] = hits / len(keys) if keys else 0.0
+    return rates
+
+
+def prepare_retriever(chunk_size=ct.CHUNK_SIZE, chunk_overlap=ct.CHUNK_OVERLAP, k=ct.RAG_SEARCH_K):
+    """
+    指定のチャンク分割・取得件数のRetrieverを作成し、全セッションで共有するRetrieverとして設定
+
+    本番と同じ設定でFAISSを使える場合は、画面と同じ手順で作成する。
+    """
+    from benchmark import get_vectorstore_class
+    from initialize_ultra_lite import (
+        get_shared_retriever, set_shared_retriever, load_source_documents, split_documents, build_retriever
+    )
+    from utils import create_csv_documents
+
+    vectorstore_cls = get_vectorstore_class()
+    if vectorstore_cls.__name__ == "FAISS" and (chunk_size, chunk_overlap) == (ct.CHUNK_SIZE, ct.CHUNK_OVERLAP):
+        retriever = get_shared_retriever()
+    else:
+        documents = create_csv_documents() + split_documents(load_source_documents(), chunk_size, chunk_overlap)
+        retriever = build_retriever(documents, vectorstore_cls=vectorstore_cls)
+        set_shared_retriever(retriever)
+    retriever.search_kwargs["k"] = k
+    return retriever
+
+
+def replay(queries, offsets, max_workers=ct.REPLAY_MAX_WORKERS):
+    """
+    記録上のセッションごとに会話を引き継ぎながら、各質問を送信時刻に再生
+
+    同じセッションの質問は、前の質問の回答が終わってから順に処理する。
+
+    Returns:
+        質問ごとの計測結果の辞書のリスト（記録の順）
+    """
+    from load_test import VirtualSession
+
+    sessions = {}
+    session_locks = {}
+    results = [None] * len(queries)
+
+    def run_one(i, started_at):
+        query = queries[i]
+        with session_locks[query["session_id"]]:
+            session = sessions[query["session_id"]]
+            sent_at = time.monotonic()
+            session.state.mode = query["mode"]
+            error = False
+            try:
+                response = session.ask(query["message"])
+                error = ct.ERROR_ICON in response.get("answer", "")
+            except Exception as e:
+                print(f"再生中にエラー（{i + 1}件目）: {e}", file=sys.stderr)
+                error = True
+            results[i] = {
+                "mode": query["mode"],
+                "latency_seconds": time.monotonic() - sent_at,
+                "lag_seconds": sent_at - started_at - offsets[i],
+                "error": error,
+            }
+
+    for query in queries:
+        if query["session_id"] not in sessions:
+            sessions[query["session_id"]] = VirtualSession(len(sessions), [])
+            session_locks[query["session_id"]] = threading.Lock()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="replay") as executor:
+        started_at = time.monotonic()
+        for i, offset in enumerate(offsets):
+            wait = started_at + offset - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            executor.submit(run_one, i, started_at)
+    return results
+
+
+def summarize_latencies(seconds):
+    """
+    応答時間のリストから、件数・平均・パーセンタイル・最大値（ミリ秒）を計算
+    """
+    if not seconds:
+        return {"count": 0}
+    summary = {"count": len(seconds), "mean_ms": float(np.mean(seconds) * 1000)}
+    for q in LATENCY_PERCENTILES:
+        summary[f"p{q}_ms"] = float(np.percentile(seconds, q) * 1000)
+    summary["max_ms"] = float(np.max(seconds) * 1000)
+    return summary
+
+
+def hit_rate(hits, misses):
+    total = hits + misses
+    return hits / total if total else None
+
+
+def build_report(queries, results, embedding_cache, single_flight, answer_cache, elapsed):
+    """
+    再生の計測結果を集計
+    """
+    completed = [result for result in results if result is not None]
+    by_mode = {}
+    for result in completed:
+        by_mode.setdefault(result["mode"], []).append(result["latency_seconds"])
+    return {
+        "queries": len(queries),
+        "sessions": len({query["session_id"] for query in queries}),
+        "completed": len(completed),
+        "errors": sum(result["error"] for result in completed),
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": len(completed) / elapsed if elapsed else 0.0,
+        "latency": summarize_latencies([result["latency_seconds"] for result in completed]),
+        "latency_by_mode": {mode: summarize_latencies(seconds) for mode, seconds in by_mode.items()},
+        "lag": summarize_latencies([max(0.0, result["lag_seconds"]) for result in completed]),
+        "embedding_cache": {**embedding_cache, "hit_rate": hit_rate(embedding_cache["hits"], embedding_cache["misses"])},
+        "single_flight": {
+            **single_flight,
+            "shared_rate": hit_rate(single_flight["shared"], single_flight["executed"]),
+        },
+        "answer_cache_hit_rate": answer_cache,
+    }
+
+
+def print_report(report):
+    print(f"質問: {report['queries']}件（{report['sessions']}セッション）  完了: {report['completed']}件  "
+          f"エラー: {report['errors']}件  所要時間: {report['elapsed_seconds']:.1f}秒  "
+          f"({report['throughput_per_second']:.2f} req/s)")
+    print(f"\n{'':24} {'count':>6} {'mean_ms':>9} " + " ".join(f"{f'p{q}_ms':>9}" for q in LATENCY_PERCENTILES)
+          + f" {'max_ms':>9}")
+    rows = [("latency", report["latency"])]
+    rows += [(f"latency[{mode}]", summary) for mode, summary in report["latency_by_mode"].items()]
+    rows.append(("lag", report["lag"]))
+    for name, summary in rows:
+        if not summary["count"]:
+            continue
+        print(f"{name:24} {summary['count']:>6} {summary['mean_ms']:>9.1f} "
+              + " ".join(f"{summary[f'p{q}_ms']:>9.1f}" for q in LATENCY_PERCENTILES)
+              + f" {summary['max_ms']:>9.1f}")
+
+    def rate(value):
+        return "-" if value is None else f"{value:.1%}"
+
+    embedding_cache = report["embedding_cache"]
+    single_flight = report["single_flight"]
+    print(f"\n埋め込みベクトルのキャッシュ: ヒット率 {rate(embedding_cache['hit_rate'])}"
+          f"（{embedding_cache['hits']}/{embedding_cache['hits'] + embedding_cache['misses']}）")
+    print(f"同じ質問の処理の共有: {rate(single_flight['shared_rate'])}"
+          f"（{single_flight['shared']}/{single_flight['executed'] + single_flight['shared']}）")
+    print("回答キャッシュのヒット率の試算: "
+          + "  ".join(f"{size}件 {rate(value)}" for size, value in report["answer_cache_hit_rate"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ログに記録された実際の質問を再生し、応答時間とキャッシュのヒット率を計測")
+    parser.add_argument("logs", nargs="*", default=[ct.LOG_DIR_PATH], help="ログファイルまたはログのフォルダ（既定は ./logs）")
+    parser.add_argument("--speed", type=float, default=ct.REPLAY_SPEED, help="再生速度の倍率（0で間隔を空けずに再生）")
+    parser.add_argument("--max-idle", type=float, default=ct.REPLAY_MAX_IDLE_SECONDS, help="質問の間隔の上限（秒）")
+    parser.add_argument("--limit", type=int, help="再生する質問の最大数")
+    parser.add_argument("--modes", nargs="+", choices=(ct.ANSWER_MODE_1, ct.ANSWER_MODE_2), help="再生する回答モード")
+    parser.add_argument("--max-workers", type=int, default=ct.REPLAY_MAX_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=ct.CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=ct.CHUNK_OVERLAP)
+    parser.add_argument("-k", type=int, default=ct.RAG_SEARCH_K, help="ベクトル検索で取得する件数")
+    parser.add_argument("--embedding-cache-size", type=int, default=ct.REWRITE_EMBEDDING_CACHE_SIZE,
+                        help="質問の埋め込みベクトルのキャッシュの件数")
+    parser.add_argument("--cache-sizes", type=int, nargs="+", default=list(ct.REPLAY_CACHE_SIZES),
+                        help="ヒット率を試算する回答キャッシュの件数")
+    parser.add_argument("--stub", action="store_true", help="APIを使わないスタブのLLM・埋め込みモデルで再生する")
+    parser.add_argument("-o", "--output", help="結果のJSONファイル（既定は ./logs/replays/replay_日時.json）")
+    args = parser.parse_args()
+
+    queries = load_queries(args.logs, args.modes, args.limit)
+    if not queries:
+        print("再生する質問がログに見つかりませんでした。", file=sys.stderr)
+        sys.exit(1)
+
+    # LLM・埋め込みモデルの差し替えは、get_llm / get_embeddingsを呼び出す前に設定
+    if args.stub:
+        os.environ[ct.LLM_BACKEND_ENV] = "stub"
+    # Streamlitの画面外で実行する際の警告を抑止
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+
+    import query_rewrite
+    from utils import get_rag_single_flight_stats
+
+    # キャッシュの件数は参照時に読み込まれるため、実行中に変更できる
+    ct.REWRITE_EMBEDDING_CACHE_SIZE = args.embedding_cache_size
+    prepare_retriever(args.chunk_size, args.chunk_overlap, args.k)
+
+    offsets = schedule_offsets(queries, args.speed, args.max_idle)
+    print(f"再生中: 質問{len(queries)}件（記録上 {offsets[-1]:.0f}秒分）", file=sys.stderr)
+    embedding_cache_before = query_rewrite.embedding_cache_stats()
+    single_flight_before = get_rag_single_flight_stats()
+    started_at = time.monotonic()
+    results = replay(queries, offsets, args.max_workers)
+    elapsed = time.monotonic() - started_at
+    embedding_cache_after = query_rewrite.embedding_cache_stats()
+    single_flight_after = get_rag_single_flight_stats()
+
+    report = build_report(
+        queries, results,
+        {key: embedding_cache_after[key] - embedding_cache_before[key] for key in ("hits", "misses")},
+        {key: single_flight_after[key] - single_flight_before[key] for key in ("executed", "shared")},
+        simulate_answer_cache(queries, args.cache_sizes),
+        elapsed,
+    )
+    print_report(report)
+
+    output = args.output
+    if output is None:
+        os.makedirs(ct.REPLAY_DIR_PATH, exist_ok=True)
+        output = os.path.join(ct.REPLAY_DIR_PATH, f"replay_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "logs": find_log_files(args.logs),
+                "speed": args.speed,
+                "chunk_size": args.chunk_size,
+                "chunk_overlap": args.chunk_overlap,
+                "k": args.k,
+                "embedding_cache_size": args.embedding_cache_size,
+                "stub": args.stub,
+            },
+            "report": report,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+このファイルは、1回の回答生成の制限時間（デッドライン）と、処理段階ごとの時間配分を管理する処理が記述されたファイルです。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import asyncio
+import logging
+import threading
+import time
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class StageTimeout(Exception):
+    """
+    処理段階が時間配分内に終わらなかったことを表す例外
+    """
+
+    def __init__(self, stage, budget):
+        super().__init__(f"処理段階「{stage}」が制限時間（{budget:.1f}秒）内に終わりませんでした。")
+        self.stage = stage
+        self.budget = budget
+
+
+class Deadline:
+    """
+    回答生成全体の制限時間と、処理段階（質問の埋め込み、ベクトル検索、文脈の作成、回答生成）ごとの時間配分
+
+    各段階の制限時間は、段階ごとの配分と全体の残り時間の短い方とする。
+    """
+
+    def __init__(self, total_seconds=ct.REQUEST_DEADLINE_SECONDS, stage_budgets=None):
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + total_seconds
+        self.stage_budgets = stage_budgets or ct.REQUEST_STAGE_BUDGETS
+        # 段階ごとの所要時間（時間切れの場合は制限時間）
+        self.timings = {}
+        # 時間切れになった段階の一覧
+        self.overruns = []
+
+    def remaining(self):
+        """
+        全体の残り時間（秒）
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def budget(self, stage):
+        """
+        処理段階の制限時間（秒）
+        """
+        return min(self.stage_budgets.get(stage, self.remaining()), self.remaining())
+
+    def run(self, stage, fn, *args, **kwargs):
+        """
+        処理段階を制限時間付きで実行
+
+        時間切れになった処理は止められないため、結果を待つのをやめた後も、終わるまで別スレッドで実行を続ける。
+        そのようなスレッドが増え続けないよう、処理段階を実行中のスレッド数には上限（ct.REQUEST_STAGE_MAX_THREADS）を設け、
+        空きを待つ時間も制限時間に含める。非同期のコードからは、時間切れの処理をキャンセルできる run_async を使う。
+
+        Args:
+            stage: 処理段階の名前（ct.REQUEST_STAGE_BUDGETSのキー）
+            fn: 実行する関数
+
+        Returns:
+            関数の戻り値
+
+        Raises:
+            StageTimeout: 制限時間内に終わらなかった場合
+        """
+        budget = self.budget(stage)
+        started_at = time.monotonic()
+        if budget <= 0:
+            self._overrun(stage, budget, 0.0)
+
+        if not _stage_slots.acquire(timeout=budget):
+            self._overrun(stage, budget, time.monotonic() - started_at)
+        outcome = {}
+        thread = _start_stage_thread(stage, fn, args, kwargs, outcome)
+        thread.join(max(0.0, budget - (time.monotonic() - started_at)))
+        if thread.is_alive():
+            self._overrun(stage, budget, time.monotonic() - started_at)
+        self.timings[stage] = time.monotonic() - started_at
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("result")
+
+    async def run_async(self, stage, awaitable):
+        """
+        処理段階を制限時間付きで実行（非同期版。時間切れの場合は処理をキャンセルする）
+
+        Args:
+            stage: 処理段階の名前（ct.REQUEST_STAGE_BUDGETSのキー）
+            awaitable: 実行するコルーチン
+
+        Returns:
+            コルーチンの戻り値
+
+        Raises:
+            StageTimeout: 制限時間内に終わらなかった場合
+        """
+        budget = self.budget(stage)
+        started_at = time.monotonic()
+        if budget <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            self._overrun(stage, budget, 0.0)
+
+        try:
+            result = await asyncio.wait_for(awaitable, budget)
+        except asyncio.TimeoutError:
+            self._overrun(stage, budget, time.monotonic() - started_at)
+        self.timings[stage] = time.monotonic() - started_at
+        return result
+
+    def _overrun(self, stage, budget, elapsed):
+        self.timings[stage] = elapsed
+        self.overruns.append(stage)
+        logging.getLogger(ct.LOGGER_NAME).warning(
+            f"処理段階「{stage}」が制限時間を超過: 配分={budget:.2f}秒, 経過={elapsed:.2f}秒, 全体の残り={self.remaining():.2f}秒"
+        )
+        raise StageTimeout(stage, budget)
+
+
+############################################################
+# 関数定義
+############################################################
+
+# 処理段階を実行中のスレッド数の上限（時間切れで結果を待たなくなったスレッドも、終わるまで数える）
+_stage_slots = threading.BoundedSemaphore(ct.REQUEST_STAGE_MAX_THREADS)
+
+
+def _start_stage_thread(stage, fn, args, kwargs, outcome):
+    """
+    処理段階を別スレッドで開始（呼び出し元で _stage_slots の空きを確保してから呼び出す。スレッドの終了時に解放する）
+
+    別スレッドからでも画面表示（プレースホルダーの更新など）ができるよう、
+    呼び出し元のStreamlitのスクリプト実行コンテキストを引き継ぐ。
+    """
+    def target():
+        try:
+            outcome["result"] = fn(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            _stage_slots.release()
+
+    thread = threading.Thread(target=target, name=f"request-stage-{stage}", daemon=True)
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is not None:
+            add_script_run_ctx(thread, ctx)
+    except ImportError:
+        pass
+    try:
+        thread.start()
+    except BaseException:
+        _stage_slots.release()
+        raise
+    return thread
@@ -0,0 +1,64 @@
+"""
+このファイルは、処理中のリクエストがどのセッションのものかを管理する処理が記述されたファイルです。
+Streamlitの画面から呼び出された場合は st.session_state を、負荷試験などで画面を介さずに呼び出す場合は、
+呼び出し元で指定したセッション状態を使います。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import contextlib
+import contextvars
+
+
+############################################################
+# クラス定義
+############################################################
+
+class SessionState(dict):
+    """
+    画面を介さずに処理する場合のセッション状態（st.session_stateと同じく、属性としても参照できる辞書）
+    """
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+
+############################################################
+# 関数定義
+############################################################
+_current_state = contextvars.ContextVar("session_state", default=None)
+
+
+def get_session_state():
+    """
+    処理中のリクエストのセッション状態を取得
+
+    Returns:
+        session_scopeで指定したセッション状態（指定がない場合はst.session_state）
+    """
+    state = _current_state.get()
+    if state is not None:
+        return state
+    import streamlit as st
+    return st.session_state
+
+
+@contextlib.contextmanager
+def session_scope(state):
+    """
+    withブロックの中の処理で使うセッション状態を指定（負荷試験などで、スレッドごとに別のセッションとして処理する場合）
+    """
+    token = _current_state.set(state)
+    try:
+        yield state
+    finally:
+        _current_state.reset(token)
@@ -0,0 +1,152 @@
+"""
+このファイルは、同じ内容の処理が同時に複数実行されている場合に、1回の実行結果を共有する（single-flight）処理が記述されたファイルです。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import threading
+import time
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class _Call:
+    """
+    実行中の処理1件分の状態
+    """
+
+    __slots__ = ("done", "result", "error", "abandoned", "followers", "owner", "progress")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # 実行した呼び出しが中断された（結果も例外も共有できない）かどうか
+        self.abandoned = False
+        self.followers = 0
+        # 実行しているスレッドと、publishで知らせた進み具合
+        self.owner = threading.get_ident()
+        self.progress = None
+
+
+class SingleFlight:
+    """
+    キーごとに、同時に実行される処理を1つにまとめるクラス
+
+    同じキーの処理が実行中の場合、後から来た呼び出しは実行を待って同じ結果（または例外）を受け取る。
+    結果はキャッシュせず、実行が終わった時点でキーを解放する。
+    共有するのは結果と通常の例外（Exception）のみで、制御用の例外（BaseException）は実行した呼び出しにのみ伝わる。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executed = 0
+        self._shared = 0
+
+    def do(self, key, fn, *args, timeout=None, on_poll=None, **kwargs):
+        """
+        同じキーの処理が実行中でなければ実行し、実行中であればその結果を待って共有
+
+        実行した呼び出しが中断された場合（画面の再実行などの制御用の例外）は、待っていた呼び出しのうち1つが改めて実行する。
+        待ち時間が timeout を超えた場合は、待つのをやめて自分で実行する。
+
+        Args:
+            key: 同一の処理とみなすためのキー（ハッシュ可能な値）
+            fn: 実行する関数
+            timeout: 実行中の処理の結果を待つ最大の秒数（Noneの場合は無制限）
+            on_poll: 待っている間、一定間隔で呼び出すコールバック（画面表示の更新用）。publishで知らせた進み具合を渡す
+
+        Returns:
+            関数の戻り値と、他の呼び出しの結果を共有したかどうか（True: 共有）
+        """
+        wait_until = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None:
+                    call.followers += 1
+                    leader = False
+                else:
+                    call = self._calls[key] = _Call()
+                    self._executed += 1
+                    leader = True
+
+            if leader:
+                return self._lead(key, call, fn, args, kwargs), False
+
+            if not self._wait(call, wait_until, on_poll):
+                # 待ち時間の上限を超えた場合は、結果を共有せずに自分で実行
+                with self._lock:
+                    self._executed += 1
+                return fn(*args, **kwargs), False
+            if call.abandoned:
+                continue
+            with self._lock:
+                self._shared += 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+    def publish(self, key, progress):
+        """
+        実行中の処理の進み具合（順番待ちの順位など）を、結果を待っている呼び出しに知らせる
+
+        キーの処理を実行している呼び出し（doに渡した関数の中）から呼び出した場合のみ反映する。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.owner == threading.get_ident():
+                call.progress = progress
+
+    def _lead(self, key, call, fn, args, kwargs):
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            # 画面の再実行・中断などの制御用の例外は、待っている呼び出しに伝えない
+            call.abandoned = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    @staticmethod
+    def _wait(call, wait_until, on_poll):
+        """
+        実行中の処理の終了を待つ
+
+        Returns:
+            終了した場合はTrue、待ち時間の上限を超えた場合はFalse
+        """
+        while True:
+            interval = ct.SINGLE_FLIGHT_POLL_INTERVAL
+            if wait_until is not None:
+                interval = min(interval, max(0.0, wait_until - time.monotonic()))
+            if call.done.wait(interval):
+                return True
+            if wait_until is not None and time.monotonic() >= wait_until:
+                return False
+            if on_poll is not None:
+                on_poll(call.progress)
+
+    def stats(self):
+        """
+        実行した回数・結果を共有した回数などのメトリクスを取得
+        """
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executed": self._executed,
+                "shared": self._shared,
+            }
@@ -0,0 +1,193 @@
+"""
+このファイルは、回答生成に時間がかかった質問を、専用のログ（./logs/slow_queries.log）に記録する処理が記述されたファイルです。
+
+所要時間が閾値（環境変数「RAG_SLOW_QUERY_SECONDS」、既定は SLOW_QUERY_THRESHOLD_SECONDS）以上の質問について、
+質問・回答モード・検索結果の出典とスコア・プロンプトのトークン数・処理段階ごとの所要時間・キャッシュの利用状況を、
+1行1件のJSONで記録します（記録は SLOW_QUERY_SAMPLE_RATE の割合で抽出）。
+
+処理中に SLOW_QUERY_PROFILE_SECONDS を超えた質問は、その時点から回答生成の終了まで全スレッドのスタックを記録し、
+プロファイル（折りたたみ形式。flamegraph.pl・speedscopeで表示できる）を ./logs/slow_queries に保存したうえで、必ず記録します。
+
+    watch = watch_request(chat_message)
+    response = ...  # 回答生成
+    watch.finish(request_span, response)
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+import constants as ct
+from profiling import StackSampler
+from structured_logging import setup_logging
+
+
+############################################################
+# 設定関連
+############################################################
+_watchdog = None
+_watchdog_lock = threading.Lock()
+
+
+############################################################
+# クラス定義
+############################################################
+
+class RequestWatch:
+    """
+    処理中の1件の質問の、開始時刻とプロファイラー
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.started_at = time.monotonic()
+        self.sampler = None
+
+    def start_profile(self):
+        self.sampler = StackSampler().start()
+
+    def finish(self, span, response):
+        """
+        回答生成の終了時に呼び出し、遅い質問であれば記録（処理全体のスパンの中で呼び出す）
+
+        Args:
+            span: 処理全体（request）のスパン
+            response: get_llm_responseの戻り値
+        """
+        # unwatchの後は記録が開始されないため、この時点のプロファイラーを止めればよい
+        get_watchdog().unwatch(self)
+        sampler = self.sampler
+        if sampler is not None:
+            sampler.stop()
+
+        elapsed = time.monotonic() - self.started_at
+        if elapsed < slow_query_threshold():
+            return
+        profile_path = None
+        if sampler is not None:
+            file_name = f"{datetime.now():%Y%m%d_%H%M%S}_{span.trace_id[:16]}.folded"
+            profile_path = sampler.write_folded(os.path.join(ct.SLOW_QUERY_PROFILE_DIR_PATH, file_name))
+        elif random.random() >= ct.SLOW_QUERY_SAMPLE_RATE:
+            return
+        get_slow_query_logger().warning(
+            "遅い質問", extra=build_slow_query_entry(self.query, span, response, elapsed, profile_path)
+        )
+
+
+class SlowQueryWatchdog:
+    """
+    処理中の質問の所要時間を一定間隔で確認し、SLOW_QUERY_PROFILE_SECONDSを超えたものの記録を開始するクラス
+
+    質問ごとにタイマーのスレッドを作らず、プロセス全体で1つのスレッドで確認する。
+    """
+
+    def __init__(self, interval=ct.SLOW_QUERY_WATCH_INTERVAL_SECONDS, profile_seconds=ct.SLOW_QUERY_PROFILE_SECONDS):
+        self.interval = interval
+        self.profile_seconds = profile_seconds
+        self._lock = threading.Lock()
+        self._watches = set()
+        self._thread = threading.Thread(target=self._run, name="slow-query-watchdog", daemon=True)
+        self._thread.start()
+
+    def watch(self, query):
+        watch = RequestWatch(query)
+        with self._lock:
+            self._watches.add(watch)
+        return watch
+
+    def unwatch(self, watch):
+        with self._lock:
+            self._watches.discard(watch)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            # 記録の開始はロックの中で行い、unwatch済み（回答生成が終了済み）の質問の記録を開始しないようにする
+            with self._lock:
+                for watch in self._watches:
+                    if watch.sampler is None and now - watch.started_at >= self.profile_seconds:
+                        watch.start_profile()
+
+
+############################################################
+# 関数定義
+############################################################
+
+def get_watchdog():
+    global _watchdog
+    if _watchdog is None:
+        with _watchdog_lock:
+            if _watchdog is None:
+                _watchdog = SlowQueryWatchdog()
+    return _watchdog
+
+
+def watch_request(query):
+    """
+    質問の処理の開始を記録（回答生成の終了時に、戻り値のfinishを呼び出す）
+    """
+    return get_watchdog().watch(query)
+
+
+def slow_query_threshold():
+    return float(os.environ.get(ct.SLOW_QUERY_THRESHOLD_ENV, ct.SLOW_QUERY_THRESHOLD_SECONDS))
+
+
+def get_slow_query_logger():
+    """
+    遅い質問の記録用のロガーを取得（初回の呼び出し時に、出力先のファイルを設定）
+    """
+    setup_logging(os.path.join(ct.LOG_DIR_PATH, ct.SLOW_QUERY_LOG_FILE), logger_name=ct.SLOW_QUERY_LOGGER_NAME)
+    return logging.getLogger(ct.SLOW_QUERY_LOGGER_NAME)
+
+
+def build_slow_query_entry(query, span, response, elapsed, profile_path=None):
+    """
+    遅い質問の記録の内容を、処理全体のスパンとその子孫のスパンから作成
+
+    Returns:
+        ログの記録に追加する項目の辞書
+    """
+    cache_lookup = span.find_descendant("cache_lookup")
+    vector_search = span.find_descendant("vector_search")
+    context_pack = span.find_descendant("context_pack")
+    llm_complete = span.find_descendant("llm_complete")
+
+    scores = vector_search.attributes.get("scores", []) if vector_search is not None else []
+    sources = []
+    for i, doc in enumerate(response.get("context") or []):
+        metadata = getattr(doc, "metadata", {}) or {}
+        sources.append({
+            "source": metadata.get("source"),
+            "page": metadata.get("page"),
+            "score": scores[i] if i < len(scores) else None,
+        })
+
+    return {
+        "event": "slow_query",
+        "query": query,
+        "mode": response.get("mode") or span.attributes.get("mode"),
+        "path": span.attributes.get("path"),
+        "duration_ms": round(elapsed * 1000, 1),
+        "threshold_ms": round(slow_query_threshold() * 1000, 1),
+        "stages": {name: round(ms, 1) for name, ms in span.stage_timings.items()},
+        "sources": sources,
+        "prompt_tokens": context_pack.attributes.get("prompt_tokens") if context_pack is not None else None,
+        "completion_tokens": llm_complete.attributes.get("completion_tokens") if llm_complete is not None else None,
+        "cache": {
+            "employee_engine": cache_lookup.attributes.get("cache_hit") if cache_lookup is not None else None,
+            "single_flight_shared": span.attributes.get("single_flight_shared"),
+            "lexical_fallback": span.find_descendant("lexical_search") is not None,
+        },
+        "timed_out": sorted(s.name for s in span.descendants if s.attributes.get("timed_out")),
+        "sample_rate": 1.0 if profile_path else ct.SLOW_QUERY_SAMPLE_RATE,
+        "profile": profile_path,
+    }
@@ -0,0 +1,172 @@
+"""
+このファイルは、アプリのログ（./logs/application.log）の出力設定が記述されたファイルです。
+
+ログは1行1件のJSONで出力し、各記録にはログを出力したリクエストのセッションID・トレースID（tracing.py）を付けます。
+セッションIDはロガーの設定時ではなく、ログの出力時に処理中のセッション（session_context.py）から取得するため、
+複数のセッションが同時に利用していても、正しいセッションの記録になります。
+
+ファイルへの書き込みはバックグラウンドのスレッド（QueueListener）で行い、ログを出力した処理はキューに入れるだけで戻ります。
+logger.info(..., extra={...}) で指定した項目（処理段階ごとの所要時間など）は、そのままJSONの項目として出力します。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+import constants as ct
+from tracing import current_span
+
+
+############################################################
+# 定数定義
+############################################################
+# LogRecordが標準で持つ属性（これ以外の属性は、extraで指定された項目としてJSONに出力する）
+STANDARD_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+# フィルターで付ける属性
+CONTEXT_ATTRIBUTES = ("session_id", "trace_id", "span_id")
+
+
+############################################################
+# 設定関連
+############################################################
+# ロガーの名前ごとの、ログをファイルに書き込むQueueListener
+_listeners = {}
+_listener_lock = threading.Lock()
+
+
+############################################################
+# クラス定義
+############################################################
+
+class SessionContextFilter(logging.Filter):
+    """
+    ログの記録に、処理中のリクエストのセッションID・トレースID・スパンIDを付けるフィルター
+
+    ログを出力したスレッド（コンテキスト変数を参照できるスレッド）で実行する必要があるため、QueueHandlerに設定する。
+    """
+
+    def filter(self, record):
+        span = current_span()
+        if getattr(record, "session_id", None) is None:
+            record.session_id = (span.session_id if span is not None else None) or _current_session_id()
+        if getattr(record, "trace_id", None) is None:
+            record.trace_id = span.trace_id if span is not None else None
+            record.span_id = span.span_id if span is not None else None
+        return True
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    ログの記録をキューに入れるハンドラー
+
+    標準のQueueHandlerはキューに入れる前にメッセージを文字列に変換するが、
+    辞書のメッセージ（質問・回答の記録など）をJSONのまま出力するため、引数の埋め込みと例外の文字列化のみ行う。
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # 例外の情報（トレースバック）は、別のスレッドに渡す前に文字列にする
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    ログの記録を1行のJSONに変換するフォーマッター
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "session_id": getattr(record, "session_id", None),
+            "trace_id": getattr(record, "trace_id", None),
+            "span_id": getattr(record, "span_id", None),
+            "logger": record.name,
+            "function": record.funcName,
+            "line": record.lineno,
+            # 辞書のメッセージ（質問・回答の記録など）は、文字列にせずJSONのオブジェクトとして出力
+            "message": record.msg if isinstance(record.msg, dict) else record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_RECORD_ATTRIBUTES and key not in CONTEXT_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+############################################################
+# 関数定義
+############################################################
+
+def _current_session_id():
+    try:
+        from session_context import get_session_state
+        return get_session_state().session_id
+    except Exception:
+        return None
+
+
+def setup_logging(path=None, level=logging.INFO, logger_name=ct.LOGGER_NAME):
+    """
+    ロガーに、JSON形式でファイルに出力するハンドラーを設定（ロガーごとにプロセスで1回のみ）
+
+    Args:
+        path: ログファイルのパス（省略時は ./logs/application.log。1日単位でローテーション）
+        level: ログレベル
+        logger_name: 設定するロガーの名前（省略時はアプリのロガー）
+
+    Returns:
+        ログをファイルに書き込むQueueListener
+    """
+    with _listener_lock:
+        listener = _listeners.get(logger_name)
+        if listener is not None:
+            return listener
+
+        path = path or os.path.join(ct.LOG_DIR_PATH, ct.LOG_FILE)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        file_handler = TimedRotatingFileHandler(path, when="D", encoding="utf8")
+        file_handler.setFormatter(JsonFormatter())
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = ContextQueueHandler(log_queue)
+        queue_handler.addFilter(SessionContextFilter())
+
+        logger = logging.getLogger(logger_name)
+        logger.setLevel(level)
+        logger.addHandler(queue_handler)
+
+        listener = _listeners[logger_name] = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        listener.start()
+        if len(_listeners) == 1:
+            atexit.register(stop_logging)
+        return listener
+
+
+def stop_logging():
+    """
+    キューに残ったログをファイルに書き込んでから、書き込み用のスレッドを止める（プロセスの終了時に呼び出す）
+    """
+    with _listener_lock:
+        for listener in _listeners.values():
+            if listener._thread is not None:
+                listener.stop()
@@ -0,0 +1,101 @@
+"""
+このファイルは、OpenAI APIを呼び出さずに決まった結果を返す、LLM・埋め込みモデルの代替（スタブ）が記述されたファイルです。
+ベンチマークや負荷試験で、APIキーや通信なしに同じ結果を再現するために使います。
+
+環境変数「RAG_LLM_BACKEND=stub」を指定すると、llm_clientsのget_llm / get_embeddingsがこのスタブを返します。
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import asyncio
+import time
+from typing import List
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from stub_openai_server import DEFAULT_EMBEDDING_DIMENSIONS, split_tokens, stub_answer, stub_embedding
+
+
+############################################################
+# クラス定義
+############################################################
+
+class StubChatModel(BaseChatModel):
+    """
+    最後のユーザー入力をもとに、決まった形式の回答を返すチャットモデル
+
+    latency 秒待ってから最初のトークンを返し、以降は token_interval 秒ごとに数文字ずつ返す。
+    """
+
+    latency: float = 0.0
+    token_interval: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "stub-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return _chat_result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _chat_result(messages)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for i, piece in enumerate(split_tokens(stub_answer(_to_openai_messages(messages)))):
+            if i > 0 and self.token_interval:
+                time.sleep(self.token_interval)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for i, piece in enumerate(split_tokens(stub_answer(_to_openai_messages(messages)))):
+            if i > 0 and self.token_interval:
+                await asyncio.sleep(self.token_interval)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+
+class StubEmbeddings(Embeddings):
+    """
+    入力テキストから決定的な単位ベクトルを返す埋め込みモデル（同じ入力には常に同じベクトルを返す）
+    """
+
+    def __init__(self, dimensions=DEFAULT_EMBEDDING_DIMENSIONS, latency=0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        # 埋め込みベクトルのキャッシュを、次元数の異なるスタブや実際のモデルと区別するための名前
+        self.model = f"stub-{dimensions}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [stub_embedding(text, self.dimensions).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return [stub_embedding(text, self.dimensions).tolist() for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+############################################################
+# 関数定義
+############################################################
+
+def _to_openai_messages(messages):
+    roles = {"human": "user", "ai": "assistant"}
+    return [{"role": roles.get(m.type, m.type), "content": m.content} for m in messages]
+
+
+def _chat_result(messages):
+    answer = stub_answer(_to_openai_messages(messages))
+    return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
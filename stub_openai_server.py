@@ -0,0 +1,224 @@
+"""
+このファイルは、OpenAI APIの代わりに使うローカルのスタブサーバーです。
+応答の遅延を意図的に発生させ、ヘッジリクエストやタイムアウトなどの動作をAPI利用料なしで確認するために使います。
+
+使い方:
+    python stub_openai_server.py --port 8765 --latency 0.2 --slow-rate 0.05 --slow-latency 5
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=dummy streamlit run main.py
+
+対応しているエンドポイント:
+    POST /v1/chat/completions（ストリーミングあり・なし）
+    POST /v1/embeddings（同じ入力には常に同じベクトルを返す）
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+import uuid
+import numpy as np
+from aiohttp import web
+
+
+############################################################
+# 定数定義
+############################################################
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+STUB_ANSWER_PREFIX = "スタブ回答: "
+
+
+############################################################
+# クラス定義
+############################################################
+
+class LatencyProfile:
+    """
+    注入する遅延の設定
+
+    通常は latency 秒（±jitter）で最初のトークンを返し、slow_rate の確率で slow_latency 秒待たせる。
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, slow_rate=0.0, slow_latency=5.0, token_interval=0.01, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.token_interval = token_interval
+        self.random = random.Random(seed)
+
+    def first_token_delay(self):
+        if self.random.random() < self.slow_rate:
+            return self.slow_latency
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+
+class StubOpenAIServer:
+    """
+    OpenAI互換のチャット補完・埋め込みAPIのスタブ
+    """
+
+    def __init__(self, profile=None, dimensions=DEFAULT_EMBEDDING_DIMENSIONS):
+        self.profile = profile or LatencyProfile()
+        self.dimensions = dimensions
+        # リクエスト数の記録（ヘッジや打ち切りの確認用）
+        self.stats = {"chat": 0, "chat_cancelled": 0, "embeddings": 0}
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/v1/embeddings", self.embeddings)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+    async def chat_completions(self, request):
+        body = await request.json()
+        self.stats["chat"] += 1
+        model = body.get("model", "stub")
+        answer = stub_answer(body.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        await asyncio.sleep(self.profile.first_token_delay())
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage(body.get("messages", []), answer),
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        try:
+            chunks = [{"role": "assistant", "content": ""}] + [{"content": piece} for piece in split_tokens(answer)]
+            for i, delta in enumerate(chunks):
+                if i > 1:
+                    await asyncio.sleep(self.profile.token_interval)
+                await send_event(response, completion_chunk(completion_id, created, model, delta, None))
+            await send_event(response, completion_chunk(completion_id, created, model, {}, "stop"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                final = completion_chunk(completion_id, created, model, None, None)
+                final["choices"] = []
+                final["usage"] = usage(body.get("messages", []), answer)
+                await send_event(response, final)
+            await response.write(b"data: [DONE]\n\n")
+        except (ConnectionResetError, asyncio.CancelledError):
+            # クライアントが打ち切った（ヘッジで負けた側など）
+            self.stats["chat_cancelled"] += 1
+            raise
+        return response
+
+    async def embeddings(self, request):
+        body = await request.json()
+        self.stats["embeddings"] += 1
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or self.dimensions
+
+        data = []
+        for index, item in enumerate(inputs):
+            vector = stub_embedding(item, dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+
+        tokens = sum(len(item) for item in inputs)
+        return web.json_response({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+
+############################################################
+# 関数定義
+############################################################
+
+def stub_answer(messages):
+    """
+    最後のユーザー入力をもとに、決まった形式の回答を作成
+    """
+    user_messages = [m.get("content", "") for m in messages if m.get("role") == "user"]
+    question = user_messages[-1] if user_messages else ""
+    if isinstance(question, list):
+        question = " ".join(part.get("text", "") for part in question if isinstance(part, dict))
+    return f"{STUB_ANSWER_PREFIX}{question[:80]}"
+
+
+def split_tokens(text, size=4):
+    """
+    ストリーミング用に、回答を数文字ずつに分割
+    """
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def stub_embedding(item, dimensions):
+    """
+    入力（文字列またはトークンIDのリスト）から、決定的な単位ベクトルを作成
+    """
+    seed = int.from_bytes(hashlib.sha256(json.dumps(item, ensure_ascii=False).encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def usage(messages, answer):
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": len(answer), "total_tokens": prompt_tokens + len(answer)}
+
+
+def completion_chunk(completion_id, created, model, delta, finish_reason):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta or {}, "finish_reason": finish_reason}],
+    }
+
+
+async def send_event(response, payload):
+    await response.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="遅延を注入できるOpenAI互換のスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="最初のトークンまでの通常の遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.05, help="通常の遅延のばらつき（秒）")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="遅い応答を返す確率（0〜1）")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="遅い応答の遅延（秒）")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="ストリーミングのトークン間隔（秒）")
+    parser.add_argument("--dimensions", type=int, default=DEFAULT_EMBEDDING_DIMENSIONS)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    profile = LatencyProfile(args.latency, args.jitter, args.slow_rate, args.slow_latency, args.token_interval, args.seed)
+    server = StubOpenAIServer(profile, args.dimensions)
+    web.run_app(server.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
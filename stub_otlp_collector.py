@@ -0,0 +1,103 @@
+"""
+このファイルは、OpenTelemetryのコレクターの代わりに使うローカルのスタブサーバーです。
+OTLP/HTTP（JSON）で送信されたスパンを受け取り、1行1件のJSONでファイルに保存して、処理段階ごとの所要時間を表示します。
+本番のコレクターを用意せずに、トレースの送信（tracing.py）の動作を確認するために使います。
+
+使い方:
+    python stub_otlp_collector.py --port 4318 -o ./logs/traces/collector.jsonl
+    RAG_OTLP_ENDPOINT=http://127.0.0.1:4318/v1/traces streamlit run main.py
+
+対応しているエンドポイント:
+    POST /v1/traces（OTLP/HTTPのJSON形式のみ）
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import json
+import os
+from aiohttp import web
+import constants as ct
+
+
+############################################################
+# 関数定義
+############################################################
+
+def from_otlp_value(value):
+    """
+    OTLPのAnyValue形式の値を、Pythonの値に変換
+    """
+    if "intValue" in value:
+        return int(value["intValue"])
+    for key in ("boolValue", "doubleValue", "stringValue"):
+        if key in value:
+            return value[key]
+    return None
+
+
+def iter_spans(payload):
+    """
+    OTLP/HTTP（JSON）の送信内容から、スパンを1件ずつ取り出す
+
+    Returns:
+        スパンの辞書（tracing.Span.to_dictと同じキー）のジェネレーター
+    """
+    for resource_spans in payload.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                attributes = {a["key"]: from_otlp_value(a.get("value", {})) for a in span.get("attributes", [])}
+                start_ns = int(span["startTimeUnixNano"])
+                yield {
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId") or None,
+                    "name": span["name"],
+                    "session_id": attributes.pop("session.id", None) or None,
+                    "start_time": start_ns / 1e9,
+                    "duration_ms": (int(span["endTimeUnixNano"]) - start_ns) / 1e6,
+                    "status": "error" if span.get("status", {}).get("code") == 2 else "ok",
+                    "attributes": attributes,
+                }
+
+
+def create_app(output_path):
+    """
+    スパンを受け取るWebアプリケーションを作成
+    """
+    async def receive_traces(request):
+        try:
+            payload = await request.json()
+        except json.JSONDecodeError:
+            raise web.HTTPBadRequest(text="OTLP/HTTPのJSON形式のみ対応しています。")
+        spans = list(iter_spans(payload))
+        with open(output_path, "a", encoding="utf8") as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False) + "\n")
+        for span in spans:
+            print(f"{span['trace_id'][:8]} {span['name']:16} {span['duration_ms']:>9.1f}ms "
+                  f"session={span['session_id']} {span['attributes']}")
+        return web.json_response({"partialSuccess": {}})
+
+    app = web.Application()
+    app.router.add_post("/v1/traces", receive_traces)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OTLP/HTTP（JSON）のスパンを受け取るスタブのコレクター")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=ct.TRACE_OTLP_STUB_PORT)
+    parser.add_argument("-o", "--output", default=os.path.join(os.path.dirname(ct.TRACE_FILE_PATH), "collector.jsonl"),
+                        help="受け取ったスパンを保存するJSONLファイル")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    web.run_app(create_app(args.output), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
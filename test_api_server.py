@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+HTTP API（api_server.py）のテストスクリプト
+
+LLM・ベクターストアを使わずに確認できる、社員検索・社員名簿からの回答・入力値の検証を確認します。
+"""
+
+import json
+import sys
+sys.path.append('.')
+
+from aiohttp import test_utils
+from api_server import create_app
+from async_engine import get_async_engine
+
+
+def call_api(*requests):
+    """
+    検索機能なし（Retrieverなし）のAPIに (メソッド, パス, 引数の辞書) の順にリクエストし、(ステータス, 本文) のリストを返す
+
+    画面と同じく、非同期エンジンのイベントループ上で動かす。
+    """
+    async def run():
+        client = test_utils.TestClient(test_utils.TestServer(create_app(None)))
+        await client.start_server()
+        try:
+            results = []
+            for method, path, kwargs in requests:
+                response = await client.request(method, path, **kwargs)
+                results.append((response.status, await response.text()))
+            return results
+        finally:
+            await client.close()
+
+    return get_async_engine().run(run())
+
+
+def test_employees():
+    [(status, body)] = call_api(("GET", "/employees", {"params": {"name": "山下涼平"}}))
+    payload = json.loads(body)
+    assert status == 200 and payload["count"] == 1
+    assert payload["employees"][0]["氏名（フルネーム）"] == "山下 涼平"
+
+    [(status, body)] = call_api(("GET", "/employees", {"params": {"部署": "営業部", "limit": "3"}}))
+    payload = json.loads(body)
+    assert status == 200 and 0 < payload["count"] <= 3
+    assert all(employee["部署"] == "営業部" for employee in payload["employees"])
+
+
+def test_structured_answer_without_retriever():
+    """社員名簿で答えられる質問は、検索機能がなくても回答すること（ストリーミングはNDJSON）"""
+    (status, body), (stream_status, stream_body) = call_api(
+        ("POST", "/answer", {"json": {"question": "営業部の人数は？", "stream": False}}),
+        ("POST", "/answer", {"json": {"question": "営業部の人数は？"}}),
+    )
+    assert status == 200 and "集計結果" in json.loads(body)["answer"]
+    events = [json.loads(line) for line in stream_body.splitlines()]
+    assert stream_status == 200 and [event["event"] for event in events] == ["sources", "token", "done"]
+    assert events[-1]["answer"] == json.loads(body)["answer"]
+
+
+def test_invalid_requests():
+    responses = call_api(
+        ("GET", "/search", {}),
+        ("GET", "/search", {"params": {"q": "有給休暇"}}),
+        ("GET", "/employees", {"params": {"limit": "many"}}),
+        ("POST", "/answer", {"data": "not json", "headers": {"Content-Type": "application/json"}}),
+        ("GET", "/healthz", {}),
+    )
+    assert [status for status, _ in responses] == [400, 503, 400, 400, 200]
+    assert json.loads(responses[-1][1])["status"] == "degraded"
+
+
+if __name__ == "__main__":
+    for test in (test_employees, test_structured_answer_without_retriever, test_invalid_requests):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+共有のイベントループで処理を実行するエンジン（async_engine.py）のテストスクリプト
+"""
+
+import asyncio
+import sys
+import threading
+import time
+sys.path.append('.')
+
+from async_engine import AsyncEngine, aembed_query, get_async_engine
+
+
+def test_run_returns_result_on_engine_loop():
+    engine = get_async_engine()
+
+    async def where():
+        return threading.current_thread().name
+
+    assert engine.run(where()) == "async-engine-loop"
+
+
+def test_concurrent_requests_do_not_need_threads():
+    """同時に投入した待ち時間のある処理が、並行して実行されること"""
+    engine = get_async_engine()
+    started_at = time.monotonic()
+    futures = [engine.submit(asyncio.sleep(0.2, result=i)) for i in range(20)]
+    assert [future.result(5) for future in futures] == list(range(20))
+    assert time.monotonic() - started_at < 1.0
+
+
+def test_to_thread_and_errors():
+    """ブロッキング処理はスレッドプールで実行し、例外は呼び出し元に伝えること"""
+    engine = get_async_engine()
+
+    async def blocking():
+        return await engine.to_thread(lambda: threading.current_thread().name)
+
+    assert engine.run(blocking()).startswith("async-engine-worker")
+
+    async def fail():
+        raise ValueError("失敗")
+
+    try:
+        engine.run(fail())
+        assert False, "例外が伝わりませんでした"
+    except ValueError:
+        pass
+
+
+def test_interrupted_caller_cancels_coroutine():
+    """待っている呼び出し元が中断された場合は、イベントループ側の処理もキャンセルすること"""
+    engine = AsyncEngine(workers=1)
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    def interrupt():
+        raise KeyboardInterrupt
+
+    try:
+        engine.run(slow(), on_poll=interrupt)
+        assert False, "中断されませんでした"
+    except KeyboardInterrupt:
+        pass
+    assert cancelled.wait(5)
+    engine.shutdown()
+
+
+def test_aembed_query_without_async_api():
+    class SyncEmbeddings:
+        def embed_query(self, text):
+            return [float(len(text))]
+
+    assert get_async_engine().run(aembed_query(SyncEmbeddings(), "質問")) == [2.0]
+
+
+if __name__ == "__main__":
+    for test in (test_run_returns_result_on_engine_loop, test_concurrent_requests_do_not_need_threads,
+                 test_to_thread_and_errors, test_interrupted_caller_cancels_coroutine,
+                 test_aembed_query_without_async_api):
+        test()
+        print(f"OK: {test.__name__}")
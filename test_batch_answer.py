@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+一括回答（batch_answer.py）の、まとめて行う検索と質問の読み込みのテストスクリプト
+"""
+
+import sys
+sys.path.append('.')
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import InMemoryVectorStore
+from batch_answer import VectorMatrix, read_questions, search_batch
+
+
+class HashEmbeddings(Embeddings):
+    """テキストから決まったベクトルを作る埋め込みモデル（APIを使わない）"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        rng = np.random.default_rng(sum(ord(char) * (i + 1) for i, char in enumerate(text)))
+        return rng.normal(size=16).tolist()
+
+
+def test_matrix_top_k_matches_full_sort():
+    """部分ソートで取り出した上位k件が、全件を並べ替えた場合の上位k件と同じ順になること"""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 32))
+    documents = [Document(page_content=str(i)) for i in range(len(vectors))]
+    queries = rng.normal(size=(5, 32))
+    results = VectorMatrix(documents, vectors).search(queries, k=7)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    for query, hits in zip(queries, results):
+        expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:7]
+        assert [int(doc.page_content) for doc, _ in hits] == expected.tolist()
+        scores = [score for _, score in hits]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_k_larger_than_documents():
+    documents = [Document(page_content="a"), Document(page_content="b")]
+    results = VectorMatrix(documents, [[1.0, 0.0], [0.0, 1.0]]).search([[1.0, 0.1]], k=5)
+    assert [doc.page_content for doc, _ in results[0]] == ["a", "b"]
+    assert VectorMatrix([], np.zeros((0, 2))).search([[1.0, 0.0]], k=3) == [[]]
+
+
+def test_search_batch_matches_vectorstore():
+    """InMemoryVectorStoreのまとめた検索結果が、1件ずつの検索結果と同じになること"""
+    embeddings = HashEmbeddings()
+    texts = [f"社内文書{i}" for i in range(30)]
+    vectorstore = InMemoryVectorStore.from_texts(texts, embeddings)
+    questions = ["有給休暇", "経費精算", "社員研修"]
+    vectors = [embeddings.embed_query(question) for question in questions]
+    for vector, hits in zip(vectors, search_batch(vectorstore, vectors, k=4)):
+        expected = vectorstore.similarity_search_by_vector(vector, k=4)
+        assert [doc.page_content for doc, _ in hits] == [doc.page_content for doc in expected]
+
+
+def test_read_questions():
+    lines = ['{"id": "q1", "question": " 経理部のスタッフを教えて "}', "", '{"query": "営業部のマネージャーは？"}',
+             '"有給休暇の申請方法は？"']
+    assert read_questions(lines) == [
+        {"id": "q1", "question": "経理部のスタッフを教えて"},
+        {"query": "営業部のマネージャーは？", "question": "営業部のマネージャーは？"},
+        {"question": "有給休暇の申請方法は？"},
+    ]
+    try:
+        read_questions(['{"id": "q2"}'])
+        assert False, "質問のない行がエラーになりませんでした"
+    except ValueError as e:
+        assert "1行目" in str(e)
+
+
+if __name__ == "__main__":
+    for test in (test_matrix_top_k_matches_full_sort, test_k_larger_than_documents,
+                 test_search_batch_matches_vectorstore, test_read_questions):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+オフラインのベンチマーク（benchmark.py）と、APIを使わないスタブのモデル（stub_models.py）のテストスクリプト
+"""
+
+import os
+import sys
+sys.path.append('.')
+
+import numpy as np
+from langchain.schema import Document, HumanMessage
+import constants as ct
+from benchmark import compare_results, scale_documents
+from stub_models import StubChatModel, StubEmbeddings
+
+
+def test_stub_backend_is_deterministic():
+    """スタブのバックエンドでは、同じ入力に常に同じ回答・埋め込みベクトルを返すこと"""
+    os.environ[ct.LLM_BACKEND_ENV] = "stub"
+    try:
+        from llm_clients import close_clients, get_embeddings, get_llm
+        close_clients()
+        llm, embeddings = get_llm(), get_embeddings()
+        assert isinstance(llm, StubChatModel) and isinstance(embeddings, StubEmbeddings)
+    finally:
+        del os.environ[ct.LLM_BACKEND_ENV]
+        close_clients()
+
+    messages = [HumanMessage(content="有給休暇の申請方法は？")]
+    answer = llm.invoke(messages).content
+    assert answer and llm.invoke(messages).content == answer
+    assert "".join(chunk.content for chunk in llm.stream(messages)) == answer
+
+    vector = np.asarray(embeddings.embed_query("有給休暇"))
+    assert np.allclose(vector, embeddings.embed_documents(["有給休暇"])[0])
+    assert abs(np.linalg.norm(vector) - 1.0) < 1e-6
+    assert not np.allclose(vector, embeddings.embed_query("経費精算"))
+
+
+def test_scale_documents():
+    """複製したドキュメントは本文・出典を変え、元のドキュメントは変えないこと"""
+    documents = [Document(page_content="規程", metadata={"source": "a.pdf", "page": 1})]
+    scaled = scale_documents(documents, 3)
+    assert len(scaled) == 3 and scaled[0] is documents[0]
+    assert [doc.metadata["source"] for doc in scaled] == ["a.pdf", "a.pdf#copy1", "a.pdf#copy2"]
+    assert len({doc.page_content for doc in scaled}) == 3 and scaled[1].metadata["page"] == 1
+
+
+def test_compare_results():
+    """所要時間の増加・処理速度の低下を劣化とし、誤差程度の差と件数の指標は劣化としないこと"""
+    baseline = {"stages": {"search": {"p50_ms": 10.0, "p95_ms": 0.5, "chunks": 100},
+                           "ingest": {"docs_per_second": 100.0, "total_seconds": 2.0}}}
+    current = {"stages": {"search": {"p50_ms": 15.0, "p95_ms": 0.9, "chunks": 300},
+                          "ingest": {"docs_per_second": 50.0, "total_seconds": 1.0}}}
+    rows = {(stage, metric): regressed for stage, metric, _, _, _, regressed in compare_results(baseline, current)}
+    assert rows == {
+        ("search", "p50_ms"): True,
+        ("search", "p95_ms"): False,
+        ("ingest", "docs_per_second"): True,
+        ("ingest", "total_seconds"): False,
+    }
+
+
+if __name__ == "__main__":
+    for test in (test_stub_backend_is_deterministic, test_scale_documents, test_compare_results):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+文脈の組み立て（context_packer.py）のテストスクリプト
+"""
+
+import sys
+sys.path.append('.')
+
+from langchain_core.documents import Document
+from context_packer import count_tokens, pack_context, remove_duplicates, merge_neighbor_chunks
+from initialize_ultra_lite import compute_index_version, split_documents
+
+
+def make_doc(text, source="規程.pdf", page=0, start=None):
+    metadata = {"source": source, "page": page}
+    if start is not None:
+        metadata["start_index"] = start
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_remove_duplicates():
+    """空白の違いのみのチャンクと、他のチャンクに含まれるチャンクを除くこと（順序は維持）"""
+    first = make_doc("有給休暇は 入社6か月後に付与されます。")
+    same = make_doc("有給休暇は\n入社6か月後に付与されます。")
+    longer = make_doc("有給休暇は 入社6か月後に付与されます。 付与日数は勤続年数に応じて増えます。")
+    other = make_doc("慶弔休暇について")
+    assert remove_duplicates([first, same, other, longer]) == [longer, other]
+
+
+def test_merge_neighbor_chunks_by_start_index():
+    """同じページで重なり合うチャンクを、重複部分を除いて1つに結合すること"""
+    text = "あ" * 50 + "い" * 50 + "う" * 50
+    later = make_doc(text[50:150], start=50)
+    earlier = make_doc(text[0:100], start=0)
+    elsewhere = make_doc(text[0:100], source="別の規程.pdf", start=0)
+    blocks = merge_neighbor_chunks([later, elsewhere, earlier])
+    assert len(blocks) == 2
+    assert blocks[0]["text"] == text and blocks[0]["docs"] == [later, earlier]
+    assert blocks[1]["docs"] == [elsewhere]
+
+
+def test_pack_context_within_budget():
+    """トークン数の上限内で、関連度の高い順に文脈に含めること"""
+    docs = [make_doc("関連度の高いチャンク。" * 20, page=1), make_doc("次に関連度の高いチャンク。" * 20, page=2),
+            make_doc("関連度の低いチャンク。" * 200, page=3)]
+    budget = count_tokens(docs[0].page_content) + count_tokens(docs[1].page_content) + 50
+    text, used_docs, used_tokens = pack_context(docs, token_budget=budget)
+    assert used_docs == docs[:2], used_docs
+    assert used_tokens <= budget and count_tokens(text) <= budget
+
+
+def test_pack_context_truncates_first_block():
+    """最初のチャンクが上限を超える場合は、切り詰めて含めること"""
+    doc = make_doc("就業規則の本文。" * 500)
+    text, used_docs, used_tokens = pack_context([doc], token_budget=100)
+    assert used_docs == [doc] and 0 < count_tokens(text) <= 100 and used_tokens <= 100
+    assert doc.page_content.startswith(text)
+
+
+def test_index_version_uses_actual_chunking():
+    """インデックスのバージョンが、定数ではなく実際に分割に使った設定で変わること"""
+    docs = [make_doc("有給休暇は入社6か月後に付与されます。")]
+    default = compute_index_version(split_documents(docs))
+    assert compute_index_version(split_documents(docs)) == default
+    # 文書が短く分割結果が同じでも、分割の設定が異なればバージョンも異なる
+    assert compute_index_version(split_documents(docs, chunk_size=300, chunk_overlap=30)) != default
+    assert compute_index_version(split_documents(docs, splitter="character")) != default
+
+
+if __name__ == "__main__":
+    for test in (test_remove_duplicates, test_merge_neighbor_chunks_by_start_index,
+                 test_pack_context_within_budget, test_pack_context_truncates_first_block,
+                 test_index_version_uses_actual_chunking):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+トークン数の上限付きの会話履歴（conversation_memory.py）のテストスクリプト
+"""
+
+import sys
+import threading
+sys.path.append('.')
+
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+from conversation_memory import ConversationMemory
+
+
+class SummaryLLM:
+    """要約の呼び出しを記録し、releaseされるまで応答を保留するLLM"""
+
+    def __init__(self, summary="要約された会話"):
+        self.summary = summary
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def invoke(self, messages):
+        self.calls.append(messages)
+        self.release.wait(5)
+        return AIMessage(content=self.summary)
+
+
+def filled_memory(turns=6):
+    memory = ConversationMemory(token_budget=60, recent_turns=2, hard_limit_tokens=10000)
+    for i in range(turns):
+        memory.add_turn(f"質問{i}" + "あ" * 10, f"回答{i}" + "い" * 10)
+    return memory
+
+
+def test_recent_turns_within_budget():
+    """上限内では、要約せずに直近の会話をそのまま渡すこと"""
+    memory = ConversationMemory(token_budget=1000, recent_turns=2)
+    memory.add_turn("有給休暇は何日？", "10日です。")
+    assert not memory.needs_summary()
+    assert memory.last_user_text() == "有給休暇は何日？"
+    messages = memory.to_messages()
+    assert [type(m) for m in messages] == [HumanMessage, AIMessage]
+
+
+def test_summary_replaces_folded_turns():
+    """上限を超えた古い会話を要約に置き換え、直近の往復は残すこと"""
+    memory = filled_memory()
+    assert memory.needs_summary()
+    llm = SummaryLLM()
+    memory.summarize_in_background(llm).join(5)
+
+    assert len(llm.calls) == 1 and "質問0" in llm.calls[0][1].content
+    assert memory.summary == "要約された会話"
+    assert len(memory) >= 4 and len(memory) % 2 == 0
+    assert memory.last_user_text().startswith("質問5")
+    messages = memory.to_messages()
+    assert isinstance(messages[0], SystemMessage) and "要約された会話" in messages[0].content
+    assert isinstance(messages[1], HumanMessage)
+
+
+def test_turns_added_while_summarizing_are_kept():
+    """要約中に追加された会話は、要約の反映後も残ること"""
+    memory = filled_memory()
+    llm = SummaryLLM()
+    llm.release.clear()
+    thread = memory.summarize_in_background(llm)
+    # 要約中は重ねて要約を開始しない
+    assert memory.summarize_in_background(llm) is None and not memory.needs_summary()
+    memory.add_turn("要約中の質問", "要約中の回答")
+    llm.release.set()
+    thread.join(5)
+    assert memory.last_user_text() == "要約中の質問"
+    assert memory.summary == "要約された会話"
+
+
+def test_failed_summary_keeps_history():
+    class FailingLLM:
+        def invoke(self, messages):
+            raise ConnectionError("接続に失敗しました")
+
+    memory = filled_memory()
+    count = len(memory)
+    memory.summarize_in_background(FailingLLM()).join(5)
+    assert len(memory) == count and memory.summary == ""
+    assert memory.needs_summary()
+
+
+def test_summary_and_recent_turns_reach_the_answer_prompt():
+    """回答生成のLLMに、これまでの会話の要約と直近の会話を、質問の前に渡すこと"""
+    from langchain_core.documents import Document
+    from langchain_core.vectorstores import InMemoryVectorStore
+    from async_engine import get_async_engine
+    from request_deadline import Deadline
+    from session_context import SessionState, session_scope
+    from stub_models import StubEmbeddings
+    import utils
+
+    class RecordingLLM:
+        def __init__(self):
+            self.messages = None
+
+        async def ainvoke(self, messages, on_first_token=None):
+            self.messages = messages
+            return AIMessage(content="回答")
+
+    memory = filled_memory()
+    memory.summarize_in_background(SummaryLLM()).join(5)
+    with session_scope(SessionState(chat_history=memory)):
+        chat_history = utils.get_chat_history_messages()
+    assert chat_history == memory.to_messages() and len(chat_history) >= 3
+
+    vectorstore = InMemoryVectorStore(StubEmbeddings())
+    vectorstore.add_documents([Document(page_content="有給休暇は入社6か月後に付与されます。")])
+    llm = RecordingLLM()
+    get_async_engine().run(utils.aanswer_with_rag(
+        llm, vectorstore.as_retriever(search_kwargs={"k": 1}), "それは何日？", Deadline(), chat_history
+    ))
+    assert llm.messages[1:-1] == chat_history
+    assert "要約された会話" in llm.messages[1].content
+    assert "それは何日？" in llm.messages[-1].content and "有給休暇" in llm.messages[-1].content
+
+
+if __name__ == "__main__":
+    for test in (test_recent_turns_within_budget, test_summary_replaces_folded_turns,
+                 test_turns_added_while_summarizing_are_kept, test_failed_summary_keeps_history,
+                 test_summary_and_recent_turns_reach_the_answer_prompt):
+        test()
+        print(f"OK: {test.__name__}")
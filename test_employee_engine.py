@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+社員名簿の構造化検索（employee_engine.py）のテストスクリプト
+
+社員名簿から直接回答する質問と、通常のRAG処理に任せる（Noneを返す）質問の判定を確認します。
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date
+sys.path.append('.')
+
+import pandas as pd
+import constants as ct
+import utils
+from employee_engine import EmployeeEngine, get_employee_engine, parse_range_query
+
+
+def write_roster(df):
+    path = os.path.join(tempfile.mkdtemp(), "社員名簿.csv")
+    df.to_csv(path, index=False, encoding="utf-8")
+    return path
+
+
+def headcount(engine, **filters):
+    return sum(stats.count for _, stats in engine.aggregate(filters=filters))
+
+
+def test_range_query_ignores_unrelated_years_and_ages():
+    """社員・入社に関係しない年・年代・「若い」の指定は、範囲検索として扱わないこと"""
+    for query in [
+        "2023年の社員研修について教えて",
+        "2024年度の社員総会の議事録",
+        "20代向けのサービスは？",
+        "若い顧客向けのサービス",
+    ]:
+        assert parse_range_query(query) is None, query
+        assert get_employee_engine().answer_range_query(query) is None, query
+
+
+def test_range_query_hire_date():
+    """入社・採用の年指定を、入社日の範囲として扱うこと"""
+    assert parse_range_query("2020年以降に入社した社員") == {"ranges": {"入社日": (date(2020, 1, 1), None)}}
+    assert parse_range_query("2019年に採用された社員") == {
+        "ranges": {"入社日": (date(2019, 1, 1), date(2019, 12, 31))}
+    }
+
+
+def test_range_query_age():
+    assert parse_range_query("30代の社員") == {"ranges": {"年齢": (30, 39)}}
+    assert parse_range_query("40歳以上の従業員") == {"ranges": {"年齢": (40, None)}}
+
+
+def test_range_query_top_n():
+    """「最も」を含む上位N件の指定（件数の指定がなければ1件）"""
+    spec = parse_range_query("勤続年数が最も長い社員")
+    assert spec == {"order_by": "入社日", "descending": False, "limit": 1, "per_group": None}, spec
+    spec = parse_range_query("各部署で最も勤続年数が長い社員")
+    assert spec["per_group"] == "部署" and spec["limit"] == 1, spec
+    spec = parse_range_query("最近入社した社員を3名")
+    assert spec == {"order_by": "入社日", "descending": True, "limit": 3, "per_group": None}, spec
+    assert get_employee_engine().answer_range_query("勤続年数が最も長い社員") is not None
+
+
+def test_aggregate_query_ignores_non_headcount_ratios():
+    """社員を指す語のない構成・割合の質問は、集計クエリとして扱わないこと"""
+    for query in [
+        "営業部の売上の割合は？",
+        "人事部の評価制度の構成を教えて",
+        "顧客の年齢層の割合は？",
+    ]:
+        assert get_employee_engine().answer_aggregate_query(query) is None, query
+
+
+def test_aggregate_query_headcount_and_distribution():
+    for query in ["営業部の人数は？", "部署ごとに何人いますか", "社員の年齢構成", "従業員の役職の内訳"]:
+        response = get_employee_engine().answer_aggregate_query(query)
+        assert response is not None and "集計結果" in response["answer"], query
+
+
+def test_name_query_ignores_documents_and_customers():
+    """氏名を含んでいても、文書や社外の人物について尋ねる質問は通常のRAG処理に任せること"""
+    for query in [
+        "顧客の田中様について",
+        "山下さんが書いた議事録を要約して",
+        "山下涼平が作成した資料はどこにありますか",
+        "山下涼平の提案した企画の背景を教えて",
+    ]:
+        assert get_employee_engine().answer_name_query(query) is None, query
+
+
+def test_name_query_about_the_person():
+    for query in ["山下さんの連絡先", "山下涼平", "山下涼平について教えて", "林真綾さんの部署は？", "山下 涼平の役職"]:
+        response = get_employee_engine().answer_name_query(query)
+        assert response is not None and "該当する社員" in response["answer"], query
+
+
+def test_invalid_and_duplicate_rows_are_skipped():
+    """年齢・入社日が不正な行と社員IDが重複する行を読み飛ばし、行データ・DataFrame・集計値が一致すること"""
+    roster = pd.read_csv(ct.EMPLOYEE_CSV_PATH, encoding="utf-8").head(5)
+    bad_age = roster.iloc[[0]].assign(社員ID="EMP9001", 年齢=None)
+    bad_date = roster.iloc[[0]].assign(社員ID="EMP9002", 入社日="2020/13/45")
+    duplicate = roster.iloc[[1]].assign(**{ct.EMPLOYEE_NAME_COLUMN: "重複 太郎"})
+    engine = EmployeeEngine(write_roster(pd.concat([roster, bad_age, bad_date, duplicate])))
+    assert engine.refresh()
+
+    assert engine.df["社員ID"].tolist() == roster["社員ID"].tolist()
+    assert headcount(engine) == 5
+    assert engine.rows_by_ids(["EMP9001", "EMP9002"]).empty
+    assert "重複 太郎" not in engine.df[ct.EMPLOYEE_NAME_COLUMN].tolist()
+
+
+def test_failed_refresh_keeps_previous_aggregates():
+    """再読み込みが途中で失敗しても集計値は前回のままで、次の再読み込みで二重に数えないこと"""
+    roster = pd.read_csv(ct.EMPLOYEE_CSV_PATH, encoding="utf-8")
+    path = write_roster(roster.head(5))
+    engine = EmployeeEngine(path)
+    engine.refresh()
+    department = roster["部署"].iloc[5]
+    before = headcount(engine, 部署=department)
+
+    roster.head(6).to_csv(path, index=False, encoding="utf-8")
+    os.utime(path, (0, os.path.getmtime(path) + 10))
+    build_indexes = EmployeeEngine._build_indexes
+
+    def fail(df):
+        raise RuntimeError("インデックスの作成に失敗")
+
+    engine._build_indexes = fail
+    try:
+        engine.refresh()
+        assert False, "再読み込みが失敗しませんでした"
+    except RuntimeError:
+        pass
+    assert headcount(engine) == 5 and headcount(engine, 部署=department) == before and len(engine.df) == 5
+
+    engine._build_indexes = build_indexes
+    assert engine.refresh()
+    assert headcount(engine) == 6 and headcount(engine, 部署=department) == before + 1 and len(engine.df) == 6
+
+
+def test_structured_query_errors_fall_through_to_rag():
+    """社員名簿を読み込めない場合は、例外にせずNone（通常のRAG処理）を返すこと"""
+    original = utils.get_employee_engine
+
+    def broken_engine():
+        raise ValueError("社員名簿を読み込めません")
+
+    utils.get_employee_engine = broken_engine
+    try:
+        assert utils.answer_structured_query("営業部の人数は？") is None
+    finally:
+        utils.get_employee_engine = original
+
+
+if __name__ == "__main__":
+    for test in (test_range_query_ignores_unrelated_years_and_ages, test_range_query_hire_date,
+                 test_range_query_age, test_range_query_top_n,
+                 test_aggregate_query_ignores_non_headcount_ratios, test_aggregate_query_headcount_and_distribution,
+                 test_name_query_ignores_documents_and_customers, test_name_query_about_the_person,
+                 test_invalid_and_duplicate_rows_are_skipped, test_failed_refresh_keeps_previous_aggregates,
+                 test_structured_query_errors_fall_through_to_rag):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+社員名簿のRAG用ドキュメント（社員1名につき1件のレコードと部署の概要）のテストスクリプト
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+import pandas as pd
+from langchain_core.vectorstores import InMemoryVectorStore
+import constants as ct
+import employee_engine
+import initialize_ultra_lite
+from employee_engine import EmployeeEngine, get_employee_engine
+from initialize_ultra_lite import (
+    ReusedEmbeddings, build_retriever, get_current_retriever, get_shared_retriever, set_shared_retriever
+)
+from stub_models import StubEmbeddings
+from utils import build_context_text, create_csv_documents
+
+
+class CountingEmbeddings(StubEmbeddings):
+    """埋め込んだテキストを記録する埋め込みモデル"""
+
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+
+def test_one_record_per_employee():
+    """社員1名につき1件のレコードと、部署ごとの概要を作成すること"""
+    engine = get_employee_engine()
+    roster = pd.read_csv(ct.EMPLOYEE_CSV_PATH, encoding="utf-8")
+    documents = create_csv_documents()
+    records = [doc for doc in documents if doc.metadata["type"] == "employee_data"]
+    summaries = [doc for doc in documents if doc.metadata["type"] == "department_summary"]
+
+    assert len(records) == len(roster)
+    assert sorted(doc.metadata["employee_id"] for doc in records) == sorted(roster["社員ID"])
+    first = next(doc for doc in records if doc.metadata["employee_id"] == roster["社員ID"][0])
+    assert first.metadata["name"] == roster[ct.EMPLOYEE_NAME_COLUMN][0]
+    assert roster[ct.EMPLOYEE_NAME_COLUMN][0] in first.page_content
+
+    assert sorted(doc.metadata["department"] for doc in summaries) == sorted(roster["部署"].unique())
+    assert sum(doc.metadata["employee_count"] for doc in summaries) == len(roster)
+    assert engine.dimension_values("部署") == sorted(roster["部署"].unique())
+
+
+def test_context_contains_only_matching_employees():
+    """回答時の文脈には、検索で見つかった社員だけを1つの表にまとめること"""
+    records = [doc for doc in create_csv_documents() if doc.metadata["type"] == "employee_data"]
+    context = build_context_text(records[:2], "この2人の保有資格は？")
+    assert "該当者2名" in context
+    assert records[0].metadata["name"] in context and records[2].metadata["name"] not in context
+
+
+def test_roster_update_rebuilds_shared_index():
+    """社員名簿のCSVが更新された場合に、変更分のみ埋め込み直して共有のRetrieverを作り直すこと"""
+    roster = pd.read_csv(ct.EMPLOYEE_CSV_PATH, encoding="utf-8")
+    path = os.path.join(tempfile.mkdtemp(), "社員名簿.csv")
+    roster.head(5).to_csv(path, index=False, encoding="utf-8")
+    original_engine = employee_engine._engine
+    employee_engine._engine = EmployeeEngine(path)
+    try:
+        embeddings = CountingEmbeddings()
+        retriever = build_retriever(
+            create_csv_documents(), embeddings=ReusedEmbeddings(embeddings), vectorstore_cls=InMemoryVectorStore
+        )
+        retriever.metadata["roster_version"] = get_employee_engine().version
+        set_shared_retriever(retriever)
+        assert get_shared_retriever() is retriever
+        embeddings.texts.clear()
+
+        roster.head(6).to_csv(path, index=False, encoding="utf-8")
+        os.utime(path, (0, os.path.getmtime(path) + 10))
+        get_shared_retriever()
+        initialize_ultra_lite._roster_rebuild.join(10)
+
+        updated = get_shared_retriever()
+        assert updated is not retriever and get_current_retriever(retriever) is updated
+        ids = [doc["metadata"].get("employee_id") for doc in updated.vectorstore.store.values()]
+        assert roster["社員ID"][5] in ids
+        # 追加した社員と、人数の変わった部署の概要のみを埋め込み直す
+        assert any(roster["社員ID"][5] in text or roster[ct.EMPLOYEE_NAME_COLUMN][5] in text for text in embeddings.texts)
+        assert len(embeddings.texts) <= 3, embeddings.texts
+    finally:
+        employee_engine._engine = original_engine
+        set_shared_retriever(None)
+
+
+if __name__ == "__main__":
+    for test in (test_one_record_per_employee, test_context_contains_only_matching_employees,
+                 test_roster_update_rebuilds_shared_index):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+検索品質の評価（evaluate_retrieval.py）の採点処理のテストスクリプト
+"""
+
+import json
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+from langchain.schema import Document
+import constants as ct
+from evaluate_retrieval import is_relevant, load_labelled_queries, score_ranking
+
+
+def doc(source, page=None):
+    metadata = {"source": source}
+    if page is not None:
+        metadata["page"] = page
+    return Document(page_content="", metadata=metadata)
+
+
+def test_is_relevant_matches_file_name():
+    """出典はフォルダを除いたファイル名で比較し、その他の条件はすべて一致した場合のみ正解とすること"""
+    assert is_relevant(doc("./data/会社について/就業規則.pdf", 2), {"source": "就業規則.pdf"})
+    assert is_relevant(doc("data\\会社について\\就業規則.pdf", 2), {"source": "就業規則.pdf", "page": 2})
+    assert not is_relevant(doc("./data/会社について/就業規則.pdf", 3), {"source": "就業規則.pdf", "page": 2})
+    assert not is_relevant(doc("./data/会社について/福利厚生.pdf"), {"source": "就業規則.pdf"})
+
+
+def test_score_ranking():
+    """再現率は見つかった正解の割合、順位の逆数は最初の正解の順位から計算すること"""
+    labels = [{"source": "a.pdf"}, {"source": "b.pdf"}]
+    docs = [doc("x.pdf"), doc("b.pdf"), doc("b.pdf"), doc("y.pdf")]
+    assert score_ranking(docs, labels) == (0.5, 0.5)
+    assert score_ranking([doc("a.pdf"), doc("b.pdf")], labels) == (1.0, 1.0)
+    assert score_ranking([doc("x.pdf")], labels) == (0.0, 0.0)
+
+
+def test_load_labelled_queries():
+    queries = load_labelled_queries(ct.EVAL_QUERIES_PATH)
+    assert queries and all(query["question"] and query["relevant"] for query in queries)
+
+    path = os.path.join(tempfile.mkdtemp(), "queries.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"question": "有給休暇は？", "relevant": [{"source": "就業規則.pdf"}]}, ensure_ascii=False))
+        f.write("\n\n" + json.dumps({"question": "正解のない質問"}, ensure_ascii=False) + "\n")
+    try:
+        load_labelled_queries(path)
+        assert False, "正解のない行がエラーになりませんでした"
+    except ValueError as e:
+        assert "3行目" in str(e)
+
+
+if __name__ == "__main__":
+    for test in (test_is_relevant_matches_file_name, test_score_ranking, test_load_labelled_queries):
+        test()
+        print(f"OK: {test.__name__}")
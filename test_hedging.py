@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+ヘッジリクエスト（hedging.py）のテストスクリプト
+"""
+
+import asyncio
+import sys
+import threading
+import time
+sys.path.append('.')
+
+import constants as ct
+from langchain_core.messages import AIMessageChunk
+from hedging import HedgeBudget, HedgedLLM, LatencyTracker
+from llm_scheduler import LLMScheduler, ScheduledLLM
+from stub_models import StubChatModel
+
+
+class FailingLLM:
+    """ストリーミングの呼び出しが、最初のトークンを返す前に必ず失敗するLLM"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def stream(self, messages, **kwargs):
+        self.calls += 1
+        raise ConnectionError("接続に失敗しました")
+        yield
+
+    async def astream(self, messages, **kwargs):
+        self.calls += 1
+        raise ConnectionError("接続に失敗しました")
+        yield
+
+
+class SlowPrimaryLLM:
+    """1本目のリクエストだけ最初のトークンが遅いLLM（閉じられたストリームを記録する）"""
+
+    def __init__(self, primary_latency=2.0):
+        self.primary_latency = primary_latency
+        self.calls = 0
+        self.closed = []
+
+    async def astream(self, messages, **kwargs):
+        self.calls += 1
+        name = "primary" if self.calls == 1 else "hedge"
+        try:
+            await asyncio.sleep(self.primary_latency if name == "primary" else 0.01)
+            for token in ["回答", "です"]:
+                yield AIMessageChunk(content=token)
+        finally:
+            self.closed.append((name, time.monotonic()))
+
+
+def trained_tracker(latency=10.0):
+    """ヘッジの待ち時間を決められるだけのTTFTを記録済みのトラッカー（待ち時間が長く、テスト中はヘッジしない）"""
+    tracker = LatencyTracker()
+    for _ in range(ct.HEDGE_MIN_SAMPLES):
+        tracker.record(latency)
+    return tracker
+
+
+def invoke_in_thread(llm, timeout=5.0):
+    """別スレッドでinvokeを呼び出し、戻り値か例外を返す（timeout秒以内に終わらない場合はNone）"""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = llm.invoke("質問")
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return None if thread.is_alive() else outcome
+
+
+def test_primary_failure_before_hedge_raises():
+    """ヘッジの前に1本目が失敗した場合に、待ち続けずにエラーを返すこと"""
+    llm = HedgedLLM(FailingLLM(), tracker=trained_tracker(), budget=HedgeBudget(), enabled=True)
+    outcome = invoke_in_thread(llm)
+    assert outcome is not None, "1本目の失敗後もinvokeが終了しない"
+    assert isinstance(outcome.get("error"), ConnectionError), outcome
+
+
+def test_primary_failure_without_samples_raises():
+    """TTFTの記録がない（ヘッジしない）状態で失敗した場合も、エラーを返すこと"""
+    llm = HedgedLLM(FailingLLM(), tracker=LatencyTracker(), budget=HedgeBudget(), enabled=True)
+    outcome = invoke_in_thread(llm)
+    assert outcome is not None and isinstance(outcome.get("error"), ConnectionError), outcome
+
+
+def test_hedged_answer_is_returned():
+    """1本目が遅い場合にヘッジして、いずれかの回答を返すこと"""
+    tracker = trained_tracker(latency=0.01)
+    llm = HedgedLLM(StubChatModel(latency=0.5), tracker=tracker, budget=HedgeBudget(), enabled=True)
+    outcome = invoke_in_thread(llm)
+    assert outcome is not None and outcome.get("result") is not None, outcome
+    assert outcome["result"].content
+
+
+def test_first_token_callback():
+    """採用したリクエストの最初のトークンが届いた時点で1回だけ通知すること（ヘッジを無効にしている場合も）"""
+    for enabled in (True, False):
+        llm = HedgedLLM(StubChatModel(latency=0.1), tracker=LatencyTracker(), budget=HedgeBudget(), enabled=enabled)
+        notified = []
+        started_at = time.monotonic()
+        result = llm.invoke("質問", on_first_token=lambda: notified.append(time.monotonic() - started_at))
+        assert result.content and len(notified) == 1 and notified[0] >= 0.1, (enabled, notified)
+
+        notified.clear()
+        started_at = time.monotonic()
+        result = asyncio.run(llm.ainvoke("質問", on_first_token=lambda: notified.append(time.monotonic() - started_at)))
+        assert result.content and len(notified) == 1 and notified[0] >= 0.1, (enabled, notified)
+
+
+def test_losing_stream_is_closed_when_winner_is_chosen():
+    """同期のinvokeでも、ヘッジ側が先に応答した時点で1本目のストリームを閉じること（次のトークンを待たない）"""
+    model = SlowPrimaryLLM(primary_latency=2.0)
+    llm = HedgedLLM(model, tracker=trained_tracker(latency=0.05), budget=HedgeBudget(), enabled=True)
+    started_at = time.monotonic()
+    result = llm.invoke("質問")
+    assert result.content == "回答です" and model.calls == 2
+    time.sleep(0.1)
+    closed = dict(model.closed)
+    assert "primary" in closed and closed["primary"] - started_at < 1.0, model.closed
+
+
+def test_losing_primary_latency_is_recorded():
+    """採用されなかった1本目の待ち時間も、TTFTとして記録すること（採用された側だけを記録しない）"""
+    tracker = trained_tracker(latency=0.05)
+    llm = HedgedLLM(SlowPrimaryLLM(primary_latency=2.0), tracker=tracker, budget=HedgeBudget(), enabled=True)
+    recorded = []
+    record = tracker.record
+    tracker.record = lambda latency: (recorded.append(latency), record(latency))
+    llm.invoke("質問")
+    # ヘッジ側のTTFTと、打ち切った時点までの1本目の待ち時間
+    assert len(recorded) == 2 and max(recorded) >= ct.HEDGE_MIN_DELAY_SECONDS > min(recorded), recorded
+
+
+def test_hedge_uses_scheduler_slot():
+    """ヘッジ側もスケジューラの実行枠を使い、空きがなければヘッジしないこと"""
+    scheduler = LLMScheduler(max_concurrency=1)
+    model = SlowPrimaryLLM(primary_latency=0.5)
+    llm = ScheduledLLM(HedgedLLM(model, tracker=trained_tracker(latency=0.05), budget=HedgeBudget(), enabled=True,
+                                 scheduler=scheduler), "a", scheduler=scheduler)
+    assert asyncio.run(llm.ainvoke("質問")).content == "回答です"
+    assert model.calls == 1 and scheduler.stats()["in_flight"] == 0
+
+    scheduler = LLMScheduler(max_concurrency=2)
+    model = SlowPrimaryLLM(primary_latency=0.5)
+    llm = ScheduledLLM(HedgedLLM(model, tracker=trained_tracker(latency=0.05), budget=HedgeBudget(), enabled=True,
+                                 scheduler=scheduler), "a", scheduler=scheduler)
+    assert asyncio.run(llm.ainvoke("質問")).content == "回答です"
+    assert model.calls == 2 and scheduler.stats()["in_flight"] == 0
+
+
+if __name__ == "__main__":
+    for test in (test_primary_failure_before_hedge_raises, test_primary_failure_without_samples_raises,
+                 test_hedged_answer_is_returned, test_first_token_callback,
+                 test_losing_stream_is_closed_when_winner_is_chosen, test_losing_primary_latency_is_recorded,
+                 test_hedge_uses_scheduler_slot):
+        test()
+        print(f"OK: {test.__name__}")
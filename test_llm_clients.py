@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+LLM・埋め込みモデルのクライアントの共有（llm_clients.py）のテストスクリプト
+"""
+
+import os
+import sys
+sys.path.append('.')
+
+# APIは呼び出さないが、クライアントの作成にはAPIキーの設定が必要
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import constants as ct
+import llm_clients
+from llm_clients import close_clients, get_embeddings, get_http_client, get_llm, get_question_answer_chain
+
+
+def test_clients_are_shared():
+    """LLM・埋め込みモデル・Chainは同じ設定であれば使い回し、同じHTTPクライアント（接続プール）を使うこと"""
+    close_clients()
+    llm = get_llm()
+    assert get_llm() is llm
+    assert get_embeddings() is get_embeddings()
+    assert llm.http_client is get_http_client() is get_embeddings().http_client
+    assert get_question_answer_chain(ct.ANSWER_MODE_1) is get_question_answer_chain(ct.ANSWER_MODE_1)
+    assert get_question_answer_chain(ct.ANSWER_MODE_1) is not get_question_answer_chain(ct.ANSWER_MODE_2)
+
+
+def test_close_clients_recreates():
+    """close_clientsの後は、接続を閉じたクライアントを使わずに作り直すこと"""
+    llm = get_llm()
+    client = get_http_client()
+    close_clients()
+    assert client.is_closed and llm_clients._http_client is None
+    assert get_llm() is not llm
+    assert get_http_client() is not client and not get_http_client().is_closed
+    close_clients()
+
+
+if __name__ == "__main__":
+    for test in (test_clients_are_shared, test_close_clients_recreates):
+        test()
+        print(f"OK: {test.__name__}")
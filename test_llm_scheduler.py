@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+LLM呼び出しのスケジューラ（llm_scheduler.py）のテストスクリプト
+"""
+
+import asyncio
+import sys
+import threading
+import time
+sys.path.append('.')
+
+from llm_scheduler import PRIORITY_HIGH, PRIORITY_NORMAL, LLMScheduler
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "条件を満たさないまま時間切れになりました"
+        time.sleep(0.005)
+
+
+def run_queued(scheduler, requests):
+    """
+    実行枠を1つ使ったまま、requests（(セッションID, 優先度)のリスト）の順に順番待ちさせ、実行された順を返す
+    """
+    order = []
+    release = threading.Event()
+    holder = threading.Thread(target=scheduler.run, args=("holder", release.wait))
+    holder.start()
+    wait_until(lambda: scheduler.stats()["in_flight"] == 1)
+
+    threads = []
+    for i, (session_id, priority) in enumerate(requests):
+        thread = threading.Thread(
+            target=scheduler.run, args=(session_id, order.append, (session_id, i)), kwargs={"priority": priority}
+        )
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: scheduler.queue_depth() == i + 1)
+
+    release.set()
+    for thread in [holder] + threads:
+        thread.join(5)
+    return order
+
+
+def test_round_robin_between_sessions():
+    """同じ優先度では、先に多く依頼したセッションが続けて実行枠を使わないこと"""
+    order = run_queued(LLMScheduler(max_concurrency=1), [
+        ("a", PRIORITY_NORMAL), ("a", PRIORITY_NORMAL), ("a", PRIORITY_NORMAL), ("b", PRIORITY_NORMAL),
+    ])
+    assert order == [("a", 0), ("b", 3), ("a", 1), ("a", 2)], order
+
+
+def test_high_priority_first():
+    order = run_queued(LLMScheduler(max_concurrency=1), [("a", PRIORITY_NORMAL), ("b", PRIORITY_HIGH)])
+    assert order == [("b", 1), ("a", 0)], order
+
+
+def test_concurrency_cap():
+    """同時に実行する数が上限を超えないこと（同期・非同期の呼び出しで実行枠を共有）"""
+    scheduler = LLMScheduler(max_concurrency=2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    async def awork():
+        work()
+
+    def run_async():
+        asyncio.run(scheduler.run_async("async", awork))
+
+    threads = [threading.Thread(target=scheduler.run, args=(f"s{i}", work)) for i in range(6)]
+    threads += [threading.Thread(target=run_async) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert max(peak) <= 2 and len(peak) == 9, peak
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0 and stats["total_requests"] == 9, stats
+
+
+def test_failed_call_releases_slot():
+    scheduler = LLMScheduler(max_concurrency=1)
+
+    def fail():
+        raise ValueError("失敗")
+
+    try:
+        scheduler.run("a", fail)
+    except ValueError:
+        pass
+    assert scheduler.run("b", lambda: "ok") == "ok"
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_positions_follow_queue_changes():
+    """待ち順位を列の変化に合わせて返し、取り消した整理券は0になること"""
+    scheduler = LLMScheduler(max_concurrency=1)
+    holder = scheduler._enqueue("holder", PRIORITY_NORMAL)
+    first = scheduler._enqueue("a", PRIORITY_NORMAL)
+    second = scheduler._enqueue("b", PRIORITY_NORMAL)
+    assert (scheduler.position(holder), scheduler.position(first), scheduler.position(second)) == (0, 1, 2)
+    urgent = scheduler._enqueue("c", PRIORITY_HIGH)
+    assert (scheduler.position(urgent), scheduler.position(first), scheduler.position(second)) == (1, 2, 3)
+    scheduler._cancel(urgent)
+    assert (scheduler.position(urgent), scheduler.position(first)) == (0, 1)
+    scheduler.release()
+    assert (scheduler.position(first), scheduler.position(second)) == (0, 1)
+
+
+def test_try_acquire_does_not_overtake_queue():
+    """順番待ちをしない実行枠の確保は、空きがあり待っているリクエストがない場合のみ成功すること"""
+    scheduler = LLMScheduler(max_concurrency=2)
+    assert scheduler.try_acquire()
+    holder = scheduler._enqueue("a", PRIORITY_NORMAL)
+    assert holder.granted.is_set() and not scheduler.try_acquire()
+    waiting = scheduler._enqueue("b", PRIORITY_NORMAL)
+    scheduler.release()
+    # 空いた枠は、順番待ちのリクエストに割り当てる
+    assert waiting.granted.is_set() and not scheduler.try_acquire()
+    scheduler.release()
+    scheduler.release()
+    assert scheduler.try_acquire() and scheduler.stats()["in_flight"] == 1
+
+
+if __name__ == "__main__":
+    for test in (test_round_robin_between_sessions, test_high_priority_first, test_concurrency_cap,
+                 test_failed_call_releases_slot, test_positions_follow_queue_changes,
+                 test_try_acquire_does_not_overtake_queue):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+負荷試験ツール（load_test.py）の飽和点の判定のテストスクリプト
+"""
+
+import sys
+sys.path.append('.')
+
+from load_test import FOLLOW_UP_QUERIES, build_queries, find_saturation
+
+
+def level(sessions, throughput, p95):
+    return {"sessions": sessions, "throughput_per_second": throughput, "latency_p95_seconds": p95}
+
+
+def test_saturation_when_throughput_stops_growing():
+    """スループットの伸びが指定の割合に満たなくなった同時セッション数を飽和点とすること"""
+    levels = [level(1, 1.0, 0.5), level(5, 4.0, 0.6), level(10, 4.2, 0.9), level(20, 4.3, 1.5)]
+    assert find_saturation(levels, gain=0.1, slo=10) == 10
+
+
+def test_saturation_when_latency_exceeds_slo():
+    levels = [level(1, 1.0, 0.5), level(5, 4.0, 3.0), level(10, 8.0, 12.0)]
+    assert find_saturation(levels, gain=0.1, slo=10) == 10
+    assert find_saturation(levels, gain=0.1, slo=2) == 5
+
+
+def test_no_saturation_within_levels():
+    levels = [level(1, 1.0, 0.5), level(5, 4.0, 0.6), level(10, 7.5, None)]
+    assert find_saturation(levels, gain=0.1, slo=10) is None
+
+
+def test_build_queries_interleaves_follow_ups():
+    """ベンチマークの質問の後に、会話の続きの質問を挟むこと"""
+    queries = build_queries()
+    assert queries and len(queries) % 2 == 0
+    assert all(query in FOLLOW_UP_QUERIES for query in queries[1::2])
+    assert not any(query in FOLLOW_UP_QUERIES for query in queries[0::2])
+
+
+if __name__ == "__main__":
+    for test in (test_saturation_when_throughput_stops_growing, test_saturation_when_latency_exceeds_slo,
+                 test_no_saturation_within_levels, test_build_queries_interleaves_follow_ups):
+        test()
+        print(f"OK: {test.__name__}")
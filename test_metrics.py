@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+メトリクスの集計（metrics.py）のヒストグラムとPrometheus形式の出力のテストスクリプト
+"""
+
+import random
+import sys
+sys.path.append('.')
+
+import numpy as np
+from metrics import HdrHistogram, MetricsRegistry, collect_caches, percentile, render_prometheus, subtract_counts
+
+
+def test_hdr_histogram_percentile_accuracy():
+    """どの桁の値も、パーセンタイルの相対誤差が有効桁数で決まる精度に収まること"""
+    rng = random.Random(0)
+    values = [rng.lognormvariate(0, 2) for _ in range(5000)]
+    histogram = HdrHistogram(significant_digits=3)
+    for value in values:
+        histogram.record(value)
+    assert histogram.count == len(values) and histogram.max == max(values) and histogram.min == min(values)
+    for q in (50, 90, 99):
+        expected = float(np.percentile(values, q, method="inverted_cdf"))
+        actual = percentile(histogram.snapshot(), q)
+        assert abs(actual - expected) / expected <= 0.01, (q, actual, expected)
+    # バケットは値が入ったものだけを持つ
+    assert len(histogram.counts) < len(values)
+
+
+def test_percentile_of_recent_window():
+    """2時点のバケットの差から、直近の期間のみのパーセンタイルを計算できること"""
+    histogram = HdrHistogram()
+    for _ in range(100):
+        histogram.record(0.01)
+    previous = histogram.snapshot()
+    for _ in range(10):
+        histogram.record(2.0)
+    recent = subtract_counts(histogram.snapshot(), previous)
+    assert sum(recent.values()) == 10
+    assert abs(percentile(recent, 50) - 2.0) / 2.0 <= 0.01
+    assert percentile({}, 50) is None
+    assert percentile(histogram.snapshot(), 0) == HdrHistogram.bucket_value(histogram.bucket(0.01))
+
+
+def test_render_prometheus():
+    registry = MetricsRegistry()
+    registry.counter("rag_answers_total", "回答した件数").inc(path="rag")
+    registry.counter("rag_answers_total").inc(2, path="rag")
+    registry.gauge("rag_llm_queue_depth", "順番待ちの件数").set(3)
+    stage = registry.histogram("rag_stage_duration_seconds", "所要時間")
+    for value in (0.1, 0.2, 0.3, 0.4):
+        stage.observe(value, stage='vector"search')
+    registry.register_collector(lambda r: r.gauge("rag_index_documents", "件数").set(42))
+
+    lines = render_prometheus(registry).splitlines()
+    assert "# TYPE rag_answers_total counter" in lines
+    assert 'rag_answers_total{path="rag"} 3' in lines
+    assert "# TYPE rag_llm_queue_depth gauge" in lines and "rag_llm_queue_depth 3" in lines
+    assert "rag_index_documents 42" in lines
+    assert "# TYPE rag_stage_duration_seconds summary" in lines
+    assert 'rag_stage_duration_seconds{stage="vector\\"search",quantile="0.5"} 0.2005' in lines, lines
+    assert 'rag_stage_duration_seconds_count{stage="vector\\"search"} 4' in lines
+    assert any(line.startswith('rag_stage_duration_seconds_sum{stage="vector\\"search"} 1.0') for line in lines)
+
+
+def test_registry_rejects_kind_mismatch():
+    registry = MetricsRegistry()
+    assert registry.counter("rag_answers_total") is registry.counter("rag_answers_total")
+    try:
+        registry.gauge("rag_answers_total")
+        assert False, "種類の異なるメトリクスを作成できてしまいました"
+    except ValueError:
+        pass
+
+
+def test_embedding_cache_requests_are_counters():
+    """埋め込みベクトルのキャッシュの参照件数（累計）を、rate()で扱えるcounterとして出力すること"""
+    from query_rewrite import embedding_cache_stats
+
+    registry = MetricsRegistry()
+    collect_caches(registry)
+    stats = embedding_cache_stats()
+    lines = render_prometheus(registry).splitlines()
+    assert "# TYPE rag_embedding_cache_requests_total counter" in lines, lines
+    assert f'rag_embedding_cache_requests_total{{result="hit"}} {stats["hits"]}' in lines, lines
+    assert f'rag_embedding_cache_requests_total{{result="miss"}} {stats["misses"]}' in lines, lines
+
+
+if __name__ == "__main__":
+    for test in (test_hdr_histogram_percentile_accuracy, test_percentile_of_recent_window, test_render_prometheus,
+                 test_registry_rejects_kind_mismatch, test_embedding_cache_requests_are_counters):
+        test()
+        print(f"OK: {test.__name__}")
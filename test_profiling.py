@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+回答生成のプロファイラー（profiling.py）のテストスクリプト
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+sys.path.append('.')
+
+import constants as ct
+from profiling import StackSampler, get_request_profiler, profile_next_request
+
+
+def run_profiles_in_threads(mode, count=2):
+    """
+    count件の質問を同時にプロファイルし、先に始まった質問から順に終了させる
+
+    Returns:
+        質問ごとの profile_next_request の戻り値か、発生した例外のリスト
+    """
+    ct.PROFILE_DIR_PATH = tempfile.mkdtemp()
+    get_request_profiler().arm(count, mode)
+    entered = threading.Barrier(count)
+    turns = [threading.Event() for _ in range(count)]
+    outcomes = [None] * count
+
+    def run(i):
+        try:
+            with profile_next_request() as result:
+                entered.wait(5)
+                turns[i].wait(5)
+                data = [bytearray(1024) for _ in range(100)]
+                del data
+            outcomes[i] = result
+        except Exception as e:
+            outcomes[i] = e
+        if i + 1 < count:
+            turns[i + 1].set()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    turns[0].set()
+    for thread in threads:
+        thread.join(10)
+    return outcomes
+
+
+def test_concurrent_tracemalloc_profiles():
+    """同時に処理中の2件をtracemallocでプロファイルしても、後に終わる質問が失敗しないこと"""
+    assert not tracemalloc.is_tracing()
+    outcomes = run_profiles_in_threads("tracemalloc")
+    for outcome in outcomes:
+        assert isinstance(outcome, dict), outcome
+        assert any(path.endswith(".tracemalloc") for path in outcome["paths"]), outcome
+    # 最後のプロファイルの終了時に計測を終了する
+    assert not tracemalloc.is_tracing()
+
+
+def test_concurrent_cprofile_profiles():
+    """cProfileを同時に使えない場合も、回答生成は失敗しないこと"""
+    outcomes = run_profiles_in_threads("cprofile")
+    for outcome in outcomes:
+        assert isinstance(outcome, dict), outcome
+
+
+def test_profile_count():
+    """指定の件数だけプロファイルし、その後はNoneを返すこと"""
+    ct.PROFILE_DIR_PATH = tempfile.mkdtemp()
+    get_request_profiler().arm(1, "sampler")
+    with profile_next_request() as result:
+        time.sleep(0.05)
+    assert result["mode"] == "sampler" and os.path.exists(result["paths"][0]), result
+    with profile_next_request() as result:
+        pass
+    assert result is None
+
+
+def test_stack_sampler_records_other_threads():
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait, name="waiting-thread")
+    thread.start()
+    sampler = StackSampler(interval=0.005).start()
+    time.sleep(0.05)
+    sampler.stop()
+    stop.set()
+    thread.join()
+    assert sampler.sample_count > 0
+    assert any(stack.startswith("waiting-thread;") for stack in sampler.samples), sampler.folded()
+
+
+if __name__ == "__main__":
+    for test in (test_concurrent_tracemalloc_profiles, test_concurrent_cprofile_profiles,
+                 test_profile_count, test_stack_sampler_records_other_threads):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+質問の書き換えの判定（query_rewrite.py）のテストスクリプト
+"""
+
+import sys
+import threading
+sys.path.append('.')
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+import constants as ct
+import query_rewrite
+from query_rewrite import has_reference_marker, needs_rewrite, retrieve_with_rewrite
+
+
+class FakeMemory:
+    def __init__(self, previous_query):
+        self.previous_query = previous_query
+        self.summary = ""
+
+    def last_user_text(self):
+        return self.previous_query
+
+
+class RecordingRetriever:
+    """検索した質問を記録するRetriever"""
+
+    def __init__(self):
+        self.queries = []
+
+    def invoke(self, query):
+        self.queries.append(query)
+        return [f"doc:{query}"]
+
+
+def test_reference_markers_match_whole_words():
+    """指示語を含む語（「それぞれ」「そのまま」など）を、指示語とみなさないこと"""
+    for query in ["それはどういう意味？", "その件について詳しく", "彼の部署は", "じゃあ営業部は？"]:
+        assert has_reference_marker(query), query
+    for query in ["それぞれの部署の人数は？", "そのまま使えますか", "問題があれば連絡して", "有給休暇の申請方法を教えて"]:
+        assert not has_reference_marker(query), query
+
+
+def test_needs_rewrite():
+    assert not needs_rewrite("それは何ですか", FakeMemory(""))
+    assert needs_rewrite("それは何ですか", FakeMemory("有給休暇について"))
+    assert not needs_rewrite("それぞれの部署の有給休暇の取得率を教えて", FakeMemory("有給休暇について"))
+
+
+def run_rewrite(rewritten):
+    prompt = ChatPromptTemplate.from_messages([("human", "{input}")])
+    retriever = RecordingRetriever()
+    docs, query = retrieve_with_rewrite(
+        RunnableLambda(lambda _: rewritten), retriever, prompt, "それは何？",
+        [("human", "有給休暇について")], FakeMemory("有給休暇について")
+    )
+    return docs, query, retriever.queries
+
+
+def test_speculative_result_is_used_when_rewrite_is_identical():
+    docs, query, queries = run_rewrite("それは何？")
+    assert query == "それは何？" and docs == ["doc:それは何？"]
+    assert queries == ["それは何？"]
+
+
+def test_rewritten_query_is_searched():
+    docs, query, queries = run_rewrite("有給休暇とは何？")
+    assert query == "有給休暇とは何？" and docs == ["doc:有給休暇とは何？"]
+
+
+def test_queued_speculative_search_is_cancelled():
+    """書き換え結果が異なる場合は、順番待ちの先行検索を取り消し、スレッドプールの空きを待たずに検索すること"""
+    release = threading.Event()
+    blockers = [query_rewrite._executor.submit(release.wait, 5) for _ in range(ct.REWRITE_SPECULATIVE_WORKERS)]
+    try:
+        docs, query, queries = run_rewrite("有給休暇とは何？")
+        assert docs == ["doc:有給休暇とは何？"]
+    finally:
+        release.set()
+        for blocker in blockers:
+            blocker.result(5)
+    query_rewrite._executor.submit(lambda: None).result(5)
+    assert queries == ["有給休暇とは何？"], queries
+
+
+if __name__ == "__main__":
+    for test in (test_reference_markers_match_whole_words, test_needs_rewrite,
+                 test_speculative_result_is_used_when_rewrite_is_identical, test_rewritten_query_is_searched,
+                 test_queued_speculative_search_is_cancelled):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+ログの再生ツール（replay_log.py）の質問の取り出しと再生時刻の計算のテストスクリプト
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append('.')
+
+import constants as ct
+from replay_log import load_queries, schedule_offsets, simulate_answer_cache
+
+
+def write_log(lines):
+    folder = tempfile.mkdtemp()
+    with open(os.path.join(folder, ct.LOG_FILE), "w", encoding="utf8") as f:
+        f.write("\n".join(lines) + "\n")
+    return folder
+
+
+def json_line(time_, session_id, message, level="INFO"):
+    return json.dumps({"level": level, "time": time_, "session_id": session_id, "message": message},
+                      ensure_ascii=False)
+
+
+def test_load_queries_from_mixed_log():
+    """テキスト形式とJSON形式の行が混在したログから、セッションごとに質問の記録のみを取り出すこと"""
+    question = {"message": "有給休暇は何日？", "application_mode": ct.ANSWER_MODE_2}
+    answer = {"message": "回答\n2行目", "application_mode": ct.ANSWER_MODE_2}
+    folder = write_log([
+        f"[INFO] 2026-10-18 09:00:00,000 session_id=a: {question}",
+        f"[INFO] 2026-10-18 09:00:01,000 session_id=b: {{'message': '福利厚生は？', 'application_mode': '{ct.ANSWER_MODE_1}'}}",
+        "[WARNING] 2026-10-18 09:00:02,000 session_id=a: 複数行の",
+        "警告メッセージの続き",
+        f"[INFO] 2026-10-18 09:00:03,000 session_id=a: {answer}",
+        json_line("2026-10-18T09:00:05", "b", "回答の取得に失敗しました", level="ERROR"),
+        json_line("2026-10-18T09:00:06", "b", {"message": "もう一度", "application_mode": ct.ANSWER_MODE_1}),
+        json_line("2026-10-18T09:00:07", "a", {"message": "それは？", "application_mode": ct.ANSWER_MODE_2}),
+        json_line("2026-10-18T09:00:08", "a", "質問以外のログ"),
+    ])
+    queries = load_queries([folder])
+    assert [(query["session_id"], query["message"]) for query in queries] == [
+        ("a", "有給休暇は何日？"), ("b", "福利厚生は？"), ("b", "もう一度"), ("a", "それは？"),
+    ], queries
+    assert [query["message"] for query in load_queries([folder], modes=[ct.ANSWER_MODE_1])] == ["福利厚生は？", "もう一度"]
+    assert len(load_queries([folder], limit=1)) == 1
+
+
+def test_schedule_offsets():
+    """長い空白を上限の秒数に詰め、指定の倍速で再生すること"""
+    start = datetime(2026, 10, 18, 9)
+    queries = [{"time": start + timedelta(seconds=seconds)} for seconds in (0, 10, 10000, 10004)]
+    assert schedule_offsets(queries, speed=2, max_idle=60) == [0.0, 5.0, 35.0, 37.0]
+    assert schedule_offsets(queries, speed=0) == [0.0] * 4
+
+
+def test_simulate_answer_cache():
+    queries = [{"mode": ct.ANSWER_MODE_2, "message": message} for message in ("A", "B", "A", "C", "A")]
+    rates = simulate_answer_cache(queries, sizes=(1, 3))
+    assert rates == {1: 0.0, 3: 0.4}, rates
+
+
+if __name__ == "__main__":
+    for test in (test_load_queries_from_mixed_log, test_schedule_offsets, test_simulate_answer_cache):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+回答生成の制限時間（request_deadline.py）のテストスクリプト
+"""
+
+import asyncio
+import sys
+import threading
+import time
+sys.path.append('.')
+
+import request_deadline
+from request_deadline import Deadline, StageTimeout
+
+
+def test_stage_budget_is_capped_by_remaining_time():
+    deadline = Deadline(total_seconds=1.0, stage_budgets={"search": 5.0, "pack": 0.1})
+    assert deadline.budget("search") <= 1.0
+    assert deadline.budget("pack") == 0.1
+    # 配分のない段階は、全体の残り時間
+    assert 0.9 < deadline.budget("other") <= 1.0
+
+
+def test_run_returns_result_and_records_timing():
+    deadline = Deadline(total_seconds=1.0, stage_budgets={"search": 0.5})
+    assert deadline.run("search", lambda x: x * 2, 21) == 42
+    assert "search" in deadline.timings and not deadline.overruns
+
+
+def test_run_raises_stage_timeout():
+    """配分を超えた段階は、終了を待たずにStageTimeoutになること"""
+    deadline = Deadline(total_seconds=5.0, stage_budgets={"search": 0.05})
+    started_at = time.monotonic()
+    try:
+        deadline.run("search", time.sleep, 1.0)
+        assert False, "StageTimeoutになりませんでした"
+    except StageTimeout as e:
+        assert e.stage == "search"
+    assert time.monotonic() - started_at < 0.5
+    assert deadline.overruns == ["search"]
+
+
+def test_abandoned_stage_threads_are_capped():
+    """時間切れ後も実行中のスレッドが上限に達している場合は、新しい処理段階を始めずにStageTimeoutになること"""
+    original = request_deadline._stage_slots
+    request_deadline._stage_slots = threading.BoundedSemaphore(1)
+    try:
+        release = threading.Event()
+        deadline = Deadline(total_seconds=5.0, stage_budgets={"search": 0.05})
+        try:
+            deadline.run("search", release.wait, 5)
+            assert False, "StageTimeoutになりませんでした"
+        except StageTimeout:
+            pass
+
+        calls = []
+        try:
+            deadline.run("search", calls.append, "実行されない")
+            assert False, "StageTimeoutになりませんでした"
+        except StageTimeout:
+            pass
+        assert calls == []
+
+        # 時間切れになった処理が終わると、次の処理段階を実行できる
+        release.set()
+        time.sleep(0.05)
+        assert deadline.run("search", lambda: "ok") == "ok"
+    finally:
+        request_deadline._stage_slots = original
+
+
+def test_run_propagates_errors():
+    deadline = Deadline(total_seconds=1.0)
+
+    def fail():
+        raise ValueError("失敗")
+
+    try:
+        deadline.run("search", fail)
+        assert False, "例外が伝わりませんでした"
+    except ValueError:
+        pass
+
+
+def test_run_async_timeout_and_expired_deadline():
+    """非同期版も時間切れでStageTimeoutになり、全体の制限時間を過ぎた段階はすぐにStageTimeoutになること"""
+    deadline = Deadline(total_seconds=5.0, stage_budgets={"embed": 0.05})
+
+    async def main():
+        assert await deadline.run_async("other", asyncio.sleep(0, result="ok")) == "ok"
+        try:
+            await deadline.run_async("embed", asyncio.sleep(1.0))
+            assert False, "StageTimeoutになりませんでした"
+        except StageTimeout:
+            pass
+
+    asyncio.run(main())
+    expired = Deadline(total_seconds=0.0)
+    try:
+        expired.run("search", lambda: "実行されない")
+        assert False, "StageTimeoutになりませんでした"
+    except StageTimeout:
+        pass
+    assert deadline.overruns == ["embed"] and expired.overruns == ["search"]
+
+
+if __name__ == "__main__":
+    for test in (test_stage_budget_is_capped_by_remaining_time, test_run_returns_result_and_records_timing,
+                 test_run_raises_stage_timeout, test_abandoned_stage_threads_are_capped, test_run_propagates_errors,
+                 test_run_async_timeout_and_expired_deadline):
+        test()
+        print(f"OK: {test.__name__}")
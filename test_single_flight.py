@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+同じ内容の処理の共有（single_flight.py）のテストスクリプト
+"""
+
+import sys
+import threading
+import time
+sys.path.append('.')
+
+from single_flight import SingleFlight
+
+
+def run_concurrently(group, key, fn, count):
+    """同じキーの処理をcount件同時に呼び出し、戻り値か例外のリストを返す"""
+    outcomes = [None] * count
+
+    def run(i):
+        try:
+            outcomes[i] = group.do(key, fn)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_concurrent_calls_share_one_execution():
+    """同時に実行された同じキーの処理は1回だけ実行し、結果を共有すること"""
+    group = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "回答"
+
+    outcomes = run_concurrently(group, "質問", slow, 5)
+    assert len(calls) == 1
+    assert all(result == "回答" for result, _ in outcomes), outcomes
+    assert sorted(shared for _, shared in outcomes) == [False, True, True, True, True]
+    assert group.stats() == {"in_flight": 0, "executed": 1, "shared": 4}
+
+
+def test_error_is_shared_and_key_released():
+    """実行中の処理の例外は待っていた呼び出しにも伝わり、終了後は同じキーで再実行できること"""
+    group = SingleFlight()
+
+    def fail():
+        time.sleep(0.1)
+        raise ValueError("失敗")
+
+    outcomes = run_concurrently(group, "質問", fail, 3)
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes), outcomes
+    assert group.do("質問", lambda: "再実行") == ("再実行", False)
+
+
+def test_control_flow_exception_is_not_shared():
+    """実行した呼び出しが制御用の例外で中断された場合、待っていた呼び出しのうち1つが改めて実行すること"""
+    group = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def answer():
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+            # Streamlitの画面の再実行（RerunException）などと同じく、Exceptionを継承しない例外
+            raise KeyboardInterrupt()
+        time.sleep(0.1)
+        return "回答"
+
+    leader_outcome = []
+
+    def lead():
+        try:
+            group.do("質問", answer)
+        except KeyboardInterrupt as e:
+            leader_outcome.append(e)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait(5)
+    follower_outcomes = []
+    followers = threading.Thread(target=lambda: follower_outcomes.extend(run_concurrently(group, "質問", answer, 3)))
+    followers.start()
+    while group.stats()["in_flight"] != 1 or len(calls) != 1:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    release.set()
+    leader.join(5)
+    followers.join(5)
+
+    assert len(leader_outcome) == 1 and len(calls) == 2
+    assert all(result == "回答" for result, _ in follower_outcomes), follower_outcomes
+    assert sorted(shared for _, shared in follower_outcomes) == [False, True, True]
+    assert group.stats()["in_flight"] == 0
+
+
+def test_follower_runs_itself_after_timeout():
+    """結果を待つ時間が上限を超えた場合は自分で実行し、待っている間は実行中の処理の進み具合を受け取ること"""
+    group = SingleFlight()
+    release = threading.Event()
+
+    def slow():
+        group.publish("質問", 3)
+        release.wait(5)
+        return "先行する処理の回答"
+
+    leader = threading.Thread(target=group.do, args=("質問", slow))
+    leader.start()
+    while group.stats()["in_flight"] != 1:
+        time.sleep(0.01)
+    # 実行していない呼び出しからの進み具合は反映しない
+    group.publish("質問", 1)
+    progress = []
+    started_at = time.monotonic()
+    result = group.do("質問", lambda: "自分で生成した回答", timeout=0.5, on_poll=progress.append)
+    assert result == ("自分で生成した回答", False)
+    assert 0.5 <= time.monotonic() - started_at < 1.0
+    assert progress and set(progress) == {3}, progress
+    release.set()
+    leader.join(5)
+    assert group.stats() == {"in_flight": 0, "executed": 2, "shared": 0}
+
+
+def test_different_keys_run_separately():
+    group = SingleFlight()
+    assert group.do("a", lambda: 1) == (1, False)
+    assert group.do("b", lambda: 2) == (2, False)
+    assert group.stats()["executed"] == 2
+
+
+if __name__ == "__main__":
+    for test in (test_concurrent_calls_share_one_execution, test_error_is_shared_and_key_released,
+                 test_control_flow_exception_is_not_shared, test_follower_runs_itself_after_timeout,
+                 test_different_keys_run_separately):
+        test()
+        print(f"OK: {test.__name__}")
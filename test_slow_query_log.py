@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+遅い質問のログ（slow_query_log.py）のテストスクリプト
+"""
+
+import os
+import sys
+import time
+sys.path.append('.')
+
+import constants as ct
+import slow_query_log
+from slow_query_log import SlowQueryWatchdog
+
+
+def test_finish_stops_started_sampler():
+    """記録の開始直後に回答生成が終了しても、プロファイラーのスレッドが残らないこと"""
+    os.environ[ct.SLOW_QUERY_THRESHOLD_ENV] = "3600"
+    slow_query_log._watchdog = SlowQueryWatchdog(interval=0.001, profile_seconds=0)
+    try:
+        for _ in range(50):
+            watch = slow_query_log.watch_request("質問")
+            time.sleep(0.002)
+            watch.finish(None, {})
+            assert watch.sampler is None or not watch.sampler._thread.is_alive()
+    finally:
+        slow_query_log._watchdog = None
+        del os.environ[ct.SLOW_QUERY_THRESHOLD_ENV]
+
+
+def test_watchdog_starts_sampler_after_profile_seconds():
+    watchdog = SlowQueryWatchdog(interval=0.005, profile_seconds=0.02)
+    watch = watchdog.watch("質問")
+    assert watch.sampler is None
+    deadline = time.monotonic() + 2
+    while watch.sampler is None and time.monotonic() < deadline:
+        time.sleep(0.005)
+    watchdog.unwatch(watch)
+    assert watch.sampler is not None
+    watch.sampler.stop()
+
+
+if __name__ == "__main__":
+    for test in (test_finish_stops_started_sampler, test_watchdog_starts_sampler_after_profile_seconds):
+        test()
+        print(f"OK: {test.__name__}")
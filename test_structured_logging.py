@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+JSON形式のログ出力（structured_logging.py）のテストスクリプト
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+sys.path.append('.')
+
+from session_context import SessionState, session_scope
+from structured_logging import setup_logging
+
+
+def read_entries(path):
+    with open(path, encoding="utf8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_json_records_with_session_context():
+    """ログの出力時に処理中のセッションのIDを付け、辞書のメッセージとextraの項目をJSONのまま出力すること"""
+    path = os.path.join(tempfile.mkdtemp(), "application.log")
+    listener = setup_logging(path, logger_name="test_structured_logging")
+    logger = logging.getLogger("test_structured_logging")
+
+    def log_in_session(session_id):
+        with session_scope(SessionState(session_id=session_id)):
+            logger.info({"message": f"{session_id}の質問", "application_mode": "社内文書検索"})
+            logger.info("所要時間: %d ms", 120, extra={"stage_ms": {"vector_search": 80}})
+
+    threads = [threading.Thread(target=log_in_session, args=(f"session-{i}",)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        raise ValueError("検索エラー")
+    except ValueError:
+        with session_scope(SessionState(session_id="session-error")):
+            logger.exception("回答の取得に失敗しました")
+    listener.stop()
+
+    entries = read_entries(path)
+    assert len(entries) == 5, entries
+    for i in range(2):
+        session_entries = [entry for entry in entries if entry["session_id"] == f"session-{i}"]
+        assert session_entries[0]["message"] == {"message": f"session-{i}の質問", "application_mode": "社内文書検索"}
+        assert session_entries[1]["message"] == "所要時間: 120 ms"
+        assert session_entries[1]["stage_ms"] == {"vector_search": 80}
+    error = entries[-1]
+    assert error["level"] == "ERROR" and error["session_id"] == "session-error"
+    assert "ValueError: 検索エラー" in error["exception"]
+
+
+if __name__ == "__main__":
+    for test in (test_json_records_with_session_context,):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+処理段階のトレース（tracing.py）のテストスクリプト
+"""
+
+import json
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+import constants as ct
+# テスト中のスパンを ./logs/traces に出力しない
+os.environ[ct.TRACE_ENABLED_ENV] = "0"
+
+from tracing import SpanExporter, current_span, end_script_span, start_script_span, start_span, to_otlp_payload
+
+
+def test_nested_spans():
+    """入れ子のスパンが親子関係を持ち、子孫の所要時間が祖先のstage_timingsに加算されること"""
+    with start_span("request", session_id="session-1") as request:
+        with start_span("retrieve") as retrieve:
+            assert current_span() is retrieve
+            with start_span("vector_search", k=5):
+                pass
+            with start_span("vector_search", k=5):
+                pass
+        assert current_span() is request
+    assert current_span() is None
+
+    search = request.find_descendant("vector_search")
+    assert search.trace_id == request.trace_id and search.parent_id == retrieve.span_id
+    assert search.session_id == "session-1" and search.attributes == {"k": 5}
+    assert [span.name for span in request.descendants] == ["vector_search", "vector_search", "retrieve"]
+    assert set(request.stage_timings) == {"retrieve", "vector_search"}
+    assert set(retrieve.stage_timings) == {"vector_search"}
+
+
+def test_error_status():
+    try:
+        with start_span("llm_complete") as span:
+            raise ValueError("失敗")
+    except ValueError:
+        pass
+    assert span.status == "error" and span.attributes["error"] == "ValueError: 失敗"
+    assert span.end_ns is not None
+
+
+def test_end_is_idempotent():
+    with start_span("request") as request:
+        child = start_span("first_token")
+        child.end()
+        end_ns = child.end_ns
+        child.end()
+    assert child.end_ns == end_ns and len(request.descendants) == 1
+
+
+def test_script_span_without_with_block():
+    """withブロックを使わないスパンも子の親になり、中断で残ったスパンは次のトレースに混ざらないこと"""
+    interrupted = start_script_span("chat_turn", mode="社内文書検索")
+    with start_span("request") as request:
+        pass
+    assert request.parent_id == interrupted.span_id and current_span() is interrupted
+
+    # st.stop などで終了しないまま、次の質問の処理が始まった場合
+    span = start_script_span("chat_turn")
+    assert interrupted.end_ns is not None and interrupted.attributes["interrupted"] is True
+    assert span.parent_id is None and span.trace_id != interrupted.trace_id and current_span() is span
+    end_script_span(span)
+    assert span.end_ns is not None and current_span() is None
+
+
+def test_engine_propagates_current_span():
+    """共有のイベントループ・ワーカーのスレッドで開始したスパンも、呼び出し元のスパンの子になること"""
+    from async_engine import get_async_engine
+
+    engine = get_async_engine()
+
+    def search():
+        with start_span("vector_search"):
+            pass
+
+    async def answer():
+        with start_span("llm_complete"):
+            await engine.to_thread(search)
+
+    with start_span("request") as request:
+        engine.run(answer())
+    llm_complete = request.find_descendant("llm_complete")
+    assert llm_complete is not None and llm_complete.parent_id == request.span_id
+    assert request.find_descendant("vector_search").parent_id == llm_complete.span_id
+    assert current_span() is None
+
+
+def test_rag_answer_records_first_token():
+    """一括応答の回答生成でも、最初のトークンが届いた時点で llm_first_token のスパンを終了すること"""
+    from langchain_core.documents import Document
+    from langchain_core.vectorstores import InMemoryVectorStore
+    from async_engine import get_async_engine
+    from hedging import HedgeBudget, HedgedLLM, LatencyTracker
+    from llm_scheduler import LLMScheduler, ScheduledLLM
+    from request_deadline import Deadline
+    from stub_models import StubChatModel, StubEmbeddings
+    import utils
+
+    vectorstore = InMemoryVectorStore(StubEmbeddings())
+    vectorstore.add_documents([Document(page_content="有給休暇は入社6か月後に付与されます。", metadata={"source": "規程.pdf"})])
+    retriever = vectorstore.as_retriever(search_kwargs={"k": 1})
+    llm = ScheduledLLM(
+        HedgedLLM(StubChatModel(latency=0.1, token_interval=0.02), tracker=LatencyTracker(), budget=HedgeBudget()),
+        "session-1", scheduler=LLMScheduler(max_concurrency=1)
+    )
+    with start_span("request") as request:
+        answer, docs = get_async_engine().run(utils.aanswer_with_rag(llm, retriever, "有給休暇は？", Deadline()))
+    assert answer and len(docs) == 1
+    llm_complete = request.find_descendant("llm_complete")
+    first_token = request.find_descendant("llm_first_token")
+    assert first_token is not None and first_token.parent_id == llm_complete.span_id
+    assert "received" not in first_token.attributes
+    assert 100 <= first_token.duration_ms < llm_complete.duration_ms
+
+
+def test_otlp_payload():
+    with start_span("request", session_id="session-1", cache_hit=True, results=3) as span:
+        pass
+    otlp_span = to_otlp_payload([span])["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert otlp_span["traceId"] == span.trace_id and otlp_span["status"] == {"code": 1}
+    attributes = {item["key"]: item["value"] for item in otlp_span["attributes"]}
+    assert attributes["cache_hit"] == {"boolValue": True}
+    assert attributes["results"] == {"intValue": "3"}
+    assert attributes["session.id"] == {"stringValue": "session-1"}
+
+
+def test_exporter_writes_jsonl():
+    path = os.path.join(tempfile.mkdtemp(), "spans.jsonl")
+    exporter = SpanExporter(path=path, interval=0.05)
+    with start_span("request", session_id="session-1") as span:
+        pass
+    exporter.export(span)
+    assert exporter.flush()
+    with open(path, encoding="utf8") as f:
+        records = [json.loads(line) for line in f]
+    assert records[0]["span_id"] == span.span_id and records[0]["session_id"] == "session-1"
+
+
+if __name__ == "__main__":
+    for test in (test_nested_spans, test_error_status, test_end_is_idempotent, test_script_span_without_with_block,
+                 test_engine_propagates_current_span, test_rag_answer_records_first_token, test_otlp_payload,
+                 test_exporter_writes_jsonl):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+チャンク分割の設定の比較（tune_chunking.py）の設定の列挙とパレート最適の判定のテストスクリプト
+"""
+
+import sys
+sys.path.append('.')
+
+from tune_chunking import dominates, iter_configs, pareto_front
+
+OBJECTIVES = ("recall_at_k", "embedding_tokens")
+
+
+def result(name, recall, tokens):
+    return {"name": name, "recall_at_k": recall, "embedding_tokens": tokens}
+
+
+def test_iter_configs_skips_invalid_and_duplicate_configs():
+    """重複が分割サイズ以上の設定と、characterで区切り文字の先頭が同じ設定を除くこと"""
+    configs = list(iter_configs(("recursive", "character"), (100, 200), (0, 100), ("paragraph", "sentence")))
+    keys = [(c["splitter"], c["chunk_size"], c["chunk_overlap"], c["separators"]) for c in configs]
+    assert all(overlap < size for _, size, overlap, _ in keys)
+    assert ("recursive", 200, 100, "sentence") in keys
+    assert ("character", 200, 100, "paragraph") in keys
+    # paragraph と sentence の区切り文字はどちらも先頭が "\n\n"
+    assert not any(splitter == "character" and separators == "sentence" for splitter, _, _, separators in keys)
+    assert len(keys) == len(set(keys)) == 9, keys
+
+
+def test_dominates():
+    """再現率は大きいほど、トークン数は小さいほど良いとして判定すること"""
+    assert dominates(result("a", 0.9, 100), result("b", 0.8, 100), OBJECTIVES)
+    assert dominates(result("a", 0.9, 90), result("b", 0.9, 100), OBJECTIVES)
+    assert not dominates(result("a", 0.9, 100), result("b", 0.9, 100), OBJECTIVES)
+    assert not dominates(result("a", 0.9, 200), result("b", 0.8, 100), OBJECTIVES)
+
+
+def test_pareto_front():
+    results = [result("high", 0.9, 300), result("cheap", 0.6, 100), result("dominated", 0.6, 200),
+               result("middle", 0.8, 150)]
+    front = pareto_front(results, OBJECTIVES)
+    assert [r["name"] for r in front] == ["high", "middle", "cheap"], front
+
+
+if __name__ == "__main__":
+    for test in (test_iter_configs_skips_invalid_and_duplicate_configs, test_dominates, test_pareto_front):
+        test()
+        print(f"OK: {test.__name__}")
@@ -0,0 +1,315 @@
+"""
+このファイルは、1回の回答生成の処理段階（質問の正規化・キャッシュの参照・埋め込み・ベクトル検索・文脈の作成・
+LLMの最初のトークン・回答生成の完了・画面表示）ごとの所要時間を、トレースのスパンとして記録・出力する処理が記述されたファイルです。
+
+スパンはセッションIDと紐づけて ./logs/traces/spans.jsonl に1行1件で出力し、
+環境変数「RAG_OTLP_ENDPOINT」を指定した場合は、OTLP/HTTP（JSON）のコレクターにも送信します。
+
+    with start_span("vector_search", k=5) as span:
+        docs = vectorstore.similarity_search_by_vector(vector, k=5)
+        span.set_attribute("results", len(docs))
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import atexit
+import contextvars
+import json
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+import constants as ct
+from metrics import observe_span
+
+
+############################################################
+# 設定関連
+############################################################
+# 処理中のスパン（入れ子のスパンの親になる）
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+############################################################
+# クラス定義
+############################################################
+
+class Span:
+    """
+    1つの処理段階の開始・終了時刻と属性
+
+    withブロックで使うと、ブロック内で開始したスパンの親になる。
+    withブロックを使わない場合は、end()を呼び出した時点で終了として出力する。
+    終了したスパンの所要時間は、すべての祖先のスパンの stage_timings（処理段階ごとの所要時間の合計、ミリ秒）に加算し、
+    スパン自体も祖先のスパンの descendants（終了した子孫のスパンのリスト）に追加する。
+    """
+
+    def __init__(self, name, parent=None, session_id=None, attributes=None, start_ns=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.session_id = session_id or (parent.session_id if parent else _current_session_id())
+        self.attributes = dict(attributes or {})
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.status = "ok"
+        self.stage_timings = {}
+        self.descendants = []
+        self._parent = parent
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def find_descendant(self, name):
+        """
+        終了した子孫のスパンのうち、指定の名前の最初のものを取得（ない場合はNone）
+        """
+        return next((span for span in self.descendants if span.name == name), None)
+
+    @property
+    def duration_ms(self):
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def end(self, end_ns=None):
+        """
+        スパンを終了して出力（2回目以降の呼び出しは無視する）
+        """
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        ancestor = self._parent
+        while ancestor is not None:
+            ancestor.stage_timings[self.name] = ancestor.stage_timings.get(self.name, 0.0) + self.duration_ms
+            ancestor.descendants.append(self)
+            ancestor = ancestor._parent
+        # メトリクス（処理段階ごとの所要時間など）は、トレースの出力を無効にしていても記録する
+        observe_span(self)
+        exporter = get_exporter()
+        if exporter is not None:
+            exporter.export(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 画面の再実行・中断などの制御用の例外（BaseException）は、エラーとして扱わない
+        if isinstance(exc, Exception):
+            self.status = "error"
+            self.attributes["error"] = f"{type(exc).__name__}: {exc}"
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # 開始時と別のコンテキストで終了した場合（非同期ジェネレーターなど）
+            pass
+        self.end()
+        return False
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "session_id": self.session_id,
+            "start_time": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter:
+    """
+    終了したスパンをバックグラウンドのスレッドでまとめて出力するクラス（回答生成の処理をファイル書き込み・通信で待たせない）
+    """
+
+    def __init__(self, path=ct.TRACE_FILE_PATH, otlp_endpoint=None,
+                 batch_size=ct.TRACE_EXPORT_BATCH_SIZE, interval=ct.TRACE_EXPORT_INTERVAL_SECONDS):
+        self.path = path
+        self.otlp_endpoint = otlp_endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        self._queue.put(span)
+
+    def flush(self, timeout=5.0):
+        """
+        出力待ちのスパンをすべて出力するまで待つ
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = []
+            flushed = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    flushed.append(item)
+                    break
+                batch.append(item)
+            if batch:
+                self._write(batch)
+            for done in flushed:
+                done.set()
+
+    def _write(self, spans):
+        records = [span.to_dict() for span in spans]
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"トレースの出力エラー: {e}", file=sys.stderr)
+
+        if self.otlp_endpoint:
+            import httpx
+            try:
+                httpx.post(self.otlp_endpoint, json=to_otlp_payload(spans), timeout=ct.TRACE_OTLP_TIMEOUT_SECONDS)
+            except httpx.HTTPError as e:
+                print(f"トレースの送信エラー: {e}", file=sys.stderr)
+
+
+############################################################
+# 関数定義
+############################################################
+
+def _current_session_id():
+    try:
+        from session_context import get_session_state
+        return get_session_state().session_id
+    except Exception:
+        return None
+
+
+def start_span(name, session_id=None, start_ns=None, **attributes):
+    """
+    処理中のスパンの子としてスパンを開始（処理中のスパンがない場合は、新しいトレースを開始）
+
+    Args:
+        name: 処理段階の名前
+        session_id: セッションID（省略時は親のスパン、親がない場合は処理中のセッションのもの）
+        start_ns: 開始時刻（省略時は現在時刻。time.time_ns()の値）
+        attributes: スパンの属性（取得件数・トークン数・キャッシュのヒットなど）
+
+    Returns:
+        スパン（withブロックで使う）
+    """
+    return Span(name, _current_span.get(), session_id, attributes, start_ns)
+
+
+def start_script_span(name, **attributes):
+    """
+    withブロックを使わずに、新しいトレースのスパンを開始して処理中のスパンに設定（Streamlitの画面の処理用）
+
+    画面の再実行・st.stop による中断で、前回のスパンが終了しないまま処理中のスパンとして残っている場合は、
+    中断として終了させたうえで新しいトレースを開始する（前回のトレースに混ざらないようにする）。
+    スパンは end_script_span で終了する。
+    """
+    stale = _current_span.get()
+    if stale is not None and stale.end_ns is None:
+        stale.set_attribute("interrupted", True)
+        stale.end()
+    span = Span(name, None, None, attributes)
+    _current_span.set(span)
+    return span
+
+
+def end_script_span(span):
+    """
+    start_script_span で開始したスパンを終了し、処理中のスパンの設定を解除
+    """
+    span.end()
+    if _current_span.get() is span:
+        _current_span.set(None)
+
+
+def current_span():
+    """
+    処理中のスパンを取得（スパンの外ではNone）
+    """
+    return _current_span.get()
+
+
+def tracing_enabled():
+    return os.environ.get(ct.TRACE_ENABLED_ENV, "1").lower() not in ("0", "false", "off")
+
+
+def get_exporter():
+    """
+    プロセス全体で共有するスパンの出力先を取得（トレースを無効にしている場合はNone）
+    """
+    global _exporter
+    if not tracing_enabled():
+        return None
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = SpanExporter(otlp_endpoint=os.environ.get(ct.TRACE_OTLP_ENDPOINT_ENV))
+                atexit.register(_exporter.flush)
+    return _exporter
+
+
+def to_otlp_value(value):
+    """
+    属性の値を、OTLPのAnyValue形式に変換
+    """
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_payload(spans):
+    """
+    スパンのリストを、OTLP/HTTP（JSON）の送信内容に変換
+    """
+    otlp_spans = []
+    for span in spans:
+        attributes = {**span.attributes, "session.id": span.session_id or ""}
+        otlp_spans.append({
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": to_otlp_value(value)} for key, value in attributes.items()],
+            "status": {"code": 2 if span.status == "error" else 1},
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": ct.TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "rag-tracing"}, "spans": otlp_spans}],
+        }]
+    }
@@ -0,0 +1,266 @@
+"""
+このファイルは、チャンク分割の設定（分割の方法・CHUNK_SIZE・CHUNK_OVERLAP・区切り文字）の組み合わせを ./data の文書で試し、
+コストと検索品質のバランスが良い（パレート最適な）設定を探すためのツールです。
+constants.pyのチャンク分割の設定を手作業で変えて試す代わりに使います。
+
+設定ごとに、チャンク数・埋め込みのトークン数・インデックスのサイズ・作成時間・検索の所要時間と、
+評価用の質問（eval_queries.jsonl）での検索の再現率を計測します。
+埋め込みベクトルはファイルにキャッシュするため、同じ内容のチャンクは設定を変えても（2回目以降の実行でも）埋め込み直しません。
+
+使い方:
+    python tune_chunking.py                                        # constants.pyの探索範囲をすべて試す
+    python tune_chunking.py --splitters recursive --sizes 600 800 --overlaps 50 100 --separators newline sentence
+    python tune_chunking.py --stub                                 # APIを使わずに動作確認（品質の値は意味を持たない）
+
+計測する指標:
+    chunks            チャンク数
+    embedding_tokens  インデックスに登録するドキュメントの合計トークン数（埋め込みのコスト）
+    index_bytes       インデックスのサイズ（ベクトルと本文のバイト数）
+    build_seconds     インデックスの作成時間（埋め込みの取得を除く）
+    embed_seconds     埋め込みの取得時間（キャッシュにないチャンクのみ）
+    search_p50_ms     ベクトル検索の所要時間
+    recall_at_k / mrr 評価用の質問での検索品質（evaluate_retrieval.pyと同じ計算）
+    prompt_tokens     検索結果から作成したLLMへのメッセージのトークン数の平均
+"""
+
+from __future__ import annotations
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import constants as ct
+from benchmark import TimedEmbeddings, get_vectorstore_class
+from evaluate_retrieval import load_labelled_queries, prompt_tokens, score_ranking, search
+
+
+############################################################
+# 定数定義
+############################################################
+# 値が大きいほど良い指標（それ以外は小さいほど良い）
+HIGHER_IS_BETTER = ("recall_at_k", "mrr", "hit_rate")
+
+
+############################################################
+# 関数定義
+############################################################
+
+def iter_configs(splitters, sizes, overlaps, separator_names):
+    """
+    試すチャンク分割の設定の組み合わせを列挙
+
+    重複が分割サイズ以上になる組み合わせと、結果が同じになる組み合わせ
+    （characterの分割は区切り文字の先頭のみを使う）は除く。
+    """
+    seen = set()
+    for splitter in splitters:
+        for separator_name in separator_names:
+            separators = ct.CHUNK_TUNING_SEPARATORS[separator_name]
+            for size in sizes:
+                for overlap in overlaps:
+                    if overlap >= size:
+                        continue
+                    key = (splitter, size, overlap, tuple(separators[:1] if splitter == "character" else separators))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    yield {
+                        "splitter": splitter,
+                        "chunk_size": size,
+                        "chunk_overlap": overlap,
+                        "separators": separator_name,
+                    }
+
+
+def index_bytes(vectorstore):
+    """
+    ベクトルストアのサイズ（ベクトルと本文のバイト数）を計算
+    """
+    index = getattr(vectorstore, "index", None)
+    if index is not None:
+        # FAISS: シリアライズしたインデックスと、ドキュメントの本文
+        import faiss
+        size = faiss.serialize_index(index).nbytes
+        texts = [doc.page_content for doc in vectorstore.docstore._dict.values()]
+    else:
+        # InMemoryVectorStore: FAISSと同じくfloat32で保持した場合のサイズに換算
+        items = list(vectorstore.store.values())
+        size = sum(len(item["vector"]) * 4 for item in items)
+        texts = [item["text"] for item in items]
+    return size + sum(len(text.encode("utf-8")) for text in texts)
+
+
+def measure_config(config, source_docs, csv_docs, queries, query_vectors, embeddings, k):
+    """
+    1つのチャンク分割の設定で、インデックスを作成して各指標を計測
+
+    Returns:
+        設定と指標の辞書
+    """
+    from context_packer import count_tokens
+    from initialize_ultra_lite import split_documents, build_retriever
+
+    chunks = split_documents(
+        source_docs, config["chunk_size"], config["chunk_overlap"],
+        ct.CHUNK_TUNING_SEPARATORS[config["separators"]], config["splitter"]
+    )
+    documents = csv_docs + chunks
+
+    embed_seconds_before = embeddings.underlying_embeddings.seconds
+    started_at = time.perf_counter()
+    retriever = build_retriever(documents, embeddings, get_vectorstore_class())
+    total_seconds = time.perf_counter() - started_at
+    embed_seconds = embeddings.underlying_embeddings.seconds - embed_seconds_before
+
+    recalls, reciprocal_ranks, tokens, search_seconds = [], [], [], []
+    for query, query_vector in zip(queries, query_vectors):
+        docs, seconds = search("vector", retriever, query["question"], query_vector, k)
+        search_seconds.append(seconds)
+        recall, reciprocal_rank = score_ranking(docs, query["relevant"])
+        recalls.append(recall)
+        reciprocal_ranks.append(reciprocal_rank)
+        tokens.append(prompt_tokens(docs, query["question"]))
+
+    return {
+        **config,
+        "k": k,
+        "chunks": len(chunks),
+        "embedding_tokens": sum(count_tokens(doc.page_content) for doc in documents),
+        "index_bytes": index_bytes(retriever.vectorstore),
+        "build_seconds": total_seconds - embed_seconds,
+        "embed_seconds": embed_seconds,
+        "search_p50_ms": float(np.percentile(search_seconds, 50) * 1000),
+        "search_p95_ms": float(np.percentile(search_seconds, 95) * 1000),
+        "recall_at_k": float(np.mean(recalls)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "hit_rate": float(np.mean([rank > 0 for rank in reciprocal_ranks])),
+        "prompt_tokens": float(np.mean(tokens)),
+    }
+
+
+def dominates(a, b, objectives):
+    """
+    設定aが設定bを支配する（すべての指標で劣らず、いずれかの指標で勝る）かを判定
+    """
+    strictly_better = False
+    for metric in objectives:
+        sign = 1 if metric in HIGHER_IS_BETTER else -1
+        diff = sign * (a[metric] - b[metric])
+        if diff < 0:
+            return False
+        if diff > 0:
+            strictly_better = True
+    return strictly_better
+
+
+def pareto_front(results, objectives=ct.CHUNK_TUNING_OBJECTIVES):
+    """
+    他のどの設定にも支配されない（パレート最適な）設定を、再現率の高い順に取得
+    """
+    front = [r for r in results if not any(dominates(other, r, objectives) for other in results if other is not r)]
+    return sorted(front, key=lambda r: (-r["recall_at_k"], r["embedding_tokens"]))
+
+
+def tune(queries, configs, k=ct.RAG_SEARCH_K, embeddings=None):
+    """
+    チャンク分割の設定ごとに計測
+
+    Returns:
+        設定ごとの計測結果の辞書のリスト
+    """
+    from initialize_ultra_lite import load_source_documents
+    from llm_clients import get_cached_embeddings, get_embeddings
+    from utils import create_csv_documents
+
+    # 埋め込みの取得時間は、キャッシュにないテキストを実際に埋め込んだ分のみ計測される
+    embeddings = get_cached_embeddings(TimedEmbeddings(embeddings or get_embeddings()))
+    source_docs = load_source_documents()
+    csv_docs = create_csv_documents()
+    query_vectors = [embeddings.embed_query(query["question"]) for query in queries]
+
+    results = []
+    for i, config in enumerate(configs, 1):
+        print(f"計測中 ({i}/{len(configs)}): {config}", file=sys.stderr)
+        results.append(measure_config(config, source_docs, csv_docs, queries, query_vectors, embeddings, k))
+    return results
+
+
+def print_results(results, front):
+    front_ids = {id(r) for r in front}
+    print(f"{'':2} {'splitter':10} {'separators':10} {'size':>5} {'overlap':>7} {'chunks':>6} {'emb_tokens':>10} "
+          f"{'index_KB':>9} {'build_s':>7} {'search_ms':>9} {'recall@k':>8} {'mrr':>6} {'prompt':>7}")
+    for r in sorted(results, key=lambda r: (-r["recall_at_k"], r["embedding_tokens"])):
+        mark = "★" if id(r) in front_ids else ""
+        print(f"{mark:2} {r['splitter']:10} {r['separators']:10} {r['chunk_size']:>5} {r['chunk_overlap']:>7} "
+              f"{r['chunks']:>6} {r['embedding_tokens']:>10} {r['index_bytes'] / 1024:>9.1f} {r['build_seconds']:>7.2f} "
+              f"{r['search_p50_ms']:>9.2f} {r['recall_at_k']:>8.3f} {r['mrr']:>6.3f} {r['prompt_tokens']:>7.0f}")
+
+
+def format_constants(result):
+    """
+    設定をconstants.pyの記述に変換
+    """
+    return "\n".join([
+        f"CHUNK_SIZE = {result['chunk_size']}",
+        f"CHUNK_OVERLAP = {result['chunk_overlap']}",
+        f"CHUNK_SPLITTER = {result['splitter']!r}",
+        f"CHUNK_SEPARATORS = {ct.CHUNK_TUNING_SEPARATORS[result['separators']]!r}",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="チャンク分割の設定の組み合わせを試し、パレート最適な設定を探す")
+    parser.add_argument("--queries", default=ct.EVAL_QUERIES_PATH, help="評価用の質問と正解のJSONLファイル")
+    parser.add_argument("--splitters", nargs="+", choices=ct.CHUNK_TUNING_SPLITTERS, default=list(ct.CHUNK_TUNING_SPLITTERS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(ct.CHUNK_TUNING_SIZES))
+    parser.add_argument("--overlaps", type=int, nargs="+", default=list(ct.CHUNK_TUNING_OVERLAPS))
+    parser.add_argument("--separators", nargs="+", choices=list(ct.CHUNK_TUNING_SEPARATORS),
+                        default=list(ct.CHUNK_TUNING_SEPARATORS))
+    parser.add_argument("-k", type=int, default=ct.RAG_SEARCH_K, help="ベクトル検索で取得する件数")
+    parser.add_argument("--objectives", nargs="+", default=list(ct.CHUNK_TUNING_OBJECTIVES),
+                        help="パレート最適かを判定する指標")
+    parser.add_argument("--stub", action="store_true", help="APIを使わないスタブの埋め込みモデルで動作確認する")
+    parser.add_argument("-o", "--output", help="結果のJSONファイル（既定は ./logs/chunk_tuning/chunk_tuning_日時.json）")
+    args = parser.parse_args()
+
+    if args.stub:
+        os.environ[ct.LLM_BACKEND_ENV] = "stub"
+    # Streamlitの画面外で実行する際の警告を抑止
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+
+    queries = load_labelled_queries(args.queries)
+    configs = list(iter_configs(args.splitters, args.sizes, args.overlaps, args.separators))
+    results = tune(queries, configs, args.k)
+    front = pareto_front(results, args.objectives)
+    print_results(results, front)
+    print(f"\nパレート最適な設定（★ {len(front)}件、指標: {', '.join(args.objectives)}）のうち、再現率が最も高いもの:")
+    print(format_constants(front[0]))
+
+    output = args.output
+    if output is None:
+        os.makedirs(ct.CHUNK_TUNING_DIR_PATH, exist_ok=True)
+        output = os.path.join(ct.CHUNK_TUNING_DIR_PATH, f"chunk_tuning_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "queries": args.queries,
+                "vectorstore": get_vectorstore_class().__name__,
+                "objectives": args.objectives,
+                "stub": args.stub,
+            },
+            "results": results,
+            "pareto_front": front,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,13 +9,26 @@ from __future__ import annotations
 # ライブラリの読み込み
 ############################################################
 import os
+import logging
 import pandas as pd
 import re
 from dotenv import load_dotenv
-import streamlit as st
 from langchain.schema import HumanMessage, SystemMessage, AIMessage
-from langchain_openai import ChatOpenAI
 import constants as ct
+from employee_engine import get_employee_engine, format_employee_table
+from context_packer import pack_context, count_tokens
+from llm_clients import get_llm
+from llm_scheduler import ScheduledLLM, PRIORITY_LOW, get_llm_scheduler, query_priority
+from hedging import HedgedLLM
+from query_rewrite import normalize_query
+from single_flight import SingleFlight
+from request_deadline import Deadline, StageTimeout
+from lexical_search import lexical_search
+from async_engine import get_async_engine, aembed_query
+from session_context import get_session_state
+from tracing import start_span
+from slow_query_log import watch_request
+from profiling import profile_next_request
 from typing import Optional
 from tabulate import tabulate
 
@@ -25,60 +38,28 @@ from tabulate import tabulate
 # 「.env」ファイルで定義した環境変数の読み込み
 load_dotenv()
 
+# 同時に来た同じ質問の検索・回答生成を1回にまとめるためのオブジェクト（プロセス全体で共有）
+_rag_single_flight = SingleFlight()
+
 ############################################################
 # 真のRAG統合関数
 ############################################################
 
 def create_csv_documents():
-    """CSVデータをRAG用のドキュメント形式に変換（Markdownテーブル統合版）"""
+    """CSVデータをRAG用のドキュメント形式に変換（社員1名につき1ドキュメント＋部署概要）"""
     from langchain.schema import Document
     
     try:
-        csv_path = "./data/社員について/社員名簿.csv"
-        if not os.path.exists(csv_path):
-            return []
-        
-        df = pd.read_csv(csv_path, encoding='utf-8')
+        employee_engine = get_employee_engine()
         documents = []
         
-        # ✅ 方法1: 全社員を1つの統合Markdownテーブルとして格納
-        all_employees_content = f"""# 全社員一覧（社員名簿）
-
-{df.to_markdown(index=False)}
-
-この表には全{len(df)}名の社員情報が含まれています。
-各部署の詳細な検索や、特定の条件での絞り込みが可能です。"""
-
-        documents.append(Document(
-            page_content=all_employees_content,
-            metadata={
-                "source": "社員名簿.csv",
-                "type": "employee_master_table",
-                "total_employees": len(df)
-            }
-        ))
+        # 社員1名ごとのコンパクトなレコード（回答時に該当者だけを表に組み立て直す）
+        for content, metadata in employee_engine.employee_records():
+            documents.append(Document(page_content=content, metadata=metadata))
         
-        # ✅ 方法2: 部署別のMarkdownテーブルも作成（詳細検索用）
-        for dept in df['部署'].unique():
-            dept_df = df[df['部署'] == dept]
-            dept_content = f"""# {dept}の社員一覧
-
-{dept_df.to_markdown(index=False)}
-
-{dept}には{len(dept_df)}名の社員が所属しています。
-役職構成: {dict(dept_df['役職'].value_counts())}
-主な役職: {', '.join(dept_df['役職'].unique())}
-従業員区分: {', '.join(dept_df['従業員区分'].unique())}"""
-            
-            documents.append(Document(
-                page_content=dept_content,
-                metadata={
-                    "source": f"社員名簿.csv",
-                    "type": "department_table", 
-                    "department": dept,
-                    "employee_count": len(dept_df)
-                }
-            ))
+        # 部署ごとの概要（人数・役職構成は事前集計値を使用）
+        for content, metadata in employee_engine.department_summaries():
+            documents.append(Document(page_content=content, metadata=metadata))
         
         return documents
         
@@ -86,6 +67,34 @@ def create_csv_documents():
         print(f"CSV文書化エラー: {e}")
         return []
 
+def build_context_text(retrieved_docs, query):
+    """検索結果からLLMに渡す文脈テキストを作成（社員レコードは該当者のみの表に組み立て直し、トークン数の上限内に収める）"""
+    from langchain.schema import Document
+    
+    employee_docs = [doc for doc in retrieved_docs if doc.metadata.get("type") == "employee_data"]
+    
+    context_docs = []
+    for doc in retrieved_docs:
+        if doc.metadata.get("type") != "employee_data":
+            context_docs.append(doc)
+        elif doc is employee_docs[0]:
+            # 社員レコードは、最も関連度の高いレコードの順位に1つの表としてまとめる
+            employee_engine = get_employee_engine()
+            # 部署・役職などの条件が指定されている場合は、条件に一致する社員全員を表にする
+            filters = employee_engine.extract_filters(query)
+            if filters:
+                rows = employee_engine.search(filters=filters)
+            else:
+                rows = employee_engine.rows_by_ids([doc.metadata.get("employee_id") for doc in employee_docs])
+            if not rows.empty:
+                context_docs.append(Document(
+                    page_content=f"# 社員名簿（該当者{len(rows)}名）\n\n{format_employee_table(rows)}",
+                    metadata={"source": ct.EMPLOYEE_CSV_SOURCE_NAME, "type": "employee_table"}
+                ))
+    
+    context_text, _, _ = pack_context(context_docs)
+    return context_text
+
 def format_search_results(retrieved_docs, query):
     """検索結果を動的にフォーマット - ファイルパスとページ数を含む表示"""
     if not retrieved_docs:
@@ -180,31 +189,289 @@ def build_error_message(error_message):
     """エラーメッセージを整形して返す"""
     return f"{ct.ERROR_ICON} **エラーが発生しました**\n\n{error_message}\n\n{ct.COMMON_ERROR_MESSAGE}"
 
-def get_llm_response(chat_message):
-    """LLMから回答を生成する（真のRAGアプローチ）"""
+def add_to_chat_history(chat_message, answer):
+    """LLMとのやりとり用の会話履歴に、1往復分の会話を追加"""
+    try:
+        session_state = get_session_state()
+        if hasattr(session_state, 'chat_history'):
+            session_state.chat_history.add_turn(chat_message, answer)
+    except Exception:
+        pass
+
+def get_chat_history_messages():
+    """回答生成のLLMに渡す会話履歴（これまでの会話の要約と直近の会話）を取得（会話履歴がない場合は空のリスト）"""
+    try:
+        return get_session_state().chat_history.to_messages()
+    except Exception:
+        return []
+
+def get_session_id():
+    """LLM呼び出しの順番待ちに使うセッションIDを取得（Streamlitセッション外では共通のID）"""
+    try:
+        return get_session_state().session_id
+    except Exception:
+        return "default"
+
+def summarize_chat_history():
+    """上限を超えた古い会話履歴の要約をバックグラウンドで開始（回答の画面表示後に呼び出す）"""
+    try:
+        chat_history = get_session_state().chat_history
+        if chat_history.needs_summary():
+            # 要約はユーザーを待たせないため、回答生成より低い優先度で実行
+            chat_history.summarize_in_background(ScheduledLLM(get_llm(), get_session_id(), priority=PRIORITY_LOW))
+    except Exception as e:
+        print(f"会話履歴の要約開始エラー: {e}")
+
+def is_first_turn():
+    """会話履歴（要約を含む）がまだない、最初の質問かどうか"""
+    try:
+        chat_history = get_session_state().chat_history
+        return len(chat_history) == 0 and not chat_history.summary
+    except Exception:
+        return True
+
+def get_index_version(retriever):
+    """検索結果が同じになるかの判定に使う、インデックス（ベクターストア＋社員名簿）のバージョンを取得"""
+    metadata = getattr(retriever, "metadata", None) or {}
+    return (metadata.get("index_version", id(retriever)), get_employee_engine().version)
+
+def get_rag_single_flight_stats():
+    """同時に来た同じ質問の処理をまとめた回数などのメトリクスを取得（実行した回数・結果を共有した回数）"""
+    return _rag_single_flight.stats()
+
+async def aretrieve_documents(retriever, chat_message, deadline, k=None):
+    """
+    質問の埋め込み・ベクトル検索を時間制限付きで非同期に実行し、関連ドキュメントを取得
+
+    埋め込みはAPIを非同期に呼び出し、ベクトル検索は非同期エンジンのスレッドプールで実行する。
+    いずれかの段階が時間切れの場合は、語彙検索（キーワード一致）の結果で代替する。
+
+    Args:
+        k: 取得する件数（省略時はRetrieverの設定値）
+
+    Returns:
+        ドキュメントのリストと、語彙検索で代替したかどうか
+    """
+    engine = get_async_engine()
+    vectorstore = getattr(retriever, "vectorstore", None)
+    embeddings = getattr(vectorstore, "embeddings", None)
+    search_kwargs = dict(getattr(retriever, "search_kwargs", None) or {"k": ct.RAG_SEARCH_K})
+    if k is not None:
+        search_kwargs["k"] = k
+    try:
+        if embeddings is None:
+            # 埋め込みと検索を分けられないRetrieverの場合は、まとめて検索の段階として扱う
+            with start_span("vector_search", k=search_kwargs["k"], with_embedding=True) as span:
+                docs = await deadline.run_async("search", engine.to_thread(retriever.invoke, chat_message))
+                span.set_attribute("results", len(docs))
+            return docs, False
+        with start_span("embed", query_chars=len(chat_message)):
+            query_vector = await deadline.run_async("embed", aembed_query(embeddings, chat_message))
+        with start_span("vector_search", k=search_kwargs["k"]) as span:
+            # スコア付きで検索できるベクトルストアは、スコアも記録（FAISSは距離、InMemoryVectorStoreはコサイン類似度）
+            search_with_score = getattr(vectorstore, "similarity_search_with_score_by_vector", None)
+            if search_with_score is not None:
+                results = await deadline.run_async("search", engine.to_thread(search_with_score, query_vector, **search_kwargs))
+                docs = [doc for doc, _ in results]
+                span.set_attribute("scores", [round(float(score), 4) for _, score in results])
+            else:
+                docs = await deadline.run_async(
+                    "search", engine.to_thread(vectorstore.similarity_search_by_vector, query_vector, **search_kwargs)
+                )
+            span.set_attribute("results", len(docs))
+        return docs, False
+    except StageTimeout:
+        with start_span("lexical_search", k=search_kwargs["k"]) as span:
+            docs = await engine.to_thread(lexical_search, retriever, chat_message, search_kwargs["k"])
+            span.set_attribute("results", len(docs))
+        return docs, True
+
+def build_rag_messages(chat_message, context_text, chat_history=None):
+    """
+    検索結果の文脈をもとに回答を生成するための、LLMへのメッセージを作成
+
+    Args:
+        chat_history: 会話履歴のメッセージのリスト（ConversationMemory.to_messagesの戻り値。要約と直近の会話）
+    """
+    system_prompt = """あなたは社内情報検索アシスタントです。
+提供された情報を基に、ユーザーの質問に正確で有用な回答を提供してください。
+
+**重要な出力ルール**:
+1. 従業員情報や一覧データがある場合は、**必ずMarkdown形式のテーブル**で出力してください
+2. 複数の従業員情報がある場合は、全員分をテーブルに含めてください（1人だけではダメ）
+3. テーブル形式: | 列名1 | 列名2 | 列名3 |
+4. 従業員以外の情報は要点をまとめて回答してください"""
+    
+    return [
+        SystemMessage(content=system_prompt),
+        *(chat_history or []),
+        HumanMessage(content=f"質問: {chat_message}\n\n検索結果:\n{context_text}\n\n上記の情報を基に回答してください。")
+    ]
+
+def build_sources_only_answer(formatted_results):
+    """回答生成が時間切れの場合に返す、検索結果（関連する情報のありか）のみの回答を作成"""
+    return f"{ct.WARNING_ICON} {ct.REQUEST_SOURCES_ONLY_MESSAGE}\n\n{formatted_results}"
+
+async def aprepare_rag(retriever, chat_message, deadline, k=None, chat_history=None):
+    """
+    関連ドキュメントを検索し、回答生成に使うLLMへのメッセージを作成（非同期エンジン上で実行。各段階は制限時間付き）
+
+    Args:
+        chat_history: 回答生成のLLMに渡す会話履歴のメッセージのリスト
+
+    Returns:
+        検索結果のドキュメントのリスト、語彙検索で代替したかどうか、整形済みの検索結果、LLMへのメッセージ
+    """
+    engine = get_async_engine()
+    retrieved_docs, lexical_fallback = await aretrieve_documents(retriever, chat_message, deadline, k)
+    
+    # 結果の動的フォーマット
+    formatted_results = format_search_results(retrieved_docs, chat_message)
+    
+    # LLMによる統合回答生成（文脈はトークン数の上限内で関連度の高い順に詰める）
+    with start_span("context_pack", documents=len(retrieved_docs)) as span:
+        try:
+            context_text = await deadline.run_async("pack", engine.to_thread(build_context_text, retrieved_docs, chat_message))
+        except StageTimeout:
+            context_text = "\n\n".join(doc.page_content for doc in retrieved_docs)[:ct.REQUEST_FALLBACK_CONTEXT_CHARS]
+            span.set_attribute("timed_out", True)
+        messages = build_rag_messages(chat_message, context_text, chat_history)
+        span.set_attributes(
+            context_tokens=count_tokens(context_text),
+            prompt_tokens=sum(count_tokens(message.content) for message in messages),
+        )
+    
+    return retrieved_docs, lexical_fallback, formatted_results, messages
+
+async def aanswer_with_rag(llm, retriever, chat_message, deadline, chat_history=None):
+    """
+    関連ドキュメントを検索し、検索結果をもとにLLMで回答を生成（非同期エンジン上で実行。各段階は制限時間付き）
+
+    Args:
+        chat_history: 回答生成のLLMに渡す会話履歴のメッセージのリスト
+
+    Returns:
+        回答のテキストと、検索結果のドキュメントのリスト
+    """
+    retrieved_docs, lexical_fallback, formatted_results, messages = await aprepare_rag(
+        retriever, chat_message, deadline, chat_history=chat_history
+    )
+    
+    with start_span("llm_complete", streaming=False) as span:
+        # 最初のトークンまでの時間（順番待ちを含む）は、ヘッジ付きの呼び出しから最初のトークンの到着の通知を受けて記録
+        first_token_span = start_span("llm_first_token")
+        try:
+            answer = (await deadline.run_async(
+                "completion", llm.ainvoke(messages, on_first_token=first_token_span.end)
+            )).content
+        except StageTimeout:
+            # 回答生成が時間切れの場合は、検索結果（関連する情報のありか）のみを返す
+            span.set_attribute("timed_out", True)
+            return build_sources_only_answer(formatted_results), retrieved_docs
+        finally:
+            if first_token_span.end_ns is None:
+                first_token_span.set_attribute("received", False)
+                first_token_span.end()
+        span.set_attribute("completion_tokens", count_tokens(answer))
+    
+    if lexical_fallback:
+        answer += f"\n\n{ct.REQUEST_LEXICAL_FALLBACK_NOTE}"
+    return answer, retrieved_docs
+
+def answer_structured_query(chat_message):
+    """
+    特定の社員に関する質問は氏名インデックスで、日付・年齢の範囲や上位N件の質問はソート済みインデックスで、
+    人数・構成・分布の質問は事前集計値で、LLMを使わずに正確な表で回答
+
+    社員名簿の読み込み・検索に失敗した場合は、ログに記録して通常のRAG処理に任せる。
+
+    Returns:
+        回答の辞書（社員名簿で回答できない質問の場合はNone）
+    """
+    try:
+        employee_engine = get_employee_engine()
+        structured_response = employee_engine.answer_name_query(chat_message)
+        if structured_response is None:
+            structured_response = employee_engine.answer_range_query(chat_message)
+        if structured_response is None:
+            structured_response = employee_engine.answer_aggregate_query(chat_message)
+        return structured_response
+    except Exception as e:
+        logging.getLogger(ct.LOGGER_NAME).warning(f"社員名簿による回答エラー（RAGで回答します）: {e}", exc_info=True)
+        return None
+
+def get_llm_response(chat_message, on_queue_wait=None):
+    """
+    LLMから回答を生成する（真のRAGアプローチ）
+
+    処理全体と処理段階ごとの所要時間は、トレースのスパンとして出力し、ログにも1件の記録として出力する。
+    時間がかかった質問は、検索結果・キャッシュの利用状況とあわせて遅い質問のログ（slow_query_log.py）にも記録する。
+    管理者用ページなどでプロファイルが指定されている場合は、プロファイル（profiling.py）を取得して保存する。
+
+    Args:
+        chat_message: ユーザー入力値
+        on_queue_wait: LLM呼び出しの順番待ちの間、待ち順位を受け取るコールバック（画面表示用）
+    """
+    with start_span("request", query_chars=len(chat_message)) as span, profile_next_request():
+        watch = watch_request(chat_message)
+        response = {}
+        try:
+            response = _get_llm_response(chat_message, on_queue_wait, span)
+        finally:
+            watch.finish(span, response)
+        span.set_attributes(mode=response.get("mode"), sources=len(response.get("context") or []))
+        logging.getLogger(ct.LOGGER_NAME).info(
+            "回答生成完了",
+            extra={
+                "event": "request",
+                "path": span.attributes.get("path"),
+                "mode": span.attributes.get("mode"),
+                "duration_ms": round(span.duration_ms, 1),
+                "stages": {name: round(ms, 1) for name, ms in span.stage_timings.items()},
+            },
+        )
+        return response
+
+def _get_llm_response(chat_message, on_queue_wait, request_span):
+    # 回答生成全体の制限時間（質問の埋め込み・ベクトル検索・文脈の作成・回答生成に配分）
+    deadline = Deadline()
     try:
         # 統一RAGアプローチ: 全てのクエリを同じ方法で処理
         # キーワード判定は廃止し、RAGの自然な検索に任せる
+
+        # 社員名簿で答えられる質問は、LLMを使わずに正確な表で回答（事前集計値・インデックスの参照）
+        with start_span("cache_lookup", source="employee_engine") as span:
+            structured_response = answer_structured_query(chat_message)
+            span.set_attribute("cache_hit", structured_response is not None)
+        if structured_response is not None:
+            add_to_chat_history(chat_message, structured_response["answer"])
+            request_span.set_attribute("path", "structured")
+            return structured_response
         
-        # 真のRAG処理: 全データを統合検索
-        llm = ChatOpenAI(model_name=ct.MODEL, temperature=ct.TEMPERATURE)
+        # 真のRAG処理: 全データを統合検索（LLMのオブジェクトと接続はプロセス全体で共有）
+        # LLMの呼び出しはプロセス全体のスケジューラ経由で行い、同時呼び出し数を制限する（短い質問は優先）
+        # 応答が遅い場合は同じリクエストをもう1本送り、先に応答した方を採用する（ヘッジリクエスト。実行枠に空きがある場合のみ）
+        llm = ScheduledLLM(HedgedLLM(get_llm(), scheduler=get_llm_scheduler()), get_session_id(), priority=query_priority(chat_message), on_wait=on_queue_wait)
         
         # RAGリトリーバーの取得（緊急修正: フォールバック強化）
         retriever = None
         try:
             # Streamlit環境での取得を試行
-            if hasattr(st, 'session_state') and hasattr(st.session_state, 'retriever'):
-                retriever = st.session_state.retriever
+            session_state = get_session_state()
+            if hasattr(session_state, 'retriever'):
+                # 社員名簿の更新を反映して共有のRetrieverを作り直した場合は、新しいものに切り替える
+                from initialize_ultra_lite import get_current_retriever
+                retriever = session_state.retriever = get_current_retriever(session_state.retriever)
             
             # retrieverがNoneの場合、緊急初期化を試行
             if retriever is None:
                 print("⚠️ retriever が None です。緊急初期化を試行...")
-                from initialize_ultra_lite import initialize_retriever
-                retriever = initialize_retriever()
+                from initialize_ultra_lite import get_shared_retriever
+                retriever = get_shared_retriever()
                 
                 # 初期化成功時はsession_stateに保存
-                if retriever and hasattr(st, 'session_state'):
-                    st.session_state.retriever = retriever
+                if retriever:
+                    session_state.retriever = retriever
                     print("✅ retriever 緊急初期化成功")
                     
         except Exception as e:
@@ -213,23 +480,15 @@ def get_llm_response(chat_message):
         
         if retriever is None:
             # リトリーバーが利用できない場合のフォールバック
-            try:
-                chat_history = st.session_state.chat_history if hasattr(st, 'session_state') and hasattr(st.session_state, 'chat_history') else []
-            except Exception:
-                chat_history = []
-            
             messages = [
                 SystemMessage(content="あなたは社内情報に詳しいアシスタントです。質問に丁寧に回答してください。"),
                 HumanMessage(content=chat_message)
             ]
             
-            response = llm.invoke(messages)
+            response = deadline.run("completion", llm.invoke, messages)
             
-            try:
-                if hasattr(st, 'session_state') and hasattr(st.session_state, 'chat_history'):
-                    st.session_state.chat_history.extend([HumanMessage(content=chat_message), response.content])
-            except Exception:
-                pass
+            add_to_chat_history(chat_message, response.content)
+            request_span.set_attribute("path", "emergency")
             
             return {
                 "answer": response.content + "\n\n⚠️ **緊急モード**: 文書検索機能が一時的に利用できません。管理者に連絡してください。",
@@ -238,45 +497,68 @@ def get_llm_response(chat_message):
         
         # RAG検索実行
         try:
-            retrieved_docs = retriever.invoke(chat_message)
+            current_mode = ct.ANSWER_MODE_1 if get_session_state().get("mode") == ct.ANSWER_MODE_1 else ct.ANSWER_MODE_2
             
-            # 結果の動的フォーマット
-            formatted_results = format_search_results(retrieved_docs, chat_message)
+            # 検索・回答生成は全セッション共有の非同期エンジンに投入し、このスレッドでは結果を待つだけにする
+            # （順番待ちの順位はイベントループ側で記録し、画面表示はこのスレッドから行う）
+            queue_status = {}
+            async_llm = ScheduledLLM(
+                HedgedLLM(get_llm(), scheduler=get_llm_scheduler()), get_session_id(), priority=query_priority(chat_message),
+                on_wait=lambda position: queue_status.update(position=position)
+            )
             
-            # LLMによる統合回答生成
-            context_text = "\n\n".join([doc.page_content for doc in retrieved_docs[:5]])  # 上位5件
+            key = None
             
-            system_prompt = """あなたは社内情報検索アシスタントです。
-提供された情報を基に、ユーザーの質問に正確で有用な回答を提供してください。
-
-**重要な出力ルール**:
-1. 従業員情報や一覧データがある場合は、**必ずMarkdown形式のテーブル**で出力してください
-2. 複数の従業員情報がある場合は、全員分をテーブルに含めてください（1人だけではダメ）
-3. テーブル形式: | 列名1 | 列名2 | 列名3 |
-4. 従業員以外の情報は要点をまとめて回答してください"""
+            def notify_queue_position():
+                position = queue_status.pop("position", None)
+                if position is None:
+                    return
+                if key is not None:
+                    # 同じ質問の結果を待っている呼び出しにも、順番待ちの順位を知らせる
+                    _rag_single_flight.publish(key, position)
+                if on_queue_wait is not None:
+                    on_queue_wait(position)
             
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=f"質問: {chat_message}\n\n検索結果:\n{context_text}\n\n上記の情報を基に回答してください。")
-            ]
+            def notify_leader_position(position):
+                # 同じ質問を先に処理している呼び出しの、順番待ちの順位を表示
+                if position is not None and position != queue_status.get("shown") and on_queue_wait is not None:
+                    queue_status["shown"] = position
+                    on_queue_wait(position)
             
-            response = llm.invoke(messages)
+            # 会話の続きの質問は、これまでの会話の要約と直近の会話をあわせてLLMに渡す
+            chat_history = get_chat_history_messages()
+            
+            def run_rag():
+                return get_async_engine().run(
+                    aanswer_with_rag(async_llm, retriever, chat_message, deadline, chat_history),
+                    on_poll=notify_queue_position
+                )
+            
+            if is_first_turn():
+                # 会話履歴に依存しない最初の質問は、同時に来た同じ質問と検索・回答生成を1回にまとめて結果を共有
+                # （結果を待つのは時間配分の範囲内のみで、超えた場合は自分で検索・回答生成する）
+                with start_span("normalize"):
+                    key = (normalize_query(chat_message), current_mode, get_index_version(retriever))
+                (answer, retrieved_docs), shared = _rag_single_flight.do(
+                    key, run_rag, timeout=deadline.budget("coalesce"), on_poll=notify_leader_position
+                )
+                request_span.set_attribute("single_flight_shared", shared)
+            else:
+                answer, retrieved_docs = run_rag()
             
             # 会話履歴に追加
-            try:
-                if hasattr(st, 'session_state') and hasattr(st.session_state, 'chat_history'):
-                    st.session_state.chat_history.extend([HumanMessage(content=chat_message), response.content])
-            except Exception:
-                pass
+            add_to_chat_history(chat_message, answer)
+            request_span.set_attribute("path", "rag")
             
             return {
-                "answer": response.content,
+                "answer": answer,
                 "context": retrieved_docs,
-                "mode": ct.ANSWER_MODE_1 if hasattr(st, 'session_state') and st.session_state.get("mode") == ct.ANSWER_MODE_1 else ct.ANSWER_MODE_2
+                "mode": current_mode
             }
             
         except Exception as rag_error:
             # RAG処理エラーの場合のフォールバック
+            request_span.set_attributes(path="fallback", error=str(rag_error))
             fallback_message = f"⚠️ 検索処理中にエラーが発生しました: {str(rag_error)}\n\n基本的な応答機能で対応します。"
             
             messages = [
@@ -285,7 +567,8 @@ def get_llm_response(chat_message):
             ]
             
             try:
-                response = llm.invoke(messages)
+                # 検索処理で使った残りの時間内で回答（時間切れの場合はエラーの説明のみを返す）
+                response = deadline.run("completion", llm.invoke, messages)
                 return {
                     "answer": response.content + f"\n\n{fallback_message}",
                     "context": []
@@ -297,5 +580,6 @@ def get_llm_response(chat_message):
                 }
 
     except Exception as e:
+        request_span.set_attributes(path="error", error=str(e))
         error_message = f"LLM応答生成中にエラーが発生しました: {str(e)}"
         return {"answer": build_error_message(error_message)}
\ No newline at end of file
@@ -12,13 +12,10 @@ import pandas as pd
 import re
 from dotenv import load_dotenv
 import streamlit as st
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.schema import HumanMessage
-from langchain_openai import ChatOpenAI
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_experimental.agents import create_pandas_dataframe_agent
 import constants as ct
+from llm_clients import get_llm, get_question_generator_prompt, get_question_answer_chain
+from query_rewrite import retrieve_with_rewrite
 from typing import Optional  # 修正点: PDF参照表示の共通関数化のためのtype hint追加
 
 
@@ -207,7 +204,7 @@ def query_employee_data(chat_message):
             # DataFrame Agentによる高度な検索
             try:
                 # LLMオブジェクトを作成
-                llm = ChatOpenAI(model_name=ct.MODEL, temperature=ct.TEMPERATURE)
+                llm = get_llm()
                 
                 # Pandas DataFrame Agentを作成
                 agent = create_pandas_dataframe_agent(
@@ -284,49 +281,23 @@ def get_llm_response(chat_message):
         # 会話履歴に追加（Streamlitセッションが利用可能な場合のみ）
         try:
             if hasattr(st, 'session_state') and hasattr(st.session_state, 'chat_history'):
-                st.session_state.chat_history.extend([
-                    HumanMessage(content=chat_message), 
-                    employee_response["answer"]
-                ])
+                st.session_state.chat_history.add_turn(chat_message, employee_response["answer"])
         except Exception:
             # セッション状態が利用できない場合は無視（デバッグ時など）
             pass
         return employee_response
     
     # 通常のRAG処理
-    # LLMのオブジェクトを用意
-    llm = ChatOpenAI(model_name=ct.MODEL, temperature=ct.TEMPERATURE)
+    # LLM・プロンプト・Chainのオブジェクトを用意（プロセス全体で共有し、毎回作り直さない）
+    llm = get_llm()
+    question_generator_prompt = get_question_generator_prompt()
 
-    # 会話履歴なしでもLLMに理解してもらえる、独立した入力テキストを取得するためのプロンプトテンプレートを作成
-    question_generator_template = ct.SYSTEM_PROMPT_CREATE_INDEPENDENT_TEXT
-    question_generator_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", question_generator_template),
-            MessagesPlaceholder("chat_history"),
-            ("human", "{input}")
-        ]
-    )
-
-    # モードによってLLMから回答を取得する用のプロンプトを変更
+    # モードによってLLMから回答を取得する用のChainを変更
     try:
         current_mode = st.session_state.mode if hasattr(st, 'session_state') and hasattr(st.session_state, 'mode') else ct.ANSWER_MODE_2
     except Exception:
         current_mode = ct.ANSWER_MODE_2  # デフォルトは「社内問い合わせ」モード
-    
-    if current_mode == ct.ANSWER_MODE_1:
-        # モードが「社内文書検索」の場合のプロンプト
-        question_answer_template = ct.SYSTEM_PROMPT_DOC_SEARCH
-    else:
-        # モードが「社内問い合わせ」の場合のプロンプト
-        question_answer_template = ct.SYSTEM_PROMPT_INQUIRY
-    # LLMから回答を取得する用のプロンプトテンプレートを作成
-    question_answer_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", question_answer_template),
-            MessagesPlaceholder("chat_history"),
-            ("human", "{input}")
-        ]
-    )
+    question_answer_chain = get_question_answer_chain(current_mode)
 
     # 会話履歴なしでもLLMに理解してもらえる、独立した入力テキストを取得するためのRetrieverを作成
     try:
@@ -339,28 +310,26 @@ def get_llm_response(chat_message):
         from initialize import initialize_retriever
         retriever = initialize_retriever()
     
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, question_generator_prompt
-    )
-
-    # LLMから回答を取得する用のChainを作成
-    question_answer_chain = create_stuff_documents_chain(llm, question_answer_prompt)
-    # 「RAG x 会話履歴の記憶機能」を実現するためのChainを作成
-    chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-
-    # チャット履歴を取得（セッション状態が利用可能な場合）
+    # チャット履歴を取得（セッション状態が利用可能な場合。要約＋直近の会話をトークン数の上限内でメッセージ化）
     try:
-        chat_history = st.session_state.chat_history if hasattr(st, 'session_state') and hasattr(st.session_state, 'chat_history') else []
+        memory = st.session_state.chat_history if hasattr(st, 'session_state') and hasattr(st.session_state, 'chat_history') else None
+        chat_history = memory.to_messages() if memory is not None else []
     except Exception:
+        memory = None
         chat_history = []
-    
+
+    # 「RAG x 会話履歴の記憶機能」: 会話履歴なしでは意味が通らない質問の場合のみ、独立した入力テキストに書き換えて検索
+    # （最初の質問や単独で意味が通る質問では、書き換えのLLM呼び出しを省略する）
+    context, _ = retrieve_with_rewrite(llm, retriever, question_generator_prompt, chat_message, chat_history, memory)
+
     # LLMへのリクエストとレスポンス取得
-    llm_response = chain.invoke({"input": chat_message, "chat_history": chat_history})
+    answer = question_answer_chain.invoke({"input": chat_message, "chat_history": chat_history, "context": context})
+    llm_response = {"input": chat_message, "chat_history": chat_history, "context": context, "answer": answer}
     
     # LLMレスポンスを会話履歴に追加（セッション状態が利用可能な場合のみ）
     try:
         if hasattr(st, 'session_state') and hasattr(st.session_state, 'chat_history'):
-            st.session_state.chat_history.extend([HumanMessage(content=chat_message), llm_response["answer"]])
+            st.session_state.chat_history.add_turn(chat_message, llm_response["answer"])
     except Exception:
         # セッション状態が利用できない場合は無視（デバッグ時など）
         pass
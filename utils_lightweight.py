@@ -13,12 +13,9 @@ import pandas as pd
 import re
 from dotenv import load_dotenv
 import streamlit as st
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.schema import HumanMessage
-from langchain_openai import ChatOpenAI
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
 import constants as ct
+from llm_clients import get_llm, get_question_generator_prompt, get_question_answer_chain
+from query_rewrite import retrieve_with_rewrite
 from typing import Optional
 from tabulate import tabulate
 
@@ -151,41 +148,21 @@ def get_llm_response(chat_message):
             # 会話履歴に追加（Streamlitセッションが利用可能な場合のみ）
             try:
                 if hasattr(st, 'session_state') and hasattr(st.session_state, 'chat_history'):
-                    st.session_state.chat_history.extend([
-                        HumanMessage(content=chat_message), 
-                        employee_response["answer"]
-                    ])
+                    st.session_state.chat_history.add_turn(chat_message, employee_response["answer"])
             except Exception:
                 pass
             return employee_response
         
-        # 通常のRAG処理
-        llm = ChatOpenAI(model_name=ct.MODEL, temperature=ct.TEMPERATURE)
-
-        # 会話履歴なしでもLLMに理解してもらえる、独立した入力テキストを取得するためのプロンプトテンプレートを作成
-        question_generator_template = ct.SYSTEM_PROMPT_CREATE_INDEPENDENT_TEXT
-        question_generator_prompt = ChatPromptTemplate.from_messages([
-            ("system", question_generator_template),
-            MessagesPlaceholder("chat_history"),
-            ("human", "{input}")
-        ])
-
-        # モードによってLLMから回答を取得する用のプロンプトを変更
+        # 通常のRAG処理（LLM・プロンプト・Chainのオブジェクトはプロセス全体で共有し、毎回作り直さない）
+        llm = get_llm()
+        question_generator_prompt = get_question_generator_prompt()
+
+        # モードによってLLMから回答を取得する用のChainを変更
         try:
             current_mode = st.session_state.mode if hasattr(st, 'session_state') and hasattr(st.session_state, 'mode') else ct.ANSWER_MODE_2
         except Exception:
             current_mode = ct.ANSWER_MODE_2
-
-        if current_mode == ct.ANSWER_MODE_1:
-            question_answer_template = ct.SYSTEM_PROMPT_DOC_SEARCH
-        else:
-            question_answer_template = ct.SYSTEM_PROMPT_INQUIRY
-
-        question_answer_prompt = ChatPromptTemplate.from_messages([
-            ("system", question_answer_template),
-            MessagesPlaceholder("chat_history"),
-            ("human", "{input}")
-        ])
+        question_answer_chain = get_question_answer_chain(current_mode)
 
         # リトリーバーを取得
         try:
@@ -197,24 +174,25 @@ def get_llm_response(chat_message):
             from initialize import initialize_retriever
             retriever = initialize_retriever()
 
-        history_aware_retriever = create_history_aware_retriever(llm, retriever, question_generator_prompt)
-
-        question_answer_chain = create_stuff_documents_chain(llm, question_answer_prompt)
-        chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-
-        # チャット履歴を取得
+        # チャット履歴を取得（要約＋直近の会話をトークン数の上限内でメッセージ化）
         try:
-            chat_history = st.session_state.chat_history if hasattr(st, 'session_state') and hasattr(st.session_state, 'chat_history') else []
+            memory = st.session_state.chat_history if hasattr(st, 'session_state') and hasattr(st.session_state, 'chat_history') else None
+            chat_history = memory.to_messages() if memory is not None else []
         except Exception:
+            memory = None
             chat_history = []
 
+        # 会話履歴をもとにした質問の書き換えは必要な場合のみ行い、関連ドキュメントを検索
+        context, _ = retrieve_with_rewrite(llm, retriever, question_generator_prompt, chat_message, chat_history, memory)
+
         # LLMへのリクエストとレスポンス取得
-        llm_response = chain.invoke({"input": chat_message, "chat_history": chat_history})
+        answer = question_answer_chain.invoke({"input": chat_message, "chat_history": chat_history, "context": context})
+        llm_response = {"input": chat_message, "chat_history": chat_history, "context": context, "answer": answer}
 
         # LLMレスポンスを会話履歴に追加
         try:
             if hasattr(st, 'session_state') and hasattr(st.session_state, 'chat_history'):
-                st.session_state.chat_history.extend([HumanMessage(content=chat_message), llm_response["answer"]])
+                st.session_state.chat_history.add_turn(chat_message, llm_response["answer"])
         except Exception:
             pass
 